@@ -36,6 +36,7 @@ from advanced_helpers import (
     get_platform_settings,
     update_platform_setting,
 )
+from subscription_entitlements import record_usage
 
 # ============================================
 # NOUVEAUX MODÈLES PYDANTIC
@@ -260,6 +261,7 @@ def add_campaigns_endpoints(app, verify_token):
             raise HTTPException(status_code=500, detail="Erreur lors de la création de la campagne")
 
         campaign = result.data[0]
+        record_usage("merchant", merchant["id"], "campaigns")
 
         # Assigner les produits si fournis
         if campaign_data.product_ids:
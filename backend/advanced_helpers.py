@@ -8,6 +8,9 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime
 import secrets
 
+from db_helpers import invalidate_principal
+from subscription_entitlements import record_usage
+
 # ============================================
 # PRODUCTS - CRUD COMPLET
 # ============================================
@@ -36,6 +39,8 @@ def create_product(
         }
 
         result = supabase.table("products").insert(product_data).execute()
+        if result.data:
+            record_usage("merchant", merchant_id, "products")
         return result.data[0] if result.data else None
     except Exception as e:
         print(f"Error creating product: {e}")
@@ -56,9 +61,12 @@ def update_product(product_id: str, updates: Dict) -> bool:
 def delete_product(product_id: str) -> bool:
     """Supprime un produit (soft delete)"""
     try:
-        supabase.table("products").update(
+        # Un produit déjà supprimé n'est pas décompté une seconde fois
+        result = supabase.table("products").update(
             {"is_available": False, "deleted_at": datetime.now().isoformat()}
-        ).eq("id", product_id).execute()
+        ).eq("id", product_id).is_("deleted_at", "null").execute()
+        for row in result.data or []:
+            record_usage("merchant", row.get("merchant_id"), "products", -1)
         return True
     except Exception as e:
         print(f"Error deleting product: {e}")
@@ -84,9 +92,12 @@ def update_campaign(campaign_id: str, updates: Dict) -> bool:
 def delete_campaign(campaign_id: str) -> bool:
     """Supprime une campagne"""
     try:
-        supabase.table("campaigns").update(
+        # Une campagne déjà supprimée n'est pas décomptée une seconde fois
+        result = supabase.table("campaigns").update(
             {"status": "archived", "deleted_at": datetime.now().isoformat()}
-        ).eq("id", campaign_id).execute()
+        ).eq("id", campaign_id).is_("deleted_at", "null").execute()
+        for row in result.data or []:
+            record_usage("merchant", row.get("merchant_id"), "campaigns", -1)
         return True
     except Exception as e:
         print(f"Error deleting campaign: {e}")
@@ -457,6 +468,7 @@ def update_user_profile(user_id: str, updates: Dict) -> bool:
     try:
         updates["updated_at"] = datetime.now().isoformat()
         supabase.table("users").update(updates).eq("id", user_id).execute()
+        invalidate_principal(user_id)
         return True
     except Exception as e:
         print(f"Error updating user profile: {e}")
@@ -469,6 +481,7 @@ def deactivate_user(user_id: str) -> bool:
         supabase.table("users").update(
             {"is_active": False, "deactivated_at": datetime.now().isoformat()}
         ).eq("id", user_id).execute()
+        invalidate_principal(user_id)
         return True
     except Exception as e:
         print(f"Error deactivating user: {e}")
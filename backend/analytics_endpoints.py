@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
 from datetime import datetime, timedelta
 from supabase_config import get_supabase_client
+from analytics_rollups import get_daily_series, PLATFORM_DIMENSION_ID
 
 router = APIRouter()
 
@@ -324,46 +325,25 @@ async def get_platform_metrics():
 async def get_merchant_sales_chart(merchant_id: Optional[str] = Query(None), days: int = Query(30)):
     """Graphique des ventes d'un marchand sur X jours"""
     try:
-        supabase = get_supabase_client()
-        
-        # Si merchant_id n'est pas fourni, prendre toutes les ventes
-        start_date = (datetime.now() - timedelta(days=days)).date()
-        
-        # Récupérer les ventes
-        query = supabase.table('sales').select('amount, created_at, merchant_id')
-        if merchant_id:
-            query = query.eq('merchant_id', merchant_id)
-        sales = query.execute()
-        
-        # Grouper par jour
-        sales_by_day = {}
-        for sale in (sales.data or []):
-            created_at = sale.get('created_at', '')
-            if created_at:
-                date_str = created_at[:10]
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                
-                if date_obj >= start_date:
-                    if date_str not in sales_by_day:
-                        sales_by_day[date_str] = {'amount': 0, 'count': 0}
-                    sales_by_day[date_str]['amount'] += float(sale.get('amount', 0))
-                    sales_by_day[date_str]['count'] += 1
-        
-        # Créer tableau avec tous les jours
-        data = []
-        current_date = start_date
+        # Rollups journaliers ; sans merchant_id, toute la plateforme
         end_date = datetime.now().date()
-        
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            day_data = sales_by_day.get(date_str, {'amount': 0, 'count': 0})
-            data.append({
-                "date": date_str,
-                "sales": round(day_data['amount'], 2),
-                "orders": day_data['count'],
-                "formatted_date": current_date.strftime('%d/%m')
-            })
-            current_date += timedelta(days=1)
+        start_date = end_date - timedelta(days=days)
+        if merchant_id:
+            series = get_daily_series('merchant', merchant_id, start_date, end_date,
+                                      fields=('conversions', 'revenue'))
+        else:
+            series = get_daily_series('platform', PLATFORM_DIMENSION_ID, start_date, end_date,
+                                      fields=('conversions', 'revenue'))
+
+        data = [
+            {
+                "date": point['day'].strftime('%Y-%m-%d'),
+                "sales": round(point['revenue'], 2),
+                "orders": int(point['conversions']),
+                "formatted_date": point['day'].strftime('%d/%m')
+            }
+            for point in series
+        ]
         
         return {
             "success": True,
@@ -456,45 +436,25 @@ async def get_merchant_performance(merchant_id: Optional[str] = Query(None)):
 async def get_influencer_earnings_chart(influencer_id: Optional[str] = Query(None), days: int = Query(30)):
     """Graphique des commissions d'un influenceur sur X jours"""
     try:
-        supabase = get_supabase_client()
-        
-        start_date = (datetime.now() - timedelta(days=days)).date()
-        
-        # Récupérer les commissions
-        query = supabase.table('commissions').select('amount, created_at, influencer_id')
-        if influencer_id:
-            query = query.eq('influencer_id', influencer_id)
-        commissions = query.execute()
-        
-        # Grouper par jour
-        earnings_by_day = {}
-        for commission in (commissions.data or []):
-            created_at = commission.get('created_at', '')
-            if created_at:
-                date_str = created_at[:10]
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                
-                if date_obj >= start_date:
-                    if date_str not in earnings_by_day:
-                        earnings_by_day[date_str] = {'amount': 0, 'count': 0}
-                    earnings_by_day[date_str]['amount'] += float(commission.get('amount', 0))
-                    earnings_by_day[date_str]['count'] += 1
-        
-        # Créer tableau avec tous les jours
-        data = []
-        current_date = start_date
+        # Rollups journaliers ; sans influencer_id, toute la plateforme
         end_date = datetime.now().date()
-        
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            day_data = earnings_by_day.get(date_str, {'amount': 0, 'count': 0})
-            data.append({
-                "date": date_str,
-                "earnings": round(day_data['amount'], 2),
-                "commissions": day_data['count'],
-                "formatted_date": current_date.strftime('%d/%m')
-            })
-            current_date += timedelta(days=1)
+        start_date = end_date - timedelta(days=days)
+        if influencer_id:
+            series = get_daily_series('influencer', influencer_id, start_date, end_date,
+                                      fields=('conversions', 'commissions'))
+        else:
+            series = get_daily_series('platform', PLATFORM_DIMENSION_ID, start_date, end_date,
+                                      fields=('conversions', 'commissions'))
+
+        data = [
+            {
+                "date": point['day'].strftime('%Y-%m-%d'),
+                "earnings": round(point['commissions'], 2),
+                "commissions": int(point['conversions']),
+                "formatted_date": point['day'].strftime('%d/%m')
+            }
+            for point in series
+        ]
         
         return {
             "success": True,
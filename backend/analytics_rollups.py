@@ -0,0 +1,138 @@
+"""
+Rollups analytiques journaliers
+Faits par jour et par dimension (plateforme / merchant / influenceur /
+produit / lien) rafraîchis de façon incrémentale par la tâche Celery
+aggregate_daily_analytics, lus par les graphiques /api/analytics/*
+
+Tables: analytics_daily_facts, analytics_rollup_state
+(database/migrations/add_daily_analytics_rollups.sql)
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from supabase_client import supabase
+from utils.logger import logger
+
+FACTS_TABLE = "analytics_daily_facts"
+PLATFORM_DIMENSION_ID = "*"
+
+FACT_FIELDS = ("clicks", "unique_clicks", "conversions", "revenue", "commissions")
+
+# Marge laissée derrière le high-water mark (transactions encore ouvertes)
+REFRESH_LAG_SECONDS = 120
+
+# Table absente (PostgREST / Postgres) : migration non appliquée
+MISSING_TABLE_CODES = ("PGRST205", "42P01")
+
+
+def _is_missing_table(error: Exception) -> bool:
+    """Seule erreur qui autorise le repli sur les ventes (pas un timeout)"""
+    code = getattr(error, "code", None)
+    return code in MISSING_TABLE_CODES or any(c in str(error) for c in MISSING_TABLE_CODES)
+
+
+def refresh_daily_analytics(lag_seconds: int = REFRESH_LAG_SECONDS) -> Dict:
+    """
+    Recalcule les jours touchés depuis le dernier high-water mark (RPC)
+
+    Returns:
+        {"skipped", "days_refreshed", "rows_written", "high_water_mark"}
+    """
+    result = supabase.rpc("refresh_daily_analytics", {"p_lag_seconds": lag_seconds}).execute()
+    return result.data or {}
+
+
+def get_daily_series(
+    dimension: str,
+    dimension_id: Optional[str],
+    start_day: date,
+    end_day: date,
+    fields: Iterable[str] = FACT_FIELDS,
+) -> List[Dict]:
+    """
+    Série continue [start_day, end_day] (bornes incluses) d'une dimension,
+    un point par jour (jours sans activité à zéro)
+
+    dimension_id=None additionne toutes les valeurs de la dimension. Si la
+    table de rollups est absente, repli sur un scan borné des ventes (les
+    champs de clics restent alors à zéro)
+    """
+    fields = tuple(fields)
+    try:
+        query = (
+            supabase.table(FACTS_TABLE)
+            .select(",".join(("day",) + fields))
+            .eq("dimension", dimension)
+            .gte("day", start_day.isoformat())
+            .lte("day", end_day.isoformat())
+        )
+        if dimension_id is not None:
+            query = query.eq("dimension_id", str(dimension_id))
+        rows = query.execute().data or []
+    except Exception as e:
+        # Migration add_daily_analytics_rollups.sql non appliquée
+        if not _is_missing_table(e):
+            raise
+        logger.warning(f"{FACTS_TABLE} absente, repli sur un scan des ventes: {e}")
+        rows = _sales_facts(dimension, dimension_id, start_day, end_day)
+
+    return fill_daily_series(rows, start_day, end_day, fields)
+
+
+def fill_daily_series(
+    rows: List[Dict],
+    start_day: date,
+    end_day: date,
+    fields: Iterable[str] = FACT_FIELDS,
+) -> List[Dict]:
+    """Somme les lignes par jour et complète les jours manquants par des zéros"""
+    fields = tuple(fields)
+    by_day: Dict[str, Dict[str, float]] = {}
+    for row in rows:
+        day = str(row.get("day"))[:10]
+        totals = by_day.setdefault(day, {field: 0.0 for field in fields})
+        for field in fields:
+            totals[field] += float(row.get(field) or 0)
+
+    series = []
+    current = start_day
+    while current <= end_day:
+        totals = by_day.get(current.isoformat(), {field: 0.0 for field in fields})
+        series.append({"day": current, **totals})
+        current += timedelta(days=1)
+    return series
+
+
+_SALES_DIMENSION_COLUMNS = {
+    "merchant": "merchant_id",
+    "influencer": "influencer_id",
+    "product": "product_id",
+    "link": "link_id",
+}
+
+
+def _sales_facts(
+    dimension: str, dimension_id: Optional[str], start_day: date, end_day: date
+) -> List[Dict]:
+    """Faits de vente recalculés depuis `sales` (une requête bornée, colonnes utiles)"""
+    query = (
+        supabase.table("sales")
+        .select("created_at, amount, influencer_commission, status")
+        .gte("created_at", start_day.isoformat())
+        .lt("created_at", (end_day + timedelta(days=1)).isoformat())
+    )
+    column = _SALES_DIMENSION_COLUMNS.get(dimension)
+    if column and dimension_id is not None:
+        query = query.eq(column, str(dimension_id))
+
+    return [
+        {
+            "day": sale["created_at"][:10],
+            "conversions": 1,
+            "revenue": sale.get("amount") or 0,
+            "commissions": sale.get("influencer_commission") or 0,
+        }
+        for sale in query.execute().data or []
+        if sale.get("created_at") and sale.get("status") not in ("refunded", "cancelled")
+    ]
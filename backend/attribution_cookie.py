@@ -0,0 +1,161 @@
+"""
+Cookie d'attribution signé (HMAC-SHA256)
+
+Format binaire encodé en base64url (sans padding), 70 octets → 94 caractères:
+
+    version (1) | key_id (1) | link_id (16) | influencer_id (16) | click_id (16)
+    | issued_at epoch secondes (4, big-endian) | HMAC-SHA256 tronqué (16)
+
+Le cookie est auto-suffisant: une signature valide suffit à attribuer une
+vente, sans lecture en BDD. Les clés sont versionnées (key_id) pour permettre
+leur rotation sans invalider les cookies déjà émis.
+
+Configuration:
+    ATTRIBUTION_COOKIE_KEYS="1:secret-actuel,0:ancien-secret"
+    ATTRIBUTION_COOKIE_KEY_ID=1   (clé utilisée pour signer)
+    A défaut, JWT_SECRET est utilisé comme clé 0.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import os
+import struct
+import time
+import uuid
+from typing import Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+COOKIE_VERSION = 1
+MAC_LENGTH = 16
+_HEADER = struct.Struct(">BB16s16s16sI")  # version, key_id, 3 UUID, issued_at
+PAYLOAD_LENGTH = _HEADER.size  # 54
+TOKEN_LENGTH = PAYLOAD_LENGTH + MAC_LENGTH  # 70
+ENCODED_LENGTH = 94  # ceil(70 * 4 / 3) sans padding
+
+
+class AttributionClaims(NamedTuple):
+    link_id: str
+    influencer_id: str
+    click_id: str
+    issued_at: int
+    key_id: int
+
+
+class AttributionCookieSigner:
+    """Émission et vérification des cookies d'attribution signés"""
+
+    def __init__(self, keys: Dict[int, bytes], current_key_id: int):
+        """
+        Args:
+            keys: {key_id: secret} — toutes les clés acceptées en vérification
+            current_key_id: clé utilisée pour signer les nouveaux cookies
+        """
+        if current_key_id not in keys:
+            raise ValueError(f"Clé de signature {current_key_id} absente du trousseau")
+        if any(not 0 <= key_id <= 255 for key_id in keys):
+            raise ValueError("Les key_id doivent tenir sur un octet (0-255)")
+
+        # HMAC pré-initialisés: .copy() évite de recalculer les pads de clé à chaque appel
+        self._macs = {key_id: hmac.new(secret, digestmod=hashlib.sha256) for key_id, secret in keys.items()}
+        self.current_key_id = current_key_id
+
+    @classmethod
+    def from_env(cls) -> "AttributionCookieSigner":
+        """Construit le signer depuis ATTRIBUTION_COOKIE_KEYS / JWT_SECRET"""
+        keys: Dict[int, bytes] = {}
+        raw_keys = os.getenv("ATTRIBUTION_COOKIE_KEYS", "")
+
+        for item in filter(None, (part.strip() for part in raw_keys.split(","))):
+            key_id, _, secret = item.partition(":")
+            if not secret:
+                logger.error("❌ Entrée ATTRIBUTION_COOKIE_KEYS invalide (format attendu id:secret)")
+                continue
+            keys[int(key_id)] = secret.encode()
+
+        if not keys:
+            fallback = os.getenv("JWT_SECRET")
+            if not fallback:
+                logger.warning("⚠️ Aucune clé d'attribution configurée, génération d'une clé éphémère")
+                fallback = base64.urlsafe_b64encode(os.urandom(32)).decode()
+            keys[0] = fallback.encode()
+
+        current_key_id = int(os.getenv("ATTRIBUTION_COOKIE_KEY_ID") or max(keys))
+        return cls(keys, current_key_id)
+
+    def _sign(self, key_id: int, payload) -> bytes:
+        mac = self._macs[key_id].copy()
+        mac.update(payload)
+        return mac.digest()[:MAC_LENGTH]
+
+    def encode(
+        self,
+        link_id: str,
+        influencer_id: str,
+        click_id: str,
+        issued_at: Optional[int] = None,
+    ) -> str:
+        """
+        Signe une attribution
+
+        Raises:
+            ValueError: si un identifiant n'est pas un UUID
+            TypeError: si un identifiant est absent (None)
+        """
+        payload = _HEADER.pack(
+            COOKIE_VERSION,
+            self.current_key_id,
+            uuid.UUID(link_id).bytes,
+            uuid.UUID(influencer_id).bytes,
+            uuid.UUID(click_id).bytes,
+            int(time.time() if issued_at is None else issued_at),
+        )
+        token = payload + self._sign(self.current_key_id, payload)
+        return base64.urlsafe_b64encode(token).rstrip(b"=").decode("ascii")
+
+    def decode(self, value: str, max_age_seconds: Optional[int] = None) -> Optional[AttributionClaims]:
+        """
+        Vérifie et décode un cookie (comparaison de MAC en temps constant)
+
+        Returns:
+            AttributionClaims, ou None si le cookie est malformé, forgé ou expiré
+        """
+        if not value or len(value) != ENCODED_LENGTH:
+            return None
+
+        try:
+            token = base64.urlsafe_b64decode(value + "==")
+        except (binascii.Error, ValueError):
+            return None
+
+        if len(token) != TOKEN_LENGTH or token[0] != COOKIE_VERSION:
+            return None
+
+        key_id = token[1]
+        if key_id not in self._macs:
+            return None
+
+        view = memoryview(token)
+        expected = self._sign(key_id, view[:PAYLOAD_LENGTH])
+        if not hmac.compare_digest(expected, view[PAYLOAD_LENGTH:]):
+            return None
+
+        _, _, link_bytes, influencer_bytes, click_bytes, issued_at = _HEADER.unpack_from(token)
+
+        if max_age_seconds is not None and time.time() - issued_at > max_age_seconds:
+            return None
+
+        return AttributionClaims(
+            link_id=str(uuid.UUID(bytes=link_bytes)),
+            influencer_id=str(uuid.UUID(bytes=influencer_bytes)),
+            click_id=str(uuid.UUID(bytes=click_bytes)),
+            issued_at=issued_at,
+            key_id=key_id,
+        )
+
+
+# Instance globale
+attribution_signer = AttributionCookieSigner.from_env()
@@ -8,7 +8,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 import os
 from dotenv import load_dotenv
-from db_helpers import get_user_by_id
+from db_helpers import get_principal, get_token_version
 
 # Load environment variables
 load_dotenv()
@@ -48,8 +48,14 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
 def require_role(required_role: str):
     """
     Dependency to require specific role
+
+    Answered from the signed token claims once the token version is
+    checked, without loading the user record
     """
-    async def role_checker(current_user: dict = Depends(get_current_user)):
+    async def role_checker(payload: dict = Depends(verify_token)):
+        current_user = token_principal(payload)
+        if not current_user:
+            raise HTTPException(status_code=404, detail="User not found")
         user_role = current_user.get("role", "user")
         if user_role != required_role:
             raise HTTPException(
@@ -75,6 +81,75 @@ async def optional_auth(credentials: HTTPAuthorizationCredentials = Depends(HTTP
         return None
 
 
+def _check_token_version(payload: dict) -> bool:
+    """
+    Compare the token's `ver` claim with the user's current token_version
+
+    Returns:
+        bool: False if the user does not exist
+
+    Raises:
+        HTTPException: If the token was issued before the user's last role change
+    """
+    current_version = get_token_version(payload["sub"])
+    if current_version is None:
+        return False
+    if current_version != payload.get("ver", 0):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked"
+        )
+    return True
+
+
+def resolve_principal(payload: dict):
+    """
+    Get the user behind a verified token payload (cached per process)
+
+    Returns:
+        dict: User data (without password_hash), or None if the user does not exist
+
+    Raises:
+        HTTPException: If the token was issued before the user's last role change
+    """
+    if not _check_token_version(payload):
+        return None
+    return get_principal(payload["sub"], payload.get("ver", 0))
+
+
+def token_principal(payload: dict):
+    """
+    Minimal principal (id, email, role) for role-only checks
+
+    Read from the signed token claims once the token version is checked
+    (a cached single-column lookup, so a role change revokes the token);
+    tokens without a role claim (2FA temp tokens, tokens issued by older
+    versions) fall back to the cached user record
+    """
+    if payload.get("role") and not payload.get("temp"):
+        if not _check_token_version(payload):
+            return None
+        return {"id": payload["sub"], "email": payload.get("email"), "role": payload["role"]}
+    return resolve_principal(payload)
+
+
+def _require_principal_role(payload: dict, role: str, detail: str):
+    # Wrong role in the signed claims: rejected before any lookup
+    if payload.get("role") and not payload.get("temp") and payload["role"] != role:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+
+    user = resolve_principal(payload)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    if user.get("role") != role:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+    return user
+
+
 async def get_current_user(payload: dict = Depends(verify_token)):
     """
     Get current authenticated user
@@ -87,13 +162,10 @@ async def get_current_user(payload: dict = Depends(verify_token)):
     Raises:
         HTTPException: If user not found
     """
-    user = get_user_by_id(payload["sub"])
+    user = resolve_principal(payload)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-
-    # Remove sensitive data
-    user_data = {k: v for k, v in user.items() if k != "password_hash"}
-    return user_data
+    return user
 
 
 async def get_current_admin(payload: dict = Depends(verify_token)):
@@ -108,22 +180,7 @@ async def get_current_admin(payload: dict = Depends(verify_token)):
     Raises:
         HTTPException: If user not found or not admin
     """
-    user = get_user_by_id(payload["sub"])
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
-    if user.get("role") != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Admin access required"
-        )
-
-    # Remove sensitive data
-    user_data = {k: v for k, v in user.items() if k != "password_hash"}
-    return user_data
+    return _require_principal_role(payload, "admin", "Admin access required")
 
 
 async def get_current_merchant(payload: dict = Depends(verify_token)):
@@ -138,22 +195,7 @@ async def get_current_merchant(payload: dict = Depends(verify_token)):
     Raises:
         HTTPException: If user not found or not merchant
     """
-    user = get_user_by_id(payload["sub"])
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
-    if user.get("role") != "merchant":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Merchant access required"
-        )
-
-    # Remove sensitive data
-    user_data = {k: v for k, v in user.items() if k != "password_hash"}
-    return user_data
+    return _require_principal_role(payload, "merchant", "Merchant access required")
 
 
 async def get_current_influencer(payload: dict = Depends(verify_token)):
@@ -168,19 +210,4 @@ async def get_current_influencer(payload: dict = Depends(verify_token)):
     Raises:
         HTTPException: If user not found or not influencer
     """
-    user = get_user_by_id(payload["sub"])
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
-    if user.get("role") != "influencer":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Influencer access required"
-        )
-
-    # Remove sensitive data
-    user_data = {k: v for k, v in user.items() if k != "password_hash"}
-    return user_data
+    return _require_principal_role(payload, "influencer", "Influencer access required")
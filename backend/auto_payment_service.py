@@ -4,7 +4,10 @@ Gère la validation des ventes et les paiements automatiques
 """
 
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from supabase_client import supabase
+from batch_checkpoints import BatchCheckpointStore
+from realtime_events import EventTypes, publish_events
 from typing import List, Dict, Optional
 import os
 from dotenv import load_dotenv
@@ -15,6 +18,23 @@ load_dotenv()
 MIN_PAYOUT_AMOUNT = 50.0  # Montant minimum pour retrait
 SALE_VALIDATION_DAYS = 14  # Jours avant validation automatique
 PAYOUT_SCHEDULE = "FRIDAY"  # Jour de paiement hebdomadaire
+VALIDATION_CHUNK_SIZE = 500  # Ventes validées par transaction
+VALIDATION_JOB_NAME = "validate_pending_sales"
+PAYOUT_CONCURRENCY = int(os.getenv("PAYOUT_CONCURRENCY", "8"))  # Appels passerelle simultanés
+PAYOUT_QUERY_CHUNK_SIZE = 200  # IDs par requête .in_() / insert groupé
+
+# Fonction SQL absente (PostgREST / Postgres) : migration non appliquée
+MISSING_RPC_CODES = ("PGRST202", "42883")
+
+
+def _is_missing_rpc(error: Exception) -> bool:
+    """
+    Seule erreur qui autorise le repli côté API : sur un timeout ou une
+    violation de contrainte, la RPC a pu être validée (commit) et rejouer
+    le traitement en doublerait l'effet
+    """
+    code = getattr(error, "code", None)
+    return code in MISSING_RPC_CODES or any(c in str(error) for c in MISSING_RPC_CODES)
 
 
 class AutoPaymentService:
@@ -22,131 +42,90 @@ class AutoPaymentService:
 
     def __init__(self):
         self.supabase = supabase
+        self.checkpoints = BatchCheckpointStore(supabase)
 
     # ============================================
     # 1. VALIDATION AUTOMATIQUE DES VENTES
     # ============================================
 
-    def validate_pending_sales(self) -> Dict:
+    def validate_pending_sales(self, chunk_size: int = VALIDATION_CHUNK_SIZE) -> Dict:
         """
         Valide automatiquement les ventes de plus de 14 jours
         et crédite le solde des influenceurs
+
+        Traitement par chunks (pagination keyset sur created_at, id):
+        chaque chunk est validé en une transaction (RPC validate_sales_batch)
+        et la position est enregistrée, un run interrompu reprend donc au
+        dernier chunk validé avec la même date limite.
         """
         try:
-            # Date limite (14 jours en arrière)
-            validation_date = (datetime.now() - timedelta(days=SALE_VALIDATION_DAYS)).isoformat()
+            checkpoint = self.checkpoints.load(VALIDATION_JOB_NAME)
 
-            # Récupérer les ventes en attente (pending) de plus de 14 jours
-            response = (
-                supabase.table("sales")
-                .select(
-                    """
-                id,
-                influencer_id,
-                merchant_id,
-                amount,
-                influencer_commission,
-                platform_commission,
-                merchant_revenue,
-                product_id,
-                link_id,
-                created_at
-            """
-                )
-                .eq("status", "pending")
-                .lt("created_at", validation_date)
-                .execute()
-            )
-
-            pending_sales = response.data if response.data else []
+            if checkpoint:
+                validation_date = checkpoint["params"]["validation_date"]
+                cursor = checkpoint.get("cursor") or {}
+                processed = int(checkpoint.get("processed") or 0)
+                print(f"↩️  Reprise de la validation au curseur {cursor or 'initial'}")
+            else:
+                # Date limite (14 jours en arrière)
+                validation_date = (
+                    datetime.now() - timedelta(days=SALE_VALIDATION_DAYS)
+                ).isoformat()
+                cursor = {}
+                processed = 0
+                self.checkpoints.start(VALIDATION_JOB_NAME, {"validation_date": validation_date})
 
             validated_count = 0
             total_commission = 0.0
             influencers_updated = set()
+            chunks = 0
+
+            while True:
+                # Récupérer le chunk suivant de ventes en attente (pending) de plus de 14 jours
+                query = (
+                    supabase.table("sales")
+                    .select("id, influencer_id, link_id, influencer_commission, created_at")
+                    .eq("status", "pending")
+                    .lt("created_at", validation_date)
+                )
+                if cursor:
+                    query = query.or_(
+                        f'created_at.gt."{cursor["created_at"]}",'
+                        f'and(created_at.eq."{cursor["created_at"]}",id.gt.{cursor["id"]})'
+                    )
+                response = query.order("created_at").order("id").limit(chunk_size).execute()
 
-            for sale in pending_sales:
-                # Vérifier qu'il n'y a pas eu de retour/remboursement
-                # (Cette logique peut être étendue avec une table de retours)
+                pending_sales = response.data if response.data else []
+                if not pending_sales:
+                    break
 
-                try:
-                    # 1. Mettre à jour le statut de la vente
-                    supabase.table("sales").update(
-                        {
-                            "status": "completed",
-                            "payment_status": "pending",
-                            "payment_processed_at": None,
-                        }
-                    ).eq("id", sale["id"]).execute()
-
-                    # 2. Créer l'entrée de commission
-                    commission_data = {
-                        "sale_id": sale["id"],
-                        "influencer_id": sale["influencer_id"],
-                        "amount": sale["influencer_commission"],
-                        "currency": "EUR",
-                        "status": "approved",  # Approuvée automatiquement
-                        "approved_at": datetime.now().isoformat(),
-                    }
-                    supabase.table("commissions").insert(commission_data).execute()
-
-                    # 3. Mettre à jour le solde de l'influenceur
-                    influencer = (
-                        supabase.table("influencers")
-                        .select("balance, total_earnings")
-                        .eq("id", sale["influencer_id"])
-                        .execute()
-                    )
+                result = self._validate_sales_chunk(pending_sales)
 
-                    if influencer.data:
-                        current_balance = float(influencer.data[0].get("balance", 0))
-                        current_earnings = float(influencer.data[0].get("total_earnings", 0))
-
-                        new_balance = current_balance + float(sale["influencer_commission"])
-                        new_earnings = current_earnings + float(sale["influencer_commission"])
-
-                        supabase.table("influencers").update(
-                            {
-                                "balance": new_balance,
-                                "total_earnings": new_earnings,
-                                "updated_at": datetime.now().isoformat(),
-                            }
-                        ).eq("id", sale["influencer_id"]).execute()
-
-                        influencers_updated.add(sale["influencer_id"])
-
-                    # 4. Mettre à jour les stats du lien d'affiliation
-                    if sale.get("link_id"):
-                        link = (
-                            supabase.table("trackable_links")
-                            .select("total_commission")
-                            .eq("id", sale["link_id"])
-                            .execute()
-                        )
-                        if link.data:
-                            current_link_commission = float(link.data[0].get("total_commission", 0))
-                            supabase.table("trackable_links").update(
-                                {
-                                    "total_commission": current_link_commission
-                                    + float(sale["influencer_commission"])
-                                }
-                            ).eq("id", sale["link_id"]).execute()
-
-                    validated_count += 1
-                    total_commission += float(sale["influencer_commission"])
+                validated_count += result["validated"]
+                total_commission += float(result["total_commission"])
+                influencers_updated.update(result["influencer_ids"])
+                chunks += 1
 
-                    print(
-                        f"✅ Vente validée: {sale['id']} - Commission: {sale['influencer_commission']}€"
-                    )
+                last_sale = pending_sales[-1]
+                cursor = {"created_at": last_sale["created_at"], "id": last_sale["id"]}
+                processed += len(pending_sales)
+                self.checkpoints.save(VALIDATION_JOB_NAME, cursor, processed)
 
-                except Exception as e:
-                    print(f"❌ Erreur validation vente {sale['id']}: {e}")
-                    continue
+                print(
+                    f"✅ Chunk {chunks}: {result['validated']}/{len(pending_sales)} ventes validées"
+                )
+
+                if len(pending_sales) < chunk_size:
+                    break
+
+            self.checkpoints.complete(VALIDATION_JOB_NAME, processed)
 
             return {
                 "success": True,
                 "validated_sales": validated_count,
                 "total_commission": round(total_commission, 2),
                 "influencers_updated": len(influencers_updated),
+                "chunks": chunks,
                 "timestamp": datetime.now().isoformat(),
             }
 
@@ -154,14 +133,127 @@ class AutoPaymentService:
             print(f"Erreur dans validate_pending_sales: {e}")
             return {"success": False, "error": str(e)}
 
+    def _validate_sales_chunk(self, sales: List[Dict]) -> Dict:
+        """
+        Valide un chunk de ventes en une seule transaction (RPC validate_sales_batch)
+
+        Returns:
+            {"validated": int, "total_commission": float, "influencer_ids": set}
+        """
+        sale_ids = [sale["id"] for sale in sales]
+
+        try:
+            result = supabase.rpc("validate_sales_batch", {"p_sale_ids": sale_ids}).execute()
+        except Exception as e:
+            if not _is_missing_rpc(e):
+                raise
+            # Migration add_batch_sale_validation.sql non appliquée
+            print(f"⚠️  RPC validate_sales_batch indisponible, traitement groupé côté API: {e}")
+            return self._validate_sales_chunk_fallback(sale_ids)
+
+        data = result.data or {}
+        validated = int(data.get("validated", 0))
+        return {
+            "validated": validated,
+            "total_commission": float(data.get("total_commission", 0)),
+            # La RPC ne renvoie qu'un nombre d'influenceurs: on l'approxime par ceux du chunk
+            "influencer_ids": {sale["influencer_id"] for sale in sales} if validated else set(),
+        }
+
+    def _validate_sales_chunk_fallback(self, sale_ids: List[str]) -> Dict:
+        """
+        Validation d'un chunk sans la RPC: requêtes groupées (une mise à jour de
+        ventes, un insert de commissions, un incrément agrégé par influenceur
+        et par lien) au lieu de 5 à 7 requêtes par vente
+        """
+        now = datetime.now().isoformat()
+
+        # 1. Statut des ventes (seules celles encore pending sont retournées)
+        updated = (
+            supabase.table("sales")
+            .update({"status": "completed", "payment_status": "pending", "payment_processed_at": None})
+            .in_("id", sale_ids)
+            .eq("status", "pending")
+            .execute()
+        )
+        validated_sales = updated.data or []
+        if not validated_sales:
+            return {"validated": 0, "total_commission": 0.0, "influencer_ids": set()}
+
+        # 2. Commissions (insert multi-lignes)
+        supabase.table("commissions").insert(
+            [
+                {
+                    "sale_id": sale["id"],
+                    "influencer_id": sale["influencer_id"],
+                    "amount": sale["influencer_commission"],
+                    "currency": "EUR",
+                    "status": "approved",  # Approuvée automatiquement
+                    "approved_at": now,
+                }
+                for sale in validated_sales
+            ]
+        ).execute()
+
+        # 3. Deltas agrégés par influenceur et par lien
+        influencer_deltas: Dict[str, float] = {}
+        link_deltas: Dict[str, float] = {}
+        for sale in validated_sales:
+            commission = float(sale.get("influencer_commission") or 0)
+            influencer_deltas[sale["influencer_id"]] = (
+                influencer_deltas.get(sale["influencer_id"], 0.0) + commission
+            )
+            if sale.get("link_id"):
+                link_deltas[sale["link_id"]] = link_deltas.get(sale["link_id"], 0.0) + commission
+
+        influencers = (
+            supabase.table("influencers")
+            .select("id, balance, total_earnings")
+            .in_("id", list(influencer_deltas))
+            .execute()
+        )
+        for influencer in influencers.data or []:
+            delta = influencer_deltas[influencer["id"]]
+            supabase.table("influencers").update(
+                {
+                    "balance": float(influencer.get("balance") or 0) + delta,
+                    "total_earnings": float(influencer.get("total_earnings") or 0) + delta,
+                    "updated_at": now,
+                }
+            ).eq("id", influencer["id"]).execute()
+
+        if link_deltas:
+            links = (
+                supabase.table("trackable_links")
+                .select("id, total_commission")
+                .in_("id", list(link_deltas))
+                .execute()
+            )
+            for link in links.data or []:
+                supabase.table("trackable_links").update(
+                    {"total_commission": float(link.get("total_commission") or 0) + link_deltas[link["id"]]}
+                ).eq("id", link["id"]).execute()
+
+        return {
+            "validated": len(validated_sales),
+            "total_commission": sum(influencer_deltas.values()),
+            "influencer_ids": set(influencer_deltas),
+        }
+
     # ============================================
     # 2. PAIEMENT AUTOMATIQUE
     # ============================================
 
-    def process_automatic_payouts(self) -> Dict:
+    def process_automatic_payouts(self, max_workers: int = PAYOUT_CONCURRENCY) -> Dict:
         """
         Traite automatiquement les paiements pour les influenceurs
         dont le solde est ≥ 50€ et qui ont configuré leur méthode de paiement
+
+        Déroulé:
+        1. Une requête pour les influenceurs éligibles, une pour les paiements en cours
+        2. Insertion groupée des payouts (clé d'idempotence par influenceur et par run)
+        3. Appels aux passerelles en parallèle (pool borné à max_workers)
+        4. Transitions de statut et débits des soldes en un seul appel (RPC complete_payout_batch)
         """
         try:
             # Récupérer les influenceurs éligibles
@@ -183,9 +275,8 @@ class AutoPaymentService:
 
             eligible_influencers = response.data if response.data else []
 
-            processed_count = 0
-            total_paid = 0.0
             failed_payments = []
+            candidates = []
 
             for influencer in eligible_influencers:
                 # Vérifier que la méthode de paiement est configurée
@@ -201,90 +292,52 @@ class AutoPaymentService:
                         }
                     )
                     continue
+                candidates.append(influencer)
 
-                # Vérifier qu'il n'y a pas déjà un paiement en cours
-                pending_payout = (
-                    supabase.table("payouts")
-                    .select("id")
-                    .eq("influencer_id", influencer["id"])
-                    .in_("status", ["pending", "processing"])
-                    .execute()
-                )
-
-                if pending_payout.data:
+            # Paiements déjà en cours (une requête par tranche d'influenceurs)
+            in_flight = self._get_in_flight_payout_influencers([i["id"] for i in candidates])
+            for influencer in candidates:
+                if influencer["id"] in in_flight:
                     print(f"⚠️  Influenceur {influencer['username']}: Paiement déjà en cours")
-                    continue
+            candidates = [i for i in candidates if i["id"] not in in_flight]
 
-                # Créer la demande de paiement
-                payout_amount = float(influencer["balance"])
+            payouts = self._create_payouts(candidates)
 
-                payout_data = {
-                    "influencer_id": influencer["id"],
-                    "amount": payout_amount,
-                    "currency": "EUR",
-                    "status": "processing",
-                    "payment_method": influencer["payment_method"],
-                    "requested_at": datetime.now().isoformat(),
-                    "approved_at": datetime.now().isoformat(),
-                    "is_automatic": True,
+            # Appels aux passerelles en parallèle
+            results = []
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self._execute_payout, payout): payout for payout in payouts
                 }
+                for future in as_completed(futures):
+                    results.append(future.result())
+
+            self._complete_payouts(results)
+            self._publish_payout_statuses(results)
 
-                payout_result = supabase.table("payouts").insert(payout_data).execute()
-
-                if payout_result.data:
-                    payout_id = payout_result.data[0]["id"]
-
-                    # Tenter le paiement selon la méthode
-                    payment_success = False
-                    transaction_id = None
-
-                    if influencer["payment_method"] == "paypal":
-                        payment_success, transaction_id = self._process_paypal_payment(
-                            influencer["payment_details"], payout_amount
-                        )
-                    elif influencer["payment_method"] == "bank_transfer":
-                        payment_success, transaction_id = self._process_bank_transfer(
-                            influencer["payment_details"], payout_amount
-                        )
-
-                    if payment_success:
-                        # Mettre à jour le payout
-                        supabase.table("payouts").update(
-                            {
-                                "status": "paid",
-                                "transaction_id": transaction_id,
-                                "paid_at": datetime.now().isoformat(),
-                            }
-                        ).eq("id", payout_id).execute()
-
-                        # Débiter le solde de l'influenceur
-                        supabase.table("influencers").update(
-                            {"balance": 0.0, "updated_at": datetime.now().isoformat()}
-                        ).eq("id", influencer["id"]).execute()
-
-                        processed_count += 1
-                        total_paid += payout_amount
-
-                        print(f"✅ Paiement réussi: {influencer['username']} - {payout_amount}€")
-
-                        # Envoyer notification
-                        self._send_payment_notification(influencer, payout_amount, transaction_id)
-
-                    else:
-                        # Échec du paiement
-                        supabase.table("payouts").update(
-                            {"status": "failed", "notes": "Échec du traitement automatique"}
-                        ).eq("id", payout_id).execute()
-
-                        failed_payments.append(
-                            {
-                                "influencer_id": influencer["id"],
-                                "reason": "payment_processing_failed",
-                                "balance": payout_amount,
-                            }
-                        )
-
-                        print(f"❌ Échec paiement: {influencer['username']}")
+            processed_count = 0
+            total_paid = 0.0
+            paid = []
+
+            for result in results:
+                influencer = result["influencer"]
+                if result["status"] == "paid":
+                    processed_count += 1
+                    total_paid += result["amount"]
+                    paid.append(result)
+                    print(f"✅ Paiement réussi: {influencer['username']} - {result['amount']}€")
+                else:
+                    failed_payments.append(
+                        {
+                            "influencer_id": influencer["id"],
+                            "reason": "payment_processing_failed",
+                            "balance": result["amount"],
+                        }
+                    )
+                    print(f"❌ Échec paiement: {influencer['username']}")
+
+            # Envoyer les notifications
+            self._send_payment_notifications(paid)
 
             return {
                 "success": True,
@@ -299,13 +352,206 @@ class AutoPaymentService:
             print(f"Erreur dans process_automatic_payouts: {e}")
             return {"success": False, "error": str(e)}
 
+    def _get_in_flight_payout_influencers(self, influencer_ids: List[str]) -> set:
+        """IDs des influenceurs ayant déjà un paiement pending/processing"""
+        in_flight = set()
+        for i in range(0, len(influencer_ids), PAYOUT_QUERY_CHUNK_SIZE):
+            chunk = influencer_ids[i : i + PAYOUT_QUERY_CHUNK_SIZE]
+            result = (
+                supabase.table("payouts")
+                .select("influencer_id")
+                .in_("influencer_id", chunk)
+                .in_("status", ["pending", "processing"])
+                .execute()
+            )
+            in_flight.update(row["influencer_id"] for row in result.data or [])
+        return in_flight
+
+    def _create_payouts(self, influencers: List[Dict]) -> List[Dict]:
+        """
+        Crée les demandes de paiement en un insert groupé
+
+        La clé d'idempotence (influenceur + date du run) est transmise aux
+        passerelles: relancer le run le même jour ne déclenche pas de second virement.
+        """
+        if not influencers:
+            return []
+
+        now = datetime.now().isoformat()
+        run_date = datetime.now().strftime("%Y%m%d")
+        by_id = {}
+        rows = []
+
+        for influencer in influencers:
+            by_id[influencer["id"]] = influencer
+            rows.append(
+                {
+                    "influencer_id": influencer["id"],
+                    "amount": float(influencer["balance"]),
+                    "currency": "EUR",
+                    "status": "processing",
+                    "payment_method": influencer["payment_method"],
+                    "requested_at": now,
+                    "approved_at": now,
+                    "is_automatic": True,
+                    "idempotency_key": f"auto-payout-{influencer['id']}-{run_date}",
+                }
+            )
+
+        created = []
+        for i in range(0, len(rows), PAYOUT_QUERY_CHUNK_SIZE):
+            created.extend(self._insert_payouts(rows[i : i + PAYOUT_QUERY_CHUNK_SIZE]))
+
+        return [
+            {
+                "payout_id": row["id"],
+                "amount": float(row["amount"]),
+                "idempotency_key": row.get("idempotency_key"),
+                "influencer": by_id[row["influencer_id"]],
+            }
+            for row in created
+        ]
+
+    def _insert_payouts(self, rows: List[Dict]) -> List[Dict]:
+        """
+        Insère un chunk de paiements, en ignorant les clés d'idempotence déjà
+        présentes (RPC create_payout_batch: ON CONFLICT sur l'index partiel)
+        """
+        try:
+            result = supabase.rpc("create_payout_batch", {"p_rows": rows}).execute()
+            return result.data or []
+        except Exception as e:
+            if not _is_missing_rpc(e):
+                raise
+            # Migration add_payout_batch_functions.sql non appliquée
+            print(f"⚠️  RPC create_payout_batch indisponible, insert groupé: {e}")
+
+        keys = [row["idempotency_key"] for row in rows]
+        try:
+            existing = (
+                supabase.table("payouts")
+                .select("idempotency_key")
+                .in_("idempotency_key", keys)
+                .execute()
+            )
+        except Exception as e:
+            # Colonne idempotency_key absente: insert sans clé
+            print(f"⚠️  Colonne payouts.idempotency_key indisponible: {e}")
+            rows = [{k: v for k, v in row.items() if k != "idempotency_key"} for row in rows]
+        else:
+            seen = {row["idempotency_key"] for row in existing.data or []}
+            rows = [row for row in rows if row["idempotency_key"] not in seen]
+
+        if not rows:
+            return []
+        result = supabase.table("payouts").insert(rows).execute()
+        return result.data or []
+
+    def _execute_payout(self, payout: Dict) -> Dict:
+        """Appelle la passerelle de paiement (exécuté dans le pool de threads)"""
+        influencer = payout["influencer"]
+        payment_success = False
+        transaction_id = None
+
+        try:
+            if influencer["payment_method"] == "paypal":
+                payment_success, transaction_id = self._process_paypal_payment(
+                    influencer["payment_details"], payout["amount"], payout["idempotency_key"]
+                )
+            elif influencer["payment_method"] == "bank_transfer":
+                payment_success, transaction_id = self._process_bank_transfer(
+                    influencer["payment_details"], payout["amount"], payout["idempotency_key"]
+                )
+        except Exception as e:
+            print(f"Erreur passerelle pour {influencer['username']}: {e}")
+
+        return {
+            **payout,
+            "status": "paid" if payment_success else "failed",
+            "transaction_id": transaction_id,
+        }
+
+    def _complete_payouts(self, results: List[Dict]):
+        """Enregistre les statuts et débite les soldes en un seul appel"""
+        if not results:
+            return
+
+        payload = [
+            {
+                "payout_id": r["payout_id"],
+                "status": r["status"],
+                "transaction_id": r["transaction_id"],
+            }
+            for r in results
+        ]
+
+        try:
+            supabase.rpc("complete_payout_batch", {"p_results": payload}).execute()
+            return
+        except Exception as e:
+            if not _is_missing_rpc(e):
+                raise
+            # Migration add_payout_batch_functions.sql non appliquée
+            print(f"⚠️  RPC complete_payout_batch indisponible, mises à jour groupées: {e}")
+
+        now = datetime.now().isoformat()
+        failed_ids = [r["payout_id"] for r in results if r["status"] == "failed"]
+        if failed_ids:
+            supabase.table("payouts").update(
+                {"status": "failed", "notes": "Échec du traitement automatique"}
+            ).in_("id", failed_ids).eq("status", "processing").execute()
+
+        # Comme la RPC: seuls les paiements encore 'processing' passent à 'paid' et sont débités
+        debits: Dict[str, float] = {}
+        for r in results:
+            if r["status"] != "paid":
+                continue
+            updated = (
+                supabase.table("payouts")
+                .update({"status": "paid", "transaction_id": r["transaction_id"], "paid_at": now})
+                .eq("id", r["payout_id"])
+                .eq("status", "processing")
+                .execute()
+            )
+            if updated.data:
+                influencer_id = r["influencer"]["id"]
+                debits[influencer_id] = debits.get(influencer_id, 0.0) + float(r["amount"])
+
+        if not debits:
+            return
+
+        # Débiter le montant payé: les commissions créditées pendant le run sont conservées
+        influencers = (
+            supabase.table("influencers").select("id, balance").in_("id", list(debits)).execute()
+        )
+        for influencer in influencers.data or []:
+            balance = float(influencer.get("balance") or 0)
+            supabase.table("influencers").update(
+                {"balance": max(balance - debits[influencer["id"]], 0.0), "updated_at": now}
+            ).eq("id", influencer["id"]).execute()
+
+    def _publish_payout_statuses(self, results: List[Dict]):
+        """Pousse les nouveaux statuts aux influenceurs connectés (un seul aller-retour Redis)"""
+        publish_events(
+            (
+                r["influencer"].get("user_id"),
+                EventTypes.PAYMENT_STATUS_CHANGED,
+                {"payout_id": r["payout_id"], "status": r["status"], "amount": r["amount"]},
+            )
+            for r in results
+            if r["influencer"].get("user_id")
+        )
+
     # ============================================
     # 3. MÉTHODES DE PAIEMENT
     # ============================================
 
-    def _process_paypal_payment(self, payment_details: dict, amount: float) -> tuple:
+    def _process_paypal_payment(
+        self, payment_details: dict, amount: float, idempotency_key: Optional[str] = None
+    ) -> tuple:
         """
         Traite un paiement PayPal
+        idempotency_key: transmis comme sender_item_id (PayPal rejette les doublons)
         Retourne: (success: bool, transaction_id: str)
         """
         try:
@@ -335,7 +581,7 @@ class AutoPaymentService:
                     },
                     "receiver": paypal_email,
                     "note": "Commission d'affiliation",
-                    "sender_item_id": f"item_{datetime.now().timestamp()}"
+                    "sender_item_id": idempotency_key
                 }]
             })
             
@@ -347,7 +593,7 @@ class AutoPaymentService:
             """
 
             # SIMULATION
-            transaction_id = f"PAYPAL_SIM_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            transaction_id = f"PAYPAL_SIM_{idempotency_key or datetime.now().strftime('%Y%m%d%H%M%S')}"
             print(f"[SIMULATION] Paiement PayPal: {amount}€ → {paypal_email}")
             return True, transaction_id
 
@@ -355,9 +601,12 @@ class AutoPaymentService:
             print(f"Erreur PayPal: {e}")
             return False, None
 
-    def _process_bank_transfer(self, payment_details: dict, amount: float) -> tuple:
+    def _process_bank_transfer(
+        self, payment_details: dict, amount: float, idempotency_key: Optional[str] = None
+    ) -> tuple:
         """
         Génère un ordre de virement bancaire (SEPA)
+        idempotency_key: utilisé comme EndToEndId de l'ordre SEPA
         Retourne: (success: bool, transaction_id: str)
         """
         try:
@@ -369,7 +618,7 @@ class AutoPaymentService:
                 return False, None
 
             # Générer fichier SEPA XML
-            transaction_id = f"SEPA_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            transaction_id = f"SEPA_{idempotency_key or datetime.now().strftime('%Y%m%d%H%M%S')}"
 
             # TODO: Générer fichier SEPA pour import dans banque
             # Utiliser bibliothèque comme sepaxml ou pain.001
@@ -385,32 +634,44 @@ class AutoPaymentService:
     # 4. NOTIFICATIONS
     # ============================================
 
-    def _send_payment_notification(self, influencer: dict, amount: float, transaction_id: str):
-        """Envoie une notification de paiement à l'influenceur"""
-        try:
-            # Récupérer l'email de l'utilisateur
-            user = supabase.table("users").select("email").eq("id", influencer["user_id"]).execute()
+    def _send_payment_notifications(self, paid: List[Dict]):
+        """
+        Notifie les influenceurs payés: une lecture des emails et un insert
+        groupé des notifications in-app
+        """
+        if not paid:
+            return
 
-            if user.data:
-                email = user.data[0]["email"]
+        try:
+            user_ids = [r["influencer"]["user_id"] for r in paid]
+            users = supabase.table("users").select("id, email").in_("id", user_ids).execute()
+            emails = {u["id"]: u["email"] for u in users.data or []}
+
+            notifications = []
+            for r in paid:
+                user_id = r["influencer"]["user_id"]
+                if user_id not in emails:
+                    continue
 
                 # TODO: Envoyer email via SendGrid/SMTP
-                print(f"📧 Notification envoyée à {email}: Paiement de {amount}€")
-
-                # Créer une notification in-app
-                notification_data = {
-                    "user_id": influencer["user_id"],
-                    "type": "payout_completed",
-                    "title": "Paiement effectué",
-                    "message": f"Votre paiement de {amount}€ a été traité avec succès. Référence: {transaction_id}",
-                    "is_read": False,
-                    "created_at": datetime.now().isoformat(),
-                }
+                print(f"📧 Notification envoyée à {emails[user_id]}: Paiement de {r['amount']}€")
+
+                notifications.append(
+                    {
+                        "user_id": user_id,
+                        "type": "payout_completed",
+                        "title": "Paiement effectué",
+                        "message": f"Votre paiement de {r['amount']}€ a été traité avec succès. Référence: {r['transaction_id']}",
+                        "is_read": False,
+                        "created_at": datetime.now().isoformat(),
+                    }
+                )
 
-                supabase.table("notifications").insert(notification_data).execute()
+            if notifications:
+                supabase.table("notifications").insert(notifications).execute()
 
         except Exception as e:
-            print(f"Erreur notification: {e}")
+            print(f"Erreur notifications: {e}")
 
     # ============================================
     # 5. GESTION DES RETOURS
@@ -0,0 +1,81 @@
+"""
+Points de reprise des traitements batch
+Permet à un job long (validation des ventes, commissions...) de reprendre
+là où il s'est arrêté après un crash ou un redémarrage
+
+Table: batch_job_checkpoints (database/migrations/add_batch_sale_validation.sql)
+"""
+
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TABLE = "batch_job_checkpoints"
+
+
+class BatchCheckpointStore:
+    """Lecture / écriture des points de reprise d'un job batch"""
+
+    def __init__(self, supabase_client):
+        self.supabase = supabase_client
+
+    def load(self, job_name: str) -> Optional[Dict]:
+        """
+        Retourne le checkpoint d'un run interrompu (status=running), sinon None
+        """
+        try:
+            result = (
+                self.supabase.table(CHECKPOINT_TABLE)
+                .select("*")
+                .eq("job_name", job_name)
+                .eq("status", "running")
+                .execute()
+            )
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.warning(f"⚠️ Checkpoint {job_name} illisible (reprise désactivée): {e}")
+            return None
+
+    def start(self, job_name: str, params: Dict) -> Dict:
+        """Initialise un nouveau run"""
+        checkpoint = {
+            "job_name": job_name,
+            "status": "running",
+            "cursor": {},
+            "params": params,
+            "processed": 0,
+            "started_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+        }
+        self._upsert(checkpoint)
+        return checkpoint
+
+    def save(self, job_name: str, cursor: Dict, processed: int):
+        """Enregistre la position atteinte après un chunk validé"""
+        self._upsert(
+            {
+                "job_name": job_name,
+                "cursor": cursor,
+                "processed": processed,
+                "updated_at": datetime.now().isoformat(),
+            }
+        )
+
+    def complete(self, job_name: str, processed: int):
+        """Marque le run comme terminé"""
+        self._upsert(
+            {
+                "job_name": job_name,
+                "status": "completed",
+                "processed": processed,
+                "updated_at": datetime.now().isoformat(),
+            }
+        )
+
+    def _upsert(self, data: Dict):
+        try:
+            self.supabase.table(CHECKPOINT_TABLE).upsert(data, on_conflict="job_name").execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Écriture checkpoint {data['job_name']} impossible: {e}")
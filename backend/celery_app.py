@@ -36,6 +36,7 @@ app = Celery(
         'celery_tasks.social_media_tasks',
         'celery_tasks.notification_tasks',
         'celery_tasks.report_tasks',
+        'celery_tasks.maintenance_tasks',
     ]
 )
 
@@ -119,6 +120,13 @@ app.conf.beat_schedule = {
         'schedule': crontab(hour=9, minute=0),
         'kwargs': {'days_before': 3},
     },
+
+    # Nettoyer par tranches les anciens sets de tags du cache (toutes les heures)
+    'prune-cache-tag-sets': {
+        'task': 'celery_tasks.maintenance_tasks.prune_cache_tag_sets',
+        'schedule': crontab(minute=30),
+        'kwargs': {'max_sets': 100},
+    },
 }
 
 # Configuration des routes (pour diriger certaines tâches vers des workers spécifiques)
@@ -14,6 +14,7 @@ Tasks:
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
 import os
 from datetime import datetime, timedelta
 import structlog
@@ -54,6 +55,7 @@ celery_app.conf.update(
 def send_email_async(self, to_email: str, subject: str, html_content: str, text_content: str = None):
     """
     Envoyer email en async
+    Passe par le pool SMTP du worker (connexion réutilisée d'une tâche à l'autre)
     Retry 3 fois en cas d'échec
     """
     try:
@@ -79,6 +81,39 @@ def send_email_async(self, to_email: str, subject: str, html_content: str, text_
         raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
 
 
+@celery_app.task(name="send_bulk_email_async", bind=True, max_retries=3)
+def send_bulk_email_async(self, emails: list, concurrency: int = None):
+    """
+    Envoyer un lot d'emails sur les connexions SMTP du pool
+    Seuls les emails dont l'envoi a échoué sont renvoyés au retry suivant
+    (les emails impossibles à construire sont journalisés puis abandonnés)
+    """
+    from services.email_service import email_service
+
+    result = email_service.send_many(emails, concurrency=concurrency)
+    logger.info("bulk_email_task_completed", sent=result["sent"], failed=result["failed"],
+                invalid=result["invalid"], per_second=result["per_second"])
+
+    if result["failed_emails"] and self.request.retries < self.max_retries:
+        raise self.retry(
+            args=[result["failed_emails"]],
+            kwargs={"concurrency": concurrency},
+            countdown=60 * (2 ** self.request.retries)
+        )
+
+    return {"success": result["failed"] == 0, "sent": result["sent"], "failed": result["failed"]}
+
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    """Fermer proprement les connexions SMTP gardées ouvertes par le worker"""
+    import sys
+
+    email_module = sys.modules.get("services.email_service")
+    if email_module is not None:
+        email_module.email_service.pool.close_all()
+
+
 @celery_app.task(name="send_welcome_email")
 def send_welcome_email(to_email: str, user_name: str, user_type: str):
     """Envoyer email de bienvenue"""
@@ -224,45 +259,15 @@ def calculate_commissions():
     """
     Calculer les commissions pour toutes les conversions
     Task planifiée toutes les heures
+
+    Traitement par chunks (services/commission_engine.py) sous verrou
+    d'exécution : un run encore en cours fait sauter le suivant
     """
     try:
         from supabase_client import supabase
+        from services.commission_engine import CommissionEngine
 
-        # Récupérer conversions non payées
-        result = supabase.table('conversions').select('*').eq('commission_paid', False).execute()
-
-        conversions = result.data or []
-
-        processed = 0
-        for conversion in conversions:
-            try:
-                # Calculer commission
-                order_amount = conversion.get('order_amount', 0)
-                commission_rate = conversion.get('commission_rate', 0)
-                commission = order_amount * (commission_rate / 100)
-
-                # Créer commission record
-                supabase.table('commissions').insert({
-                    'conversion_id': conversion['id'],
-                    'influencer_id': conversion['influencer_id'],
-                    'merchant_id': conversion['merchant_id'],
-                    'amount': commission,
-                    'status': 'pending',
-                    'created_at': datetime.utcnow().isoformat()
-                }).execute()
-
-                # Marquer conversion comme payée
-                supabase.table('conversions').update({
-                    'commission_paid': True
-                }).eq('id', conversion['id']).execute()
-
-                processed += 1
-
-            except Exception as e:
-                logger.error("commission_calculation_failed", conversion=conversion, error=str(e))
-
-        logger.info("commissions_calculated", total=len(conversions), processed=processed)
-        return {"total": len(conversions), "processed": processed}
+        return CommissionEngine(supabase).run()
 
     except Exception as e:
         logger.error("calculate_commissions_failed", error=str(e))
@@ -277,18 +282,19 @@ def calculate_commissions():
 def aggregate_daily_analytics():
     """
     Agréger analytics quotidiennes
-    Task planifiée à minuit
+    Task planifiée toutes les 15 minutes
+
+    Rollup incrémental (analytics_rollups.py) : seuls les jours touchés par
+    des ventes ou clics écrits depuis le dernier high-water mark sont
+    recalculés, y compris les données arrivées en retard
     """
     try:
-        from supabase_client import supabase
-
-        yesterday = (datetime.utcnow() - timedelta(days=1)).date()
+        from analytics_rollups import refresh_daily_analytics
 
-        # Agréger par utilisateur
-        # TODO: Implémenter agrégation analytics
+        result = refresh_daily_analytics()
 
-        logger.info("daily_analytics_aggregated", date=str(yesterday))
-        return {"date": str(yesterday), "success": True}
+        logger.info("daily_analytics_aggregated", **result)
+        return {**result, "success": True}
 
     except Exception as e:
         logger.error("aggregate_daily_analytics_failed", error=str(e))
@@ -409,10 +415,10 @@ celery_app.conf.beat_schedule = {
         'schedule': crontab(minute=0),
     },
 
-    # Agréger analytics - Tous les jours à minuit
+    # Agréger analytics (incrémental) - Toutes les 15 minutes
     'aggregate-daily-analytics': {
         'task': 'aggregate_daily_analytics',
-        'schedule': crontab(hour=0, minute=0),
+        'schedule': crontab(minute='*/15'),
     },
 
     # Nettoyer tokens expirés - Tous les jours à 4h
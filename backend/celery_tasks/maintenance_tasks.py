@@ -0,0 +1,41 @@
+"""
+Tâches Celery de maintenance
+
+Tâches:
+1. prune_cache_tag_sets - Nettoie par tranches les anciens sets de tags du cache Redis
+"""
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from datetime import datetime
+
+from services.cache_service import cache
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(
+    name='celery_tasks.maintenance_tasks.prune_cache_tag_sets'
+)
+def prune_cache_tag_sets(max_sets: int = 100):
+    """
+    Retirer les membres expirés des sets de tags et supprimer les sets vides
+
+    Chaque passage traite au plus `max_sets` sets et reprend au passage suivant
+
+    Args:
+        max_sets: Nombre maximum de sets visités par passage
+    """
+    logger.info(f"🧹 Pruning cache tag sets (max {max_sets})")
+
+    result = cache.prune_tag_sets(max_sets=max_sets)
+
+    logger.info(
+        f"✅ Visited {result['visited']} tag sets, "
+        f"pruned {result['pruned_members']} members, removed {result['deleted_sets']} sets"
+    )
+
+    return {
+        **result,
+        'timestamp': datetime.utcnow().isoformat()
+    }
@@ -7,7 +7,7 @@ Rapports générés:
 - Rapports d'engagement pour les marchands
 """
 
-from celery import shared_task
+from celery import group, shared_task
 from celery.utils.log import get_task_logger
 from datetime import datetime, timedelta
 from typing import Dict, List
@@ -22,65 +22,151 @@ logger = get_task_logger(__name__)
 # TÂCHES DE RAPPORTS
 # ============================================
 
+WEEKLY_REPORTS_JOB_NAME = 'weekly_social_reports'
+WEEKLY_REPORTS_CHUNK_SIZE = 500  # Influenceurs par requête groupée
+# Un run interrompu plus vieux que ça appartient à une autre semaine : on repart de zéro
+WEEKLY_REPORTS_MAX_RESUME_AGE = timedelta(days=6)
+
+# Stats de toutes les plateformes actives d'un chunk d'influenceurs (keyset sur users.id),
+# en une requête : dernière sync et dernière sync d'il y a 7 jours par fenêtre ROW_NUMBER.
+# user_id (optionnel) restreint la requête à un influenceur (rapport unitaire)
+WEEKLY_REPORTS_CHUNK_SQL = """
+    WITH targets AS (
+        SELECT u.id AS user_id, u.email, u.full_name
+        FROM users u
+        WHERE u.role = 'influencer'
+        AND (%(user_id)s::uuid IS NULL OR u.id = %(user_id)s::uuid)
+        AND (%(after_user_id)s::uuid IS NULL OR u.id > %(after_user_id)s::uuid)
+        AND EXISTS (
+            SELECT 1 FROM social_media_connections smc
+            WHERE smc.user_id = u.id AND smc.connection_status = 'active'
+        )
+        ORDER BY u.id
+        LIMIT %(limit)s
+    ),
+    connections AS (
+        SELECT smc.id, smc.user_id, smc.platform, smc.platform_username
+        FROM social_media_connections smc
+        JOIN targets t ON t.user_id = smc.user_id
+        WHERE smc.connection_status = 'active'
+    ),
+    ranked AS (
+        SELECT
+            sms.connection_id,
+            sms.followers_count,
+            sms.engagement_rate,
+            sms.total_posts,
+            ROW_NUMBER() OVER (
+                PARTITION BY sms.connection_id ORDER BY sms.synced_at DESC
+            ) AS latest_rank,
+            CASE WHEN sms.synced_at <= %(week_ago)s THEN ROW_NUMBER() OVER (
+                PARTITION BY sms.connection_id, sms.synced_at <= %(week_ago)s ORDER BY sms.synced_at DESC
+            ) END AS week_ago_rank
+        FROM social_media_stats sms
+        JOIN connections c ON c.id = sms.connection_id
+    )
+    SELECT
+        t.user_id,
+        t.email,
+        t.full_name,
+        c.platform,
+        c.platform_username,
+        MAX(r.followers_count) FILTER (WHERE r.latest_rank = 1) AS current_followers,
+        MAX(r.engagement_rate) FILTER (WHERE r.latest_rank = 1) AS current_engagement,
+        MAX(r.total_posts) FILTER (WHERE r.latest_rank = 1) AS current_posts,
+        MAX(r.followers_count) FILTER (WHERE r.week_ago_rank = 1) AS week_ago_followers,
+        MAX(r.engagement_rate) FILTER (WHERE r.week_ago_rank = 1) AS week_ago_engagement
+    FROM targets t
+    JOIN connections c ON c.user_id = t.user_id
+    LEFT JOIN ranked r ON r.connection_id = c.id AND (r.latest_rank = 1 OR r.week_ago_rank = 1)
+    GROUP BY t.user_id, t.email, t.full_name, c.id, c.platform, c.platform_username
+    ORDER BY t.user_id, c.platform
+"""
+
+
 @shared_task(
     name='celery_tasks.report_tasks.send_weekly_social_reports',
     bind=True
 )
-def send_weekly_social_reports(self):
+def send_weekly_social_reports(self, chunk_size: int = WEEKLY_REPORTS_CHUNK_SIZE):
     """
     Envoyer les rapports hebdomadaires de statistiques sociales
 
     Exécuté chaque lundi à 9h00
+
+    Traitement par chunks d'influenceurs (keyset sur users.id) : une requête
+    groupée par chunk, rapports construits en mémoire, emails envoyés par
+    lot. La position est enregistrée après chaque chunk : un run interrompu
+    (ou retenté) reprend au chunk suivant, sur la même période.
     """
     try:
         logger.info("📊 Generating weekly social media reports")
 
+        from supabase_client import supabase
+        from batch_checkpoints import BatchCheckpointStore
+
+        checkpoints = BatchCheckpointStore(supabase)
+        checkpoint = checkpoints.load(WEEKLY_REPORTS_JOB_NAME)
+
+        if checkpoint and _is_resumable(checkpoint):
+            params = checkpoint['params']
+            after_user_id = (checkpoint.get('cursor') or {}).get('user_id')
+            processed = int(checkpoint.get('processed') or 0)
+            logger.info(f"↩️  Resuming weekly reports after user {after_user_id or 'initial'}")
+        else:
+            now = datetime.now()
+            params = {
+                'week_ago': (now - timedelta(days=7)).isoformat(),
+                'period': {
+                    'start': (now - timedelta(days=7)).strftime('%d/%m/%Y'),
+                    'end': now.strftime('%d/%m/%Y')
+                },
+                'started_at': now.isoformat()
+            }
+            after_user_id = None
+            processed = 0
+            checkpoints.start(WEEKLY_REPORTS_JOB_NAME, params)
+
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Récupérer tous les influenceurs avec au moins une connexion active
-        cursor.execute("""
-            SELECT DISTINCT
-                u.id,
-                u.email,
-                u.full_name
-            FROM users u
-            JOIN social_media_connections smc ON u.id = smc.user_id
-            WHERE smc.connection_status = 'active'
-            AND u.role = 'influencer'
-        """)
-
-        influencers = cursor.fetchall()
-
-        logger.info(f"Found {len(influencers)} influencers to send reports to")
-
         reports_sent = 0
-
-        for user_id, email, full_name in influencers:
-            try:
-                # Générer le rapport pour cet influenceur
-                report_data = generate_weekly_report(user_id, cursor)
-
-                if report_data:
-                    # Envoyer l'email
-                    send_weekly_report_email.delay(
-                        email=email,
-                        full_name=full_name,
-                        report_data=report_data
-                    )
-                    reports_sent += 1
-
-            except Exception as e:
-                logger.error(f"Failed to generate report for user {user_id}: {str(e)}")
+        total_influencers = 0
+
+        while True:
+            cursor.execute(WEEKLY_REPORTS_CHUNK_SQL, {
+                'user_id': None,
+                'after_user_id': after_user_id,
+                'week_ago': params['week_ago'],
+                'limit': chunk_size
+            })
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            reports = build_weekly_reports(rows, params['period'])
+            reports_sent += _send_report_batch(reports)
+
+            chunk_users = len({row[0] for row in rows})
+            total_influencers += chunk_users
+            after_user_id = str(rows[-1][0])
+            processed += chunk_users
+            checkpoints.save(WEEKLY_REPORTS_JOB_NAME, {'user_id': after_user_id}, processed)
+
+            if chunk_users < chunk_size:
+                break
 
         cursor.close()
         conn.close()
 
+        checkpoints.complete(WEEKLY_REPORTS_JOB_NAME, processed)
+
         logger.info(f"✅ Sent {reports_sent} weekly reports")
 
         return {
-            'total_influencers': len(influencers),
+            'total_influencers': total_influencers,
             'reports_sent': reports_sent,
+            'processed': processed,
             'timestamp': datetime.utcnow().isoformat()
         }
 
@@ -89,115 +175,155 @@ def send_weekly_social_reports(self):
         raise self.retry(exc=exc)
 
 
+def _is_resumable(checkpoint: Dict) -> bool:
+    started_at = (checkpoint.get('params') or {}).get('started_at')
+    if not started_at:
+        return False
+    return datetime.now() - datetime.fromisoformat(started_at) < WEEKLY_REPORTS_MAX_RESUME_AGE
+
+
+def _send_report_batch(reports: Dict[str, Dict]) -> int:
+    """Envoyer les emails d'un chunk en un seul lot (group Celery)"""
+    signatures = [
+        send_weekly_report_email.s(
+            email=entry['email'],
+            full_name=entry['full_name'],
+            report_data=entry['report']
+        )
+        for entry in reports.values()
+    ]
+    if signatures:
+        group(signatures).apply_async()
+    return len(signatures)
+
+
+def build_weekly_reports(rows: List[tuple], period: Dict) -> Dict[str, Dict]:
+    """
+    Construire les rapports d'un chunk à partir des lignes groupées
+
+    Args:
+        rows: (user_id, email, full_name, platform, username, current_followers,
+            current_engagement, current_posts, week_ago_followers, week_ago_engagement)
+        period: {'start', 'end'} affichés dans l'email
+
+    Returns:
+        {user_id: {'email', 'full_name', 'report'}}
+    """
+    grouped = {}
+    for row in rows:
+        user_id, email, full_name = str(row[0]), row[1], row[2]
+        entry = grouped.setdefault(user_id, {'email': email, 'full_name': full_name, 'platforms': []})
+        entry['platforms'].append(row[3:])
+
+    return {
+        user_id: {
+            'email': entry['email'],
+            'full_name': entry['full_name'],
+            'report': _build_report(entry['platforms'], period)
+        }
+        for user_id, entry in grouped.items()
+    }
+
+
+def _build_report(platforms: List[tuple], period: Dict) -> Dict:
+    """Rapport d'un influenceur à partir de ses lignes par plateforme"""
+    report = {
+        'period': period,
+        'platforms': [],
+        'summary': {
+            'total_followers': 0,
+            'total_growth': 0,
+            'avg_engagement': 0,
+            'best_platform': None
+        }
+    }
+
+    total_followers = 0
+    total_growth = 0
+    total_engagement = 0
+    platforms_count = 0
+    best_platform = {'name': None, 'growth': 0}
+
+    for platform_data in platforms:
+        (platform, username, current_followers, current_engagement, current_posts,
+         week_ago_followers, week_ago_engagement) = platform_data
+
+        # Plateforme jamais synchronisée : valeurs à zéro
+        current_followers = current_followers or 0
+        current_engagement = float(current_engagement or 0)
+
+        # Calculer la croissance
+        followers_growth = 0
+        if week_ago_followers:
+            followers_growth = current_followers - week_ago_followers
+
+        engagement_change = 0
+        if week_ago_engagement:
+            engagement_change = current_engagement - float(week_ago_engagement)
+
+        # Ajouter au rapport
+        platform_report = {
+            'name': platform,
+            'username': username,
+            'followers': current_followers,
+            'followers_growth': followers_growth,
+            'engagement_rate': current_engagement,
+            'engagement_change': engagement_change,
+            'total_posts': current_posts
+        }
+        report['platforms'].append(platform_report)
+
+        # Calculer totaux
+        total_followers += current_followers
+        total_growth += followers_growth
+        total_engagement += current_engagement
+        platforms_count += 1
+
+        # Meilleure plateforme
+        if followers_growth > best_platform['growth']:
+            best_platform = {'name': platform, 'growth': followers_growth}
+
+    # Summary
+    report['summary']['total_followers'] = total_followers
+    report['summary']['total_growth'] = total_growth
+    report['summary']['avg_engagement'] = round(total_engagement / platforms_count, 2) if platforms_count > 0 else 0
+    report['summary']['best_platform'] = best_platform['name']
+
+    return report
+
+
 def generate_weekly_report(user_id: str, cursor) -> Dict:
     """
     Générer les données du rapport hebdomadaire pour un influenceur
 
+    Rapport unitaire (même requête groupée, restreinte à un utilisateur) ;
+    le job hebdomadaire passe par build_weekly_reports
+
     Returns:
         Dict avec les statistiques de la semaine
     """
     try:
-        report = {
-            'period': {
-                'start': (datetime.now() - timedelta(days=7)).strftime('%d/%m/%Y'),
-                'end': datetime.now().strftime('%d/%m/%Y')
-            },
-            'platforms': [],
-            'summary': {
-                'total_followers': 0,
-                'total_growth': 0,
-                'avg_engagement': 0,
-                'best_platform': None
-            }
+        now = datetime.now()
+        period = {
+            'start': (now - timedelta(days=7)).strftime('%d/%m/%Y'),
+            'end': now.strftime('%d/%m/%Y')
         }
 
-        # Récupérer les stats de chaque plateforme
-        cursor.execute("""
-            SELECT
-                smc.platform,
-                smc.platform_username,
-                -- Stats actuelles (dernière sync)
-                latest.followers_count as current_followers,
-                latest.engagement_rate as current_engagement,
-                latest.total_posts as current_posts,
-                -- Stats d'il y a 7 jours
-                week_ago.followers_count as week_ago_followers,
-                week_ago.engagement_rate as week_ago_engagement
-            FROM social_media_connections smc
-            -- Dernière stats
-            LEFT JOIN LATERAL (
-                SELECT followers_count, engagement_rate, total_posts
-                FROM social_media_stats
-                WHERE connection_id = smc.id
-                ORDER BY synced_at DESC
-                LIMIT 1
-            ) latest ON TRUE
-            -- Stats d'il y a 7 jours
-            LEFT JOIN LATERAL (
-                SELECT followers_count, engagement_rate
-                FROM social_media_stats
-                WHERE connection_id = smc.id
-                AND synced_at <= NOW() - INTERVAL '7 days'
-                ORDER BY synced_at DESC
-                LIMIT 1
-            ) week_ago ON TRUE
-            WHERE smc.user_id = %s
-            AND smc.connection_status = 'active'
-        """, (user_id,))
-
-        platforms = cursor.fetchall()
-
-        if not platforms:
-            return None
-
-        total_followers = 0
-        total_growth = 0
-        total_engagement = 0
-        platforms_count = 0
-        best_platform = {'name': None, 'growth': 0}
-
-        for platform_data in platforms:
-            (platform, username, current_followers, current_engagement, current_posts,
-             week_ago_followers, week_ago_engagement) = platform_data
-
-            # Calculer la croissance
-            followers_growth = 0
-            if week_ago_followers:
-                followers_growth = current_followers - week_ago_followers
-
-            engagement_change = 0
-            if week_ago_engagement:
-                engagement_change = current_engagement - week_ago_engagement
-
-            # Ajouter au rapport
-            platform_report = {
-                'name': platform,
-                'username': username,
-                'followers': current_followers,
-                'followers_growth': followers_growth,
-                'engagement_rate': current_engagement,
-                'engagement_change': engagement_change,
-                'total_posts': current_posts
+        cursor.execute(
+            WEEKLY_REPORTS_CHUNK_SQL,
+            {
+                'user_id': user_id,
+                'after_user_id': None,
+                'week_ago': (now - timedelta(days=7)).isoformat(),
+                'limit': 1
             }
-            report['platforms'].append(platform_report)
-
-            # Calculer totaux
-            total_followers += current_followers
-            total_growth += followers_growth
-            total_engagement += current_engagement
-            platforms_count += 1
-
-            # Meilleure plateforme
-            if followers_growth > best_platform['growth']:
-                best_platform = {'name': platform, 'growth': followers_growth}
+        )
+        rows = cursor.fetchall()
 
-        # Summary
-        report['summary']['total_followers'] = total_followers
-        report['summary']['total_growth'] = total_growth
-        report['summary']['avg_engagement'] = round(total_engagement / platforms_count, 2) if platforms_count > 0 else 0
-        report['summary']['best_platform'] = best_platform['name']
+        if not rows:
+            return None
 
-        return report
+        return build_weekly_reports(rows, period)[str(rows[0][0])]['report']
 
     except Exception as e:
         logger.error(f"Error generating report for user {user_id}: {str(e)}")
@@ -0,0 +1,278 @@
+"""
+Ingestion des clics par lots
+Collecte les évènements de clic émis par /r/{short_code} et les persiste en bulk
+
+- Tampon en mémoire (asyncio.Queue bornée) ou Redis Stream si REDIS_URL est configuré
+- Flush toutes les CLICK_FLUSH_INTERVAL_MS ou dès CLICK_FLUSH_BATCH_SIZE évènements
+- Un flush = un INSERT multi-lignes + un incrément agrégé par lien
+- Backpressure: submit() refuse l'évènement quand le tampon est plein
+  (l'appelant retombe alors sur l'écriture directe)
+- Vidage complet du tampon à l'arrêt du serveur
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CLICK_FLUSH_INTERVAL_MS = int(os.getenv("CLICK_FLUSH_INTERVAL_MS", "250"))
+CLICK_FLUSH_BATCH_SIZE = int(os.getenv("CLICK_FLUSH_BATCH_SIZE", "500"))
+CLICK_BUFFER_MAX_SIZE = int(os.getenv("CLICK_BUFFER_MAX_SIZE", "50000"))
+CLICK_STREAM_KEY = "sysales:clicks"
+CLICK_STREAM_GROUP = "click-ingestion"
+CLICK_STREAM_CLAIM_IDLE_MS = 60_000  # Reprise des évènements d'un worker mort
+CLICK_DRAIN_MAX_ATTEMPTS = 3  # Tentatives de flush à l'arrêt avant abandon
+
+
+class ClickIngestionQueue:
+    """File d'ingestion des clics avec flush groupé"""
+
+    def __init__(
+        self,
+        flush_func: Callable[[List[Dict]], int],
+        batch_size: int = CLICK_FLUSH_BATCH_SIZE,
+        flush_interval_ms: int = CLICK_FLUSH_INTERVAL_MS,
+        max_buffer: int = CLICK_BUFFER_MAX_SIZE,
+        redis_url: Optional[str] = None,
+    ):
+        """
+        Args:
+            flush_func: Fonction synchrone persistant un lot (exécutée dans un thread)
+            batch_size: Nombre max d'évènements par flush
+            flush_interval_ms: Délai max avant flush d'un lot incomplet
+            max_buffer: Capacité du tampon (au-delà: backpressure)
+            redis_url: URL Redis pour utiliser un stream partagé entre workers
+        """
+        self.flush_func = flush_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffer = max_buffer
+        self.redis_url = redis_url
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._redis = None
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._stream_backlog = 0
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._drain_failures = 0
+
+        self.stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "flushed": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "memory"
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    # ============================================
+    # CYCLE DE VIE
+    # ============================================
+
+    async def start(self):
+        """Démarre le worker de flush (appelé au démarrage du serveur)"""
+        if self.running:
+            return
+
+        self._stopping = False
+        self._drain_failures = 0
+        self._queue = asyncio.Queue(maxsize=self.max_buffer)
+
+        if self.redis_url:
+            try:
+                import redis.asyncio as aioredis
+
+                self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+                try:
+                    await self._redis.xgroup_create(
+                        CLICK_STREAM_KEY, CLICK_STREAM_GROUP, id="0", mkstream=True
+                    )
+                except Exception as e:
+                    if "BUSYGROUP" not in str(e):
+                        raise
+            except Exception as e:
+                logger.warning(f"⚠️ Redis indisponible pour l'ingestion des clics, tampon mémoire: {e}")
+                self._redis = None
+
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"🖱️ Ingestion des clics démarrée (backend: {self.backend})")
+
+    async def stop(self):
+        """Arrête le worker après avoir vidé le tampon"""
+        self._stopping = True
+        if self._worker is not None:
+            await self._worker
+            self._worker = None
+
+        if self._queue is not None and not self._queue.empty():
+            logger.error(f"❌ {self._queue.qsize()} clics non persistés à l'arrêt")
+
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+        logger.info(
+            f"🛑 Ingestion des clics arrêtée ({self.stats['flushed']} clics persistés, "
+            f"{self.stats['rejected']} refusés)"
+        )
+
+    # ============================================
+    # PRODUCTION
+    # ============================================
+
+    async def submit(self, click: Dict) -> bool:
+        """
+        Ajoute un clic au tampon sans jamais attendre
+
+        Returns:
+            False si la file n'est pas démarrée ou si le tampon est plein
+        """
+        if not self.running or self._stopping:
+            return False
+
+        if self._redis is not None:
+            if self._stream_backlog >= self.max_buffer:
+                self.stats["rejected"] += 1
+                return False
+            try:
+                await self._redis.xadd(CLICK_STREAM_KEY, {"click": json.dumps(click)})
+            except Exception as e:
+                logger.error(f"Erreur XADD clic: {e}")
+                self.stats["rejected"] += 1
+                return False
+            self._stream_backlog += 1
+        else:
+            try:
+                self._queue.put_nowait(click)
+            except asyncio.QueueFull:
+                self.stats["rejected"] += 1
+                return False
+
+        self.stats["submitted"] += 1
+        return True
+
+    # ============================================
+    # CONSOMMATION
+    # ============================================
+
+    async def _run(self):
+        while True:
+            if self._redis is not None:
+                drained = await self._consume_stream()
+            else:
+                drained = await self._consume_memory()
+
+            if self._stopping and drained:
+                return
+
+    async def _consume_memory(self) -> bool:
+        """Constitue un lot depuis la file mémoire. Retourne True si la file est vide."""
+        batch: List[Dict] = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or (self._stopping and self._queue.empty()):
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        if batch and not await self._flush(batch):
+            # Remise en file du lot (dans la limite de la capacité)
+            for click in batch:
+                try:
+                    self._queue.put_nowait(click)
+                except asyncio.QueueFull:
+                    self.stats["rejected"] += 1
+            if self._stopping:
+                self._drain_failures += 1
+                if self._drain_failures >= CLICK_DRAIN_MAX_ATTEMPTS:
+                    return True
+            await asyncio.sleep(self.flush_interval)
+
+        return self._queue.empty()
+
+    async def _consume_stream(self) -> bool:
+        """Constitue un lot depuis le Redis Stream. Retourne True si le stream est vide."""
+        try:
+            entries = []
+            # Reprise des évènements laissés en attente par un worker arrêté
+            claimed = await self._redis.xautoclaim(
+                CLICK_STREAM_KEY,
+                CLICK_STREAM_GROUP,
+                self._consumer,
+                min_idle_time=CLICK_STREAM_CLAIM_IDLE_MS,
+                count=self.batch_size,
+            )
+            entries.extend(claimed[1] if claimed else [])
+
+            if len(entries) < self.batch_size:
+                response = await self._redis.xreadgroup(
+                    CLICK_STREAM_GROUP,
+                    self._consumer,
+                    {CLICK_STREAM_KEY: ">"},
+                    count=self.batch_size - len(entries),
+                    block=None if self._stopping else int(self.flush_interval * 1000),
+                )
+                for _, stream_entries in response or []:
+                    entries.extend(stream_entries)
+
+            self._stream_backlog = await self._redis.xlen(CLICK_STREAM_KEY)
+        except Exception as e:
+            logger.error(f"Erreur lecture stream clics: {e}")
+            await asyncio.sleep(self.flush_interval)
+            return self._stopping
+
+        if not entries:
+            return True
+
+        ids = [entry_id for entry_id, _ in entries]
+        batch = [json.loads(fields["click"]) for _, fields in entries if fields]
+
+        if await self._flush(batch):
+            await self._redis.xack(CLICK_STREAM_KEY, CLICK_STREAM_GROUP, *ids)
+            await self._redis.xdel(CLICK_STREAM_KEY, *ids)
+            self._stream_backlog = max(0, self._stream_backlog - len(ids))
+        elif self._stopping:
+            # Les évènements restent en attente dans le stream (repris par xautoclaim)
+            return True
+
+        return False
+
+    async def _flush(self, batch: List[Dict]) -> bool:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.flush_func, batch)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.error(f"Erreur flush de {len(batch)} clics: {e}")
+            return False
+
+        self.stats["flushed"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return True
+
+    def get_stats(self) -> Dict:
+        """Statistiques d'ingestion"""
+        pending = self._stream_backlog if self._redis is not None else (
+            self._queue.qsize() if self._queue is not None else 0
+        )
+        return {**self.stats, "backend": self.backend, "pending": pending}
@@ -0,0 +1,176 @@
+"""
+Agrégats journaliers du dashboard
+Lecture des buckets (plateforme / merchant / influenceur) maintenus par les
+triggers sur sales et conversions
+
+Table: dashboard_daily_stats (database/migrations/add_dashboard_daily_stats.sql)
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from supabase_client import supabase
+
+ROLLUP_TABLE = "dashboard_daily_stats"
+PLATFORM_SCOPE_ID = "*"
+
+BUCKET_FIELDS = (
+    "sales_count",
+    "sales_amount",
+    "conversions_count",
+    "conversions_completed",
+    "commission_amount",
+    "platform_commission",
+    "influencer_commission",
+    "merchant_revenue",
+)
+
+REVENUE_FIELDS = (
+    "platform_commission",
+    "influencer_commission",
+    "merchant_revenue",
+    "sales_amount",
+    "sales_count",
+)
+
+
+def get_daily_buckets(
+    scope_type: str,
+    scope_id: Optional[str] = PLATFORM_SCOPE_ID,
+    since: Optional[date] = None,
+    fields: Iterable[str] = BUCKET_FIELDS,
+    until: Optional[date] = None,
+) -> List[Dict]:
+    """
+    Retourne les buckets journaliers d'un périmètre (un par jour actif)
+    scope_id=None retourne les buckets de tous les périmètres du type
+
+    Lève une exception si la table est absente : l'appelant décide du repli
+    """
+    query = (
+        supabase.table(ROLLUP_TABLE)
+        .select(",".join(("scope_id", "day") + tuple(fields)))
+        .eq("scope_type", scope_type)
+    )
+    if scope_id is not None:
+        query = query.eq("scope_id", str(scope_id))
+    if since:
+        query = query.gte("day", since.isoformat())
+    if until:
+        query = query.lte("day", until.isoformat())
+    return query.execute().data or []
+
+
+def sum_buckets(
+    buckets: List[Dict],
+    fields: Iterable[str] = BUCKET_FIELDS,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> Dict[str, float]:
+    """Somme les champs des buckets dont le jour est dans [since, until["""
+    totals = {field: 0.0 for field in fields}
+    for bucket in buckets:
+        day = bucket.get("day")
+        if since and day < since.isoformat():
+            continue
+        if until and day >= until.isoformat():
+            continue
+        for field in totals:
+            totals[field] += float(bucket.get(field) or 0)
+    return totals
+
+
+def get_platform_revenue_rollup(
+    start_day: Optional[date] = None,
+    end_day: Optional[date] = None,
+    top: int = 20,
+) -> Dict:
+    """
+    Revenus plateforme sur [start_day, end_day] (bornes incluses) :
+    totaux + top N merchants par commission plateforme
+
+    Agrégé côté base (RPC platform_revenue_rollup) ; repli sur la somme des
+    buckets si la fonction n'est pas déployée, puis sur les ventes brutes si
+    les buckets de revenus n'existent pas non plus
+    """
+    try:
+        result = supabase.rpc(
+            "platform_revenue_rollup",
+            {
+                "p_start_day": start_day.isoformat() if start_day else None,
+                "p_end_day": end_day.isoformat() if end_day else None,
+                "p_top": top,
+            },
+        ).execute()
+        rollup = result.data or {}
+        summary = {field: float(rollup.get("summary", {}).get(field) or 0) for field in REVENUE_FIELDS}
+        by_merchant = [
+            {
+                "merchant_id": row["merchant_id"],
+                **{field: float(row.get(field) or 0) for field in REVENUE_FIELDS},
+            }
+            for row in rollup.get("by_merchant") or []
+        ]
+    except Exception as e:
+        print(f"platform_revenue_rollup RPC unavailable, summing buckets: {e}")
+        try:
+            summary, by_merchant = _revenue_from_buckets(start_day, end_day)
+        except Exception as e:
+            # Migration add_dashboard_daily_stats.sql / add_platform_revenue_rollup.sql non appliquée
+            print(f"Revenue buckets unavailable, scanning sales: {e}")
+            summary, by_merchant = _revenue_from_sales(start_day, end_day)
+
+    by_merchant.sort(key=lambda row: row["platform_commission"], reverse=True)
+    return {"summary": summary, "by_merchant": by_merchant[:top]}
+
+
+def _revenue_from_buckets(start_day: Optional[date], end_day: Optional[date]) -> Tuple[Dict, List[Dict]]:
+    """Totaux et répartition par merchant depuis dashboard_daily_stats"""
+    summary = sum_buckets(
+        get_daily_buckets("platform", since=start_day, until=end_day, fields=REVENUE_FIELDS),
+        REVENUE_FIELDS,
+    )
+    per_merchant: Dict[str, List[Dict]] = {}
+    for bucket in get_daily_buckets(
+        "merchant", None, since=start_day, until=end_day, fields=REVENUE_FIELDS
+    ):
+        per_merchant.setdefault(bucket["scope_id"], []).append(bucket)
+    by_merchant = [
+        {"merchant_id": merchant_id, **sum_buckets(buckets, REVENUE_FIELDS)}
+        for merchant_id, buckets in per_merchant.items()
+    ]
+    return summary, [row for row in by_merchant if row["sales_count"] > 0]
+
+
+def _revenue_from_sales(start_day: Optional[date], end_day: Optional[date]) -> Tuple[Dict, List[Dict]]:
+    """Mêmes agrégats calculés sur les ventes complétées (mêmes bornes au jour près)"""
+    query = (
+        supabase.table("sales")
+        .select("merchant_id, amount, platform_commission, influencer_commission, merchant_revenue")
+        .eq("status", "completed")
+    )
+    if start_day:
+        query = query.gte("created_at", start_day.isoformat())
+    if end_day:
+        query = query.lt("created_at", (end_day + timedelta(days=1)).isoformat())
+    sales = query.execute().data or []
+
+    summary = {field: 0.0 for field in REVENUE_FIELDS}
+    per_merchant: Dict[str, Dict[str, float]] = {}
+    for sale in sales:
+        values = {
+            "platform_commission": float(sale.get("platform_commission") or 0),
+            "influencer_commission": float(sale.get("influencer_commission") or 0),
+            "merchant_revenue": float(sale.get("merchant_revenue") or 0),
+            "sales_amount": float(sale.get("amount") or 0),
+            "sales_count": 1,
+        }
+        targets = [summary]
+        if sale.get("merchant_id"):
+            targets.append(per_merchant.setdefault(sale["merchant_id"], {field: 0.0 for field in REVENUE_FIELDS}))
+        for totals in targets:
+            for field, value in values.items():
+                totals[field] += value
+
+    by_merchant = [{"merchant_id": merchant_id, **totals} for merchant_id, totals in per_merchant.items()]
+    return summary, by_merchant
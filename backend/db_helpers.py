@@ -7,6 +7,22 @@ from supabase_client import supabase
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import bcrypt
+import os
+import time
+
+from dashboard_rollups import get_daily_buckets, sum_buckets
+from services.cache_engine import CacheEngine
+from subscription_entitlements import record_usage
+
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# Délai max avant qu'un changement de rôle fait par un autre processus révoque les tokens
+TOKEN_VERSION_CACHE_TTL = int(os.getenv("TOKEN_VERSION_CACHE_TTL", "5"))
+
+# Utilisateurs authentifiés (sans password_hash) et token_version courants,
+# locaux au processus (invalidate_principal n'atteint que ce processus : les
+# autres voient le changement après TOKEN_VERSION_CACHE_TTL / PRINCIPAL_CACHE_TTL)
+principal_cache = CacheEngine(max_entries=PRINCIPAL_CACHE_SIZE, refresh_workers=1)
 
 # ============================================
 # USERS
@@ -33,6 +49,72 @@ def get_user_by_id(user_id: str) -> Optional[Dict]:
         return None
 
 
+def sanitize_user(user: Dict) -> Dict:
+    """Copie de l'utilisateur sans données sensibles"""
+    return {k: v for k, v in user.items() if k != "password_hash"}
+
+
+def get_principal(user_id: str, token_version: int = 0) -> Optional[Dict]:
+    """
+    Utilisateur authentifié, mis en cache PRINCIPAL_CACHE_TTL secondes
+
+    La clé inclut la version du token : un token émis avant un changement
+    de rôle (version incrémentée) ne retrouve jamais l'entrée d'un token récent
+    """
+    def load():
+        user = get_user_by_id(user_id)
+        return sanitize_user(user) if user else None
+
+    principal = principal_cache.get_or_load(
+        f"principal:{user_id}:{token_version}",
+        load,
+        ttl=PRINCIPAL_CACHE_TTL,
+        tags=[f"principal:{user_id}"],
+        use_l2=False,
+    )
+    # Copie : les endpoints peuvent modifier le dict retourné
+    return dict(principal) if principal else None
+
+
+def get_token_version(user_id: str) -> Optional[int]:
+    """
+    token_version courant de l'utilisateur (None s'il n'existe pas)
+
+    Lecture d'une seule colonne, en cache TOKEN_VERSION_CACHE_TTL secondes :
+    c'est elle qui révoque les tokens émis avant un changement de rôle
+    """
+    def load():
+        try:
+            result = supabase.table("users").select("token_version").eq("id", user_id).execute()
+        except Exception as e:
+            # Migration add_users_token_version.sql non appliquée
+            print(f"⚠️  token_version indisponible: {e}")
+            user = get_user_by_id(user_id)
+            return {"token_version": user.get("token_version", 0)} if user else None
+        if not result.data:
+            return None
+        return {"token_version": result.data[0].get("token_version") or 0}
+
+    entry = principal_cache.get_or_load(
+        f"token_version:{user_id}",
+        load,
+        ttl=TOKEN_VERSION_CACHE_TTL,
+        tags=[f"principal:{user_id}"],
+        use_l2=False,
+    )
+    return entry["token_version"] if entry else None
+
+
+def invalidate_principal(user_id: str):
+    """
+    Retire les entrées en cache d'un utilisateur (principal et token_version)
+
+    Ce processus seulement : les autres workers voient la révocation après
+    TOKEN_VERSION_CACHE_TTL secondes au plus
+    """
+    principal_cache.invalidate_tag(f"principal:{user_id}", local_only=True)
+
+
 def create_user(email: str, password: str, role: str, **kwargs) -> Optional[Dict]:
     """Crée un nouvel utilisateur"""
     try:
@@ -124,17 +206,34 @@ def hash_password(password: str) -> str:
 
 
 def update_user(user_id: str, updates: Dict[str, Any]) -> bool:
-    """Met à jour les informations d'un utilisateur"""
+    """
+    Met à jour les informations d'un utilisateur
+
+    Un changement de rôle change aussi token_version : les tokens émis
+    avant sont refusés
+    """
     try:
         # Ajouter updated_at automatiquement
         updates["updated_at"] = datetime.now().isoformat()
 
+        if "role" in updates:
+            try:
+                supabase.table("users").update(
+                    {**updates, "token_version": int(time.time())}
+                ).eq("id", user_id).execute()
+                return True
+            except Exception as e:
+                # Migration add_users_token_version.sql non appliquée
+                print(f"⚠️  token_version indisponible, mise à jour simple: {e}")
+
         # Exécuter la mise à jour
         supabase.table("users").update(updates).eq("id", user_id).execute()
         return True
     except Exception as e:
         print(f"Error updating user: {e}")
         return False
+    finally:
+        invalidate_principal(user_id)
 
 
 def update_user_last_login(user_id: str):
@@ -443,6 +542,8 @@ def create_affiliate_link(product_id: str, influencer_id: str, unique_code: str)
         }
 
         result = supabase.table("trackable_links").insert(link_data).execute()
+        if result.data:
+            record_usage("influencer", influencer_id, "links")
         return result.data[0] if result.data else None
     except Exception as e:
         print(f"Error creating affiliate link: {e}")
@@ -490,6 +591,8 @@ def create_campaign(merchant_id: str, name: str, **kwargs) -> Optional[Dict]:
         }
 
         result = supabase.table("campaigns").insert(campaign_data).execute()
+        if result.data:
+            record_usage("merchant", merchant_id, "campaigns")
         return result.data[0] if result.data else None
     except Exception as e:
         print(f"Error creating campaign: {e}")
@@ -501,32 +604,127 @@ def create_campaign(merchant_id: str, name: str, **kwargs) -> Optional[Dict]:
 # ============================================
 
 
+def _completed_sales_total(merchant_id: Optional[str] = None) -> float:
+    """Somme des ventes complétées (plateforme ou merchant)"""
+    try:
+        if merchant_id:
+            buckets = get_daily_buckets("merchant", merchant_id, fields=("sales_amount",))
+        else:
+            buckets = get_daily_buckets("platform", fields=("sales_amount",))
+        return sum_buckets(buckets, ("sales_amount",))["sales_amount"]
+    except Exception as e:
+        print(f"Dashboard rollup unavailable, scanning sales: {e}")
+
+    # Repli: agrégats absents (migration non appliquée)
+    query = supabase.table("sales").select("amount").eq("status", "completed")
+    if merchant_id:
+        query = query.eq("merchant_id", merchant_id)
+    sales = query.execute()
+    return sum([float(s.get("amount") or 0) for s in sales.data]) if sales.data else 0
+
+
+def _influencer_conversion_windows(influencer_id: str) -> Dict[str, Dict[str, float]]:
+    """
+    Totaux des conversions d'un influenceur: historique complet, 30 derniers
+    jours et 30 jours précédents
+    """
+    from datetime import timedelta
+
+    fields = ("conversions_count", "conversions_completed", "commission_amount")
+    now = datetime.now()
+    thirty_days_ago = now - timedelta(days=30)
+    sixty_days_ago = now - timedelta(days=60)
+
+    try:
+        buckets = get_daily_buckets("influencer", influencer_id, fields=fields)
+        return {
+            "total": sum_buckets(buckets, fields),
+            "recent": sum_buckets(buckets, fields, since=thirty_days_ago.date()),
+            "previous": sum_buckets(
+                buckets, fields, since=sixty_days_ago.date(), until=thirty_days_ago.date()
+            ),
+        }
+    except Exception as e:
+        print(f"Dashboard rollup unavailable, scanning conversions: {e}")
+
+    # Repli: agrégats absents (migration non appliquée)
+    conversions_result = (
+        supabase.table("conversions")
+        .select("status, commission_amount, created_at")
+        .eq("influencer_id", influencer_id)
+        .execute()
+    )
+    windows = {name: {field: 0.0 for field in fields} for name in ("total", "recent", "previous")}
+    for c in conversions_result.data or []:
+        created_at = datetime.fromisoformat(
+            (c.get("created_at") or "1970-01-01").replace("Z", "+00:00")
+        ).replace(tzinfo=None)
+        targets = ["total"]
+        if created_at >= thirty_days_ago:
+            targets.append("recent")
+        elif created_at >= sixty_days_ago:
+            targets.append("previous")
+        completed = c.get("status") == "completed"
+        for name in targets:
+            windows[name]["conversions_count"] += 1
+            if completed:
+                windows[name]["conversions_completed"] += 1
+                windows[name]["commission_amount"] += float(c.get("commission_amount") or 0)
+    return windows
+
+
+def _growth(recent: float, previous: float) -> float:
+    if previous > 0:
+        return ((recent - previous) / previous) * 100
+    return 0
+
+
 def get_dashboard_stats(role: str, user_id: str) -> Dict:
-    """Récupère les statistiques pour le dashboard selon le rôle"""
+    """
+    Récupère les statistiques pour le dashboard selon le rôle
+
+    Les montants viennent de dashboard_daily_stats (buckets journaliers tenus à
+    jour par triggers): le coût ne dépend plus de l'historique du compte
+    """
     try:
         if role == "admin":
             # Stats admin depuis la table users
-            users_count = supabase.table("users").select("id", count="exact").execute().count or 0
-            
+            users_count = (
+                supabase.table("users").select("id", count="exact", head=True).execute().count or 0
+            )
+
             # Compter les merchants
             merchants_count = (
-                supabase.table("users").select("id", count="exact").eq("role", "merchant").execute().count or 0
+                supabase.table("users")
+                .select("id", count="exact", head=True)
+                .eq("role", "merchant")
+                .execute()
+                .count
+                or 0
             )
-            
+
             # Compter les influencers
             influencers_count = (
-                supabase.table("users").select("id", count="exact").eq("role", "influencer").execute().count or 0
+                supabase.table("users")
+                .select("id", count="exact", head=True)
+                .eq("role", "influencer")
+                .execute()
+                .count
+                or 0
             )
-            
+
             # Compter les produits
-            products_count = supabase.table("products").select("id", count="exact").execute().count or 0
+            products_count = (
+                supabase.table("products").select("id", count="exact", head=True).execute().count or 0
+            )
 
             # Compter les services
-            services_count = supabase.table("services").select("id", count="exact").execute().count or 0
+            services_count = (
+                supabase.table("services").select("id", count="exact", head=True).execute().count or 0
+            )
 
-            # Revenue total (sum des sales)
-            sales = supabase.table("sales").select("amount").eq("status", "completed").execute()
-            total_revenue = sum([float(s.get("amount", 0)) for s in sales.data]) if sales.data else 0
+            # Revenue total (buckets plateforme)
+            total_revenue = _completed_sales_total()
 
             return {
                 "total_users": users_count,
@@ -545,20 +743,13 @@ def get_dashboard_stats(role: str, user_id: str) -> Dict:
 
             products_count = (
                 supabase.table("products")
-                .select("id", count="exact")
+                .select("id", count="exact", head=True)
                 .eq("merchant_id", merchant["id"])
                 .execute()
                 .count
             )
 
-            sales = (
-                supabase.table("sales")
-                .select("amount")
-                .eq("merchant_id", merchant["id"])
-                .eq("status", "completed")
-                .execute()
-            )
-            total_sales = sum([s["amount"] for s in sales.data]) if sales.data else 0
+            total_sales = _completed_sales_total(merchant["id"])
 
             return {
                 "total_sales": total_sales,
@@ -574,56 +765,31 @@ def get_dashboard_stats(role: str, user_id: str) -> Dict:
                 user_result = supabase.table("users").select("influencer_id, id").eq("id", user_id).single().execute()
                 if not user_result.data:
                     return {}
-                
+
                 influencer_id = user_result.data.get("influencer_id") or user_result.data.get("id")
-                
-                # Stats depuis la table conversions (remplace click_tracking)
-                conversions_result = supabase.table("conversions").select("*").eq("influencer_id", influencer_id).execute()
-                conversions = conversions_result.data if conversions_result.data else []
-                
-                # Compter les clics (chaque conversion = 1 clic)
-                total_clicks = len(conversions)
-                
-                # Compter les ventes (conversions avec status = 'completed')
-                total_sales = len([c for c in conversions if c.get("status") == "completed"])
-                
-                # Calculer les earnings depuis les conversions
-                total_earnings = sum([float(c.get("commission_amount", 0)) for c in conversions if c.get("status") == "completed"])
-                
+
+                # Stats depuis les buckets de conversions (chaque conversion = 1 clic)
+                windows = _influencer_conversion_windows(influencer_id)
+                total, recent, previous = windows["total"], windows["recent"], windows["previous"]
+
+                total_clicks = int(total["conversions_count"])
+                total_sales = int(total["conversions_completed"])
+                total_earnings = total["commission_amount"]
+
                 # Calculer le balance: earnings - payouts payés
                 payouts_result = supabase.table("payouts").select("amount").eq("influencer_id", influencer_id).eq("status", "paid").execute()
                 payouts = payouts_result.data if payouts_result.data else []
                 total_paid = sum([float(p.get("amount", 0)) for p in payouts])
                 balance = total_earnings - total_paid
-                
-                # Calculer les croissances (comparaison 30 derniers jours vs 30 jours précédents)
-                from datetime import datetime, timedelta
-                now = datetime.now()
-                thirty_days_ago = now - timedelta(days=30)
-                sixty_days_ago = now - timedelta(days=60)
-                
-                # Conversions des 30 derniers jours
-                recent_conversions = [c for c in conversions if datetime.fromisoformat(c.get("created_at", "1970-01-01").replace("Z", "+00:00")) >= thirty_days_ago]
-                previous_conversions = [c for c in conversions if sixty_days_ago <= datetime.fromisoformat(c.get("created_at", "1970-01-01").replace("Z", "+00:00")) < thirty_days_ago]
-                
-                # Calcul des croissances
+
+                # Croissances: 30 derniers jours vs 30 jours précédents
                 earnings_growth = 0
-                if len(previous_conversions) > 0:
-                    recent_earnings = sum([float(c.get("commission_amount", 0)) for c in recent_conversions if c.get("status") == "completed"])
-                    previous_earnings = sum([float(c.get("commission_amount", 0)) for c in previous_conversions if c.get("status") == "completed"])
-                    if previous_earnings > 0:
-                        earnings_growth = ((recent_earnings - previous_earnings) / previous_earnings) * 100
-                
                 clicks_growth = 0
-                if len(previous_conversions) > 0:
-                    clicks_growth = ((len(recent_conversions) - len(previous_conversions)) / len(previous_conversions)) * 100
-                
-                sales_growth = 0
-                recent_sales = len([c for c in recent_conversions if c.get("status") == "completed"])
-                previous_sales = len([c for c in previous_conversions if c.get("status") == "completed"])
-                if previous_sales > 0:
-                    sales_growth = ((recent_sales - previous_sales) / previous_sales) * 100
-                
+                if previous["conversions_count"] > 0:
+                    earnings_growth = _growth(recent["commission_amount"], previous["commission_amount"])
+                    clicks_growth = _growth(recent["conversions_count"], previous["conversions_count"])
+                sales_growth = _growth(recent["conversions_completed"], previous["conversions_completed"])
+
                 return {
                     "total_earnings": total_earnings,
                     "total_clicks": total_clicks,
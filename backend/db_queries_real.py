@@ -4,8 +4,11 @@ Remplace toutes les données statiques par des requêtes Supabase réelles
 """
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timedelta
+import asyncio
 from supabase_client import get_supabase_client
+from supabase_async import get_async_supabase_client
 from utils.db_safe import safe_ilike
+from subscription_entitlements import record_usage
 
 # ============================================
 # ANALYTICS - INFLUENCER
@@ -396,10 +399,10 @@ async def get_user_payouts(user_id: str) -> List[Dict[str, Any]]:
     Liste des demandes de payout d'un influenceur
     """
     try:
-        supabase = get_supabase_client()
+        supabase = get_async_supabase_client()
         
         # Récupérer influencer_id
-        influencer_response = supabase.table("influencers") \
+        influencer_response = await supabase.table("influencers") \
             .select("id") \
             .eq("user_id", user_id) \
             .single() \
@@ -412,7 +415,7 @@ async def get_user_payouts(user_id: str) -> List[Dict[str, Any]]:
         
         # Récupérer les payouts (table à créer si elle n'existe pas)
         # Pour l'instant, on utilise les commissions avec status = "paid"
-        payouts_response = supabase.table("commissions") \
+        payouts_response = await supabase.table("commissions") \
             .select("*") \
             .eq("influencer_id", influencer_id) \
             .in_("status", ["approved", "paid"]) \
@@ -548,6 +551,7 @@ async def create_affiliate_link(
             return {"success": False, "error": "Failed to create link"}
         
         created_link = link_response.data[0]
+        record_usage("influencer", influencer_id, "links")
         
         return {
             "success": True,
@@ -805,6 +809,7 @@ async def create_product(merchant_id: str, product_data: Dict[str, Any]) -> Dict
             .execute()
         
         created_product = product_response.data[0]
+        record_usage("merchant", merchant_id, "products")
         
         return {
             "success": True,
@@ -1595,29 +1600,44 @@ async def get_admin_stats() -> Dict[str, Any]:
     Récupérer les statistiques globales de la plateforme (admin)
     """
     try:
-        supabase = get_supabase_client()
-        
-        # Compter les utilisateurs par rôle
-        users_response = supabase.table("users").select("role", count="exact").execute()
-        total_users = users_response.count if users_response.count else 0
-        
-        merchants_count = supabase.table("users").select("id", count="exact").eq("role", "merchant").execute().count or 0
-        influencers_count = supabase.table("users").select("id", count="exact").eq("role", "influencer").execute().count or 0
-        admins_count = supabase.table("users").select("id", count="exact").eq("role", "admin").execute().count or 0
-        
-        # Compter les produits
-        products_response = supabase.table("products").select("id", count="exact").execute()
-        total_products = products_response.count if products_response.count else 0
-        
-        # Compter les liens d'affiliation
-        links_response = supabase.table("trackable_links").select("id", count="exact").execute()
-        total_links = links_response.count if links_response.count else 0
-        
+        supabase = get_async_supabase_client()
+
+        def count(table: str, **filters):
+            query = supabase.table(table).select("id", count="exact", head=True)
+            for column, value in filters.items():
+                query = query.eq(column, value)
+            return query.execute()
+
+        # Comptages lancés en parallèle sur le pool de connexions
+        (
+            users_response,
+            merchants_response,
+            influencers_response,
+            admins_response,
+            products_response,
+            links_response,
+            sales_response,
+        ) = await asyncio.gather(
+            count("users"),
+            count("users", role="merchant"),
+            count("users", role="influencer"),
+            count("users", role="admin"),
+            count("products"),
+            count("trackable_links"),
+            supabase.table("sales").select("amount, platform_commission").execute(),
+        )
+
+        total_users = users_response.count or 0
+        merchants_count = merchants_response.count or 0
+        influencers_count = influencers_response.count or 0
+        admins_count = admins_response.count or 0
+        total_products = products_response.count or 0
+        total_links = links_response.count or 0
+
         # Calculer le revenu total (somme des sales)
-        sales_response = supabase.table("sales").select("amount, platform_commission").execute()
         total_revenue = sum(float(s.get("amount", 0)) for s in sales_response.data)
         platform_revenue = sum(float(s.get("platform_commission", 0)) for s in sales_response.data)
-        
+
         return {
             "platform_stats": {
                 "total_users": total_users,
@@ -21,6 +21,8 @@ from typing import Callable
 import psutil
 import sys
 
+from services.metrics_sketch import QuantileSketch
+
 # Configuration
 SENTRY_DSN = os.getenv("SENTRY_DSN", "")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
@@ -207,6 +209,8 @@ async def request_logging_middleware(request: Request, call_next: Callable):
             duration=f"{duration:.3f}s"
         )
 
+        metrics.record_request(duration, response.status_code)
+
         # Ajouter headers de tracking
         response.headers["X-Request-ID"] = request_id
         response.headers["X-Response-Time"] = f"{duration:.3f}s"
@@ -215,6 +219,7 @@ async def request_logging_middleware(request: Request, call_next: Callable):
 
     except Exception as e:
         duration = time.time() - start_time
+        metrics.record_request(duration, 500)
 
         # Logger erreur
         logger.error(
@@ -350,52 +355,54 @@ async def liveness_check() -> dict:
 
 class Metrics:
     """
-    Collecteur de métriques basique
+    Collecteur de métriques HTTP
 
-    En production, remplacer par Prometheus/Datadog
+    Durées stockées dans un histogramme à quantiles en flux (O(1) par
+    requête, mémoire bornée)
     """
 
     def __init__(self):
-        self.request_count = 0
+        # Durées en secondes : résolution de 1 µs à 1 h
+        self.response_times = QuantileSketch(min_value=1e-6, max_value=3600)
         self.error_count = 0
-        self.response_times = []
 
-    def record_request(self, duration: float, status: int):
-        """Enregistrer une requête"""
-        self.request_count += 1
-        self.response_times.append(duration)
+    @property
+    def request_count(self) -> int:
+        return self.response_times.count
 
+    def record_request(self, duration: float, status: int):
+        """Enregistrer une requête (durée en secondes)"""
+        self.response_times.record(duration)
         if status >= 500:
             self.error_count += 1
 
-        # Garder seulement les 1000 dernières
-        if len(self.response_times) > 1000:
-            self.response_times = self.response_times[-1000:]
-
     def get_stats(self) -> dict:
         """Récupérer statistiques"""
-        if not self.response_times:
+        request_count = self.request_count
+        error_count = self.error_count
+
+        if not request_count:
             return {
-                "request_count": self.request_count,
-                "error_count": self.error_count,
+                "request_count": 0,
+                "error_count": 0,
                 "avg_response_time": 0,
                 "p95_response_time": 0,
                 "p99_response_time": 0
             }
 
-        sorted_times = sorted(self.response_times)
-        p95_index = int(len(sorted_times) * 0.95)
-        p99_index = int(len(sorted_times) * 0.99)
+        summary = self.response_times.summary()
 
         return {
-            "request_count": self.request_count,
-            "error_count": self.error_count,
-            "error_rate": self.error_count / self.request_count if self.request_count > 0 else 0,
-            "avg_response_time": sum(sorted_times) / len(sorted_times),
-            "p95_response_time": sorted_times[p95_index],
-            "p99_response_time": sorted_times[p99_index],
-            "min_response_time": min(sorted_times),
-            "max_response_time": max(sorted_times)
+            "request_count": request_count,
+            "error_count": error_count,
+            "error_rate": error_count / request_count,
+            "avg_response_time": summary["avg"],
+            "p50_response_time": summary["p50"],
+            "p95_response_time": summary["p95"],
+            "p99_response_time": summary["p99"],
+            "p999_response_time": summary["p999"],
+            "min_response_time": summary["min"],
+            "max_response_time": summary["max"]
         }
 
 
@@ -12,10 +12,14 @@ Features:
 """
 
 import redis
+import redis.asyncio as aioredis
+import math
+import threading
 import time
+from collections import OrderedDict
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional, Tuple
 import structlog
 import os
 from functools import wraps
@@ -25,6 +29,54 @@ logger = structlog.get_logger()
 # Configuration Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+async_redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+
+# Jetons réservés d'avance par process (0 = toujours demander à Redis)
+RATE_LIMIT_LOCAL_LEASE_MAX = int(os.getenv("RATE_LIMIT_LOCAL_LEASE_MAX", "10"))
+RATE_LIMIT_LOCAL_LEASE_TTL = float(os.getenv("RATE_LIMIT_LOCAL_LEASE_TTL", "1.0"))
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_KEYS", "10000"))
+
+WHITELIST_PREFIX = "ratelimit:whitelist"
+
+
+# GCRA (Generic Cell Rate Algorithm) : une seule valeur par clé, le "TAT"
+# (theoretical arrival time). Chaque requête avance le TAT de T = window/limit ;
+# elle est acceptée tant que TAT - now <= window (rafale max = limit).
+#
+# KEYS[1] = clé du bucket, KEYS[2] = clé de whitelist
+# ARGV[1] = T (µs), ARGV[2] = window (µs), ARGV[3] = jetons souhaités (1 + réserve locale)
+# Retour: {autorisé, jetons accordés, restants, retry_after (µs)}
+GCRA_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return {1, -1, -1, 0}
+end
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+local interval = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+
+local available = math.floor((window - (tat - now)) / interval)
+if available < 1 then
+    return {0, 0, 0, tat + interval - window - now}
+end
+
+-- Réserve locale seulement si la requête est largement dans la limite
+local granted = 1
+if available >= 2 * wanted then
+    granted = wanted
+end
+
+local new_tat = tat + granted * interval
+redis.call('SET', KEYS[1], string.format('%d', new_tat), 'PX', math.ceil((new_tat - now) / 1000))
+return {1, granted, available - granted, 0}
+"""
 
 
 class RateLimitExceeded(HTTPException):
@@ -38,43 +90,99 @@ class RateLimitExceeded(HTTPException):
         )
 
 
+class LocalTokenCache:
+    """
+    Jetons réservés auprès de Redis, consommés localement
+
+    Quand Redis constate qu'un client est loin de sa limite, il accorde
+    quelques jetons d'avance : les requêtes suivantes de ce process sont
+    servies sans aller-retour. Les jetons non utilisés expirent vite (ils
+    sont déjà décomptés côté Redis : l'erreur est toujours conservatrice)
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS, lease_ttl: float = RATE_LIMIT_LOCAL_LEASE_TTL):
+        self.max_keys = max_keys
+        self.lease_ttl = lease_ttl
+        self._leases: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, remaining, expires_at]
+        self._lock = threading.Lock()
+        self.local_hits = 0
+
+    def take(self, key: str) -> Optional[int]:
+        """Consomme un jeton local ; retourne le nombre restant estimé, sinon None"""
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None:
+                return None
+            if lease[0] <= 0 or time.monotonic() >= lease[2]:
+                del self._leases[key]
+                return None
+            lease[0] -= 1
+            self.local_hits += 1
+            return lease[0] + lease[1]
+
+    def grant(self, key: str, tokens: int, remaining: int):
+        if tokens <= 0:
+            return
+        with self._lock:
+            self._leases[key] = [tokens, remaining, time.monotonic() + self.lease_ttl]
+            self._leases.move_to_end(key)
+            while len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._leases.pop(key, None)
+
+
 class RateLimiter:
     """
-    Rate limiter avec stratégie sliding window
+    Rate limiter GCRA (équivalent token bucket)
 
-    Plus précis que fixed window, évite les bursts en fin de fenêtre
+    Un seul aller-retour Redis async (script Lua atomique, whitelist incluse)
+    et une seule valeur par clé, quel que soit le nombre de requêtes
     """
 
     def __init__(
         self,
         key_prefix: str = "ratelimit",
         default_limit: int = 100,
-        default_window: int = 60  # secondes
+        default_window: int = 60,  # secondes
+        redis=None,
+        local_lease_max: int = RATE_LIMIT_LOCAL_LEASE_MAX
     ):
-        self.redis = redis_client
+        self.redis = redis if redis is not None else async_redis_client
         self.key_prefix = key_prefix
         self.default_limit = default_limit
         self.default_window = default_window
+        self.local_lease_max = local_lease_max
+        self.local_tokens = LocalTokenCache()
+        self._script = self.redis.register_script(GCRA_SCRIPT)
 
     def get_rate_limit_key(self, identifier: str, endpoint: str) -> str:
         """Générer clé Redis unique"""
         return f"{self.key_prefix}:{endpoint}:{identifier}"
 
+    def _lease_size(self, limit: int) -> int:
+        # Endpoints stricts (login...) : jamais de réserve, chaque requête passe par Redis
+        return min(self.local_lease_max, limit // 20)
+
     async def check_rate_limit(
         self,
         identifier: str,
         endpoint: str,
         limit: Optional[int] = None,
-        window: Optional[int] = None
+        window: Optional[int] = None,
+        client_ip: Optional[str] = None
     ) -> tuple[bool, int, int]:
         """
-        Vérifier rate limit avec sliding window
+        Vérifier rate limit (GCRA)
 
         Args:
             identifier: Identifiant unique (user_id, IP, etc.)
-            endpoint: Nom de l'endpoint
+            endpoint: Nom de l'endpoint (ou préfixe de la règle appliquée)
             limit: Nombre max de requêtes (None = default)
             window: Fenêtre en secondes (None = default)
+            client_ip: IP à tester contre la whitelist (optionnel)
 
         Returns:
             (allowed, remaining, retry_after)
@@ -83,52 +191,39 @@ class RateLimiter:
         window = window or self.default_window
 
         key = self.get_rate_limit_key(identifier, endpoint)
-        now = time.time()
-        window_start = now - window
-
-        try:
-            # Pipeline Redis pour atomicité
-            pipe = self.redis.pipeline()
 
-            # 1. Supprimer les timestamps hors fenêtre
-            pipe.zremrangebyscore(key, 0, window_start)
-
-            # 2. Compter requêtes dans la fenêtre
-            pipe.zcard(key)
-
-            # 3. Ajouter timestamp actuel
-            pipe.zadd(key, {str(now): now})
-
-            # 4. Expiration de la clé (cleanup auto)
-            pipe.expire(key, window * 2)
-
-            results = pipe.execute()
-            current_count = results[1]  # Résultat du ZCARD
-
-            # Vérifier si limite dépassée
-            if current_count >= limit:
-                # Calculer retry_after (temps jusqu'à expiration de la plus vieille requête)
-                oldest_timestamps = self.redis.zrange(key, 0, 0, withscores=True)
-                if oldest_timestamps:
-                    oldest_time = oldest_timestamps[0][1]
-                    retry_after = int(window - (now - oldest_time)) + 1
-                else:
-                    retry_after = window
-
-                return False, 0, retry_after
-
-            remaining = limit - current_count - 1  # -1 pour la requête actuelle
+        remaining = self.local_tokens.take(key)
+        if remaining is not None:
             return True, remaining, 0
 
+        interval_us = window * 1_000_000 / limit
+        lease = self._lease_size(limit)
+
+        try:
+            allowed, granted, remaining, retry_after_us = await self._script(
+                keys=[key, f"{WHITELIST_PREFIX}:{client_ip or identifier}"],
+                args=[interval_us, window * 1_000_000, 1 + lease]
+            )
         except redis.RedisError as e:
             logger.error("rate_limit_redis_error", error=str(e))
             # En cas d'erreur Redis, permettre la requête (fail open)
             return True, limit, 0
 
+        if not allowed:
+            return False, 0, max(1, math.ceil(int(retry_after_us) / 1_000_000))
+
+        if int(granted) < 0:
+            # Whitelisté
+            return True, limit, 0
+
+        self.local_tokens.grant(key, int(granted) - 1, int(remaining))
+        return True, int(remaining) + int(granted) - 1, 0
+
     async def reset_limit(self, identifier: str, endpoint: str):
         """Reset rate limit pour un identifiant (utile pour tests/admin)"""
         key = self.get_rate_limit_key(identifier, endpoint)
-        self.redis.delete(key)
+        self.local_tokens.discard(key)
+        await self.redis.delete(key)
 
 
 # Instance globale
@@ -139,6 +234,11 @@ rate_limiter = RateLimiter()
 # MIDDLEWARE FASTAPI
 # ============================================
 
+def _client_ip(request: Request) -> str:
+    """IP du client ; request.client est None hors socket (TestClient, ASGI sans client)"""
+    return request.client.host if request.client else "unknown"
+
+
 async def rate_limit_middleware(request: Request, call_next: Callable):
     """
     Middleware FastAPI pour rate limiting automatique
@@ -149,23 +249,25 @@ async def rate_limit_middleware(request: Request, call_next: Callable):
     identifier = None
     endpoint = request.url.path
 
+    client_ip = _client_ip(request)
+
     # 1. Priorité à l'user_id si authentifié
     if hasattr(request.state, "user") and request.state.user:
         identifier = f"user:{request.state.user['id']}"
     else:
         # 2. Sinon utiliser IP
-        client_ip = request.client.host
         identifier = f"ip:{client_ip}"
 
-    # Limites personnalisées selon endpoint
+    # Limites personnalisées selon endpoint (règle par préfixe)
     limits = get_endpoint_limits(endpoint)
 
-    # Vérifier rate limit
+    # Vérifier rate limit (whitelist IP incluse dans le même appel Redis)
     allowed, remaining, retry_after = await rate_limiter.check_rate_limit(
         identifier=identifier,
-        endpoint=endpoint,
+        endpoint=limits.get("prefix") or endpoint,
         limit=limits["limit"],
-        window=limits["window"]
+        window=limits["window"],
+        client_ip=client_ip
     )
 
     if not allowed:
@@ -202,39 +304,50 @@ async def rate_limit_middleware(request: Request, call_next: Callable):
     return response
 
 
+# Limites par défaut
+DEFAULT_ENDPOINT_LIMITS = {"limit": 100, "window": 60}  # 100 req/min
+
+# Limites personnalisées, appliquées au préfixe et à tous ses sous-chemins
+CUSTOM_ENDPOINT_LIMITS = {
+    # Auth endpoints - très strict
+    "/api/auth/login": {"limit": 5, "window": 60},  # 5/min
+    "/api/auth/register": {"limit": 3, "window": 3600},  # 3/heure
+    "/api/auth/reset-password": {"limit": 3, "window": 3600},
+
+    # Upload endpoints - modéré
+    "/api/kyc/upload": {"limit": 10, "window": 3600},  # 10/heure
+    "/api/products/upload-image": {"limit": 20, "window": 3600},
+
+    # API endpoints - généreux pour utilisateurs payants
+    "/api/products": {"limit": 300, "window": 60},
+    "/api/influencers": {"limit": 300, "window": 60},
+
+    # Webhooks - très généreux (vient de Stripe/etc)
+    "/api/stripe/webhook": {"limit": 1000, "window": 60},
+    "/api/social-media/webhooks": {"limit": 1000, "window": 60},
+
+    # Bot IA - modéré
+    "/api/bot/chat": {"limit": 30, "window": 60},  # 30 msg/min
+}
+
+# Préfixes du plus long au plus court : la règle la plus spécifique gagne
+_SORTED_LIMIT_PREFIXES = sorted(CUSTOM_ENDPOINT_LIMITS, key=len, reverse=True)
+
+
 def get_endpoint_limits(endpoint: str) -> dict:
     """
     Récupérer les limites spécifiques à un endpoint
 
-    Endpoints critiques = limites plus strictes
+    Endpoints critiques = limites plus strictes. Une règle s'applique à son
+    chemin et à ses sous-chemins (/api/products couvre /api/products/123) ;
+    "prefix" indique la règle retenue (None = limites par défaut)
     """
-    # Limites par défaut
-    default = {"limit": 100, "window": 60}  # 100 req/min
-
-    # Limites personnalisées
-    custom_limits = {
-        # Auth endpoints - très strict
-        "/api/auth/login": {"limit": 5, "window": 60},  # 5/min
-        "/api/auth/register": {"limit": 3, "window": 3600},  # 3/heure
-        "/api/auth/reset-password": {"limit": 3, "window": 3600},
-
-        # Upload endpoints - modéré
-        "/api/kyc/upload": {"limit": 10, "window": 3600},  # 10/heure
-        "/api/products/upload-image": {"limit": 20, "window": 3600},
-
-        # API endpoints - généreux pour utilisateurs payants
-        "/api/products": {"limit": 300, "window": 60},
-        "/api/influencers": {"limit": 300, "window": 60},
-
-        # Webhooks - très généreux (vient de Stripe/etc)
-        "/api/stripe/webhook": {"limit": 1000, "window": 60},
-        "/api/social-media/webhooks": {"limit": 1000, "window": 60},
-
-        # Bot IA - modéré
-        "/api/bot/chat": {"limit": 30, "window": 60},  # 30 msg/min
-    }
+    path = endpoint.rstrip("/") or "/"
+    for prefix in _SORTED_LIMIT_PREFIXES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return {**CUSTOM_ENDPOINT_LIMITS[prefix], "prefix": prefix}
 
-    return custom_limits.get(endpoint, default)
+    return {**DEFAULT_ENDPOINT_LIMITS, "prefix": None}
 
 
 # ============================================
@@ -258,7 +371,8 @@ def rate_limit(limit: int, window: int):
             request = kwargs.get("request") or args[0]
 
             # Extraire identifiant
-            identifier = getattr(request.state, "user_id", request.client.host)
+            client_ip = _client_ip(request)
+            identifier = getattr(request.state, "user_id", client_ip)
             endpoint = request.url.path
 
             # Vérifier rate limit
@@ -266,7 +380,8 @@ def rate_limit(limit: int, window: int):
                 identifier=identifier,
                 endpoint=endpoint,
                 limit=limit,
-                window=window
+                window=window,
+                client_ip=client_ip
             )
 
             if not allowed:
@@ -286,25 +401,31 @@ def rate_limit(limit: int, window: int):
 async def get_rate_limit_stats(identifier: str, endpoint: str) -> dict:
     """Récupérer stats rate limit pour debugging"""
     key = rate_limiter.get_rate_limit_key(identifier, endpoint)
+    limits = get_endpoint_limits(endpoint)
+
+    tat = await async_redis_client.get(key)
+    ttl_ms = await async_redis_client.pttl(key)
 
-    count = redis_client.zcard(key)
-    ttl = redis_client.ttl(key)
+    # Temps de "dette" accumulée : 0 = bucket plein
+    interval = limits["window"] / limits["limit"]
+    backlog = max(ttl_ms, 0) / 1000
 
     return {
         "identifier": identifier,
         "endpoint": endpoint,
-        "current_count": count,
-        "ttl": ttl
+        "tat_us": int(tat) if tat else None,
+        "current_count": math.ceil(backlog / interval) if backlog else 0,
+        "ttl": math.ceil(backlog)
     }
 
 
 async def whitelist_ip(ip: str, duration: int = 3600):
     """Whitelist une IP (bypass rate limiting)"""
-    key = f"ratelimit:whitelist:{ip}"
-    redis_client.setex(key, duration, "1")
+    key = f"{WHITELIST_PREFIX}:{ip}"
+    await async_redis_client.setex(key, duration, "1")
 
 
 async def is_whitelisted(ip: str) -> bool:
     """Vérifier si IP est whitelistée"""
-    key = f"ratelimit:whitelist:{ip}"
-    return redis_client.exists(key) == 1
+    key = f"{WHITELIST_PREFIX}:{ip}"
+    return await async_redis_client.exists(key) == 1
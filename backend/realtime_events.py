@@ -0,0 +1,101 @@
+"""
+Publication des évènements temps réel (côté producteurs)
+
+Les services (création de vente par webhook, paiements automatiques...)
+publient sur un canal Redis pub/sub ; chaque processus websocket_server.py
+y est abonné et pousse les messages à ses propres connexions
+
+Format publié : "<cible>\\t<clé de fusion>\\t<trame JSON>"
+- cible : user_id, ou "*" pour tous les utilisateurs
+- clé de fusion : vide, ou clé d'un évènement dont seule la dernière
+  version compte (ex: dashboard_update) ; un client lent n'en reçoit qu'une
+- trame : message final envoyé tel quel au navigateur (sérialisé une fois)
+
+Une publication ne lève jamais d'exception : le temps réel est un bonus,
+la donnée de référence reste en base
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REALTIME_CHANNEL = "realtime:events"
+BROADCAST_TARGET = "*"
+
+
+class EventTypes:
+    COMMISSION_CREATED = "commission_created"
+    COMMISSION_UPDATED = "commission_updated"
+    PAYMENT_CREATED = "payment_created"
+    PAYMENT_STATUS_CHANGED = "payment_status_changed"
+    SALE_CREATED = "sale_created"
+    DASHBOARD_UPDATE = "dashboard_update"
+
+
+# Évènements "état courant" : seule la dernière version en attente est envoyée
+COALESCED_EVENTS = {EventTypes.DASHBOARD_UPDATE}
+
+_redis_client = None
+
+
+def _get_redis():
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+def encode_frame(event_type: str, data: dict) -> str:
+    """Trame envoyée au navigateur"""
+    return json.dumps(
+        {"type": event_type, "data": data, "timestamp": datetime.now().isoformat()},
+        default=str,
+    )
+
+
+def encode_envelope(target: str, event_type: str, data: dict) -> str:
+    coalesce_key = event_type if event_type in COALESCED_EVENTS else ""
+    return f"{target}\t{coalesce_key}\t{encode_frame(event_type, data)}"
+
+
+def decode_envelope(message: str) -> Tuple[str, Optional[str], str]:
+    """(cible, clé de fusion ou None, trame)"""
+    target, coalesce_key, frame = message.split("\t", 2)
+    return target, coalesce_key or None, frame
+
+
+def publish_event(user_id: Optional[str], event_type: str, data: dict) -> bool:
+    """Publie un évènement pour un utilisateur (user_id=None : tous les utilisateurs)"""
+    return publish_events([(user_id, event_type, data)]) == 1
+
+
+def publish_events(events: Iterable[Tuple[Optional[str], str, dict]], client=None) -> int:
+    """
+    Publie un lot d'évènements en un aller-retour Redis (pipeline)
+
+    Returns:
+        Nombre d'évènements publiés (0 si Redis est indisponible)
+    """
+    envelopes = [
+        encode_envelope(str(user_id) if user_id else BROADCAST_TARGET, event_type, data)
+        for user_id, event_type, data in events
+    ]
+    if not envelopes:
+        return 0
+
+    try:
+        pipe = (client or _get_redis()).pipeline(transaction=False)
+        for envelope in envelopes:
+            pipe.publish(REALTIME_CHANNEL, envelope)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"⚠️ Publication temps réel impossible ({len(envelopes)} évènements): {e}")
+        return 0
+    return len(envelopes)
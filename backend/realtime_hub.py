@@ -0,0 +1,168 @@
+"""
+Hub de diffusion des évènements temps réel (côté websocket_server.py)
+
+- Chaque connexion a sa propre file d'envoi bornée et sa tâche d'envoi :
+  un client lent ne ralentit jamais les autres ni le producteur
+- File pleine : le message le plus ancien est abandonné ; les évènements
+  "état courant" (clé de fusion) remplacent leur version encore en attente
+- Un client qui n'accepte pas un envoi en WS_SEND_TIMEOUT secondes est
+  déconnecté (il se reconnectera et rechargera son état)
+- Les trames arrivent déjà sérialisées (realtime_events.py) : une diffusion
+  à N clients = N références à la même chaîne
+
+Indépendant d'aiohttp : une connexion n'a besoin que de `send_str` et `close`
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Dict, Optional, Set
+
+from realtime_events import BROADCAST_TARGET, decode_envelope
+
+logger = logging.getLogger(__name__)
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+
+class ClientConnection:
+    """Connexion websocket avec file d'envoi bornée"""
+
+    def __init__(self, ws, user_id: str, max_queue: int = WS_SEND_QUEUE_SIZE):
+        self.ws = ws
+        self.user_id = user_id
+        self.max_queue = max_queue
+        # Éléments mutables [clé de fusion, trame] : remplacement en place
+        self._pending: deque = deque()
+        self._coalesced: Dict[str, list] = {}
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._sender: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.sent = 0
+
+    def start(self):
+        self._sender = asyncio.create_task(self._send_loop())
+
+    def enqueue(self, frame: str, coalesce_key: Optional[str] = None) -> bool:
+        """Ajoute une trame sans jamais attendre. Retourne False si un message a été abandonné"""
+        if self._closed:
+            return False
+
+        if coalesce_key is not None:
+            pending = self._coalesced.get(coalesce_key)
+            if pending is not None:
+                pending[1] = frame
+                return True
+
+        accepted = True
+        if len(self._pending) >= self.max_queue:
+            oldest = self._pending.popleft()
+            if oldest[0] is not None:
+                self._coalesced.pop(oldest[0], None)
+            self.dropped += 1
+            accepted = False
+
+        item = [coalesce_key, frame]
+        self._pending.append(item)
+        if coalesce_key is not None:
+            self._coalesced[coalesce_key] = item
+        self._ready.set()
+        return accepted
+
+    async def _send_loop(self):
+        try:
+            while not self._closed:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._pending and not self._closed:
+                    coalesce_key, frame = self._pending.popleft()
+                    if coalesce_key is not None:
+                        self._coalesced.pop(coalesce_key, None)
+                    await asyncio.wait_for(self.ws.send_str(frame), WS_SEND_TIMEOUT)
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Client {self.user_id} déconnecté (envoi impossible): {e}")
+            self._closed = True
+            try:
+                await self.ws.close()
+            except Exception:
+                pass
+
+    async def close(self):
+        self._closed = True
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class ConnectionHub:
+    """Connexions locales d'un processus, indexées par utilisateur"""
+
+    def __init__(self, max_queue: int = WS_SEND_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self.connections: Dict[str, Set[ClientConnection]] = {}
+        self.stats = {"delivered": 0, "dropped": 0, "received": 0}
+
+    def register(self, ws, user_id: str) -> ClientConnection:
+        connection = ClientConnection(ws, user_id, self.max_queue)
+        connection.start()
+        self.connections.setdefault(user_id, set()).add(connection)
+        return connection
+
+    async def unregister(self, connection: ClientConnection):
+        connections = self.connections.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self.connections[connection.user_id]
+        await connection.close()
+
+    def deliver(self, target: str, frame: str, coalesce_key: Optional[str] = None) -> int:
+        """Met une trame en file pour un utilisateur (ou "*" : tous). Retourne le nombre de connexions"""
+        if target == BROADCAST_TARGET:
+            recipients = [c for connections in self.connections.values() for c in connections]
+        else:
+            recipients = list(self.connections.get(target, ()))
+
+        for connection in recipients:
+            if connection.closed:
+                continue
+            if not connection.enqueue(frame, coalesce_key):
+                self.stats["dropped"] += 1
+        self.stats["delivered"] += len(recipients)
+        return len(recipients)
+
+    def deliver_envelope(self, message: str) -> int:
+        """Message reçu du canal pub/sub"""
+        self.stats["received"] += 1
+        target, coalesce_key, frame = decode_envelope(message)
+        return self.deliver(target, frame, coalesce_key)
+
+    async def close_all(self):
+        for connections in list(self.connections.values()):
+            for connection in list(connections):
+                await connection.close()
+                try:
+                    await connection.ws.close()
+                except Exception:
+                    pass
+        self.connections.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "users": len(self.connections),
+            "connections": sum(len(c) for c in self.connections.values()),
+        }
@@ -2,12 +2,13 @@
 Routes API pour l'optimisation d'images
 Endpoints pour upload, optimisation et gestion d'images
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, current_app, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 import io
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from services.image_optimizer import ImageOptimizer
+from services.image_store import ContentAddressedImageStore, is_valid_key, source_hash, variant_key
 from utils.image_processing import validate_image, ImageValidationError, get_safe_filename
 from utils.logger import logger
 
@@ -21,6 +22,9 @@ optimizer = ImageOptimizer(
     enable_webp=True
 )
 
+# Variantes adressées par contenu, sous le storage_path de l'optimiseur
+image_store = ContentAddressedImageStore(str(optimizer.storage_path))
+
 # Configuration
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'gif'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
@@ -31,6 +35,55 @@ def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def _variant_url(key: str, fmt: str) -> str:
+    return f'/api/images/serve/{key}.{fmt}'
+
+
+def _store_variant(digest: str, data: bytes, fmt: str, **params) -> str:
+    """Enregistre une variante encodée et retourne son URL"""
+    key = variant_key(digest, format=fmt, **params)
+    if image_store.get(key) is None:
+        image_store.put(key, data, fmt)
+    return _variant_url(key, fmt)
+
+
+def _cached_response(key: str) -> Optional[Dict[str, Any]]:
+    """Réponse mémorisée, seulement si toutes ses variantes sont encore sur disque"""
+    cached = image_store.get_json(key)
+    if cached is None:
+        return None
+
+    variants = list((cached.get('optimized') or {}).values())
+    for formats in (cached.get('thumbnails') or {}).values():
+        variants.extend(formats.values())
+
+    for variant in variants:
+        variant_name = variant['url'].rsplit('/', 1)[-1]
+        if image_store.get(variant_name.partition('.')[0]) is None:
+            # Une variante a été évincée : retraiter l'image
+            return None
+    return cached
+
+
+def _store_thumbnails(digest: str, thumbnails: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Enregistre les thumbnails ; la réponse contient des URLs au lieu des octets"""
+    return {
+        size_name: {
+            fmt: {
+                'size': thumb['size'],
+                'dimensions': thumb['dimensions'],
+                'url': _store_variant(
+                    digest, thumb['data'], fmt,
+                    op='thumbnail', size=size_name,
+                    width=thumb['dimensions']['width'], height=thumb['dimensions']['height']
+                )
+            }
+            for fmt, thumb in formats.items()
+        }
+        for size_name, formats in thumbnails.items()
+    }
+
+
 @image_bp.route('/upload', methods=['POST'])
 def upload_image():
     """
@@ -87,6 +140,16 @@ def upload_image():
         quality = request.form.get('quality', type=int)
         generate_thumbnails = request.form.get('generate_thumbnails', 'true').lower() == 'true'
 
+        # Même image, mêmes paramètres : réponse déjà calculée
+        digest = source_hash(file_data)
+        upload_key = variant_key(
+            digest, op='upload', formats=formats, quality=quality, thumbnails=generate_thumbnails
+        )
+        cached = _cached_response(upload_key)
+        if cached is not None:
+            logger.info("Image déjà optimisée, réponse servie depuis le stockage", filename=filename)
+            return jsonify({**cached, 'filename': filename, 'cached': True}), 200
+
         # Optimiser l'image
         result = optimizer.optimize_image(
             image_data=file_data,
@@ -107,7 +170,7 @@ def upload_image():
                 formats=formats
             )
             if thumb_result['success']:
-                thumbnails = thumb_result['thumbnails']
+                thumbnails = _store_thumbnails(digest, thumb_result['thumbnails'])
 
         # Construire la réponse
         response = {
@@ -120,7 +183,7 @@ def upload_image():
                     'size_kb': round(data['size'] / 1024, 2),
                     'compression_percentage': data['compression']['percentage'],
                     'quality': data['quality'],
-                    'url': f'/api/images/serve/{filename.rsplit(".", 1)[0]}.{fmt}'
+                    'url': _store_variant(digest, data['data'], fmt, op='optimize', quality=data['quality'])
                 }
                 for fmt, data in result['optimized'].items()
             },
@@ -129,6 +192,8 @@ def upload_image():
             'processing_time': result['processing_time']
         }
 
+        image_store.put_json(upload_key, response)
+
         logger.info(
             "Image uploadée et optimisée",
             filename=filename,
@@ -277,6 +342,12 @@ def generate_thumbnails():
         formats = request.form.get('formats', 'webp,jpeg').split(',')
         custom_sizes = request.form.get('sizes')  # JSON optionnel
 
+        digest = source_hash(file_data)
+        thumbnails_key = variant_key(digest, op='thumbnails', formats=formats)
+        cached = _cached_response(thumbnails_key)
+        if cached is not None:
+            return jsonify({**cached, 'cached': True}), 200
+
         # Générer les thumbnails
         result = optimizer.generate_thumbnails(
             image_data=file_data,
@@ -288,6 +359,9 @@ def generate_thumbnails():
         if not result['success']:
             return jsonify(result), 400
 
+        result['thumbnails'] = _store_thumbnails(digest, result['thumbnails'])
+        image_store.put_json(thumbnails_key, result)
+
         logger.info(
             "Thumbnails générés",
             filename=filename,
@@ -465,22 +539,45 @@ def generate_srcset():
 @image_bp.route('/serve/<path:filename>', methods=['GET'])
 def serve_image(filename: str):
     """
-    Sert une image optimisée
+    Sert une variante optimisée depuis le stockage adressé par contenu
 
     Args:
-        filename: Nom du fichier avec extension
+        filename: <clé>.<format>, tel que retourné par /upload et /thumbnails
 
     Returns:
-        Fichier image
+        Fichier image (304 si l'ETag du client est à jour)
     """
     try:
-        # TODO: Implémenter selon votre système de stockage
-        # (local, S3, etc.)
+        key, _, fmt = filename.partition('.')
+        if not is_valid_key(key) or fmt == 'json':
+            return jsonify({
+                'success': False,
+                'error': 'Image introuvable'
+            }), 404
 
-        return jsonify({
-            'success': False,
-            'error': 'Non implémenté'
-        }), 501
+        stored = image_store.get(key)
+        if stored is None:
+            return jsonify({
+                'success': False,
+                'error': 'Image introuvable'
+            }), 404
+
+        # Contenu immuable pour une clé : ETag fort, cache navigateur/CDN permanent
+        if request.if_none_match.contains(stored.etag):
+            response = current_app.response_class(status=304)
+        else:
+            # Chemin disque : le serveur WSGI peut utiliser sendfile (wsgi.file_wrapper)
+            response = send_file(
+                stored.path,
+                mimetype=stored.mime_type,
+                etag=stored.etag,
+                conditional=False,
+                max_age=31536000
+            )
+
+        response.set_etag(stored.etag)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
 
     except Exception as e:
         logger.error(f"Erreur service image: {str(e)}")
@@ -501,5 +598,6 @@ def health_check():
             'webp': optimizer.enable_webp,
             'avif': optimizer.enable_avif,
             'background_removal': True  # Vérifier si rembg est installé
-        }
+        },
+        'store': image_store.get_stats()
     }), 200
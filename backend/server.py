@@ -11,9 +11,9 @@ if sys.platform == "win32":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-from fastapi import FastAPI, HTTPException, Depends, status, Request, Response, Query
+from fastapi import FastAPI, HTTPException, Depends, status, Request, Response, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
@@ -52,7 +52,16 @@ from db_helpers import (
     get_payouts,
     update_payout_status,
 )
+from auth import resolve_principal, token_principal
 from supabase_client import supabase
+from supabase_async import async_supabase, run_sync, close_async_supabase
+from dashboard_rollups import get_platform_revenue_rollup
+from analytics_rollups import fill_daily_series, get_daily_series, PLATFORM_DIMENSION_ID
+from services.report_generator import EXPORT_DATASETS, STREAM_FORMATS, ReportFormat, paged_rows, report_generator
+from services.leaderboard_engine import leaderboard_engine
+from services.sales_representative_service import SALES_REP_USER_TYPE, deal_points
+from subscription_entitlements import record_usage
+from subscription_helpers_simple import get_account
 
 # Initialize logger
 logging.basicConfig(level=logging.INFO)
@@ -242,8 +251,8 @@ Les limites peuvent varier selon votre plan d'abonnement.
 # Importer le scheduler et les services
 from scheduler import start_scheduler, stop_scheduler
 from auto_payment_service import AutoPaymentService
-from tracking_service import tracking_service
-from webhook_service import webhook_service
+from tracking_service import tracking_service, click_ingestion_queue
+from webhook_service import webhook_service, webhook_worker_pool
 
 # Initialiser les services
 payment_service = AutoPaymentService()
@@ -390,6 +399,9 @@ class PayoutStatusUpdate(BaseModel):
 class AffiliateLinkGenerate(BaseModel):
     product_id: str = Field(..., min_length=1)
 
+class TrackingLinkStatusUpdate(BaseModel):
+    status: str = Field(..., pattern="^(active|paused|archived)$")
+
 class AIContentGenerate(BaseModel):
     type: str = Field(default="social_post", pattern="^(social_post|email|blog)$")
     platform: Optional[str] = "Instagram"
@@ -515,7 +527,8 @@ async def login(login_data: LoginRequest):
     access_token = create_access_token({
         "sub": user["id"],
         "email": user["email"],
-        "role": user["role"]
+        "role": user["role"],
+        "ver": user.get("token_version", 0)
     })
 
     # Retirer le password_hash de la réponse
@@ -560,7 +573,8 @@ async def verify_2fa(data: TwoFAVerifyRequest):
     access_token = create_access_token({
         "sub": user["id"],
         "email": user["email"],
-        "role": user["role"]
+        "role": user["role"],
+        "ver": user.get("token_version", 0)
     })
 
     user_data = {k: v for k, v in user.items() if k != "password_hash"}
@@ -574,11 +588,10 @@ async def verify_2fa(data: TwoFAVerifyRequest):
 @app.get("/api/auth/me")
 async def get_current_user(payload: dict = Depends(verify_token)):
     """Récupère l'utilisateur connecté"""
-    user = get_user_by_id(payload["sub"])
+    user = resolve_principal(payload)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user_data = {k: v for k, v in user.items() if k != "password_hash"}
-    return user_data
+    return user
 
 @app.post("/api/auth/logout")
 async def logout(payload: dict = Depends(verify_token)):
@@ -638,21 +651,21 @@ async def register(data: RegisterRequest):
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats_endpoint(payload: dict = Depends(verify_token)):
     """Statistiques du dashboard selon le rôle"""
-    user = get_user_by_id(payload["sub"])
+    user = await run_sync(token_principal, payload)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    stats = get_dashboard_stats(user["role"], user["id"])
+    stats = await run_sync(get_dashboard_stats, user["role"], user["id"])
     return stats
 
 @app.get("/api/analytics/overview")
 async def get_analytics_overview(payload: dict = Depends(verify_token)):
     """Vue d'ensemble des analytics"""
-    user = get_user_by_id(payload["sub"])
+    user = await run_sync(token_principal, payload)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    stats = get_dashboard_stats(user["role"], user["id"])
+    stats = await run_sync(get_dashboard_stats, user["role"], user["id"])
     return stats
 
 # ============================================
@@ -664,7 +677,7 @@ async def get_merchants(payload: dict = Depends(verify_token)):
     """Liste tous les merchants depuis la table users"""
     try:
         # Récupérer les merchants depuis la table users
-        result = supabase.from_("users").select("*").eq("role", "merchant").execute()
+        result = await async_supabase.from_("users").select("*").eq("role", "merchant").execute()
         merchants = result.data if result.data else []
         
         # Formater les données pour le dashboard admin
@@ -705,7 +718,7 @@ async def get_influencers(payload: dict = Depends(verify_token)):
     """Liste tous les influencers depuis la table users"""
     try:
         # Récupérer les influenceurs depuis la table users
-        result = supabase.from_("users").select("*").eq("role", "influencer").execute()
+        result = await async_supabase.from_("users").select("*").eq("role", "influencer").execute()
         influencers = result.data if result.data else []
         
         # Formater les données pour le dashboard admin
@@ -1288,50 +1301,115 @@ async def get_my_deals(payload: dict = Depends(verify_token)):
         logger.error(f"Error getting deals: {e}")
         return {"deals": [], "total": 0}
 
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "300"))
+LEADERBOARD_PAGE_SIZE = 1000
+
+
+def _load_sales_rep_deal_boards():
+    """
+    Classements du mois des commerciaux recalculés depuis deals
+
+    Un parcours paginé (clé id) des deals gagnés du mois, agrégé en mémoire :
+    deals, revenu et points (100 par deal + 1 par 100 MAD)
+    """
+    start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    deals, revenue, points = {}, {}, {}
+
+    cursor = None
+    while True:
+        query = supabase.table("deals").select("id, sales_rep_id, value")\
+            .eq("status", "won")\
+            .gte("closed_date", start_of_month.isoformat())
+        if cursor:
+            query = query.gt("id", cursor)
+        page = query.order("id").limit(LEADERBOARD_PAGE_SIZE).execute().data or []
+
+        for deal in page:
+            rep_id = deal.get("sales_rep_id")
+            if not rep_id:
+                continue
+            value = float(deal.get("value") or 0)
+            deals[rep_id] = deals.get(rep_id, 0) + 1
+            revenue[rep_id] = revenue.get(rep_id, 0.0) + value
+            points[rep_id] = points.get(rep_id, 0.0) + deal_points(value)
+
+        if len(page) < LEADERBOARD_PAGE_SIZE:
+            break
+        cursor = page[-1]["id"]
+
+    return {
+        (SALES_REP_USER_TYPE, "deals", "month"): deals,
+        (SALES_REP_USER_TYPE, "revenue", "month"): revenue,
+        (SALES_REP_USER_TYPE, "deal_points", "month"): points,
+    }
+
+
 @app.get("/api/sales/leaderboard")
-async def get_sales_leaderboard(payload: dict = Depends(verify_token)):
-    """Classement des commerciaux"""
+async def get_sales_leaderboard(
+    limit: int = Query(50, ge=1, le=200),
+    payload: dict = Depends(verify_token)
+):
+    """
+    Classement des commerciaux du mois
+
+    Lu dans les ensembles triés du moteur de classements (top-N en O(log n)) ;
+    reconstruits depuis deals au plus toutes les LEADERBOARD_REFRESH_SECONDS.
+    Les commerciaux actifs sans deal ce mois complètent le classement à 0 point
+    """
     try:
-        from datetime import datetime, timedelta
-        
-        # Date du début du mois
-        now = datetime.now()
-        start_of_month = now.replace(day=1, hour=0, minute=0, second=0)
-        
-        # Récupérer tous les sales_reps
-        reps_result = supabase.table("sales_representatives").select("*").eq("is_active", True).execute()
-        reps = reps_result.data if reps_result.data else []
-        
+        await run_sync(
+            leaderboard_engine.ensure,
+            _load_sales_rep_deal_boards,
+            LEADERBOARD_REFRESH_SECONDS,
+            "sales_rep_deals"
+        )
+
+        ranked = await run_sync(leaderboard_engine.top, SALES_REP_USER_TYPE, "deal_points", "month", limit)
+        rep_ids = [entry["member_id"] for entry in ranked]
+
+        deals, revenue, reps = {}, {}, {}
+        if rep_ids:
+            deals = await run_sync(leaderboard_engine.scores, SALES_REP_USER_TYPE, rep_ids, "deals", "month")
+            revenue = await run_sync(leaderboard_engine.scores, SALES_REP_USER_TYPE, rep_ids, "revenue", "month")
+
+            # Noms des commerciaux classés (une requête)
+            reps_result = await run_sync(
+                lambda: supabase.table("sales_representatives")
+                .select("id, first_name, last_name")
+                .in_("id", rep_ids)
+                .eq("is_active", True)
+                .execute()
+            )
+            reps = {rep["id"]: rep for rep in reps_result.data or []}
+
+        entries = [(reps[entry["member_id"]], int(entry["score"])) for entry in ranked if entry["member_id"] in reps]
+
+        # Places restantes : commerciaux actifs sans deal (absents des classements)
+        if len(entries) < limit:
+            idle_result = await run_sync(
+                lambda: supabase.table("sales_representatives")
+                .select("id, first_name, last_name")
+                .eq("is_active", True)
+                .order("last_name")
+                .limit(limit + len(rep_ids))
+                .execute()
+            )
+            ranked_ids = set(rep_ids)
+            idle = [rep for rep in idle_result.data or [] if rep["id"] not in ranked_ids]
+            entries.extend((rep, 0) for rep in idle[:limit - len(entries)])
+
         leaderboard = []
-        for rep in reps:
-            rep_id = rep["id"]
-            
-            # Deals ce mois
-            deals_result = supabase.table("deals").select("value").eq("sales_rep_id", rep_id).eq("status", "won").gte("closed_date", start_of_month.isoformat()).execute()
-            deals = deals_result.data if deals_result.data else []
-            
-            total_deals = len(deals)
-            total_revenue = sum([float(d.get("value", 0)) for d in deals])
-            
-            # Calculer points
-            points = total_deals * 100 + int(total_revenue * 0.01)
-            
+        for rep, points in entries:
             leaderboard.append({
-                "sales_rep_id": rep_id,
+                "sales_rep_id": rep["id"],
                 "name": f"{rep.get('first_name', '')} {rep.get('last_name', '')}".strip(),
-                "deals": total_deals,
-                "revenue": round(total_revenue, 2),
+                "deals": int(deals.get(rep["id"], 0)),
+                "revenue": round(revenue.get(rep["id"], 0), 2),
                 "points": points,
-                "level_tier": "bronze" if points < 1000 else "silver" if points < 5000 else "gold"
+                "level_tier": "bronze" if points < 1000 else "silver" if points < 5000 else "gold",
+                "rank": len(leaderboard) + 1
             })
-        
-        # Trier par points décroissants
-        leaderboard.sort(key=lambda x: x["points"], reverse=True)
-        
-        # Ajouter le rang
-        for i, rep in enumerate(leaderboard):
-            rep["rank"] = i + 1
-        
+
         return {
             "leaderboard": leaderboard,
             "total": len(leaderboard)
@@ -1860,7 +1938,7 @@ async def get_products(
     payload: dict = Depends(verify_token)
 ):
     """Liste tous les produits avec filtres optionnels"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
     
     # Si merchant, filtrer par ses propres produits (sauf si admin)
     if user["role"] == "merchant" and not merchant_id:
@@ -1896,7 +1974,7 @@ async def get_services(
     payload: dict = Depends(verify_token)
 ):
     """Liste tous les services avec filtres optionnels"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
     
     # Si merchant, filtrer par ses propres services (sauf si admin)
     if user["role"] == "merchant" and not merchant_id:
@@ -1923,7 +2001,7 @@ async def get_service(service_id: str):
 @app.get("/api/affiliate-links")
 async def get_affiliate_links_endpoint(payload: dict = Depends(verify_token)):
     """Liste les liens d'affiliation"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
 
     if user["role"] == "influencer":
         influencer = get_influencer_by_user_id(user["id"])
@@ -1939,7 +2017,7 @@ async def get_affiliate_links_endpoint(payload: dict = Depends(verify_token)):
 @app.post("/api/affiliate-links/generate")
 async def generate_affiliate_link(data: AffiliateLinkGenerate, payload: dict = Depends(verify_token)):
     """Génère un lien d'affiliation"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
 
     if user["role"] != "influencer":
         raise HTTPException(status_code=403, detail="Accès refusé")
@@ -1975,7 +2053,7 @@ async def generate_affiliate_link(data: AffiliateLinkGenerate, payload: dict = D
 @app.get("/api/campaigns")
 async def get_campaigns_endpoint(payload: dict = Depends(verify_token)):
     """Liste toutes les campagnes"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
 
     if user["role"] == "merchant":
         merchant = get_merchant_by_user_id(user["id"])
@@ -1988,7 +2066,7 @@ async def get_campaigns_endpoint(payload: dict = Depends(verify_token)):
 @app.post("/api/campaigns")
 async def create_campaign_endpoint(campaign_data: CampaignCreate, payload: dict = Depends(verify_token)):
     """Créer une nouvelle campagne"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
 
     if user["role"] != "merchant":
         raise HTTPException(status_code=403, detail="Seuls les merchants peuvent créer des campagnes")
@@ -2253,44 +2331,37 @@ async def get_merchant_sales_chart(payload: dict = Depends(verify_token)):
     Format: [{date: '01/06', ventes: 12, revenus: 3500}, ...]
     """
     try:
-        from datetime import datetime, timedelta
-        
+        from datetime import date, timedelta
+
         user_id = payload.get("user_id")
         role = payload.get("role")
-        
-        # Calculer les 7 derniers jours
-        today = datetime.now()
-        days_data = []
-        
-        for i in range(6, -1, -1):  # 6 jours en arrière jusqu'à aujourd'hui
-            target_date = today - timedelta(days=i)
-            date_str = target_date.strftime('%Y-%m-%d')
-            
-            # Query: ventes du jour pour ce marchand
-            query = supabase.table('sales').select('amount, commission, status')
-            
-            # Filtrer par merchant_id si pas admin
-            if role != 'admin':
-                query = query.eq('merchant_id', user_id)
-            
-            # Filtrer par date (créées ce jour-là)
-            query = query.gte('created_at', f'{date_str}T00:00:00').lt('created_at', f'{date_str}T23:59:59')
-            
-            response = query.execute()
-            sales = response.data if response.data else []
-            
-            # Calculer les totaux
-            ventes_count = len(sales)
-            revenus_total = sum(float(s.get('amount', 0)) for s in sales)
-            
-            days_data.append({
-                'date': target_date.strftime('%d/%m'),
-                'ventes': ventes_count,
-                'revenus': round(revenus_total, 2)
-            })
-        
+
+        # Rollups journaliers (toute la plateforme pour l'admin)
+        today = date.today()
+        fields = ('conversions', 'revenue')
+        if role == 'admin':
+            series = get_daily_series('platform', PLATFORM_DIMENSION_ID, today - timedelta(days=6), today,
+                                      fields=fields)
+        else:
+            # Les rollups sont indexés par merchants.id, pas par users.id
+            merchant = await run_sync(get_merchant_by_user_id, user_id)
+            if merchant:
+                series = get_daily_series('merchant', merchant['id'], today - timedelta(days=6), today,
+                                          fields=fields)
+            else:
+                series = fill_daily_series([], today - timedelta(days=6), today, fields)
+
+        days_data = [
+            {
+                'date': point['day'].strftime('%d/%m'),
+                'ventes': int(point['conversions']),
+                'revenus': round(point['revenue'], 2)
+            }
+            for point in series
+        ]
+
         return {"data": days_data}
-        
+
     except Exception as e:
         print(f"Error fetching merchant sales chart: {e}")
         # Retourner des données vides en cas d'erreur
@@ -2303,32 +2374,29 @@ async def get_influencer_earnings_chart(payload: dict = Depends(verify_token)):
     Format: [{date: '01/06', gains: 450}, ...]
     """
     try:
-        from datetime import datetime, timedelta
-        
+        from datetime import date, timedelta
+
         user_id = payload.get("user_id")
-        today = datetime.now()
-        days_data = []
-        
-        for i in range(6, -1, -1):
-            target_date = today - timedelta(days=i)
-            date_str = target_date.strftime('%Y-%m-%d')
-            
-            # Query: commissions gagnées ce jour
-            query = supabase.table('sales').select('commission').eq('affiliate_id', user_id)
-            query = query.gte('created_at', f'{date_str}T00:00:00').lt('created_at', f'{date_str}T23:59:59')
-            
-            response = query.execute()
-            sales = response.data if response.data else []
-            
-            gains_total = sum(float(s.get('commission', 0)) for s in sales)
-            
-            days_data.append({
-                'date': target_date.strftime('%d/%m'),
-                'gains': round(gains_total, 2)
-            })
-        
+        today = date.today()
+
+        # Commissions gagnées par jour (rollups indexés par influencers.id)
+        influencer = await run_sync(get_influencer_by_user_id, user_id)
+        if influencer:
+            series = get_daily_series('influencer', influencer['id'], today - timedelta(days=6), today,
+                                      fields=('commissions',))
+        else:
+            series = fill_daily_series([], today - timedelta(days=6), today, ('commissions',))
+
+        days_data = [
+            {
+                'date': point['day'].strftime('%d/%m'),
+                'gains': round(point['commissions'], 2)
+            }
+            for point in series
+        ]
+
         return {"data": days_data}
-        
+
     except Exception as e:
         print(f"Error fetching influencer earnings chart: {e}")
         return {"data": [{"date": f"0{i}/01", "gains": 0} for i in range(1, 8)]}
@@ -2340,36 +2408,27 @@ async def get_admin_revenue_chart(payload: dict = Depends(verify_token)):
     Format: [{date: '01/06', revenus: 8500}, ...]
     """
     try:
-        from datetime import datetime, timedelta
-        
+        from datetime import date, timedelta
+
         role = payload.get("role")
-        
+
         if role != 'admin':
             raise HTTPException(status_code=403, detail="Admin access required")
-        
-        today = datetime.now()
-        days_data = []
-        
-        for i in range(6, -1, -1):
-            target_date = today - timedelta(days=i)
-            date_str = target_date.strftime('%Y-%m-%d')
-            
-            # Query: toutes les ventes du jour
-            query = supabase.table('sales').select('amount')
-            query = query.gte('created_at', f'{date_str}T00:00:00').lt('created_at', f'{date_str}T23:59:59')
-            
-            response = query.execute()
-            sales = response.data if response.data else []
-            
-            revenus_total = sum(float(s.get('amount', 0)) for s in sales)
-            
-            days_data.append({
-                'date': target_date.strftime('%d/%m'),
-                'revenus': round(revenus_total, 2)
-            })
-        
+
+        today = date.today()
+        series = get_daily_series('platform', PLATFORM_DIMENSION_ID, today - timedelta(days=6), today,
+                                  fields=('revenue',))
+
+        days_data = [
+            {
+                'date': point['day'].strftime('%d/%m'),
+                'revenus': round(point['revenue'], 2)
+            }
+            for point in series
+        ]
+
         return {"data": days_data}
-        
+
     except Exception as e:
         print(f"Error fetching admin revenue chart: {e}")
         return {"data": [{"date": f"0{i}/01", "revenus": 0} for i in range(1, 8)]}
@@ -3012,7 +3071,7 @@ async def get_coupons(payload: dict = Depends(verify_token)):
 async def get_merchant_performance(payload: dict = Depends(verify_token)):
     """Métriques de performance réelles pour merchants"""
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "merchant":
             raise HTTPException(status_code=403, detail="Accès refusé")
         
@@ -3056,7 +3115,7 @@ async def get_merchant_performance(payload: dict = Depends(verify_token)):
 async def get_influencer_performance(payload: dict = Depends(verify_token)):
     """Métriques de performance réelles pour influencers"""
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "influencer":
             raise HTTPException(status_code=403, detail="Accès refusé")
         
@@ -3102,7 +3161,7 @@ async def get_influencer_performance(payload: dict = Depends(verify_token)):
 async def get_platform_metrics(payload: dict = Depends(verify_token)):
     """Métriques plateforme réelles pour admin"""
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Accès refusé")
         
@@ -3156,10 +3215,65 @@ async def get_platform_metrics(payload: dict = Depends(verify_token)):
             "signup_trend": 0
         }
 
+@app.get("/api/reports/export/{dataset}")
+async def export_report(
+    dataset: str,
+    format: ReportFormat = Query(ReportFormat.CSV),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    payload: dict = Depends(verify_token)
+):
+    """
+    Export en flux des ventes / conversions (CSV, JSON Lines, Excel)
+
+    Lecture paginée et écriture incrémentale : la mémoire reste constante,
+    même pour une année de ventes. Périmètre : tout pour un admin, ses
+    propres lignes pour un merchant / influenceur
+    """
+    config = EXPORT_DATASETS.get(dataset)
+    if config is None:
+        raise HTTPException(status_code=404, detail="Dataset inconnu")
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="Formats disponibles: csv, jsonl, excel")
+
+    user = await run_sync(token_principal, payload)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    filters = {}
+    if user["role"] != "admin":
+        scope_column = config["scopes"].get(user["role"])
+        if scope_column is None:
+            raise HTTPException(status_code=403, detail="Export non autorisé pour ce rôle")
+        if user["role"] == "merchant":
+            owner = await run_sync(get_merchant_by_user_id, user["id"])
+        else:
+            owner = await run_sync(get_influencer_by_user_id, user["id"])
+        if not owner:
+            raise HTTPException(status_code=404, detail="Profil introuvable")
+        filters[scope_column] = owner["id"]
+
+    rows = paged_rows(supabase, dataset, config["columns"], filters, since=start_date, until=end_date)
+    media_type, _ = STREAM_FORMATS[format]
+    filename = report_generator.export_filename(dataset, format)
+
+    try:
+        chunks = report_generator.stream_export(format, rows, title=dataset)
+    except ValueError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    # Générateur synchrone : Starlette l'itère dans le threadpool, bloc par bloc
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/api/admin/platform-revenue")
 async def get_platform_revenue(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    top: int = Query(20, ge=1, le=100),
     payload: dict = Depends(verify_token)
 ):
     """
@@ -3167,98 +3281,85 @@ async def get_platform_revenue(
     
     Affiche:
     - Total des commissions plateforme
-    - Répartition par merchant
+    - Répartition par merchant (top N)
     - Statistiques détaillées
+
+    Les totaux viennent des buckets journaliers (dashboard_daily_stats) :
+    les filtres de dates sont appliqués au jour près, bornes incluses
     """
     try:
-        user = get_user_by_id(payload["sub"])
+        user = await run_sync(token_principal, payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Admin uniquement")
-        
-        # Requête base
-        query = supabase.table('sales')\
-            .select('*, merchants(company_name)')\
+
+        try:
+            start_day = datetime.fromisoformat(start_date.replace("Z", "+00:00")).date() if start_date else None
+            end_day = datetime.fromisoformat(end_date.replace("Z", "+00:00")).date() if end_date else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates invalides (format ISO 8601 attendu)")
+        if start_day and end_day and start_day > end_day:
+            raise HTTPException(status_code=400, detail="start_date doit précéder end_date")
+
+        rollup = await run_sync(get_platform_revenue_rollup, start_day, end_day, top)
+        totals = rollup["summary"]
+        total_platform_revenue = totals["platform_commission"]
+        total_amount = totals["sales_amount"]
+        total_sales = int(totals["sales_count"])
+
+        # 10 dernières commissions (lecture bornée)
+        recent_query = async_supabase.table('sales')\
+            .select('merchant_id, amount, platform_commission, influencer_commission, merchant_revenue, created_at, merchants(company_name)')\
             .eq('status', 'completed')
-        
-        # Filtres dates optionnels
         if start_date:
-            query = query.gte('created_at', start_date)
+            recent_query = recent_query.gte('created_at', start_date)
         if end_date:
-            query = query.lte('created_at', end_date)
-        
-        sales = query.execute()
-        
-        if not sales.data:
-            return {
-                'summary': {
-                    'total_platform_revenue': 0,
-                    'total_influencer_commission': 0,
-                    'total_merchant_revenue': 0,
-                    'total_sales': 0,
-                    'average_commission_per_sale': 0
-                },
-                'by_merchant': [],
-                'recent_commissions': []
+            recent_query = recent_query.lte('created_at', end_date)
+        recent_result = await recent_query.order('created_at', desc=True).limit(10).execute()
+        recent_sales = recent_result.data or []
+
+        # Noms des merchants du top N uniquement
+        merchant_ids = [row['merchant_id'] for row in rollup['by_merchant']]
+        company_names = {}
+        if merchant_ids:
+            merchants_result = await async_supabase.table('merchants')\
+                .select('id, company_name')\
+                .in_('id', merchant_ids)\
+                .execute()
+            company_names = {m['id']: m.get('company_name') for m in merchants_result.data or []}
+
+        merchants_list = [
+            {
+                'merchant_id': row['merchant_id'],
+                'company_name': company_names.get(row['merchant_id']) or 'Unknown',
+                'platform_commission': round(row['platform_commission'], 2),
+                'influencer_commission': round(row['influencer_commission'], 2),
+                'merchant_revenue': round(row['merchant_revenue'], 2),
+                'total_sales_amount': round(row['sales_amount'], 2),
+                'sales_count': int(row['sales_count'])
             }
-        
-        # Calculer statistiques globales
-        total_platform_revenue = sum(float(sale.get('platform_commission', 0)) for sale in sales.data)
-        total_influencer_commission = sum(float(sale.get('influencer_commission', 0)) for sale in sales.data)
-        total_merchant_revenue = sum(float(sale.get('merchant_revenue', 0)) for sale in sales.data)
-        total_amount = sum(float(sale.get('amount', 0)) for sale in sales.data)
-        
-        # Grouper par merchant
-        merchants_revenue = {}
-        for sale in sales.data:
-            merchant_id = sale.get('merchant_id')
-            if not merchant_id:
-                continue
-                
-            if merchant_id not in merchants_revenue:
-                merchants_revenue[merchant_id] = {
-                    'merchant_id': merchant_id,
-                    'company_name': sale.get('merchants', {}).get('company_name', 'Unknown') if sale.get('merchants') else 'Unknown',
-                    'platform_commission': 0,
-                    'influencer_commission': 0,
-                    'merchant_revenue': 0,
-                    'total_sales_amount': 0,
-                    'sales_count': 0
-                }
-            
-            merchants_revenue[merchant_id]['platform_commission'] += float(sale.get('platform_commission', 0))
-            merchants_revenue[merchant_id]['influencer_commission'] += float(sale.get('influencer_commission', 0))
-            merchants_revenue[merchant_id]['merchant_revenue'] += float(sale.get('merchant_revenue', 0))
-            merchants_revenue[merchant_id]['total_sales_amount'] += float(sale.get('amount', 0))
-            merchants_revenue[merchant_id]['sales_count'] += 1
-        
-        # Trier par commission décroissante
-        merchants_list = sorted(
-            merchants_revenue.values(),
-            key=lambda x: x['platform_commission'],
-            reverse=True
-        )
-        
-        # 10 dernières commissions
+            for row in rollup['by_merchant']
+        ]
+
         recent_commissions = []
-        for sale in sales.data[:10]:
+        for sale in recent_sales:
             recent_commissions.append({
                 'merchant_id': sale.get('merchant_id'),
                 'company_name': sale.get('merchants', {}).get('company_name', 'Unknown') if sale.get('merchants') else 'Unknown',
-                'amount': float(sale.get('amount', 0)),
-                'platform_commission': float(sale.get('platform_commission', 0)),
-                'influencer_commission': float(sale.get('influencer_commission', 0)),
-                'merchant_revenue': float(sale.get('merchant_revenue', 0)),
+                'amount': float(sale.get('amount') or 0),
+                'platform_commission': float(sale.get('platform_commission') or 0),
+                'influencer_commission': float(sale.get('influencer_commission') or 0),
+                'merchant_revenue': float(sale.get('merchant_revenue') or 0),
                 'created_at': sale.get('created_at')
             })
-        
+
         return {
             'summary': {
                 'total_platform_revenue': round(total_platform_revenue, 2),
-                'total_influencer_commission': round(total_influencer_commission, 2),
-                'total_merchant_revenue': round(total_merchant_revenue, 2),
+                'total_influencer_commission': round(totals['influencer_commission'], 2),
+                'total_merchant_revenue': round(totals['merchant_revenue'], 2),
                 'total_sales_amount': round(total_amount, 2),
-                'total_sales': len(sales.data),
-                'average_commission_per_sale': round(total_platform_revenue / len(sales.data), 2) if sales.data else 0,
+                'total_sales': total_sales,
+                'average_commission_per_sale': round(total_platform_revenue / total_sales, 2) if total_sales else 0,
                 'platform_commission_rate': round((total_platform_revenue / total_amount * 100), 2) if total_amount > 0 else 0
             },
             'by_merchant': merchants_list,
@@ -3316,6 +3417,10 @@ async def startup_event():
             print(f"⚠️ Erreur démarrage scheduler (non bloquant): {e}")
     else:
         print("⏰ Scheduler non disponible (import failed or disabled)")
+    print("🔗 Préchargement de l'index des liens trackés...")
+    tracking_service.warm_link_index()
+    await click_ingestion_queue.start()
+    await webhook_worker_pool.start()
     print("✅ Serveur prêt")
 
 @app.on_event("shutdown")
@@ -3327,6 +3432,15 @@ async def shutdown_event():
             stop_scheduler()
         except Exception as e:
             print(f"⚠️ Erreur arrêt scheduler (non bloquant): {e}")
+    # Vider le tampon des clics avant de quitter
+    await click_ingestion_queue.stop()
+    # Terminer les lots de webhooks en cours
+    await webhook_worker_pool.stop()
+    # Processus d'encodage d'images (pool créé seulement si le module a servi)
+    image_optimizer = sys.modules.get("services.image_optimizer")
+    if image_optimizer is not None:
+        image_optimizer.shutdown_encode_pool()
+    await close_async_supabase()
     print("✅ Arrêt propre")
 
 # ============================================
@@ -3336,7 +3450,7 @@ async def shutdown_event():
 @app.post("/api/admin/validate-sales")
 async def manual_validate_sales(payload: dict = Depends(verify_token)):
     """Déclenche manuellement la validation des ventes (admin only)"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
     
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin uniquement")
@@ -3347,7 +3461,7 @@ async def manual_validate_sales(payload: dict = Depends(verify_token)):
 @app.post("/api/admin/process-payouts")
 async def manual_process_payouts(payload: dict = Depends(verify_token)):
     """Déclenche manuellement les paiements automatiques (admin only)"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
     
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin uniquement")
@@ -3358,7 +3472,7 @@ async def manual_process_payouts(payload: dict = Depends(verify_token)):
 @app.post("/api/sales/{sale_id}/refund")
 async def refund_sale(sale_id: str, reason: str = "customer_return", payload: dict = Depends(verify_token)):
     """Traite un remboursement de vente"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
     
     if user["role"] not in ["admin", "merchant"]:
         raise HTTPException(status_code=403, detail="Accès refusé")
@@ -3376,7 +3490,7 @@ async def update_payment_method(
     payload: dict = Depends(verify_token)
 ):
     """Met à jour la méthode de paiement de l'influenceur"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
     
     if user["role"] != "influencer":
         raise HTTPException(status_code=403, detail="Influenceurs uniquement")
@@ -3417,7 +3531,7 @@ async def update_payment_method(
 @app.get("/api/influencer/payment-status")
 async def get_payment_status(payload: dict = Depends(verify_token)):
     """Récupère le statut de paiement de l'influenceur"""
-    user = get_user_by_id(payload["sub"])
+    user = token_principal(payload)
     
     if user["role"] != "influencer":
         raise HTTPException(status_code=403, detail="Influenceurs uniquement")
@@ -3461,36 +3575,41 @@ async def get_payment_status(payload: dict = Depends(verify_token)):
 # ============================================
 
 @app.get("/r/{short_code}")
-async def redirect_tracking_link(short_code: str, request: Request, response: Response):
+async def redirect_tracking_link(short_code: str, request: Request, background_tasks: BackgroundTasks):
     """
     Endpoint de redirection avec tracking
     
     Workflow:
-    1. Enregistre le clic dans la BDD
+    1. Résout le short_code depuis l'index en mémoire (aucune requête BDD si l'index est chaud)
     2. Crée un cookie d'attribution (30 jours)
     3. Redirige vers l'URL marchande
+    4. Publie le clic dans la file d'ingestion (persisté par lots)
     
     Exemple: http://localhost:8000/r/ABC12345 → https://boutique.com/produit
     """
     try:
-        # Tracker le clic et récupérer l'URL de destination
-        destination_url = await tracking_service.track_click(
-            short_code=short_code,
-            request=request,
-            response=response
-        )
+        link = tracking_service.resolve_short_code(short_code)
         
-        if not destination_url:
+        if not link or link.status != "active" or not link.destination_url:
             raise HTTPException(
                 status_code=404,
                 detail=f"Lien de tracking introuvable ou inactif: {short_code}"
             )
         
+        click_data = tracking_service.build_click_event(link, request)
+        
         # Rediriger vers la boutique marchande
-        return RedirectResponse(
-            url=destination_url,
+        redirect = RedirectResponse(
+            url=link.destination_url,
             status_code=302  # Temporary redirect
         )
+        tracking_service.set_attribution_cookie(redirect, link, click_data["id"])
+        
+        # Ingestion par lots; si la file est saturée, écriture directe après la réponse
+        if not await click_ingestion_queue.submit(click_data):
+            background_tasks.add_task(tracking_service.record_click, click_data)
+        
+        return redirect
         
     except HTTPException:
         raise
@@ -3589,6 +3708,44 @@ async def get_tracking_link_stats(link_id: str, payload: dict = Depends(verify_t
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.put("/api/tracking-links/{link_id}/status")
+async def update_tracking_link_status(
+    link_id: str,
+    data: TrackingLinkStatusUpdate,
+    payload: dict = Depends(verify_token)
+):
+    """
+    Active / met en pause / archive un lien tracké
+    
+    Invalide l'entrée correspondante de l'index de redirection /r/{short_code}
+    """
+    try:
+        user_id = payload.get("user_id") or payload.get("sub")
+        
+        influencer = supabase.table('influencers').select('id').eq('user_id', user_id).execute()
+        link = supabase.table('tracking_links').select('influencer_id').eq('id', link_id).execute()
+        
+        if not link.data:
+            raise HTTPException(status_code=404, detail="Lien introuvable")
+        
+        owner_id = influencer.data[0]['id'] if influencer.data else None
+        if payload.get("role") != "admin" and link.data[0].get('influencer_id') != owner_id:
+            raise HTTPException(status_code=403, detail="Accès refusé")
+        
+        result = await tracking_service.update_link_status(link_id, data.status)
+        
+        if not result.get('success'):
+            raise HTTPException(status_code=500, detail=result.get('error'))
+        
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Erreur statut lien: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================
 # ENDPOINTS WEBHOOKS E-COMMERCE
 # ============================================
@@ -3639,6 +3796,22 @@ async def shopify_webhook(merchant_id: str, request: Request):
         return {"status": "error", "message": str(e)}
 
 
+@app.post("/api/webhook/queue/{source}/{merchant_id}")
+async def queued_ecommerce_webhook(source: str, merchant_id: str, request: Request):
+    """
+    Reçoit un webhook de commande (shopify, woocommerce, tiktok_shop) en mode file
+
+    Vérifie la signature HMAC, enregistre le body brut (dédupliqué par
+    commande) et répond immédiatement ; la vente est créée par les workers
+    (webhook_ingestion.py). Les renvois d'une même commande sont acquittés
+    sans créer de doublon
+    """
+    result = await webhook_service.enqueue_webhook(source, request, merchant_id)
+    if result.get("accepted") and not result.get("duplicate"):
+        webhook_worker_pool.notify()
+    return {"status": "accepted" if result.get("accepted") else "ignored", **result}
+
+
 @app.post("/api/webhook/woocommerce/{merchant_id}")
 async def woocommerce_webhook(merchant_id: str, request: Request):
     """
@@ -4071,7 +4244,7 @@ async def get_gateway_statistics(payload: dict = Depends(verify_token)):
     """
     try:
         # Vérifier admin
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Admin uniquement")
         
@@ -4110,7 +4283,7 @@ async def get_merchant_payment_config(payload: dict = Depends(verify_token)):
     }
     """
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         
         if user["role"] != "merchant":
             raise HTTPException(status_code=403, detail="Merchants uniquement")
@@ -4169,7 +4342,7 @@ async def update_merchant_payment_config(
     }
     """
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         
         if user["role"] != "merchant":
             raise HTTPException(status_code=403, detail="Merchants uniquement")
@@ -4237,7 +4410,7 @@ async def generate_monthly_invoices(
     """
     try:
         # Vérifier admin
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Admin uniquement")
         
@@ -4281,7 +4454,7 @@ async def get_all_invoices(
     """
     try:
         # Vérifier admin
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Admin uniquement")
         
@@ -4310,7 +4483,7 @@ async def get_invoice_details_admin(
     """Récupère les détails complets d'une facture (Admin)"""
     
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Admin uniquement")
         
@@ -4344,7 +4517,7 @@ async def mark_invoice_paid_admin(
     }
     """
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Admin uniquement")
         
@@ -4383,7 +4556,7 @@ async def get_merchant_invoices(payload: dict = Depends(verify_token)):
     ]
     """
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         
         if user["role"] != "merchant":
             raise HTTPException(status_code=403, detail="Merchants uniquement")
@@ -4407,7 +4580,7 @@ async def get_invoice_details_merchant(
     """Récupère les détails d'une facture (Merchant)"""
     
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         
         if user["role"] != "merchant":
             raise HTTPException(status_code=403, detail="Merchants uniquement")
@@ -4447,7 +4620,7 @@ async def pay_invoice_merchant(
     }
     """
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         
         if user["role"] != "merchant":
             raise HTTPException(status_code=403, detail="Merchants uniquement")
@@ -4486,7 +4659,7 @@ async def send_payment_reminders(payload: dict = Depends(verify_token)):
     """Envoie des rappels pour toutes les factures en retard (Admin)"""
     
     try:
-        user = get_user_by_id(payload["sub"])
+        user = token_principal(payload)
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Admin uniquement")
         
@@ -5379,7 +5552,11 @@ async def respond_to_invitation(
                 "commission_rate": invitation_data.get("commission_rate", 10),
                 "created_at": "now()"
             }
-            supabase.table("tracking_links").insert(tracking_link).execute()
+            created = supabase.table("tracking_links").insert(tracking_link).execute()
+            if created.data:
+                # Compteur d'usage indexé sur l'id du compte influencers (cf. count_usage)
+                account = get_account(user["id"], "influencer")
+                record_usage("influencer", account["id"] if account else None, "links")
         
         return {
             "success": True,
@@ -6404,6 +6581,7 @@ async def assign_company_link(
         result = supabase.table("tracking_links").update({
             "influencer_id": team_member_id
         }).eq("id", link_id).eq("merchant_id", user["id"]).execute()
+        tracking_service.link_index.invalidate(link_id=link_id)
         
         return {
             "success": True,
@@ -4,13 +4,13 @@ Redis + Memory + CDN avec invalidation intelligente
 """
 import os
 import json
+import asyncio
 import hashlib
 from typing import Any, Optional, Callable, List
-from datetime import timedelta
 from functools import wraps
 import redis
-from cachetools import TTLCache, LRUCache
 
+from services.cache_engine import CacheEngine, RedisTier
 from utils.logger import logger
 
 
@@ -18,10 +18,6 @@ class AdvancedCachingStrategy:
     """Système de cache multi-niveaux avec stratégies avancées"""
 
     def __init__(self):
-        # Niveau 1: Cache mémoire (le plus rapide)
-        self.memory_cache = TTLCache(maxsize=1000, ttl=300)  # 5 min
-        self.lru_cache = LRUCache(maxsize=5000)
-
         # Niveau 2: Redis (partagé entre instances)
         try:
             self.redis_client = redis.Redis(
@@ -37,6 +33,11 @@ class AdvancedCachingStrategy:
             logger.warning(f"❌ Redis not available: {e}")
             self.redis_available = False
 
+        # Niveau 1 (mémoire bornée, TTL par entrée) + niveau 2 (Redis)
+        self.engine = CacheEngine(
+            l2=RedisTier(self.redis_client) if self.redis_available else None
+        )
+
         # Configuration TTL par type de données
         self.ttl_config = {
             'static': 86400 * 7,      # 7 jours (images, CSS, JS)
@@ -48,6 +49,17 @@ class AdvancedCachingStrategy:
             'permanent': 86400 * 30    # 30 jours
         }
 
+        # Fenêtre stale-while-revalidate par type (0 = jamais de valeur périmée)
+        self.stale_config = {
+            'static': 86400,
+            'product': 300,
+            'user': 0,
+            'analytics': 60,
+            'api': 30,
+            'session': 0,
+            'permanent': 86400
+        }
+
     def cache(
         self,
         key: str,
@@ -57,7 +69,11 @@ class AdvancedCachingStrategy:
         use_redis: bool = True
     ):
         """
-        Décorateur de cache multi-niveaux
+        Décorateur de cache multi-niveaux (fonctions sync ou async)
+
+        Sur un miss, un seul appel à la fonction par clé (les appels
+        concurrents attendent son résultat) ; une valeur expirée depuis moins
+        de stale_config[cache_type] est servie et rafraîchie en arrière-plan
 
         Usage:
             @cache_service.cache(key='product:{product_id}', cache_type='product')
@@ -65,86 +81,51 @@ class AdvancedCachingStrategy:
                 return expensive_db_query(product_id)
         """
         def decorator(func: Callable):
-            @wraps(func)
-            def wrapper(*args, **kwargs):
-                # Générer clé de cache unique
-                cache_key = self._generate_cache_key(key, args, kwargs)
-
-                # Niveau 1: Chercher en mémoire (le plus rapide)
-                if use_memory:
-                    cached_value = self._get_from_memory(cache_key)
-                    if cached_value is not None:
-                        logger.debug(f"Cache HIT (memory): {cache_key}")
-                        return cached_value
-
-                # Niveau 2: Chercher dans Redis
-                if use_redis and self.redis_available:
-                    cached_value = self._get_from_redis(cache_key)
-                    if cached_value is not None:
-                        logger.debug(f"Cache HIT (redis): {cache_key}")
-                        # Promouvoir vers mémoire
-                        if use_memory:
-                            self._set_in_memory(cache_key, cached_value, ttl)
-                        return cached_value
-
-                # Cache MISS: Exécuter fonction
-                logger.debug(f"Cache MISS: {cache_key}")
-                result = func(*args, **kwargs)
-
-                # Stocker dans les caches
-                actual_ttl = self.ttl_config.get(cache_type, ttl)
+            actual_ttl = self.ttl_config.get(cache_type, ttl)
+            options = dict(
+                ttl=actual_ttl,
+                namespace=cache_type,
+                stale_ttl=self.stale_config.get(cache_type, 0),
+                use_memory=use_memory,
+                use_l2=use_redis,
+            )
 
-                if use_redis and self.redis_available:
-                    self._set_in_redis(cache_key, result, actual_ttl)
+            if asyncio.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    cache_key = self._generate_cache_key(key, args, kwargs)
+                    return await self.engine.get_or_load_async(
+                        cache_key, lambda: func(*args, **kwargs), **options
+                    )
 
-                if use_memory:
-                    self._set_in_memory(cache_key, result, actual_ttl)
+                return async_wrapper
 
-                return result
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key = self._generate_cache_key(key, args, kwargs)
+                return self.engine.get_or_load(
+                    cache_key, lambda: func(*args, **kwargs), **options
+                )
 
             return wrapper
         return decorator
 
     def get(self, key: str, default: Any = None) -> Optional[Any]:
         """Récupérer une valeur du cache (memory → redis)"""
-        # Mémoire d'abord
-        value = self._get_from_memory(key)
-        if value is not None:
-            return value
-
-        # Redis ensuite
-        if self.redis_available:
-            value = self._get_from_redis(key)
-            if value is not None:
-                # Promouvoir vers mémoire
-                self._set_in_memory(key, value, 300)
-                return value
-
-        return default
+        return self.engine.get(key, default)
 
     def set(self, key: str, value: Any, ttl: int = 300, cache_type: str = 'api'):
         """Stocker une valeur dans le cache"""
         actual_ttl = self.ttl_config.get(cache_type, ttl)
 
         # Stocker dans les deux niveaux
-        self._set_in_memory(key, value, actual_ttl)
-
-        if self.redis_available:
-            self._set_in_redis(key, value, actual_ttl)
+        self.engine.set(key, value, actual_ttl)
 
         logger.debug(f"Cache SET: {key} (TTL: {actual_ttl}s)")
 
     def delete(self, key: str):
         """Supprimer une clé du cache (tous niveaux)"""
-        # Mémoire
-        if key in self.memory_cache:
-            del self.memory_cache[key]
-        if key in self.lru_cache:
-            del self.lru_cache[key]
-
-        # Redis
-        if self.redis_available:
-            self.redis_client.delete(key)
+        self.engine.delete(key)
 
         logger.debug(f"Cache DELETE: {key}")
 
@@ -154,35 +135,13 @@ class AdvancedCachingStrategy:
 
         Example: invalidate_pattern('product:*')
         """
-        # Mémoire (scan manuel)
-        keys_to_delete = [
-            k for k in self.memory_cache.keys()
-            if self._match_pattern(k, pattern)
-        ]
-        for key in keys_to_delete:
-            del self.memory_cache[key]
-
-        # Redis (scan avec MATCH)
-        if self.redis_available:
-            cursor = 0
-            while True:
-                cursor, keys = self.redis_client.scan(
-                    cursor,
-                    match=pattern,
-                    count=100
-                )
-                if keys:
-                    self.redis_client.delete(*keys)
-
-                if cursor == 0:
-                    break
+        self.engine.invalidate_pattern(pattern)
 
         logger.info(f"Cache INVALIDATE pattern: {pattern}")
 
     def clear_all(self):
         """Vider tout le cache"""
-        self.memory_cache.clear()
-        self.lru_cache.clear()
+        self.engine.clear_local()
 
         if self.redis_available:
             self.redis_client.flushdb()
@@ -190,19 +149,8 @@ class AdvancedCachingStrategy:
         logger.warning("Cache CLEARED (all levels)")
 
     def get_stats(self) -> dict:
-        """Statistiques de cache"""
-        stats = {
-            'memory_cache': {
-                'size': len(self.memory_cache),
-                'maxsize': self.memory_cache.maxsize,
-                'hits': getattr(self.memory_cache, 'hits', 0),
-                'misses': getattr(self.memory_cache, 'misses', 0)
-            },
-            'lru_cache': {
-                'size': len(self.lru_cache),
-                'maxsize': self.lru_cache.maxsize
-            }
-        }
+        """Statistiques de cache (par namespace)"""
+        stats = self.engine.get_stats()
 
         if self.redis_available:
             redis_info = self.redis_client.info('stats')
@@ -249,57 +197,12 @@ class AdvancedCachingStrategy:
         # Si encore des placeholders, utiliser args
         if '{' in key:
             # Fallback: hash des arguments
-            args_str = json.dumps({'args': args, 'kwargs': kwargs}, sort_keys=True)
+            args_str = json.dumps({'args': args, 'kwargs': kwargs}, sort_keys=True, default=str)
             args_hash = hashlib.md5(args_str.encode()).hexdigest()[:8]
             key = f"{key}:{args_hash}"
 
         return key
 
-    def _get_from_memory(self, key: str) -> Optional[Any]:
-        """Récupérer de la mémoire"""
-        # TTL cache d'abord
-        if key in self.memory_cache:
-            return self.memory_cache[key]
-
-        # LRU cache ensuite
-        if key in self.lru_cache:
-            return self.lru_cache[key]
-
-        return None
-
-    def _set_in_memory(self, key: str, value: Any, ttl: int):
-        """Stocker en mémoire"""
-        # TTL cache pour données temporaires
-        if ttl < 3600:  # < 1h
-            self.memory_cache[key] = value
-        else:
-            # LRU cache pour données plus persistantes
-            self.lru_cache[key] = value
-
-    def _get_from_redis(self, key: str) -> Optional[Any]:
-        """Récupérer de Redis"""
-        try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
-        except Exception as e:
-            logger.error(f"Redis GET error: {e}")
-
-        return None
-
-    def _set_in_redis(self, key: str, value: Any, ttl: int):
-        """Stocker dans Redis"""
-        try:
-            serialized = json.dumps(value)
-            self.redis_client.setex(key, ttl, serialized)
-        except Exception as e:
-            logger.error(f"Redis SET error: {e}")
-
-    def _match_pattern(self, key: str, pattern: str) -> bool:
-        """Matcher un pattern (simple wildcard)"""
-        import fnmatch
-        return fnmatch.fnmatch(key, pattern)
-
 
 # CDN Cache Headers Helper
 class CDNCacheHeaders:
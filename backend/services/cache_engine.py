@@ -0,0 +1,600 @@
+"""
+Moteur de cache à deux niveaux
+
+- L1 : mémoire locale, LRU bornée en nombre d'entrées ET en octets, TTL par
+  entrée, admission TinyLFU (un accès unique ne chasse pas une clé chaude)
+- L2 : Redis (partagé entre instances), optionnel
+- Single-flight : sur un miss, un seul appel au loader par clé, les appels
+  concurrents attendent son résultat
+- Stale-while-revalidate : pendant `stale_ttl` après expiration, la valeur
+  périmée est servie immédiatement et rafraîchie en arrière-plan
+- Métriques par namespace (hits, misses, évictions...)
+- Tags : une entrée L1 taguée garde les générations de ses tags lues dans le
+  L2 ; chaque hit les compare aux générations courantes (mises en cache
+  localement CACHE_TAG_VERSION_TTL secondes), donc une invalidation faite par
+  un autre worker est vue au plus tard après ce délai
+
+Utilisé par AdvancedCachingStrategy (services/advanced_caching.py) et le
+décorateur `cached` (services/cache_service.py)
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from utils.logger import logger
+
+CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "5000"))
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "4"))
+CACHE_TAG_VERSION_TTL = float(os.getenv("CACHE_TAG_VERSION_TTL", "1"))
+LEGACY_L1_TTL = 60
+
+# Enveloppe stockée en L2 (l'échéance "fraîche" survit au passage dans Redis)
+_ENVELOPE_VALUE = "__cache_v"
+_ENVELOPE_FRESH_UNTIL = "__cache_fresh_until"
+
+
+def _default_namespace(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+def _estimate_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+    size: int
+    namespace: str
+    tags: FrozenSet[str] = field(default_factory=frozenset)
+    # Générations des tags au moment du chargement (vide : pas de source L2)
+    tag_versions: Dict[str, int] = field(default_factory=dict)
+
+
+class FrequencySketch:
+    """
+    Count-Min Sketch (compteurs plafonnés à 15, divisés par deux
+    périodiquement) : estime la fréquence d'accès récente d'une clé
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, capacity: int):
+        width = 1
+        while width < max(capacity, 16) * 4:
+            width <<= 1
+        self._mask = width - 1
+        self._table = [[0] * width for _ in range(self.DEPTH)]
+        self._sample_size = max(capacity, 16) * 10
+        self._additions = 0
+
+    def _indexes(self, key: str):
+        for i in range(self.DEPTH):
+            yield i, hash((i, key)) & self._mask
+
+    def increment(self, key: str):
+        for row, col in self._indexes(key):
+            if self._table[row][col] < self.MAX_COUNT:
+                self._table[row][col] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._age()
+
+    def frequency(self, key: str) -> int:
+        return min(self._table[row][col] for row, col in self._indexes(key))
+
+    def _age(self):
+        for row in self._table:
+            for i, count in enumerate(row):
+                row[i] = count >> 1
+        self._additions //= 2
+
+
+class NamespaceStats:
+    """Compteurs par namespace"""
+
+    FIELDS = (
+        "hits", "l2_hits", "stale_hits", "misses", "loads", "load_errors",
+        "coalesced", "evictions", "expirations", "rejections",
+    )
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+        self._lock = threading.Lock()
+
+    def incr(self, namespace: str, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[namespace][name] += amount
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for namespace, counters in self._counters.items():
+                lookups = counters["hits"] + counters["l2_hits"] + counters["stale_hits"] + counters["misses"]
+                served = lookups - counters["misses"]
+                result[namespace] = {
+                    **counters,
+                    "hit_rate_percent": round(served / lookups * 100, 2) if lookups else 0,
+                }
+            return result
+
+
+class MemoryTier:
+    """L1 : LRU bornée (entrées + octets), TTL par entrée, admission TinyLFU"""
+
+    def __init__(self, max_entries: int, max_bytes: int, stats: NamespaceStats):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._sketch = FrequencySketch(max_entries)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def get(self, key: str, now: float) -> Optional[CacheEntry]:
+        """Entrée fraîche ou périmée-servable, sinon None"""
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if now >= entry.stale_until:
+                self._remove(key)
+                self.stats.incr(entry.namespace, "expirations")
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CacheEntry) -> bool:
+        """Insère l'entrée ; False si refusée (trop grosse ou moins fréquente)"""
+        if entry.size > self.max_bytes:
+            self.stats.incr(entry.namespace, "rejections")
+            return False
+
+        with self._lock:
+            # Mise à jour d'une clé déjà admise : pas de filtre d'admission
+            admitted = self._remove(key) is not None
+
+            while self._entries and (
+                len(self._entries) >= self.max_entries
+                or self.current_bytes + entry.size > self.max_bytes
+            ):
+                victim_key, victim = next(iter(self._entries.items()))
+                expired = time.time() >= victim.stale_until
+                if (
+                    not expired
+                    and not admitted
+                    and self._sketch.frequency(key) < self._sketch.frequency(victim_key)
+                ):
+                    self.stats.incr(entry.namespace, "rejections")
+                    return False
+                self._remove(victim_key)
+                self.stats.incr(victim.namespace, "expirations" if expired else "evictions")
+
+            self._entries[key] = entry
+            self.current_bytes += entry.size
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key) is not None
+
+    def delete_matching(self, predicate: Callable[[str, CacheEntry], bool]) -> int:
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if predicate(k, e)]
+            for k in keys:
+                self._remove(k)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+        return entry
+
+
+class RedisTier:
+    """L2 Redis : valeurs JSON, clés éventuellement préfixées"""
+
+    def __init__(self, redis_client, prefix: str = ""):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self.redis.get(f"{self.prefix}{key}")
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.error(f"Redis GET error: {e}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: int, tags: Optional[List[str]] = None):
+        try:
+            self.redis.setex(f"{self.prefix}{key}", ttl, json.dumps(value))
+        except Exception as e:
+            logger.error(f"Redis SET error: {e}")
+
+    def delete(self, key: str):
+        try:
+            self.redis.delete(f"{self.prefix}{key}")
+        except Exception as e:
+            logger.error(f"Redis DELETE error: {e}")
+
+    def delete_by_pattern(self, pattern: str) -> int:
+        deleted = 0
+        cursor = 0
+        while True:
+            cursor, keys = self.redis.scan(cursor, match=f"{self.prefix}{pattern}", count=100)
+            if keys:
+                deleted += self.redis.delete(*keys)
+            if cursor == 0:
+                return deleted
+
+
+class CacheEngine:
+    """Cache L1 (mémoire) + L2 (Redis) avec single-flight et stale-while-revalidate"""
+
+    def __init__(
+        self,
+        l2=None,
+        max_entries: int = CACHE_L1_MAX_ENTRIES,
+        max_bytes: int = CACHE_L1_MAX_BYTES,
+        refresh_workers: int = CACHE_REFRESH_WORKERS,
+    ):
+        self.l2 = l2
+        self.stats = NamespaceStats()
+        self.l1 = MemoryTier(max_entries, max_bytes, self.stats)
+
+        self._flights: Dict[str, Future] = {}
+        self._flights_lock = threading.Lock()
+        self._async_flights: Dict[str, asyncio.Future] = {}
+        self._background_tasks = set()
+        # {tag: (génération, lue_à)} : évite un aller-retour Redis par hit L1
+        self._tag_versions: Dict[str, Tuple[int, float]] = {}
+        self._tag_versions_lock = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix="cache-refresh"
+        )
+
+    # ------------------------------------------------------------------
+    # Lecture / écriture
+    # ------------------------------------------------------------------
+
+    def lookup(
+        self,
+        key: str,
+        namespace: Optional[str] = None,
+        use_memory: bool = True,
+        use_l2: bool = True,
+        tags: Iterable[str] = (),
+    ) -> Tuple[Optional[Any], bool, bool]:
+        """
+        Retourne (valeur, trouvée, fraîche). Une valeur périmée n'est
+        retournée que dans sa fenêtre stale-while-revalidate
+        """
+        namespace = namespace or _default_namespace(key)
+        now = time.time()
+
+        tags = tuple(tags or ())
+
+        if use_memory:
+            entry = self.l1.get(key, now)
+            if entry is not None:
+                if self._tags_current(entry):
+                    fresh = now < entry.fresh_until
+                    self.stats.incr(namespace, "hits" if fresh else "stale_hits")
+                    return entry.value, True, fresh
+                # Tag invalidé (éventuellement par un autre worker)
+                self.l1.delete(key)
+
+        if use_l2 and self.l2 is not None:
+            # Générations lues avant la valeur : une invalidation concurrente
+            # rend l'entrée promue obsolète au lieu de la valider
+            versions = self._read_tag_versions(tags) if use_memory and tags else {}
+            # Tags connus : le L2 peut valider leurs générations dans la même lecture
+            stored = self.l2.get(key, tags=list(tags)) if tags else self.l2.get(key)
+            if stored is not None:
+                value, fresh_until = self._unwrap(stored, now)
+                fresh = now < fresh_until
+                self.stats.incr(namespace, "l2_hits" if fresh else "stale_hits")
+                if use_memory and fresh:
+                    # Promotion en L1 pour la durée de vie restante
+                    self._put_l1(key, value, fresh_until - now, 0, namespace, tags, versions)
+                return value, True, fresh
+
+        self.stats.incr(namespace, "misses")
+        return None, False, False
+
+    def get(self, key: str, default: Any = None, namespace: Optional[str] = None) -> Any:
+        value, found, _ = self.lookup(key, namespace)
+        return value if found else default
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: int,
+        namespace: Optional[str] = None,
+        stale_ttl: int = 0,
+        tags: Iterable[str] = (),
+        use_memory: bool = True,
+        use_l2: bool = True,
+    ):
+        self._store(key, value, ttl, namespace, stale_ttl, tags, use_memory, use_l2)
+
+    def _store(self, key, value, ttl, namespace, stale_ttl, tags, use_memory, use_l2, tag_versions=None):
+        namespace = namespace or _default_namespace(key)
+        tags = tuple(tags or ())
+        if use_memory:
+            if tag_versions is None:
+                tag_versions = self._read_tag_versions(tags)
+            self._put_l1(key, value, ttl, stale_ttl, namespace, tags, tag_versions)
+        if use_l2 and self.l2 is not None:
+            envelope = {_ENVELOPE_VALUE: value, _ENVELOPE_FRESH_UNTIL: time.time() + ttl}
+            self.l2.set(key, envelope, ttl=int(ttl + stale_ttl), tags=list(tags) or None)
+
+    def delete(self, key: str):
+        self.l1.delete(key)
+        if self.l2 is not None:
+            self.l2.delete(key)
+
+    def invalidate_pattern(self, pattern: str, local_only: bool = False) -> int:
+        deleted = self.l1.delete_matching(lambda k, _: fnmatch.fnmatch(k, pattern))
+        if not local_only and self.l2 is not None and hasattr(self.l2, "delete_by_pattern"):
+            deleted += self.l2.delete_by_pattern(pattern)
+        return deleted
+
+    def invalidate_tag(self, tag: str, local_only: bool = False) -> int:
+        deleted = self.l1.delete_matching(lambda _, e: tag in e.tags)
+        if not local_only and self.l2 is not None and hasattr(self.l2, "delete_by_tag"):
+            version = self.l2.delete_by_tag(tag)
+            deleted += version
+            with self._tag_versions_lock:
+                if version:
+                    self._tag_versions[tag] = (version, time.time())
+                else:
+                    self._tag_versions.pop(tag, None)
+        return deleted
+
+    def clear_local(self):
+        self.l1.clear()
+
+    # ------------------------------------------------------------------
+    # Lecture avec chargement (single-flight + stale-while-revalidate)
+    # ------------------------------------------------------------------
+
+    def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int,
+        namespace: Optional[str] = None,
+        stale_ttl: int = 0,
+        tags: Iterable[str] = (),
+        use_memory: bool = True,
+        use_l2: bool = True,
+    ) -> Any:
+        """Version synchrone : les appels concurrents partagent un seul chargement"""
+        namespace = namespace or _default_namespace(key)
+        store = dict(ttl=ttl, namespace=namespace, stale_ttl=stale_ttl, tags=tags,
+                     use_memory=use_memory, use_l2=use_l2)
+
+        value, found, fresh = self.lookup(key, namespace, use_memory, use_l2, tags)
+        if found:
+            if not fresh:
+                self._refresh_in_background(key, loader, store)
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._flights[key] = flight
+
+        if not leader:
+            self.stats.incr(namespace, "coalesced")
+            return flight.result()
+
+        try:
+            result = self._load(key, loader, store)
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+    async def get_or_load_async(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int,
+        namespace: Optional[str] = None,
+        stale_ttl: int = 0,
+        tags: Iterable[str] = (),
+        use_memory: bool = True,
+        use_l2: bool = True,
+    ) -> Any:
+        """Version async (loader = fabrique de coroutine)"""
+        namespace = namespace or _default_namespace(key)
+        store = dict(ttl=ttl, namespace=namespace, stale_ttl=stale_ttl, tags=tags,
+                     use_memory=use_memory, use_l2=use_l2)
+
+        value, found, fresh = self.lookup(key, namespace, use_memory, use_l2, tags)
+        if found:
+            if not fresh and key not in self._async_flights:
+                task = asyncio.ensure_future(self._load_async_flight(key, loader, store))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_done)
+            return value
+
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            self.stats.incr(namespace, "coalesced")
+            return await asyncio.shield(flight)
+
+        return await self._load_async_flight(key, loader, store)
+
+    # ------------------------------------------------------------------
+    # Métriques
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "l1": {
+                "entries": len(self.l1),
+                "max_entries": self.l1.max_entries,
+                "bytes": self.l1.current_bytes,
+                "max_bytes": self.l1.max_bytes,
+            },
+            "l2_enabled": self.l2 is not None,
+            "namespaces": self.stats.snapshot(),
+        }
+
+    # ------------------------------------------------------------------
+    # Interne
+    # ------------------------------------------------------------------
+
+    def _read_tag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """
+        Générations courantes des tags (cache local de CACHE_TAG_VERSION_TTL
+        secondes, un seul pipeline pour les tags à relire). Vide si le L2 ne
+        gère pas les générations
+        """
+        tags = tuple(tags)
+        if not tags or self.l2 is None or not hasattr(self.l2, "get_tag_versions"):
+            return {}
+
+        now = time.time()
+        versions = {}
+        with self._tag_versions_lock:
+            for tag in tags:
+                cached = self._tag_versions.get(tag)
+                if cached is not None and now - cached[1] < CACHE_TAG_VERSION_TTL:
+                    versions[tag] = cached[0]
+        missing = [tag for tag in tags if tag not in versions]
+        if missing:
+            fetched = self.l2.get_tag_versions(missing)
+            with self._tag_versions_lock:
+                for tag, version in fetched.items():
+                    self._tag_versions[tag] = (version, now)
+            versions.update(fetched)
+        return versions
+
+    def _tags_current(self, entry: CacheEntry) -> bool:
+        if not entry.tag_versions:
+            return True
+        current = self._read_tag_versions(entry.tag_versions)
+        return all(current.get(tag, version) == version for tag, version in entry.tag_versions.items())
+
+    def _put_l1(self, key, value, ttl, stale_ttl, namespace, tags, tag_versions=None):
+        now = time.time()
+        self.l1.put(
+            key,
+            CacheEntry(
+                value=value,
+                fresh_until=now + ttl,
+                stale_until=now + ttl + stale_ttl,
+                size=_estimate_size(value),
+                namespace=namespace,
+                tags=frozenset(tags),
+                tag_versions=dict(tag_versions or {}),
+            ),
+        )
+
+    @staticmethod
+    def _unwrap(stored: Any, now: float) -> Tuple[Any, float]:
+        if isinstance(stored, dict) and _ENVELOPE_VALUE in stored:
+            return stored[_ENVELOPE_VALUE], float(stored.get(_ENVELOPE_FRESH_UNTIL) or now)
+        # Valeur écrite avant l'enveloppe : fraîche tant que Redis la garde,
+        # promue en L1 pour une durée courte
+        return stored, now + LEGACY_L1_TTL
+
+    def _load(self, key: str, loader: Callable[[], Any], store: Dict) -> Any:
+        self.stats.incr(store["namespace"], "loads")
+        # Lues avant le loader : une invalidation pendant le chargement
+        # périme la valeur chargée
+        versions = self._read_tag_versions(store["tags"]) if store["use_memory"] else {}
+        try:
+            result = loader()
+        except Exception:
+            self.stats.incr(store["namespace"], "load_errors")
+            raise
+        if result is not None:
+            self._store(key, result, tag_versions=versions, **store)
+        return result
+
+    async def _load_async_flight(self, key: str, loader, store: Dict) -> Any:
+        flight = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = flight
+        self.stats.incr(store["namespace"], "loads")
+        try:
+            versions = self._read_tag_versions(store["tags"]) if store["use_memory"] else {}
+            result = await loader()
+            if result is not None:
+                self._store(key, result, tag_versions=versions, **store)
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            self.stats.incr(store["namespace"], "load_errors")
+            flight.set_exception(e)
+            # Exception consommée si personne n'attendait ce vol
+            flight.exception()
+            raise
+        finally:
+            self._async_flights.pop(key, None)
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Any], store: Dict):
+        with self._flights_lock:
+            if key in self._flights:
+                return
+            flight = Future()
+            self._flights[key] = flight
+
+        def refresh():
+            try:
+                flight.set_result(self._load(key, loader, store))
+            except Exception as e:
+                logger.warning(f"Cache refresh failed for {key}: {e}")
+                flight.set_exception(e)
+            finally:
+                with self._flights_lock:
+                    self._flights.pop(key, None)
+
+        self._refresh_executor.submit(refresh)
+
+    def _background_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Cache refresh failed: {task.exception()}")
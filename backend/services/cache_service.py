@@ -15,19 +15,27 @@ import redis
 import json
 # import pickle # Remplacé par une sérialisation JSON plus robuste
 import hashlib
-from typing import Optional, Any, Callable, List
+from typing import Optional, Any, Callable, Dict, List
 from functools import wraps
 from datetime import timedelta
 import structlog
 import os
 from contextlib import asynccontextmanager
 
+from services.cache_engine import CacheEngine
+
 logger = structlog.get_logger()
 
 # Configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 CACHE_PREFIX = "sysales:cache:"
 CACHE_DEFAULT_TTL = 3600  # 1 heure
+TAG_VERSION_PREFIX = "tagver:"
+TAG_PRUNE_CURSOR_KEY = "tagprune:cursor"
+
+# Enveloppe d'une valeur taguée: {"__tagged": valeur, "__tagver": {tag: génération}}
+TAGGED_VALUE_KEY = "__tagged"
+TAGGED_VERSIONS_KEY = "__tagver"
 
 
 # ============================================
@@ -37,6 +45,13 @@ CACHE_DEFAULT_TTL = 3600  # 1 heure
 class RedisCache:
     """
     Client Redis pour caching avec features avancées
+
+    Invalidation par tag en O(1) : chaque tag a un compteur de génération
+    (tagver:{tag}). Une valeur taguée embarque les générations de ses tags
+    au moment de l'écriture ; invalider un tag incrémente son compteur et
+    rend toutes ses valeurs obsolètes (elles expirent ensuite via leur TTL).
+    Les lectures valeur + générations partent dans un seul pipeline
+    (pas de MGET multi-clés : compatible Redis Cluster)
     """
 
     def __init__(self):
@@ -45,44 +60,140 @@ class RedisCache:
             "hits": 0,
             "misses": 0,
             "sets": 0,
-            "deletes": 0
+            "deletes": 0,
+            "stale_tag_misses": 0,
+            "tag_invalidations": 0
         }
 
     def _make_key(self, key: str, prefix: str = CACHE_PREFIX) -> str:
         """Générer clé Redis avec préfixe"""
         return f"{prefix}{key}"
 
-    def get(self, key: str) -> Optional[Any]:
+    def _tag_version_key(self, tag: str) -> str:
+        return self._make_key(f"{TAG_VERSION_PREFIX}{tag}")
+
+    @staticmethod
+    def _decode_version(raw) -> int:
+        return int(raw) if raw is not None else 0
+
+    def _decode(self, key: str, raw, tag_versions: Dict[str, int]) -> Optional[Any]:
+        """Désérialise et vérifie les générations des tags embarquées"""
+        if raw is None:
+            self.stats["misses"] += 1
+            return None
+
+        try:
+            value = json.loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            # return pickle.loads(value) # Remplacé par une erreur pour éviter B301
+            logger.error("cache_deserialization_error", key=key, error="Failed to deserialize with JSON. Data is not JSON-serializable, which is not supported.")
+            return None
+
+        if isinstance(value, dict) and TAGGED_VALUE_KEY in value:
+            stored_versions = value.get(TAGGED_VERSIONS_KEY) or {}
+            for tag, version in stored_versions.items():
+                if tag_versions.get(tag, version) != version:
+                    self.stats["misses"] += 1
+                    self.stats["stale_tag_misses"] += 1
+                    logger.debug("cache_stale_tag", key=key, tag=tag)
+                    return None
+            value = value[TAGGED_VALUE_KEY]
+
+        self.stats["hits"] += 1
+        logger.debug("cache_hit", key=key)
+        return value
+
+    def _fetch_tag_versions(self, raws: List[Any], known: Dict[str, int]) -> Dict[str, int]:
+        """
+        Générations des tags embarqués dans des valeurs lues sans que l'appelant
+        ait fourni leurs tags (second aller-retour, uniquement si nécessaire)
+        """
+        missing = set()
+        for raw in raws:
+            if raw and TAGGED_VERSIONS_KEY.encode() in raw:
+                try:
+                    missing.update((json.loads(raw).get(TAGGED_VERSIONS_KEY) or {}).keys())
+                except (json.JSONDecodeError, TypeError, AttributeError):
+                    continue
+        missing -= set(known)
+        if not missing:
+            return known
+
+        tags = sorted(missing)
+        pipe = self.redis.pipeline(transaction=False)
+        for tag in tags:
+            pipe.get(self._tag_version_key(tag))
+        return {**known, **{tag: self._decode_version(v) for tag, v in zip(tags, pipe.execute())}}
+
+    def get_tag_versions(self, tags: List[str]) -> Dict[str, int]:
+        """
+        Générations courantes des tags (un seul pipeline)
+
+        Utilisé par CacheEngine pour valider ses entrées L1 taguées ; en cas
+        d'erreur Redis, {} (les entrées L1 restent servies jusqu'à leur TTL)
+        """
+        tags = list(tags)
+        if not tags:
+            return {}
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for tag in tags:
+                pipe.get(self._tag_version_key(tag))
+            return {tag: self._decode_version(v) for tag, v in zip(tags, pipe.execute())}
+        except Exception as e:
+            logger.error("cache_tag_versions_error", tags=tags, error=str(e))
+            return {}
+
+    def get(self, key: str, tags: Optional[List[str]] = None) -> Optional[Any]:
         """
         Récupérer valeur du cache
 
+        Args:
+            key: Clé du cache
+            tags: Tags de la valeur si connus (lecture en un seul aller-retour)
+
         Returns:
-            Valeur désérialisée ou None si pas trouvé
+            Valeur désérialisée ou None si pas trouvé / invalidée
         """
-        cache_key = self._make_key(key)
+        return self.get_many([key], tags=tags).get(key)
 
-        try:
-            value = self.redis.get(cache_key)
+    def get_many(self, keys: List[str], tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Lecture groupée (pipeline) : {clé: valeur} pour les clés présentes
 
-            if value is None:
-                self.stats["misses"] += 1
-                logger.debug("cache_miss", key=key)
-                return None
+        Example:
+            cache.get_many([CacheKeys.product(pid) for pid in product_ids])
+        """
+        if not keys:
+            return {}
 
-            self.stats["hits"] += 1
-            logger.debug("cache_hit", key=key)
+        tags = list(tags or [])
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(self._make_key(key))
+            for tag in tags:
+                pipe.get(self._tag_version_key(tag))
+            results = pipe.execute()
+
+            raws = results[:len(keys)]
+            tag_versions = {
+                tag: self._decode_version(v) for tag, v in zip(tags, results[len(keys):])
+            }
+            tag_versions = self._fetch_tag_versions(raws, tag_versions)
 
-            # Tenter de désérialiser JSON, sinon pickle
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                # return pickle.loads(value) # Remplacé par une erreur pour éviter B301
-                logger.error("cache_deserialization_error", key=key, error="Failed to deserialize with JSON. Data is not JSON-serializable, which is not supported.")
-                return None
+            found = {}
+            for key, raw in zip(keys, raws):
+                value = self._decode(key, raw, tag_versions)
+                if value is not None:
+                    found[key] = value
+            if len(found) < len(keys):
+                logger.debug("cache_miss", keys=[k for k in keys if k not in found])
+            return found
 
         except Exception as e:
-            logger.error("cache_get_error", key=key, error=str(e))
-            return None
+            logger.error("cache_get_error", keys=keys, error=str(e))
+            return {}
 
     def set(
         self,
@@ -103,52 +214,83 @@ class RedisCache:
         Returns:
             True si succès
         """
-        cache_key = self._make_key(key)
+        return self.set_many({key: value}, ttl=ttl, tags=tags)
+
+    def set_many(
+        self,
+        items: Dict[str, Any],
+        ttl: int = CACHE_DEFAULT_TTL,
+        tags: Optional[List[str]] = None
+    ) -> bool:
+        """Écriture groupée (pipeline), même TTL et mêmes tags pour toutes les clés"""
+        if not items:
+            return True
 
         try:
-            # Sérialiser (JSON si possible, sinon pickle)
-            try:
-                serialized = json.dumps(value)
-            except (TypeError, ValueError) as e:
-                # Si la sérialisation JSON échoue, on lève une erreur au lieu d'utiliser pickle
-                logger.error("cache_serialization_error", key=key, error=str(e), value_type=type(value).__name__)
-                raise ValueError("Value is not JSON serializable and pickle is disabled for security reasons.") from e
-
-            # Stocker avec TTL
-            self.redis.setex(cache_key, ttl, serialized)
-            self.stats["sets"] += 1
-
-            # Ajouter aux tags si spécifiés
+            tags = list(tags or [])
+            tag_versions = {}
             if tags:
+                pipe = self.redis.pipeline(transaction=False)
                 for tag in tags:
-                    tag_key = self._make_key(f"tag:{tag}")
-                    self.redis.sadd(tag_key, cache_key)
-                    self.redis.expire(tag_key, ttl + 3600)  # Tag expire 1h après cache
-
-            logger.debug("cache_set", key=key, ttl=ttl, tags=tags)
+                    pipe.get(self._tag_version_key(tag))
+                tag_versions = {
+                    tag: self._decode_version(v) for tag, v in zip(tags, pipe.execute())
+                }
+
+            pipe = self.redis.pipeline(transaction=False)
+            for key, value in items.items():
+                payload = (
+                    {TAGGED_VALUE_KEY: value, TAGGED_VERSIONS_KEY: tag_versions}
+                    if tag_versions else value
+                )
+                # Sérialiser (JSON uniquement)
+                try:
+                    serialized = json.dumps(payload)
+                except (TypeError, ValueError) as e:
+                    # Si la sérialisation JSON échoue, on lève une erreur au lieu d'utiliser pickle
+                    logger.error("cache_serialization_error", key=key, error=str(e), value_type=type(value).__name__)
+                    raise ValueError("Value is not JSON serializable and pickle is disabled for security reasons.") from e
+
+                # Stocker avec TTL
+                pipe.setex(self._make_key(key), ttl, serialized)
+            pipe.execute()
+            self.stats["sets"] += len(items)
+
+            logger.debug("cache_set", keys=list(items), ttl=ttl, tags=tags)
             return True
 
         except Exception as e:
-            logger.error("cache_set_error", key=key, error=str(e))
+            logger.error("cache_set_error", keys=list(items), error=str(e))
             return False
 
     def delete(self, key: str) -> bool:
         """Supprimer clé du cache"""
-        cache_key = self._make_key(key)
+        return self.delete_many([key]) > 0
+
+    def delete_many(self, keys: List[str]) -> int:
+        """Suppression groupée (une commande DEL par clé, dans un pipeline)"""
+        if not keys:
+            return 0
 
         try:
-            result = self.redis.delete(cache_key)
-            self.stats["deletes"] += 1
-            logger.debug("cache_delete", key=key, deleted=result > 0)
-            return result > 0
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.delete(self._make_key(key))
+            deleted = sum(pipe.execute())
+            self.stats["deletes"] += len(keys)
+            logger.debug("cache_delete", keys=keys, deleted=deleted)
+            return deleted
         except Exception as e:
-            logger.error("cache_delete_error", key=key, error=str(e))
-            return False
+            logger.error("cache_delete_error", keys=keys, error=str(e))
+            return 0
 
     def delete_by_pattern(self, pattern: str) -> int:
         """
         Supprimer toutes les clés matchant un pattern
 
+        ⚠️ Parcourt tout le keyspace (SCAN) : réservé à la maintenance,
+        préférer delete_by_tag pour l'invalidation courante
+
         Example:
             cache.delete_by_pattern("user:*")
         """
@@ -159,9 +301,12 @@ class RedisCache:
             deleted_count = 0
 
             while True:
-                cursor, keys = self.redis.scan(cursor, match=cache_pattern, count=100)
+                cursor, keys = self.redis.scan(cursor, match=cache_pattern, count=1000)
                 if keys:
-                    deleted_count += self.redis.delete(*keys)
+                    pipe = self.redis.pipeline(transaction=False)
+                    for key in keys:
+                        pipe.delete(key)
+                    deleted_count += sum(pipe.execute())
 
                 if cursor == 0:
                     break
@@ -175,33 +320,64 @@ class RedisCache:
 
     def delete_by_tag(self, tag: str) -> int:
         """
-        Supprimer toutes les clés associées à un tag
+        Invalider toutes les clés associées à un tag (O(1) : INCR de la
+        génération du tag)
 
         Example:
             cache.set("user:123", data, tags=["users", "user:123"])
-            cache.delete_by_tag("users")  # Supprime tous les users
-        """
-        tag_key = self._make_key(f"tag:{tag}")
+            cache.delete_by_tag("users")  # Invalide tous les users
 
+        Returns:
+            Nouvelle génération du tag (0 en cas d'erreur)
+        """
         try:
-            # Récupérer toutes les clés avec ce tag
-            cache_keys = self.redis.smembers(tag_key)
+            version = self.redis.incr(self._tag_version_key(tag))
+            self.stats["tag_invalidations"] += 1
+            logger.info("cache_tag_invalidate", tag=tag, version=version)
+            return version
 
-            if not cache_keys:
-                return 0
+        except Exception as e:
+            logger.error("cache_tag_delete_error", tag=tag, error=str(e))
+            return 0
 
-            # Supprimer toutes les clés
-            deleted_count = self.redis.delete(*cache_keys)
+    def prune_tag_sets(self, max_sets: int = 100, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Nettoyage incrémental des anciens sets de tags (format d'avant les
+        générations) : retire les membres expirés, supprime les sets vides
 
-            # Supprimer le tag lui-même
-            self.redis.delete(tag_key)
+        Reprend là où le passage précédent s'est arrêté (curseur SCAN
+        persisté), pour ne traiter qu'une tranche bornée à chaque appel
+        """
+        cursor_key = self._make_key(TAG_PRUNE_CURSOR_KEY)
+        pruned_members = 0
+        deleted_sets = 0
+        visited = 0
 
-            logger.info("cache_tag_delete", tag=tag, deleted=deleted_count)
-            return deleted_count
+        try:
+            cursor = int(self.redis.get(cursor_key) or 0)
+            while visited < max_sets:
+                cursor, tag_keys = self.redis.scan(cursor, match=self._make_key("tag:*"), count=batch_size)
+                for tag_key in tag_keys:
+                    visited += 1
+                    members = list(self.redis.sscan_iter(tag_key, count=batch_size))
+                    pipe = self.redis.pipeline(transaction=False)
+                    for member in members:
+                        pipe.exists(member)
+                    dead = [m for m, alive in zip(members, pipe.execute()) if not alive]
+                    if dead:
+                        pruned_members += self.redis.srem(tag_key, *dead)
+                    # Redis supprime de lui-même un set vidé
+                    if len(dead) == len(members):
+                        deleted_sets += 1
+                if cursor == 0:
+                    break
+            self.redis.set(cursor_key, cursor)
 
         except Exception as e:
-            logger.error("cache_tag_delete_error", tag=tag, error=str(e))
-            return 0
+            logger.error("cache_tag_prune_error", error=str(e))
+
+        logger.info("cache_tag_prune", visited=visited, pruned_members=pruned_members, deleted_sets=deleted_sets)
+        return {"visited": visited, "pruned_members": pruned_members, "deleted_sets": deleted_sets}
 
     def clear_all(self) -> bool:
         """Vider tout le cache (DANGER en production!)"""
@@ -242,6 +418,9 @@ class RedisCache:
 # Instance globale
 cache = RedisCache()
 
+# L1 mémoire + single-flight devant Redis (utilisé par @cached)
+cache_engine = CacheEngine(l2=cache)
+
 
 # ============================================
 # CACHE DECORATOR
@@ -251,11 +430,15 @@ def cached(
     key_prefix: str,
     ttl: int = CACHE_DEFAULT_TTL,
     tags: Optional[List[str]] = None,
-    key_builder: Optional[Callable] = None
+    key_builder: Optional[Callable] = None,
+    stale_ttl: int = 0
 ):
     """
     Decorator pour cacher résultats de fonctions async
 
+    Lecture L1 mémoire puis Redis ; sur un miss, un seul appel à la fonction
+    par clé et par process, les appels concurrents attendent son résultat
+
     Usage:
         @cached(key_prefix="user", ttl=3600, tags=["users"])
         async def get_user(user_id: str):
@@ -267,6 +450,8 @@ def cached(
         ttl: Time to live en secondes
         tags: Tags pour invalidation groupée
         key_builder: Fonction custom pour générer la clé (optionnel)
+        stale_ttl: Fenêtre pendant laquelle une valeur expirée est servie
+                   et rafraîchie en arrière-plan (0 = désactivé)
     """
     def decorator(func: Callable):
         @wraps(func)
@@ -280,18 +465,14 @@ def cached(
                 kwargs_str = "_".join(f"{k}={v}" for k, v in sorted(kwargs.items()))
                 cache_key = f"{key_prefix}:{args_str}:{kwargs_str}"
 
-            # Chercher dans cache
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                return cached_value
-
-            # Exécuter fonction
-            result = await func(*args, **kwargs)
-
-            # Stocker dans cache
-            cache.set(cache_key, result, ttl=ttl, tags=tags)
-
-            return result
+            return await cache_engine.get_or_load_async(
+                cache_key,
+                lambda: func(*args, **kwargs),
+                ttl=ttl,
+                namespace=key_prefix,
+                stale_ttl=stale_ttl,
+                tags=tags or (),
+            )
 
         return wrapper
     return decorator
@@ -370,6 +551,18 @@ class CacheTags:
     def product(product_id: str) -> str:
         return f"product:{product_id}"
 
+    @staticmethod
+    def merchant_products(merchant_id: str) -> str:
+        return f"products:{merchant_id}"
+
+    @staticmethod
+    def social(user_id: str) -> str:
+        return f"social:{user_id}"
+
+    @staticmethod
+    def subscription(user_id: str) -> str:
+        return f"subscription:{user_id}"
+
 
 # ============================================
 # CACHE WARMING
@@ -403,37 +596,43 @@ async def warm_cache():
 class CacheInvalidator:
     """
     Helpers pour invalidation de cache
+
+    Invalidation par tag uniquement (O(1), pas de SCAN) : les entrées
+    user:{id}:*, products:{merchant_id}:*, social:{user_id}:* et
+    subscription:{user_id} / quotas:{user_id} doivent être écrites avec
+    CacheTags.user / merchant_products / social / subscription. Un DELETE
+    ne retire l'entrée L1 que dans ce worker ; le tag est vérifié par le L1
+    de tous les workers
     """
 
     @staticmethod
     def invalidate_user(user_id: str):
         """Invalider tout le cache d'un utilisateur"""
-        cache.delete_by_tag(CacheTags.user(user_id))
-        cache.delete_by_pattern(f"user:{user_id}:*")
+        cache_engine.invalidate_tag(CacheTags.user(user_id))
 
     @staticmethod
     def invalidate_merchant(merchant_id: str):
         """Invalider tout le cache d'un marchand"""
-        cache.delete_by_tag(CacheTags.merchant(merchant_id))
-        cache.delete_by_pattern(f"products:{merchant_id}:*")
+        cache_engine.invalidate_tag(CacheTags.merchant(merchant_id))
+        cache_engine.invalidate_tag(CacheTags.merchant_products(merchant_id))
 
     @staticmethod
     def invalidate_product(product_id: str, merchant_id: str):
         """Invalider cache d'un produit"""
-        cache.delete(CacheKeys.product(product_id))
-        cache.delete_by_pattern(f"products:{merchant_id}:*")
+        cache_engine.delete(CacheKeys.product(product_id))
+        cache_engine.invalidate_tag(CacheTags.product(product_id))
+        cache_engine.invalidate_tag(CacheTags.merchant_products(merchant_id))
 
     @staticmethod
     def invalidate_social_stats(user_id: str, platform: str):
         """Invalider stats sociales"""
-        cache.delete(CacheKeys.social_stats(user_id, platform))
-        cache.delete_by_pattern(f"social:{user_id}:*")
+        cache_engine.delete(CacheKeys.social_stats(user_id, platform))
+        cache_engine.invalidate_tag(CacheTags.social(user_id))
 
     @staticmethod
     def invalidate_subscription(user_id: str):
         """Invalider abonnement et quotas"""
-        cache.delete(CacheKeys.subscription(user_id))
-        cache.delete(CacheKeys.quotas(user_id))
+        cache_engine.invalidate_tag(CacheTags.subscription(user_id))
 
 
 # ============================================
@@ -476,7 +675,25 @@ async def get_product_details(product_id: str):
     return product
 
 
-# Example 3: Invalidation après update
+# Example 3: Lecture groupée (un seul aller-retour Redis)
+async def get_products_details(product_ids: List[str]):
+    """
+    Cache manuel par lot: get_many / set_many en pipeline
+    """
+    keys = {CacheKeys.product(pid): pid for pid in product_ids}
+    found = cache.get_many(list(keys))
+
+    missing = [pid for key, pid in keys.items() if key not in found]
+    if missing:
+        # Fetch from DB...
+        fetched = {CacheKeys.product(pid): {"id": pid, "name": "Product"} for pid in missing}
+        cache.set_many(fetched, ttl=3600, tags=[CacheTags.PRODUCTS])
+        found.update(fetched)
+
+    return [found[key] for key in keys]
+
+
+# Example 4: Invalidation après update
 async def update_product(product_id: str, merchant_id: str, data: dict):
     """
     Update avec invalidation de cache
@@ -0,0 +1,294 @@
+"""
+Calcul des commissions par lots
+
+Remplace la boucle « un insert + un update par conversion » de la tâche
+calculate_commissions :
+
+- Pagination keyset sur conversions.id (commission_paid = false)
+- Un chunk = une transaction (RPC calculate_commissions_batch) : calcul
+  ensembliste, insert multi-lignes et marquage des conversions en une
+  requête. Seules les conversions encore non payées sont traitées : rejouer
+  un chunk ne crée aucun doublon
+- Verrou d'exécution Redis (SET NX + jeton) : deux runs ne se chevauchent
+  jamais ; un run trop long s'arrête à son budget de temps et le suivant
+  reprend naturellement (les conversions traitées sortent du filtre)
+- Chaque chunk publie commission_created aux dashboards des influenceurs
+  concernés (un aller-retour Redis)
+
+Migration: database/migrations/add_batch_commission_calculation.sql
+"""
+
+import os
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple
+
+import redis
+import structlog
+
+from realtime_events import EventTypes, publish_events
+
+logger = structlog.get_logger()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+COMMISSION_CHUNK_SIZE = int(os.getenv("COMMISSION_CHUNK_SIZE", "2000"))
+# Sous task_soft_time_limit (240 s) : le run rend la main avant d'être tué
+COMMISSION_TIME_BUDGET = float(os.getenv("COMMISSION_TIME_BUDGET", "200"))
+COMMISSION_LOCK_KEY = "lock:calculate_commissions"
+COMMISSION_LOCK_TTL = 300
+
+CENT = Decimal("0.01")
+
+# Fonction SQL absente (PostgREST / Postgres) : migration non appliquée
+MISSING_RPC_CODES = ("PGRST202", "42883")
+
+# Libère le verrou seulement s'il appartient encore à ce run
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _is_missing_rpc(error: Exception) -> bool:
+    """
+    Seule erreur qui autorise le repli : sur un timeout, la transaction de
+    la RPC a pu être validée et le repli se ferait sur un état inconnu
+    """
+    code = getattr(error, "code", None)
+    return code in MISSING_RPC_CODES or any(c in str(error) for c in MISSING_RPC_CODES)
+
+
+def compute_commissions(conversions: List[Dict], created_at: Optional[str] = None) -> List[Dict]:
+    """
+    Lignes `commissions` d'un chunk de conversions (montant arrondi au centime)
+
+    Même formule que la RPC : order_amount * commission_rate / 100
+    """
+    created_at = created_at or datetime.utcnow().isoformat()
+    return [
+        {
+            "conversion_id": conversion["id"],
+            "influencer_id": conversion.get("influencer_id"),
+            "merchant_id": conversion.get("merchant_id"),
+            "amount": float(
+                (
+                    Decimal(str(conversion.get("order_amount") or 0))
+                    * Decimal(str(conversion.get("commission_rate") or 0))
+                    / 100
+                ).quantize(CENT, rounding=ROUND_HALF_UP)
+            ),
+            "status": "pending",
+            "created_at": created_at,
+        }
+        for conversion in conversions
+    ]
+
+
+class RunLock:
+    """Verrou d'exécution Redis avec jeton (un seul run à la fois)"""
+
+    def __init__(self, client, key: str = COMMISSION_LOCK_KEY, ttl: int = COMMISSION_LOCK_TTL):
+        self.client = client
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+
+    def acquire(self) -> bool:
+        return bool(self.client.set(self.key, self.token, nx=True, ex=self.ttl))
+
+    def extend(self):
+        """Prolonger le verrou (appelé après chaque chunk)"""
+        if self.client.get(self.key) == self.token:
+            self.client.expire(self.key, self.ttl)
+
+    def release(self):
+        self.client.eval(_RELEASE_LOCK_SCRIPT, 1, self.key, self.token)
+
+
+class CommissionEngine:
+    """Calcul des commissions des conversions non payées, par chunks"""
+
+    def __init__(self, supabase_client, redis_client=None):
+        self.supabase = supabase_client
+        self.redis = redis_client or redis.from_url(REDIS_URL, decode_responses=True)
+
+    def run(
+        self,
+        chunk_size: int = COMMISSION_CHUNK_SIZE,
+        time_budget: float = COMMISSION_TIME_BUDGET
+    ) -> Dict:
+        """
+        Traiter le backlog jusqu'à épuisement ou jusqu'au budget de temps
+
+        Returns:
+            {"total", "processed", "chunks", "rows_per_sec", "elapsed", "complete"}
+            ou {"skipped": True} si un autre run tient le verrou
+        """
+        lock = RunLock(self.redis)
+        try:
+            acquired = lock.acquire()
+        except redis.RedisError as e:
+            # Sans Redis, la RPC reste idempotente (conversions verrouillées
+            # et filtrées sur commission_paid) : pas de double insert possible
+            logger.warning("commission_lock_unavailable", error=str(e))
+            lock = None
+            acquired = True
+
+        if not acquired:
+            logger.info("commission_run_skipped", reason="already_running")
+            return {"skipped": True, "reason": "already_running"}
+
+        try:
+            return self._run(chunk_size, time_budget, lock)
+        finally:
+            if lock is not None:
+                try:
+                    lock.release()
+                except redis.RedisError as e:
+                    logger.warning("commission_lock_release_failed", error=str(e))
+
+    def _run(self, chunk_size: int, time_budget: float, lock: Optional[RunLock]) -> Dict:
+        started = time.monotonic()
+        after_id = None
+        total = 0
+        processed = 0
+        chunks = 0
+        complete = False
+
+        while True:
+            query = (
+                self.supabase.table("conversions")
+                .select("id, influencer_id, merchant_id, order_amount, commission_rate")
+                .eq("commission_paid", False)
+            )
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            conversions = query.order("id").limit(chunk_size).execute().data or []
+
+            if not conversions:
+                complete = True
+                break
+
+            processed += self._process_chunk(conversions)
+            total += len(conversions)
+            chunks += 1
+            after_id = conversions[-1]["id"]
+
+            if lock is not None:
+                lock.extend()
+
+            if len(conversions) < chunk_size:
+                complete = True
+                break
+            if time.monotonic() - started >= time_budget:
+                logger.warning("commission_run_time_budget_reached", processed=processed, chunks=chunks)
+                break
+
+        elapsed = time.monotonic() - started
+        rows_per_sec = round(total / elapsed, 1) if elapsed > 0 else float(total)
+
+        logger.info(
+            "commissions_calculated",
+            total=total,
+            processed=processed,
+            chunks=chunks,
+            rows_per_sec=rows_per_sec,
+            elapsed=round(elapsed, 3),
+            complete=complete
+        )
+        return {
+            "total": total,
+            "processed": processed,
+            "chunks": chunks,
+            "rows_per_sec": rows_per_sec,
+            "elapsed": round(elapsed, 3),
+            "complete": complete
+        }
+
+    def _process_chunk(self, conversions: List[Dict]) -> int:
+        """Un chunk en une transaction (RPC), sinon en deux requêtes groupées"""
+        conversion_ids = [conversion["id"] for conversion in conversions]
+
+        try:
+            result = self.supabase.rpc(
+                "calculate_commissions_batch", {"p_conversion_ids": conversion_ids}
+            ).execute()
+        except Exception as e:
+            if not _is_missing_rpc(e):
+                raise
+            # Migration add_batch_commission_calculation.sql non appliquée
+            logger.warning("commission_rpc_unavailable", error=str(e))
+            processed, created = self._process_chunk_fallback(conversion_ids)
+        else:
+            data = result.data or {}
+            processed, created = int(data.get("processed", 0)), data.get("commissions") or []
+
+        self._publish_created(created)
+        return processed
+
+    def _process_chunk_fallback(self, conversion_ids: List[str]) -> Tuple[int, List[Dict]]:
+        """
+        Sans la RPC : marquage des conversions encore non payées (une requête,
+        qui renvoie les lignes effectivement basculées) puis insert multi-lignes
+        des commissions correspondantes ; marquage annulé si l'insert échoue
+        """
+        updated = (
+            self.supabase.table("conversions")
+            .update({"commission_paid": True})
+            .in_("id", conversion_ids)
+            .eq("commission_paid", False)
+            .execute()
+        )
+        claimed = updated.data or []
+        if not claimed:
+            return 0, []
+
+        try:
+            inserted = self.supabase.table("commissions").insert(compute_commissions(claimed)).execute()
+        except Exception:
+            # Rendre les conversions au prochain run plutôt que de perdre leurs commissions
+            self.supabase.table("conversions").update({"commission_paid": False}).in_(
+                "id", [conversion["id"] for conversion in claimed]
+            ).execute()
+            raise
+        return len(claimed), inserted.data or []
+
+    def _publish_created(self, commissions: List[Dict]):
+        """
+        commission_created vers les utilisateurs des influenceurs concernés
+
+        Une lecture influencers -> user_id et un pipeline Redis par chunk ;
+        une panne ici n'annule jamais le calcul
+        """
+        influencer_ids = list({c["influencer_id"] for c in commissions if c.get("influencer_id")})
+        if not influencer_ids:
+            return
+
+        try:
+            influencers = (
+                self.supabase.table("influencers")
+                .select("id, user_id")
+                .in_("id", influencer_ids)
+                .execute()
+            )
+            user_ids = {row["id"]: row["user_id"] for row in influencers.data or []}
+            publish_events(
+                (
+                    user_ids[c["influencer_id"]],
+                    EventTypes.COMMISSION_CREATED,
+                    {
+                        "commission_id": c.get("id"),
+                        "conversion_id": c.get("conversion_id"),
+                        "amount": c.get("amount"),
+                    },
+                )
+                for c in commissions
+                if user_ids.get(c.get("influencer_id"))
+            )
+        except Exception as e:
+            logger.warning("commission_events_not_published", error=str(e))
@@ -23,6 +23,8 @@ import structlog
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pathlib import Path
 
+from services.smtp_pool import SMTPConnectionPool
+
 logger = structlog.get_logger()
 
 # Configuration SMTP
@@ -32,6 +34,7 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 EMAIL_FROM_NAME = os.getenv("EMAIL_FROM_NAME", "ShareYourSales")
 EMAIL_FROM_ADDRESS = os.getenv("EMAIL_FROM_ADDRESS", "noreply@shareyoursales.ma")
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))
 
 
 # ============================================
@@ -51,6 +54,9 @@ class EmailService:
         self.from_name = EMAIL_FROM_NAME
         self.from_address = EMAIL_FROM_ADDRESS
 
+        # Connexions SMTP réutilisées entre les envois (ouvertes à la demande)
+        self.pool = SMTPConnectionPool(connect=self._create_smtp_connection)
+
         # Initialiser Jinja2 pour templates
         template_dir = Path(__file__).parent.parent / "templates" / "emails"
         template_dir.mkdir(parents=True, exist_ok=True)
@@ -61,9 +67,10 @@ class EmailService:
         )
 
     def _create_smtp_connection(self):
-        """Créer connexion SMTP sécurisée"""
+        """Créer connexion SMTP sécurisée (socket fermé si STARTTLS ou LOGIN échoue)"""
+        server = None
         try:
-            server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+            server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=SMTP_TIMEOUT)
             server.starttls()
 
             if self.smtp_user and self.smtp_password:
@@ -73,8 +80,45 @@ class EmailService:
 
         except Exception as e:
             logger.error("smtp_connection_failed", error=str(e))
+            if server is not None:
+                server.close()
             raise
 
+    def _build_message(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None,
+        reply_to: Optional[str] = None,
+        attachments: Optional[List[Dict]] = None
+    ) -> MIMEMultipart:
+        """Construire le message MIME"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = f"{self.from_name} <{self.from_address}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+
+        if reply_to:
+            msg['Reply-To'] = reply_to
+
+        # Ajouter version texte
+        if text_content:
+            part1 = MIMEText(text_content, 'plain')
+            msg.attach(part1)
+
+        # Ajouter version HTML
+        part2 = MIMEText(html_content, 'html')
+        msg.attach(part2)
+
+        # Ajouter pièces jointes
+        if attachments:
+            for attachment in attachments:
+                # TODO: Implémenter attachments
+                pass
+
+        return msg
+
     def send_email(
         self,
         to_email: str,
@@ -99,33 +143,10 @@ class EmailService:
             True si envoyé avec succès
         """
         try:
-            # Créer message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{self.from_name} <{self.from_address}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-
-            if reply_to:
-                msg['Reply-To'] = reply_to
-
-            # Ajouter version texte
-            if text_content:
-                part1 = MIMEText(text_content, 'plain')
-                msg.attach(part1)
-
-            # Ajouter version HTML
-            part2 = MIMEText(html_content, 'html')
-            msg.attach(part2)
-
-            # Ajouter pièces jointes
-            if attachments:
-                for attachment in attachments:
-                    # TODO: Implémenter attachments
-                    pass
-
-            # Envoyer
-            with self._create_smtp_connection() as server:
-                server.send_message(msg)
+            msg = self._build_message(to_email, subject, html_content, text_content, reply_to, attachments)
+
+            # Envoyer (connexion du pool)
+            self.pool.send(msg)
 
             logger.info("email_sent", to=to_email, subject=subject)
             return True
@@ -134,6 +155,52 @@ class EmailService:
             logger.error("email_send_failed", to=to_email, error=str(e))
             return False
 
+    def send_many(self, emails: List[Dict], concurrency: Optional[int] = None) -> Dict:
+        """
+        Envoyer un lot d'emails (campagnes, factures mensuelles)
+
+        Les connexions SMTP sont réutilisées d'un message à l'autre et le lot
+        est réparti sur au plus `concurrency` connexions simultanées
+
+        Args:
+            emails: Liste de dicts avec les paramètres de send_email
+            concurrency: Connexions simultanées (défaut: SMTP_POOL_SIZE)
+
+        Returns:
+            sent, failed, invalid, failed_emails (à renvoyer), seconds, per_second
+
+            Un email impossible à construire (paramètres, template) échouerait
+            de la même façon au renvoi : journalisé et compté dans invalid,
+            jamais dans failed_emails
+        """
+        messages, built = [], []
+        failed_emails = []
+        invalid = 0
+
+        for email in emails:
+            try:
+                messages.append(self._build_message(**email))
+                built.append(email)
+            except Exception as e:
+                logger.error("email_build_failed", to=email.get('to_email'), error=str(e))
+                invalid += 1
+
+        result = self.pool.send_many(messages, concurrency=concurrency)
+
+        for failure in result['failures']:
+            email = built[failure['index']]
+            logger.error("email_send_failed", to=email.get('to_email'), error=failure['error'])
+            failed_emails.append(email)
+
+        return {
+            'sent': result['sent'],
+            'failed': len(failed_emails) + invalid,
+            'invalid': invalid,
+            'failed_emails': failed_emails,
+            'seconds': result['seconds'],
+            'per_second': result['per_second']
+        }
+
     def render_template(self, template_name: str, context: Dict) -> str:
         """
         Rendre un template email
@@ -13,6 +13,7 @@ from enum import Enum
 from decimal import Decimal
 
 from utils.logger import logger
+from services.leaderboard_engine import leaderboard_engine
 
 
 class UserType(str, Enum):
@@ -156,6 +157,9 @@ class GamificationService:
         # Mettre à jour dans DB
         await self._update_user_points(user_id, user_type, new_total)
 
+        # Classements semaine / mois / global
+        leaderboard_engine.incr(user_type.value, user_id, points)
+
         # Vérifier level up
         level_up_info = await self._check_level_up(user_id, user_type, current_points, new_total)
 
@@ -716,10 +720,16 @@ class GamificationService:
         Returns:
             Top performers
         """
-        # En production: Query avec agrégations
-        leaderboard = []
-
-        return leaderboard
+        return [
+            {
+                'rank': entry['rank'],
+                'user_id': entry['member_id'],
+                'score': entry['score'],
+                'metric': metric,
+                'period': period
+            }
+            for entry in leaderboard_engine.top(user_type.value, metric, period, limit)
+        ]
 
     async def get_user_rank(
         self,
@@ -728,13 +738,14 @@ class GamificationService:
         period: str = 'month'
     ) -> Dict[str, Any]:
         """Récupérer rang de l'utilisateur"""
+        rank = leaderboard_engine.rank(user_type.value, user_id, 'points', period)
         rank_info = {
             'user_id': user_id,
             'period': period,
-            'rank': 0,
-            'total_users': 0,
-            'percentile': 0,
-            'points_to_next_rank': 0
+            'rank': rank['rank'],
+            'total_users': rank['total'],
+            'percentile': rank['percentile'],
+            'points_to_next_rank': rank['points_to_next_rank']
         }
 
         return rank_info
@@ -3,9 +3,14 @@ Service d'optimisation d'images automatique
 Pipeline complet de transformation, compression et génération de formats optimaux
 """
 import io
+import math
+import multiprocessing
 import os
+import threading
 import time
-from typing import Dict, List, Optional, Any, Tuple, BinaryIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Any, Tuple, BinaryIO
 from pathlib import Path
 from datetime import datetime
 from PIL import Image, ImageFilter, ImageOps, ExifTags
@@ -15,6 +20,7 @@ from utils.logger import logger
 from utils.image_processing import (
     validate_image,
     calculate_optimal_quality,
+    image_variance,
     generate_blurhash,
     analyze_image_colors,
     detect_faces,
@@ -42,6 +48,121 @@ DEFAULT_QUALITY = {
     'png': 95
 }
 
+# Encodages répartis sur un pool de processus (0 = tout sur le thread appelant)
+IMAGE_ENCODE_WORKERS = int(os.getenv("IMAGE_ENCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# En dessous de ce volume de pixels à encoder, le pool coûte plus qu'il ne rapporte
+IMAGE_POOL_MIN_PIXELS = int(os.getenv("IMAGE_POOL_MIN_PIXELS", "2000000"))
+
+_encode_pool: Optional[ProcessPoolExecutor] = None
+_encode_pool_lock = threading.Lock()
+
+
+def _get_encode_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool partagé, créé à la première image lourde ("spawn" : sûr dans un serveur multi-thread)"""
+    global _encode_pool
+    if IMAGE_ENCODE_WORKERS <= 0:
+        return None
+    with _encode_pool_lock:
+        if _encode_pool is None:
+            _encode_pool = ProcessPoolExecutor(
+                max_workers=IMAGE_ENCODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _encode_pool
+
+
+def shutdown_encode_pool():
+    """Arrêter le pool d'encodage (shutdown de l'application)"""
+    global _encode_pool
+    with _encode_pool_lock:
+        if _encode_pool is not None:
+            _encode_pool.shutdown(wait=False, cancel_futures=True)
+            _encode_pool = None
+
+
+def _encode_image(image: Image.Image, format: str, quality: int) -> Dict[str, Any]:
+    """
+    Encode une image dans un format donné
+
+    Fonction de module (et non méthode) pour pouvoir s'exécuter dans le pool
+    """
+    buffer = io.BytesIO()
+    raw_size = image.width * image.height * len(image.getbands())
+
+    # Conversion de mode si nécessaire
+    if format in ('jpeg', 'jpg'):
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG ne supporte pas la transparence
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            if image.mode == 'P':
+                image = image.convert('RGBA')
+            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        image.save(
+            buffer,
+            format='JPEG',
+            quality=quality,
+            optimize=True,
+            progressive=True
+        )
+
+    elif format == 'webp':
+        image.save(
+            buffer,
+            format='WEBP',
+            quality=quality,
+            method=6,  # Meilleure compression
+            optimize=True
+        )
+
+    elif format == 'avif':
+        # AVIF nécessite pillow-heif
+        image.save(
+            buffer,
+            format='AVIF',
+            quality=quality
+        )
+
+    elif format == 'png':
+        if image.mode not in ('RGB', 'RGBA', 'P'):
+            image = image.convert('RGBA')
+
+        image.save(
+            buffer,
+            format='PNG',
+            optimize=True,
+            compress_level=9
+        )
+
+    data = buffer.getvalue()
+
+    return {
+        'format': format,
+        'data': data,
+        'size': len(data),
+        'quality': quality,
+        'compression': estimate_compression_ratio(raw_size, len(data))
+    }
+
+
+def _encode_job(job: Tuple[Image.Image, str, int]) -> Dict[str, Any]:
+    """Exécuté dans le pool : une erreur d'encodage ne fait pas échouer les autres"""
+    image, format, quality = job
+    started = time.perf_counter()
+    try:
+        result = _encode_image(image, format, quality)
+    except Exception as e:
+        result = {'error': str(e)}
+    result['encode_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
 
 class ImageOptimizer:
     """
@@ -94,17 +215,19 @@ class ImageOptimizer:
             Dictionnaire avec les URLs et métadonnées
         """
         start_time = time.time()
+        timings = {}
 
         try:
             # Validation
+            stage = time.perf_counter()
             validation_result = validate_image(image_data, filename)
             logger.info(f"Image validée: {filename}", **validation_result)
+            timings['validate_ms'] = _elapsed_ms(stage)
 
-            # Charger l'image
-            image = Image.open(io.BytesIO(image_data))
-
-            # Correction d'orientation EXIF
-            image = self._fix_orientation(image)
+            # Décoder une seule fois (orientation EXIF corrigée)
+            stage = time.perf_counter()
+            image = self._decode(image_data)
+            timings['decode_ms'] = _elapsed_ms(stage)
 
             # Formats à générer
             if generate_formats is None:
@@ -115,26 +238,38 @@ class ImageOptimizer:
                     generate_formats.append('avif')
                 generate_formats.append('jpeg')  # Toujours générer JPEG comme fallback
 
-            # Extraire métadonnées
+            # Complexité de l'image calculée une fois pour tous les formats
+            variance = None
+            if quality is None:
+                stage = time.perf_counter()
+                variance = image_variance(image)
+                timings['stats_ms'] = _elapsed_ms(stage)
+
+            jobs = [
+                (image, fmt, quality or calculate_optimal_quality(image, fmt, variance=variance))
+                for fmt in generate_formats
+            ]
+
+            # Encodages en parallèle, métadonnées extraites pendant ce temps
+            stage = time.perf_counter()
+            collect_encodes = self._submit_encodes(jobs)
+
+            metadata_stage = time.perf_counter()
             metadata = self.extract_metadata(image, filename)
+            timings['metadata_ms'] = _elapsed_ms(metadata_stage)
 
-            # Générer les formats optimisés
             optimized_formats = {}
-            for fmt in generate_formats:
-                try:
-                    optimized = self._optimize_format(
-                        image,
-                        fmt,
-                        quality or calculate_optimal_quality(image, fmt)
-                    )
-                    optimized_formats[fmt] = optimized
-                    logger.info(
-                        f"Format généré: {fmt}",
-                        size_kb=optimized['size'] / 1024,
-                        compression=optimized['compression']['percentage']
-                    )
-                except Exception as e:
-                    logger.error(f"Erreur génération format {fmt}: {str(e)}")
+            for fmt, optimized in zip(generate_formats, collect_encodes()):
+                if 'error' in optimized:
+                    logger.error(f"Erreur génération format {fmt}: {optimized['error']}")
+                    continue
+                optimized_formats[fmt] = optimized
+                logger.info(
+                    f"Format généré: {fmt}",
+                    size_kb=optimized['size'] / 1024,
+                    compression=optimized['compression']['percentage']
+                )
+            timings['encode_ms'] = _elapsed_ms(stage)
 
             duration = time.time() - start_time
 
@@ -151,7 +286,8 @@ class ImageOptimizer:
                 },
                 'optimized': optimized_formats,
                 'metadata': metadata,
-                'processing_time': round(duration, 3)
+                'processing_time': round(duration, 3),
+                'timings': {**timings, 'total_ms': round(duration * 1000, 2)}
             }
 
             logger.info(
@@ -197,14 +333,13 @@ class ImageOptimizer:
             Dict avec tous les thumbnails générés
         """
         start_time = time.time()
+        timings = {}
 
         try:
             # Validation
+            stage = time.perf_counter()
             validate_image(image_data, filename)
-
-            # Charger l'image
-            image = Image.open(io.BytesIO(image_data))
-            image = self._fix_orientation(image)
+            timings['validate_ms'] = _elapsed_ms(stage)
 
             # Utiliser les tailles par défaut si non spécifiées
             if sizes is None:
@@ -214,39 +349,53 @@ class ImageOptimizer:
             if formats is None:
                 formats = ['webp', 'jpeg']
 
-            thumbnails = {}
-
-            for size_name, (width, height) in sizes.items():
-                thumbnails[size_name] = {}
-
-                # Créer le thumbnail
-                thumb = self._create_thumbnail(image, width, height)
-
-                # Générer dans chaque format
-                for fmt in formats:
-                    try:
-                        quality = calculate_optimal_quality(thumb, fmt)
-                        optimized = self._optimize_format(thumb, fmt, quality)
-
-                        thumbnails[size_name][fmt] = {
-                            'data': optimized['data'],
-                            'size': optimized['size'],
-                            'dimensions': {
-                                'width': thumb.width,
-                                'height': thumb.height
-                            },
-                            'url': optimized.get('url')
-                        }
+            # Décodage réduit : seulement la résolution utile à la plus grande taille
+            stage = time.perf_counter()
+            image = self._decode(image_data, target_sizes=list(sizes.values()))
+            timings['decode_ms'] = _elapsed_ms(stage)
+
+            # Pyramide : chaque taille dérive de la précédente, plus grande
+            stage = time.perf_counter()
+            levels = self._build_pyramid(image, sizes)
+            timings['resize_ms'] = _elapsed_ms(stage)
+
+            # Statistiques calculées une fois, sur le niveau le plus grand
+            stage = time.perf_counter()
+            largest = max(levels.values(), key=lambda level: level.width * level.height)
+            variance = image_variance(largest)
+            timings['stats_ms'] = _elapsed_ms(stage)
+
+            keys = [(size_name, fmt) for size_name in sizes for fmt in formats]
+            jobs = [
+                (levels[size_name], fmt, calculate_optimal_quality(levels[size_name], fmt, variance=variance))
+                for size_name, fmt in keys
+            ]
+
+            stage = time.perf_counter()
+            thumbnails = {size_name: {} for size_name in sizes}
+            for (size_name, fmt), optimized in zip(keys, self._submit_encodes(jobs)()):
+                if 'error' in optimized:
+                    logger.error(
+                        f"Erreur génération thumbnail {size_name}/{fmt}: {optimized['error']}"
+                    )
+                    continue
 
-                        logger.debug(
-                            f"Thumbnail généré: {size_name} ({fmt})",
-                            size_kb=optimized['size'] / 1024
-                        )
+                thumb = levels[size_name]
+                thumbnails[size_name][fmt] = {
+                    'data': optimized['data'],
+                    'size': optimized['size'],
+                    'dimensions': {
+                        'width': thumb.width,
+                        'height': thumb.height
+                    },
+                    'url': optimized.get('url')
+                }
 
-                    except Exception as e:
-                        logger.error(
-                            f"Erreur génération thumbnail {size_name}/{fmt}: {str(e)}"
-                        )
+                logger.debug(
+                    f"Thumbnail généré: {size_name} ({fmt})",
+                    size_kb=optimized['size'] / 1024
+                )
+            timings['encode_ms'] = _elapsed_ms(stage)
 
             duration = time.time() - start_time
 
@@ -260,7 +409,8 @@ class ImageOptimizer:
                 'success': True,
                 'thumbnails': thumbnails,
                 'sizes_generated': list(thumbnails.keys()),
-                'processing_time': round(duration, 3)
+                'processing_time': round(duration, 3),
+                'timings': {**timings, 'total_ms': round(duration * 1000, 2)}
             }
 
         except Exception as e:
@@ -543,6 +693,122 @@ class ImageOptimizer:
 
     # Méthodes privées
 
+    def _decode(
+        self,
+        image_data: bytes,
+        target_sizes: Optional[List[Tuple[int, int]]] = None
+    ) -> Image.Image:
+        """
+        Décode l'image une seule fois, orientation EXIF corrigée
+
+        Si target_sizes est fourni, ne décode que la résolution nécessaire à
+        la plus grande sortie : mode draft pour JPEG (décodage DCT direct à
+        1/2, 1/4 ou 1/8), Image.reduce (réduction entière) sinon
+        """
+        image = Image.open(io.BytesIO(image_data))
+
+        if target_sizes and image.format == 'JPEG':
+            image.draft(image.mode, self._min_source_size(image.size, target_sizes))
+
+        image = self._fix_orientation(image)
+
+        if target_sizes:
+            needed = self._min_source_size(image.size, target_sizes)
+            # Marge x2 : la réduction entière est grossière, LANCZOS finit le travail
+            factor = int(min(image.width / needed[0], image.height / needed[1]) / 2)
+            if factor >= 2:
+                image = image.reduce(factor)
+
+        return image
+
+    @staticmethod
+    def _min_source_size(
+        size: Tuple[int, int],
+        target_sizes: List[Tuple[int, int]]
+    ) -> Tuple[int, int]:
+        """Plus petite résolution source couvrant toutes les sorties (orientation comprise)"""
+        width, height = size
+        scale = min(1.0, max(
+            max(w / width, h / height, w / height, h / width)
+            for w, h in target_sizes
+        ))
+        return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
+
+    def _build_pyramid(
+        self,
+        image: Image.Image,
+        sizes: Dict[str, Tuple[int, int]]
+    ) -> Dict[str, Image.Image]:
+        """
+        Thumbnails "cover" du plus grand au plus petit
+
+        L'image de travail (non recadrée) est réduite à chaque niveau : chaque
+        taille est calculée depuis le niveau précédent et non depuis l'original.
+        Les niveaux sont ordonnés par l'échelle "cover" que chaque taille exige
+        de l'original (max des deux axes) : un niveau couvre toujours les deux
+        axes des tailles suivantes, rien n'est agrandi
+        """
+        source_width, source_height = image.size
+
+        def cover_scale(size: Tuple[int, int]) -> float:
+            return max(size[0] / source_width, size[1] / source_height)
+
+        levels = {}
+        working = image
+
+        for size_name, (width, height) in sorted(
+            sizes.items(), key=lambda item: cover_scale(item[1]), reverse=True
+        ):
+            scale = cover_scale((width, height))
+            if scale < 1:
+                target = (
+                    min(working.width, max(width, math.ceil(source_width * scale))),
+                    min(working.height, max(height, math.ceil(source_height * scale)))
+                )
+                if target != working.size:
+                    working = working.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            levels[size_name] = self._create_thumbnail(working, width, height)
+
+        return levels
+
+    def _submit_encodes(
+        self,
+        jobs: List[Tuple[Image.Image, str, int]]
+    ) -> Callable[[], List[Dict[str, Any]]]:
+        """
+        Lance les encodages et retourne une fonction qui collecte les résultats
+
+        Les images lourdes partent dans le pool de processus (l'appelant peut
+        travailler pendant ce temps) ; les petites, ou si le pool est
+        indisponible, sont encodées localement
+        """
+        pixels = sum(image.width * image.height for image, _, _ in jobs)
+        pool = _get_encode_pool() if len(jobs) > 1 and pixels >= IMAGE_POOL_MIN_PIXELS else None
+
+        if pool is None:
+            return lambda: [_encode_job(job) for job in jobs]
+
+        try:
+            futures = [pool.submit(_encode_job, job) for job in jobs]
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.warning(f"Pool d'encodage indisponible, encodage local: {str(e)}")
+            shutdown_encode_pool()
+            return lambda: [_encode_job(job) for job in jobs]
+
+        def collect() -> List[Dict[str, Any]]:
+            results = []
+            for job, future in zip(jobs, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.warning(f"Encodage en pool échoué, encodage local: {str(e)}")
+                    if isinstance(e, BrokenProcessPool):
+                        shutdown_encode_pool()
+                    results.append(_encode_job(job))
+            return results
+
+        return collect
+
     def _fix_orientation(self, image: Image.Image) -> Image.Image:
         """
         Corrige l'orientation d'une image selon EXIF
@@ -558,12 +824,13 @@ class ImageOptimizer:
                 if orientation_key and orientation_key in exif:
                     orientation = exif[orientation_key]
 
+                    # transpose : permutation exacte des pixels, sans rééchantillonnage
                     if orientation == 3:
-                        image = image.rotate(180, expand=True)
+                        image = image.transpose(Image.Transpose.ROTATE_180)
                     elif orientation == 6:
-                        image = image.rotate(270, expand=True)
+                        image = image.transpose(Image.Transpose.ROTATE_270)
                     elif orientation == 8:
-                        image = image.rotate(90, expand=True)
+                        image = image.transpose(Image.Transpose.ROTATE_90)
 
                     logger.debug(f"Orientation corrigée: {orientation}")
 
@@ -607,65 +874,4 @@ class ImageOptimizer:
         """
         Optimise une image dans un format spécifique
         """
-        buffer = io.BytesIO()
-
-        # Conversion de mode si nécessaire
-        if format in ('jpeg', 'jpg'):
-            if image.mode in ('RGBA', 'LA', 'P'):
-                # JPEG ne supporte pas la transparence
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            image.save(
-                buffer,
-                format='JPEG',
-                quality=quality,
-                optimize=True,
-                progressive=True
-            )
-
-        elif format == 'webp':
-            image.save(
-                buffer,
-                format='WEBP',
-                quality=quality,
-                method=6,  # Meilleure compression
-                optimize=True
-            )
-
-        elif format == 'avif':
-            # AVIF nécessite pillow-heif
-            image.save(
-                buffer,
-                format='AVIF',
-                quality=quality
-            )
-
-        elif format == 'png':
-            if image.mode not in ('RGB', 'RGBA', 'P'):
-                image = image.convert('RGBA')
-
-            image.save(
-                buffer,
-                format='PNG',
-                optimize=True,
-                compress_level=9
-            )
-
-        data = buffer.getvalue()
-
-        return {
-            'format': format,
-            'data': data,
-            'size': len(data),
-            'quality': quality,
-            'compression': estimate_compression_ratio(
-                len(image.tobytes()),
-                len(data)
-            )
-        }
+        return _encode_image(image, format, quality)
@@ -0,0 +1,235 @@
+"""
+Stockage d'images adressé par contenu
+
+Une variante (format, qualité, taille...) est identifiée par le hash SHA-256
+des octets source ET des paramètres de transformation : une image déjà vue
+avec les mêmes paramètres n'est jamais retraitée.
+
+- Disque : <storage_path>/<ab>/<cd>/<clé>.<ext> (répertoires shardés pour
+  garder des dossiers de taille raisonnable)
+- Index en mémoire (clé -> chemin, taille, type MIME), reconstruit au
+  démarrage depuis le disque
+- Taille totale plafonnée : éviction LRU des fichiers les moins servis
+
+Utilisé par routes/image_optimization.py
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.logger import logger
+
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+
+MIME_TYPES = {
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'jpeg': 'image/jpeg',
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'json': 'application/json',
+}
+
+_KEY_LENGTH = 64
+
+
+@dataclass
+class StoredObject:
+    key: str
+    path: Path
+    size: int
+    mime_type: str
+
+    @property
+    def etag(self) -> str:
+        # Contenu immuable pour une clé donnée : la clé est un ETag fort
+        return self.key
+
+
+def source_hash(data: bytes) -> str:
+    """Empreinte des octets source (calculée une fois par upload)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_key(source_digest: str, **params: Any) -> str:
+    """Clé d'une variante : hash de la source + paramètres canoniques"""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f"{source_digest}:{canonical}".encode()).hexdigest()
+
+
+def is_valid_key(key: str) -> bool:
+    return len(key) == _KEY_LENGTH and all(c in '0123456789abcdef' for c in key)
+
+
+class ContentAddressedImageStore:
+    """Stockage disque des variantes d'images avec index mémoire et plafond LRU"""
+
+    def __init__(self, storage_path: str, max_bytes: int = IMAGE_STORE_MAX_BYTES):
+        self.root = Path(storage_path) / 'cas'
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._index: "OrderedDict[str, StoredObject]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        self._load_index()
+
+    def _path_for(self, key: str, ext: str) -> Path:
+        return self.root / key[:2] / key[2:4] / f"{key}.{ext}"
+
+    def _load_index(self):
+        """Reconstruire l'index depuis le disque, du plus ancien au plus récent"""
+        found = []
+        for path in self.root.glob('*/*/*.*'):
+            key, _, ext = path.name.partition('.')
+            if not is_valid_key(key):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            found.append((stat.st_mtime, StoredObject(key, path, stat.st_size, MIME_TYPES.get(ext, 'application/octet-stream'))))
+
+        for _, stored in sorted(found, key=lambda item: item[0]):
+            self._index[stored.key] = stored
+            self.total_bytes += stored.size
+
+        if found:
+            logger.info("Index du stockage d'images chargé", objects=len(self._index), total_bytes=self.total_bytes)
+        self._evict()
+
+    def get(self, key: str) -> Optional[StoredObject]:
+        """
+        Objet stocké pour une clé (None si absent) ; le marque comme récemment utilisé
+
+        L'index est local au processus : une clé absente est cherchée sur le
+        disque (écrite par un autre worker), une entrée dont le fichier a
+        disparu (évincé par un autre worker) est retirée de l'index
+        """
+        with self._lock:
+            stored = self._index.get(key)
+            if stored is not None:
+                self._index.move_to_end(key)
+
+        if stored is not None and not stored.path.is_file():
+            self._forget(key)
+            stored = None
+        if stored is None:
+            stored = self._find_on_disk(key)
+
+        with self._lock:
+            self.stats['hits' if stored is not None else 'misses'] += 1
+        return stored
+
+    def _find_on_disk(self, key: str) -> Optional[StoredObject]:
+        """Variante présente sur le disque mais pas dans l'index ; l'y ajoute"""
+        if not is_valid_key(key):
+            return None
+        for path in (self.root / key[:2] / key[2:4]).glob(f"{key}.*"):
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            ext = path.name.partition('.')[2]
+            stored = StoredObject(key, path, size, MIME_TYPES.get(ext, 'application/octet-stream'))
+            with self._lock:
+                previous = self._index.pop(key, None)
+                if previous is not None:
+                    self.total_bytes -= previous.size
+                self._index[key] = stored
+                self.total_bytes += size
+            self._evict()
+            return stored
+        return None
+
+    def _forget(self, key: str):
+        """Retire une clé de l'index sans toucher au disque"""
+        with self._lock:
+            stored = self._index.pop(key, None)
+            if stored is not None:
+                self.total_bytes -= stored.size
+
+    def put(self, key: str, data: bytes, ext: str) -> StoredObject:
+        """Écrire une variante (écriture atomique : fichier temporaire puis rename)"""
+        path = self._path_for(key, ext)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        stored = StoredObject(key, path, len(data), MIME_TYPES.get(ext, 'application/octet-stream'))
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+            self._index[key] = stored
+            self.total_bytes += stored.size
+            self.stats['writes'] += 1
+        self._evict()
+        return stored
+
+    def get_json(self, key: str) -> Optional[Dict[str, Any]]:
+        """Résultat JSON mémorisé (ex: réponse complète d'un upload déjà traité)"""
+        stored = self.get(key)
+        if stored is None:
+            return None
+        try:
+            return json.loads(stored.path.read_bytes())
+        except (OSError, ValueError):
+            self.discard(key)
+            return None
+
+    def put_json(self, key: str, value: Dict[str, Any]) -> StoredObject:
+        return self.put(key, json.dumps(value, default=str).encode(), 'json')
+
+    def discard(self, key: str):
+        with self._lock:
+            stored = self._index.pop(key, None)
+            if stored is not None:
+                self.total_bytes -= stored.size
+        if stored is not None:
+            try:
+                stored.path.unlink()
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Supprimer les objets les moins récemment servis au-delà du plafond"""
+        victims = []
+        with self._lock:
+            while self.total_bytes > self.max_bytes and self._index:
+                _, stored = self._index.popitem(last=False)
+                self.total_bytes -= stored.size
+                self.stats['evictions'] += 1
+                victims.append(stored)
+
+        for stored in victims:
+            try:
+                stored.path.unlink()
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'objects': len(self._index),
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+        }
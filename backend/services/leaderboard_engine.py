@@ -0,0 +1,417 @@
+"""
+Moteur de classements (leaderboards)
+
+- Un ensemble trié par (user_type, métrique, période) : Redis ZSET, ou skip
+  list indexable en mémoire quand Redis est absent
+- Mises à jour incrémentales (ZINCRBY) depuis l'attribution de points et la
+  clôture des deals ; top-N, rang et points jusqu'au rang suivant en O(log n)
+- Changement de période automatique : la clé contient le seau courant
+  (semaine ISO, mois) et expire après deux périodes
+- Classements alimentés par une autre source (table deals) : reconstruits
+  d'un bloc par `ensure`, au plus une fois toutes les `refresh_every` secondes
+"""
+
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+from utils.logger import logger
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+LEADERBOARD_PREFIX = "leaderboard"
+PERIODS = ("week", "month", "all")
+
+# Durée de vie d'un seau après sa dernière mise à jour
+PERIOD_TTL = {"week": 14 * 86400, "month": 62 * 86400, "all": None}
+
+_MAX_LEVEL = 32
+
+
+def period_bucket(period: str, now: Optional[datetime] = None) -> str:
+    """Seau courant d'une période : 2026-W42, 2026-10 ou all"""
+    now = now or datetime.now()
+    if period == "week":
+        year, week, _ = now.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == "month":
+        return now.strftime("%Y-%m")
+    if period == "all":
+        return "all"
+    raise ValueError(f"Période inconnue: {period}")
+
+
+def leaderboard_key(user_type: str, metric: str, period: str, now: Optional[datetime] = None) -> str:
+    return f"{LEADERBOARD_PREFIX}:{user_type}:{metric}:{period_bucket(period, now)}"
+
+
+# ============================================
+# SKIP LIST (repli mémoire)
+# ============================================
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * level
+        self.width: List[int] = [1] * level
+
+
+class ScoreSkipList:
+    """
+    Ensemble trié membre -> score, score décroissant (égalités : membre croissant)
+
+    Skip list indexable : chaque lien connaît le nombre d'éléments qu'il
+    saute, d'où rang et accès par position en O(log n)
+    """
+
+    def __init__(self):
+        self._head = _Node(None, _MAX_LEVEL)
+        self._scores: Dict[str, float] = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    @staticmethod
+    def _key(member: str, score: float) -> Tuple[float, str]:
+        return (-score, member)
+
+    def score(self, member: str) -> Optional[float]:
+        return self._scores.get(member)
+
+    def incr(self, member: str, amount: float) -> float:
+        score = self._scores.get(member, 0.0) + amount
+        self.add(member, score)
+        return score
+
+    def add(self, member: str, score: float):
+        if member in self._scores:
+            self.remove(member)
+        self._scores[member] = score
+        key = self._key(member, score)
+
+        chain = [self._head] * _MAX_LEVEL
+        steps_at_level = [0] * _MAX_LEVEL
+        node = self._head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = 1
+        while height < _MAX_LEVEL and random.random() < 0.5:
+            height += 1
+
+        new_node = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            previous = chain[level]
+            new_node.next[level] = previous.next[level]
+            previous.next[level] = new_node
+            new_node.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, _MAX_LEVEL):
+            chain[level].width[level] += 1
+
+    def remove(self, member: str):
+        score = self._scores.pop(member, None)
+        if score is None:
+            return
+        key = self._key(member, score)
+
+        chain = [self._head] * _MAX_LEVEL
+        node = self._head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        for level in range(_MAX_LEVEL):
+            previous = chain[level]
+            if level < len(target.next) and previous.next[level] is target:
+                previous.width[level] += target.width[level] - 1
+                previous.next[level] = target.next[level]
+            else:
+                previous.width[level] -= 1
+
+    def rank(self, member: str) -> Optional[int]:
+        """Position (0 = premier), None si absent"""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        key = self._key(member, score)
+
+        position = 0
+        node = self._head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def range(self, start: int, stop: int) -> List[Tuple[str, float]]:
+        """Éléments des positions start..stop incluses"""
+        stop = min(stop, len(self) - 1)
+        if start > stop:
+            return []
+
+        # Descente jusqu'à la position `start`
+        remaining = start + 1
+        node = self._head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+
+        items = []
+        for _ in range(stop - start + 1):
+            items.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return items
+
+
+# ============================================
+# MOTEUR
+# ============================================
+
+class LeaderboardEngine:
+    """Classements par (user_type, métrique, période), Redis ou mémoire locale"""
+
+    def __init__(self, redis_client=None, use_redis: bool = True):
+        self._redis = redis_client
+        self._redis_checked = redis_client is not None or not use_redis
+        self._local: Dict[str, Tuple[Optional[float], ScoreSkipList]] = {}
+        self._refreshed: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def _client(self):
+        if not self._redis_checked:
+            self._redis_checked = True
+            try:
+                client = redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=1)
+                client.ping()
+                self._redis = client
+            except redis.RedisError as e:
+                logger.warning(f"⚠️ Redis indisponible, classements en mémoire locale: {e}")
+        return self._redis
+
+    def _local_set(self, key: str, period: str, create: bool = False) -> Optional[ScoreSkipList]:
+        entry = self._local.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.time():
+            del self._local[key]
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            ttl = PERIOD_TTL[period]
+            entry = (time.time() + ttl if ttl else None, ScoreSkipList())
+            self._local[key] = entry
+        return entry[1]
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+
+    def incr(
+        self,
+        user_type: str,
+        member_id: str,
+        amount: float,
+        metric: str = "points",
+        periods: Iterable[str] = PERIODS,
+        now: Optional[datetime] = None,
+    ):
+        """Ajoute `amount` au score du membre dans chaque période (un aller-retour Redis)"""
+        if not member_id or not amount:
+            return
+        member_id = str(member_id)
+        client = self._client()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for period in periods:
+                    key = leaderboard_key(user_type, metric, period, now)
+                    pipe.zincrby(key, amount, member_id)
+                    if PERIOD_TTL[period]:
+                        pipe.expire(key, PERIOD_TTL[period])
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.warning(f"Mise à jour du classement {user_type}:{metric} impossible: {e}")
+            return
+
+        with self._lock:
+            for period in periods:
+                key = leaderboard_key(user_type, metric, period, now)
+                self._local_set(key, period, create=True).incr(member_id, amount)
+
+    def replace(
+        self,
+        user_type: str,
+        metric: str,
+        period: str,
+        scores: Dict[str, float],
+        now: Optional[datetime] = None,
+    ):
+        """Remplace tout le classement (reconstruction depuis la base)"""
+        key = leaderboard_key(user_type, metric, period, now)
+        client = self._client()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=True)
+                pipe.delete(key)
+                if scores:
+                    pipe.zadd(key, {str(member): score for member, score in scores.items()})
+                    if PERIOD_TTL[period]:
+                        pipe.expire(key, PERIOD_TTL[period])
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.warning(f"Reconstruction du classement {key} impossible: {e}")
+            return
+
+        with self._lock:
+            self._local.pop(key, None)
+            board = self._local_set(key, period, create=True)
+            for member, score in scores.items():
+                board.add(str(member), score)
+
+    def ensure(
+        self,
+        loader: Callable[[], Dict[Tuple[str, str, str], Dict[str, float]]],
+        refresh_every: int,
+        name: str,
+    ):
+        """
+        Reconstruit les classements de `loader` au plus une fois par
+        `refresh_every` secondes et par processus
+
+        loader() -> {(user_type, métrique, période): {membre: score}}
+        """
+        with self._lock:
+            if time.time() - self._refreshed.get(name, 0) < refresh_every:
+                return
+            self._refreshed[name] = time.time()
+
+        try:
+            boards = loader()
+        except Exception as e:
+            logger.error(f"Reconstruction des classements {name} impossible: {e}")
+            with self._lock:
+                self._refreshed.pop(name, None)
+            return
+
+        for (user_type, metric, period), scores in boards.items():
+            self.replace(user_type, metric, period, scores)
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+
+    def top(
+        self,
+        user_type: str,
+        metric: str = "points",
+        period: str = "month",
+        limit: int = 10,
+        now: Optional[datetime] = None,
+    ) -> List[Dict]:
+        """Top-N : [{"member_id", "score", "rank"}] (rang à partir de 1)"""
+        key = leaderboard_key(user_type, metric, period, now)
+        client = self._client()
+        if client is not None:
+            try:
+                rows = client.zrevrange(key, 0, limit - 1, withscores=True)
+            except redis.RedisError as e:
+                logger.warning(f"Lecture du classement {key} impossible: {e}")
+                rows = []
+        else:
+            with self._lock:
+                board = self._local_set(key, period)
+                rows = board.range(0, limit - 1) if board else []
+
+        return [
+            {"member_id": member, "score": score, "rank": position + 1}
+            for position, (member, score) in enumerate(rows)
+        ]
+
+    def scores(
+        self,
+        user_type: str,
+        member_ids: List[str],
+        metric: str = "points",
+        period: str = "month",
+        now: Optional[datetime] = None,
+    ) -> Dict[str, float]:
+        """Scores de plusieurs membres en une lecture (0 si absent)"""
+        if not member_ids:
+            return {}
+        key = leaderboard_key(user_type, metric, period, now)
+        member_ids = [str(m) for m in member_ids]
+        client = self._client()
+        if client is not None:
+            try:
+                values = client.zmscore(key, member_ids)
+            except redis.RedisError as e:
+                logger.warning(f"Lecture des scores de {key} impossible: {e}")
+                values = [None] * len(member_ids)
+        else:
+            with self._lock:
+                board = self._local_set(key, period)
+                values = [board.score(m) if board else None for m in member_ids]
+
+        return {member: value or 0 for member, value in zip(member_ids, values)}
+
+    def rank(
+        self,
+        user_type: str,
+        member_id: str,
+        metric: str = "points",
+        period: str = "month",
+        now: Optional[datetime] = None,
+    ) -> Dict:
+        """Rang du membre, taille du classement et points jusqu'au rang suivant"""
+        key = leaderboard_key(user_type, metric, period, now)
+        member_id = str(member_id)
+        position, score, total, above = None, None, 0, None
+
+        client = self._client()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.zrevrank(key, member_id)
+                pipe.zscore(key, member_id)
+                pipe.zcard(key)
+                position, score, total = pipe.execute()
+                if position:
+                    above = client.zrevrange(key, position - 1, position - 1, withscores=True)
+            except redis.RedisError as e:
+                logger.warning(f"Lecture du rang dans {key} impossible: {e}")
+        else:
+            with self._lock:
+                board = self._local_set(key, period)
+                if board is not None:
+                    position, score, total = board.rank(member_id), board.score(member_id), len(board)
+                    if position:
+                        above = board.range(position - 1, position - 1)
+
+        if position is None:
+            return {"rank": 0, "score": 0, "total": total, "percentile": 0, "points_to_next_rank": 0}
+
+        return {
+            "rank": position + 1,
+            "score": score,
+            "total": total,
+            "percentile": round((1 - position / total) * 100, 1) if total else 0,
+            "points_to_next_rank": (above[0][1] - score) if above else 0,
+        }
+
+
+# Instance globale
+leaderboard_engine = LeaderboardEngine()
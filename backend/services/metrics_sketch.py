@@ -0,0 +1,210 @@
+"""
+Histogrammes à quantiles en flux (type DDSketch, buckets logarithmiques fixes)
+
+- Enregistrement O(1) : un log, un index, une incrémentation (pas de tri,
+  pas de liste de valeurs brutes)
+- Erreur relative bornée sur chaque quantile (1 % par défaut) : p50, p95,
+  p99 et p999 exacts à 1 % près, quel que soit le volume
+- Fusionnable : deux sketches de même précision s'additionnent bucket par
+  bucket
+- Export Prometheus en une passe, sans liste intermédiaire : les noms et
+  labels de chaque série sont rendus une seule fois, à sa création
+
+Utilisé par MetricsCollector (services/monitoring_observability.py) et
+Metrics (middleware/monitoring.py)
+"""
+
+import math
+import re
+import threading
+from typing import Dict, Iterable, Optional, TextIO, Tuple
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MIN_VALUE = 1e-3  # 1 µs quand les valeurs sont en ms
+DEFAULT_MAX_VALUE = 1e7
+
+EXPORTED_QUANTILES = (0.5, 0.95, 0.99, 0.999)
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_:]")
+
+
+class QuantileSketch:
+    """
+    Histogramme à buckets logarithmiques de taille fixe
+
+    Le bucket i couvre ]gamma^(i-1), gamma^i] avec gamma = (1+a)/(1-a) :
+    son représentant est à moins de `a` (relatif) de toute valeur du bucket.
+    Les valeurs <= min_value tombent dans le bucket 0, celles > max_value
+    dans le dernier
+    """
+
+    __slots__ = (
+        "relative_accuracy", "min_value", "max_value", "_log_gamma", "_offset",
+        "counts", "count", "sum", "min", "max", "_lock"
+    )
+
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        min_value: float = DEFAULT_MIN_VALUE,
+        max_value: float = DEFAULT_MAX_VALUE
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(gamma)
+        self._offset = math.ceil(math.log(min_value) / self._log_gamma)
+        size = math.ceil(math.log(max_value) / self._log_gamma) - self._offset + 2
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # Verrou non contendu (~100 ns) : garantit des compteurs exacts entre threads
+        self._lock = threading.Lock()
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = math.ceil(math.log(value) / self._log_gamma) - self._offset + 1
+        last = len(self.counts) - 1
+        return index if index < last else last
+
+    def _bucket_value(self, index: int) -> float:
+        if index == 0:
+            return self.min_value
+        gamma = math.exp(self._log_gamma)
+        return 2 * gamma ** (index + self._offset - 1) / (gamma + 1)
+
+    def record(self, value: float):
+        """Enregistrer une valeur (O(1))"""
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Quantile q (0..1), à `relative_accuracy` près ; 0 si vide"""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if not bucket_count:
+                continue
+            seen += bucket_count
+            if seen > rank:
+                # Borné par les extrêmes observés (exacts)
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    def quantiles(self, qs: Iterable[float]) -> Dict[float, float]:
+        """Plusieurs quantiles en une seule passe sur les buckets"""
+        wanted = sorted(qs)
+        result = {q: 0.0 for q in wanted}
+        if not self.count:
+            return result
+        seen = 0
+        position = 0
+        for index, bucket_count in enumerate(self.counts):
+            if not bucket_count:
+                continue
+            seen += bucket_count
+            value = None
+            while position < len(wanted) and seen > wanted[position] * (self.count - 1):
+                if value is None:
+                    value = min(max(self._bucket_value(index), self.min), self.max)
+                result[wanted[position]] = value
+                position += 1
+            if position == len(wanted):
+                break
+        return result
+
+    @property
+    def avg(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def merge(self, other: "QuantileSketch"):
+        """Ajouter les observations d'un autre sketch (même précision)"""
+        if len(other.counts) != len(self.counts) or other._offset != self._offset:
+            raise ValueError("Cannot merge sketches with different accuracy or range")
+        with self._lock:
+            counts = self.counts
+            for index, bucket_count in enumerate(other.counts):
+                if bucket_count:
+                    counts[index] += bucket_count
+            self.count += other.count
+            self.sum += other.sum
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+    def summary(self) -> Dict[str, float]:
+        """Résumé lisible (count, avg, min, max, p50...p999)"""
+        values = self.quantiles(EXPORTED_QUANTILES)
+        return {
+            "count": self.count,
+            "avg": self.avg,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": values[0.5],
+            "p95": values[0.95],
+            "p99": values[0.99],
+            "p999": values[0.999],
+        }
+
+
+# ----------------------------------------
+# Format Prometheus
+# ----------------------------------------
+
+def render_series(name: str, labels: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """
+    Nom Prometheus valide et labels rendus (sans accolades)
+
+    Appelé une fois par série : l'export ne fait plus que de l'écriture
+    """
+    metric = _INVALID_NAME_CHARS.sub("_", name)
+    if not labels:
+        return metric, ""
+    rendered = ",".join(
+        '{}="{}"'.format(
+            _INVALID_NAME_CHARS.sub("_", k),
+            str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in sorted(labels.items())
+    )
+    return metric, rendered
+
+
+def write_sample(out: TextIO, metric: str, labels: str, value):
+    out.write(metric)
+    if labels:
+        out.write("{")
+        out.write(labels)
+        out.write("}")
+    out.write(" ")
+    out.write(repr(value) if isinstance(value, float) else str(value))
+    out.write("\n")
+
+
+def write_summary(out: TextIO, metric: str, labels: str, sketch: QuantileSketch):
+    """Écrire un sketch au format summary (quantiles, _count, _sum)"""
+    separator = "," if labels else ""
+    for q, value in sketch.quantiles(EXPORTED_QUANTILES).items():
+        out.write(metric)
+        out.write("{")
+        out.write(labels)
+        out.write(separator)
+        out.write('quantile="')
+        out.write(str(q))
+        out.write('"} ')
+        out.write(repr(value))
+        out.write("\n")
+    write_sample(out, metric + "_count", labels, sketch.count)
+    write_sample(out, metric + "_sum", labels, sketch.sum)
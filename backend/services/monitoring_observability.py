@@ -13,33 +13,38 @@ import time
 import traceback
 import psutil
 import platform
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Optional, Callable, TextIO
 from datetime import datetime, timedelta
 from functools import wraps
 from collections import defaultdict
+from io import StringIO
 import asyncio
 
+from services.metrics_sketch import (
+    QuantileSketch,
+    render_series,
+    write_sample,
+    write_summary,
+)
 from utils.logger import logger
 
 
 class MetricsCollector:
-    """Collects and aggregates application metrics"""
+    """
+    Collects and aggregates application metrics
 
-    def __init__(self):
-        self.metrics = defaultdict(lambda: {
-            'count': 0,
-            'sum': 0,
-            'min': float('inf'),
-            'max': float('-inf'),
-            'avg': 0,
-            'p95': 0,
-            'p99': 0,
-            'values': []  # For percentile calculation
-        })
+    Timings and histograms are streaming quantile sketches (O(1) record,
+    bounded memory, mergeable across workers through Redis)
+    """
 
+    def __init__(self):
         self.counters = defaultdict(int)
         self.gauges = {}
-        self.histograms = defaultdict(list)
+        self.timings: Dict[str, QuantileSketch] = {}
+        self.histograms: Dict[str, QuantileSketch] = {}
+
+        # key -> (prometheus name, rendered labels), computed once per series
+        self._series: Dict[str, tuple] = {}
 
     def increment(self, metric_name: str, value: int = 1, tags: Dict[str, str] = None):
         """Increment a counter metric"""
@@ -54,69 +59,93 @@ class MetricsCollector:
     def histogram(self, metric_name: str, value: float, tags: Dict[str, str] = None):
         """Record a value in histogram (for percentiles)"""
         key = self._make_key(metric_name, tags)
-        self.histograms[key].append(value)
-
-        # Keep only last 1000 values
-        if len(self.histograms[key]) > 1000:
-            self.histograms[key] = self.histograms[key][-1000:]
+        sketch = self.histograms.get(key)
+        if sketch is None:
+            sketch = self.histograms.setdefault(key, QuantileSketch())
+        sketch.record(value)
 
     def timing(self, metric_name: str, duration_ms: float, tags: Dict[str, str] = None):
         """Record a timing metric"""
         key = self._make_key(metric_name, tags)
-        metric = self.metrics[key]
-
-        metric['count'] += 1
-        metric['sum'] += duration_ms
-        metric['min'] = min(metric['min'], duration_ms)
-        metric['max'] = max(metric['max'], duration_ms)
-        metric['avg'] = metric['sum'] / metric['count']
-
-        # Store for percentiles
-        metric['values'].append(duration_ms)
-        if len(metric['values']) > 1000:
-            metric['values'] = metric['values'][-1000:]
-
-        # Calculate percentiles
-        if len(metric['values']) >= 10:
-            sorted_values = sorted(metric['values'])
-            p95_idx = int(len(sorted_values) * 0.95)
-            p99_idx = int(len(sorted_values) * 0.99)
-            metric['p95'] = sorted_values[p95_idx]
-            metric['p99'] = sorted_values[p99_idx]
+        sketch = self.timings.get(key)
+        if sketch is None:
+            sketch = self.timings.setdefault(key, QuantileSketch())
+        sketch.record(duration_ms)
 
     def get_metrics(self) -> Dict[str, Any]:
         """Get all collected metrics"""
         return {
             'counters': dict(self.counters),
             'gauges': dict(self.gauges),
-            'histograms': {k: sorted(v) for k, v in self.histograms.items()},
-            'timings': {
-                k: {
-                    'count': v['count'],
-                    'avg': round(v['avg'], 2),
-                    'min': round(v['min'], 2),
-                    'max': round(v['max'], 2),
-                    'p95': round(v['p95'], 2),
-                    'p99': round(v['p99'], 2)
-                }
-                for k, v in self.metrics.items()
-            }
+            'histograms': {k: self._rounded(v.summary()) for k, v in list(self.histograms.items())},
+            'timings': {k: self._rounded(v.summary()) for k, v in list(self.timings.items())}
         }
 
     def reset(self):
         """Reset all metrics"""
-        self.metrics.clear()
         self.counters.clear()
         self.gauges.clear()
+        self.timings.clear()
         self.histograms.clear()
 
+    def write_prometheus(self, out: TextIO):
+        """
+        Write every series in Prometheus text format
+
+        Series are grouped by metric name so each family gets a single
+        TYPE line, however many tag combinations it has
+        """
+        families: Dict[str, tuple] = {}
+
+        def add(kind: str, key: str, value):
+            name, labels = self._prometheus_series(key)
+            family = families.get(name)
+            if family is None:
+                family = families[name] = (kind, [])
+            family[1].append((labels, value))
+
+        for key, value in list(self.counters.items()):
+            add('counter', key, value)
+        for key, value in list(self.gauges.items()):
+            add('gauge', key, value)
+        for sketches in (self.timings, self.histograms):
+            for key, sketch in list(sketches.items()):
+                add('summary', key, sketch)
+
+        for name, (kind, series) in families.items():
+            out.write(f'# TYPE {name} {kind}\n')
+            for labels, value in series:
+                if kind == 'summary':
+                    write_summary(out, name, labels, value)
+                else:
+                    write_sample(out, name, labels, value)
+
+    def export_prometheus(self) -> str:
+        """Export metrics in Prometheus format"""
+        out = StringIO()
+        self.write_prometheus(out)
+        return out.getvalue()
+
     def _make_key(self, metric_name: str, tags: Optional[Dict[str, str]]) -> str:
         """Create metric key with tags"""
         if not tags:
             return metric_name
 
         tag_str = ','.join(f'{k}={v}' for k, v in sorted(tags.items()))
-        return f'{metric_name}{{{tag_str}}}'
+        key = f'{metric_name}{{{tag_str}}}'
+        if key not in self._series:
+            self._series[key] = render_series(metric_name, tags)
+        return key
+
+    def _prometheus_series(self, key: str) -> tuple:
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = render_series(key)
+        return series
+
+    @staticmethod
+    def _rounded(summary: Dict[str, float]) -> Dict[str, float]:
+        return {k: round(v, 2) if k != 'count' else v for k, v in summary.items()}
 
 
 class ErrorTracker:
@@ -477,28 +506,7 @@ class MonitoringService:
 
     def export_prometheus(self) -> str:
         """Export metrics in Prometheus format"""
-        lines = []
-
-        # Counters
-        for name, value in self.metrics.counters.items():
-            lines.append(f'# TYPE {name} counter')
-            lines.append(f'{name} {value}')
-
-        # Gauges
-        for name, value in self.metrics.gauges.items():
-            lines.append(f'# TYPE {name} gauge')
-            lines.append(f'{name} {value}')
-
-        # Histograms (as summaries)
-        for name, metric in self.metrics.metrics.items():
-            lines.append(f'# TYPE {name} summary')
-            lines.append(f'{name}{{quantile="0.5"}} {metric["avg"]}')
-            lines.append(f'{name}{{quantile="0.95"}} {metric["p95"]}')
-            lines.append(f'{name}{{quantile="0.99"}} {metric["p99"]}')
-            lines.append(f'{name}_count {metric["count"]}')
-            lines.append(f'{name}_sum {metric["sum"]}')
-
-        return '\n'.join(lines)
+        return self.metrics.export_prometheus()
 
 
 # Global monitoring instance
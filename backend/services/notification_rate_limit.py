@@ -0,0 +1,91 @@
+"""
+Limite de débit des notifications partagée entre workers
+
+SlidingWindowRateLimiter : fenêtre glissante par utilisateur dans un ZSET
+Redis (notif_rate:{user_id}), partagée par tous les workers ; mémoire
+locale si Redis est indisponible
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Optional
+
+import redis
+
+from utils.logger import logger
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+NOTIFICATION_RATE_LIMIT = int(os.getenv("NOTIFICATION_RATE_LIMIT", "10"))
+NOTIFICATION_RATE_WINDOW_SECONDS = int(os.getenv("NOTIFICATION_RATE_WINDOW_SECONDS", "3600"))
+
+RATE_KEY_PREFIX = "notif_rate"
+
+# Purge des envois sortis de la fenêtre, puis ajout si la limite n'est pas atteinte
+_SLIDING_WINDOW = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1] - ARGV[2])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class SlidingWindowRateLimiter:
+    """Au plus `limit` envois par utilisateur sur `window` secondes glissantes"""
+
+    def __init__(
+        self,
+        limit: int = NOTIFICATION_RATE_LIMIT,
+        window: int = NOTIFICATION_RATE_WINDOW_SECONDS,
+        redis_client=None,
+        use_redis: bool = True,
+    ):
+        self.limit = limit
+        self.window = window
+        self._redis = redis_client
+        self._redis_checked = redis_client is not None or not use_redis
+        self._script = None
+        self._local: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if not self._redis_checked:
+            self._redis_checked = True
+            try:
+                client = redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=1)
+                client.ping()
+                self._redis = client
+            except redis.RedisError as e:
+                logger.warning(f"⚠️ Redis indisponible, limite de notifications en mémoire locale: {e}")
+        return self._redis
+
+    def allow(self, user_id, now: Optional[float] = None) -> bool:
+        """Compte un envoi et dit s'il est autorisé"""
+        now = time.time() if now is None else now
+        key = f"{RATE_KEY_PREFIX}:{user_id}"
+
+        client = self._client()
+        if client is not None:
+            try:
+                if self._script is None:
+                    self._script = client.register_script(_SLIDING_WINDOW)
+                return bool(self._script(keys=[key], args=[now, self.window, self.limit, uuid.uuid4().hex]))
+            except redis.RedisError as e:
+                # On ne bloque pas les notifications sur une panne Redis
+                logger.warning(f"Limite de notifications non vérifiée ({key}): {e}")
+                return True
+
+        with self._lock:
+            sent = self._local.setdefault(key, deque())
+            while sent and sent[0] <= now - self.window:
+                sent.popleft()
+            if len(sent) >= self.limit:
+                return False
+            sent.append(now)
+            return True
+
@@ -467,15 +467,16 @@ class NotificationService:
             
             influencer_ids = list(set([l['influencer_id'] for l in leads.data if l.get('influencer_id')]))
             
-            for influencer_id in influencer_ids:
-                influencer = self.supabase.table('influencers').select('user_id').eq('id', influencer_id).single().execute()
-                
-                if not influencer.data:
-                    continue
-                
-                user_id = influencer.data['user_id']
-                
-                notification_data = {
+            if not influencer_ids:
+                return
+            
+            # user_id de tous les influenceurs en une requête
+            influencers = self.supabase.table('influencers').select('user_id').in_('id', influencer_ids).execute()
+            user_ids = list(set([i['user_id'] for i in influencers.data or [] if i.get('user_id')]))
+            
+            # Un seul INSERT pour toutes les notifications
+            notifications = [
+                {
                     'user_id': user_id,
                     'type': 'campaign_stopped_influencer',
                     'level': 'warning',
@@ -487,10 +488,13 @@ class NotificationService:
                     },
                     'is_read': False
                 }
-                
-                self.supabase.table('notifications').insert(notification_data).execute()
+                for user_id in user_ids
+            ]
+            
+            if notifications:
+                self.supabase.table('notifications').insert(notifications).execute()
             
-            print(f"✅ {len(influencer_ids)} influenceurs notifiés de l'arrêt de campagne")
+            print(f"✅ {len(notifications)} influenceurs notifiés de l'arrêt de campagne")
             
         except Exception as e:
             print(f"Erreur _notify_influencers_campaign_stopped: {e}")
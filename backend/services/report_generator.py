@@ -6,8 +6,10 @@ Service complet pour exports de données
 import os
 import csv
 import json
+import tempfile
 from io import BytesIO, StringIO
-from typing import Dict, List, Any, Optional
+from itertools import chain, islice
+from typing import Dict, List, Any, Iterable, Iterator, Optional
 from datetime import datetime, timedelta
 from enum import Enum
 
@@ -27,6 +29,8 @@ try:
     import openpyxl
     from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
     from openpyxl.chart import BarChart, Reference, LineChart
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
     OPENPYXL_AVAILABLE = True
 except ImportError:
     OPENPYXL_AVAILABLE = False
@@ -49,6 +53,73 @@ class ReportFormat(str, Enum):
     CSV = "csv"
     EXCEL = "excel"
     JSON = "json"
+    JSONL = "jsonl"
+
+
+# Export en flux : taille des pages lues en base et des blocs envoyés au client
+EXPORT_PAGE_SIZE = int(os.getenv("REPORT_EXPORT_PAGE_SIZE", "1000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Lignes échantillonnées pour dimensionner les colonnes Excel
+EXCEL_WIDTH_SAMPLE_ROWS = 200
+
+STREAM_FORMATS = {
+    ReportFormat.CSV: ("text/csv; charset=utf-8", "csv"),
+    ReportFormat.JSONL: ("application/x-ndjson", "jsonl"),
+    ReportFormat.EXCEL: ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+# Datasets exportables en flux : colonnes lues et colonne de périmètre par rôle
+EXPORT_DATASETS = {
+    "sales": {
+        "columns": (
+            "id, created_at, product_id, merchant_id, influencer_id, quantity, amount, currency, "
+            "influencer_commission, platform_commission, merchant_revenue, status, payment_status"
+        ),
+        "scopes": {"merchant": "merchant_id", "influencer": "influencer_id"},
+    },
+    "conversions": {
+        "columns": "*",
+        "scopes": {"merchant": "merchant_id", "influencer": "influencer_id"},
+    },
+}
+
+
+def paged_rows(
+    client,
+    table: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, Any]] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    page_size: int = EXPORT_PAGE_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourt une table page par page (pagination par clé sur created_at, id)
+
+    Une seule page en mémoire à la fois ; contrairement à OFFSET, chaque
+    page coûte le même prix quelle que soit sa position
+    """
+    cursor = None
+    while True:
+        query = client.table(table).select(columns)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        if since:
+            query = query.gte('created_at', since)
+        if until:
+            query = query.lt('created_at', until)
+        if cursor:
+            created_at, row_id = cursor
+            query = query.or_(
+                f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{row_id})'
+            )
+
+        page = query.order('created_at').order('id').limit(page_size).execute().data or []
+        yield from page
+
+        if len(page) < page_size:
+            return
+        cursor = (page[-1]['created_at'], page[-1]['id'])
 
 
 class ReportGenerator:
@@ -418,27 +489,21 @@ class ReportGenerator:
                 cell.fill = header_fill
                 cell.font = header_font
             
-            # Ajouter les données
+            # Ajouter les données (largeurs mesurées au passage, sans relire les cellules)
+            widths = [len(header) for header in headers]
             for row_data in data.get('daily_revenue', []):
-                ws.append([
+                values = [
                     row_data.get('date'),
                     row_data.get('revenue', 0),
                     row_data.get('orders', 0),
                     row_data.get('average_order', 0)
-                ])
-        
-        # Ajuster les largeurs de colonnes
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+                ]
+                ws.append(values)
+                widths = [max(width, len(str(value))) for width, value in zip(widths, values)]
+
+            # Ajuster les largeurs de colonnes
+            for col, width in enumerate(widths, start=1):
+                ws.column_dimensions[get_column_letter(col)].width = min(width + 2, 50)
         
         # Sauvegarder
         wb.save(filepath)
@@ -481,6 +546,128 @@ class ReportGenerator:
             "generated_at": datetime.now().isoformat()
         }
 
+    # ============================================
+    # EXPORT EN FLUX (mémoire constante)
+    # ============================================
+
+    def stream_export(
+        self,
+        format: ReportFormat,
+        rows: Iterable[Dict[str, Any]],
+        columns: Optional[List[str]] = None,
+        title: str = "Export"
+    ) -> Iterator[bytes]:
+        """
+        Exporter un itérateur de lignes par blocs d'octets
+
+        Les lignes sont consommées au fur et à mesure (ex: paged_rows) : la
+        mémoire reste bornée quel que soit le nombre de lignes. Colonnes
+        déduites de la première ligne si non fournies
+        """
+        if format == ReportFormat.CSV:
+            return self._stream_csv(rows, columns)
+        elif format == ReportFormat.JSONL:
+            return self._stream_jsonl(rows)
+        elif format == ReportFormat.EXCEL:
+            if not self.excel_available:
+                raise ValueError("openpyxl n'est pas installé. Utilisez: pip install openpyxl")
+            return self._stream_excel(rows, columns, title)
+        else:
+            raise ValueError(f"Format non supporté en flux: {format}")
+
+    def _stream_csv(self, rows: Iterable[Dict[str, Any]], columns: Optional[List[str]]) -> Iterator[bytes]:
+        rows = iter(rows)
+        if columns is None:
+            first = next(rows, None)
+            if first is None:
+                return
+            columns = list(first.keys())
+            rows = chain([first], rows)
+
+        buffer = StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def _stream_jsonl(self, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        chunk = []
+        size = 0
+        for row in rows:
+            line = json.dumps(row, ensure_ascii=False, default=str) + "\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(chunk).encode('utf-8')
+                chunk = []
+                size = 0
+
+        if chunk:
+            yield "".join(chunk).encode('utf-8')
+
+    def _stream_excel(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        columns: Optional[List[str]],
+        title: str
+    ) -> Iterator[bytes]:
+        """
+        Excel en mode write-only : les lignes partent dans un fichier
+        temporaire au lieu de rester en mémoire. Les largeurs (à fixer avant
+        la première ligne) sont calculées sur un échantillon
+        """
+        rows = iter(rows)
+        sample = list(islice(rows, EXCEL_WIDTH_SAMPLE_ROWS))
+        if columns is None:
+            columns = list(sample[0].keys()) if sample else []
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=title[:31])
+
+        for col, column in enumerate(columns, start=1):
+            width = max([len(column)] + [len(str(row.get(column, ''))) for row in sample])
+            ws.column_dimensions[get_column_letter(col)].width = min(width + 2, 50)
+
+        header_fill = PatternFill(start_color="2563eb", end_color="2563eb", fill_type="solid")
+        header_font = Font(color="FFFFFF", bold=True, size=12)
+        header = []
+        for column in columns:
+            cell = WriteOnlyCell(ws, value=column)
+            cell.fill = header_fill
+            cell.font = header_font
+            header.append(cell)
+        ws.append(header)
+
+        for row in chain(sample, rows):
+            ws.append([self._excel_value(row.get(column)) for column in columns])
+
+        with tempfile.TemporaryFile() as output:
+            wb.save(output)
+            output.seek(0)
+            while True:
+                chunk = output.read(EXPORT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+    @staticmethod
+    def _excel_value(value: Any) -> Any:
+        # Listes / objets JSON (colonnes jsonb) : pas de type de cellule natif
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return value
+
+    def export_filename(self, name: str, format: ReportFormat) -> str:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"{name}_{timestamp}.{STREAM_FORMATS[format][1]}"
+
 
 # Instance singleton
 report_generator = ReportGenerator()
@@ -14,6 +14,22 @@ from decimal import Decimal
 import random
 
 from utils.logger import logger
+from services.leaderboard_engine import leaderboard_engine
+
+
+SALES_REP_USER_TYPE = "commercial"
+
+
+def deal_points(deal_value: float) -> float:
+    """Points de classement d'un deal gagné : 100 + 1 point par 100 MAD"""
+    return 100 + deal_value * 0.01
+
+
+def record_closed_deal(sales_rep_id: str, deal_value: float):
+    """Répercute un deal gagné sur les classements des commerciaux"""
+    leaderboard_engine.incr(SALES_REP_USER_TYPE, sales_rep_id, 1, metric="deals")
+    leaderboard_engine.incr(SALES_REP_USER_TYPE, sales_rep_id, deal_value, metric="revenue")
+    leaderboard_engine.incr(SALES_REP_USER_TYPE, sales_rep_id, deal_points(deal_value), metric="deal_points")
 
 
 class SalesRepresentativeService:
@@ -366,6 +382,7 @@ class SalesRepresentativeService:
 
         # Ajouter points gamification
         await self._award_points(sales_rep_id, 'deal_closed', deal_value)
+        record_closed_deal(sales_rep_id, float(deal_value))
 
         logger.info(f"✅ Deal créé: {deal_name} - {deal_value} MAD (Commission: {commission_amount} MAD)")
 
@@ -629,6 +646,9 @@ class SalesRepresentativeService:
         #     .eq('id', sales_rep_id)\
         #     .execute()
 
+        # Classements semaine / mois / global
+        leaderboard_engine.incr(SALES_REP_USER_TYPE, sales_rep_id, points)
+
         # Vérifier si nouveau level atteint
         await self._check_level_up(sales_rep_id)
 
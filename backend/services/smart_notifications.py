@@ -2,6 +2,7 @@
 Smart Notifications Multi-canal
 Email, SMS, Push, In-App, WhatsApp avec routage intelligent
 """
+import asyncio
 import os
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
@@ -11,6 +12,8 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import requests
 
+from services.notification_rate_limit import SlidingWindowRateLimiter
+from services.smtp_pool import SMTPConnectionPool
 from utils.logger import logger
 
 
@@ -60,8 +63,11 @@ class SmartNotificationService:
         # Préférences utilisateurs (stocké en DB normalement)
         self.user_preferences = {}
 
-        # Compteurs pour rate limiting
-        self.notification_counts = {}
+        # Rate limiting : fenêtre glissante partagée entre workers (Redis)
+        self.rate_limiter = SlidingWindowRateLimiter()
+
+        # Connexions SMTP réutilisées entre les emails
+        self.smtp_pool = SMTPConnectionPool(connect=self._create_smtp_connection)
 
     async def send_notification(
         self,
@@ -100,38 +106,18 @@ class SmartNotificationService:
                 preferences
             )
 
-        # Envoyer sur chaque canal
-        results = {}
-
-        for channel in channels:
-            try:
-                if channel == NotificationChannel.EMAIL:
-                    success = await self._send_email(user_id, title, message, data)
-                    results['email'] = success
-
-                elif channel == NotificationChannel.SMS:
-                    success = await self._send_sms(user_id, message)
-                    results['sms'] = success
-
-                elif channel == NotificationChannel.PUSH:
-                    success = await self._send_push(user_id, title, message, data)
-                    results['push'] = success
-
-                elif channel == NotificationChannel.IN_APP:
-                    success = await self._send_in_app(user_id, title, message, data)
-                    results['in_app'] = success
-
-                elif channel == NotificationChannel.WHATSAPP:
-                    success = await self._send_whatsapp(user_id, message)
-                    results['whatsapp'] = success
-
-                elif channel == NotificationChannel.SLACK:
-                    success = await self._send_slack(title, message, data)
-                    results['slack'] = success
+        # Envoyer sur tous les canaux en parallèle
+        outcomes = await asyncio.gather(
+            *(self._send_channel(channel, user_id, title, message, data) for channel in channels),
+            return_exceptions=True
+        )
 
-            except Exception as e:
-                logger.error(f"Notification failed on {channel.value}: {e}")
-                results[channel.value] = False
+        results = {}
+        for channel, outcome in zip(channels, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Notification failed on {channel.value}: {outcome}")
+                outcome = False
+            results[channel.value] = outcome
 
         # Logger résultats
         successful = sum(1 for v in results.values() if v)
@@ -142,6 +128,40 @@ class SmartNotificationService:
 
         return results
 
+    async def _send_channel(
+        self,
+        channel: NotificationChannel,
+        user_id: int,
+        title: str,
+        message: str,
+        data: Optional[Dict] = None
+    ) -> bool:
+        """Envoyer sur un canal"""
+        if channel == NotificationChannel.EMAIL:
+            return await self._send_email(user_id, title, message, data)
+        if channel == NotificationChannel.SMS:
+            return await self._send_sms(user_id, message)
+        if channel == NotificationChannel.PUSH:
+            return await self._send_push(user_id, title, message, data)
+        if channel == NotificationChannel.IN_APP:
+            return await self._send_in_app(user_id, title, message, data)
+        if channel == NotificationChannel.WHATSAPP:
+            return await self._send_whatsapp(user_id, message)
+        if channel == NotificationChannel.SLACK:
+            return await self._send_slack(title, message, data)
+        return False
+
+    def _create_smtp_connection(self) -> smtplib.SMTP:
+        """Connexion SMTP authentifiée (ouverte par le pool)"""
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30)
+        try:
+            server.starttls()
+            server.login(self.smtp_user, self.smtp_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
     async def _send_email(
         self,
         user_id: int,
@@ -175,11 +195,8 @@ class SmartNotificationService:
             msg.attach(MIMEText(text_content, 'plain'))
             msg.attach(MIMEText(html_content, 'html'))
 
-            # Envoyer
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(msg)
+            # Envoyer (connexion du pool)
+            await asyncio.to_thread(self.smtp_pool.send, msg)
 
             logger.info(f"Email sent to {user_email}")
             return True
@@ -203,7 +220,8 @@ class SmartNotificationService:
 
             client = Client(self.twilio_sid, self.twilio_token)
 
-            client.messages.create(
+            await asyncio.to_thread(
+                client.messages.create,
                 body=message[:160],  # Limite SMS
                 from_=self.twilio_phone,
                 to=user_phone
@@ -251,7 +269,7 @@ class SmartNotificationService:
                 'data': data or {}
             }
 
-            response = requests.post(url, json=payload, headers=headers)
+            response = await asyncio.to_thread(requests.post, url, json=payload, headers=headers)
             response.raise_for_status()
 
             logger.info(f"Push sent to {len(device_tokens)} devices")
@@ -270,25 +288,8 @@ class SmartNotificationService:
     ) -> bool:
         """Créer notification in-app (stockée en DB)"""
         try:
-            # En production: INSERT dans table notifications
-            notification = {
-                'user_id': user_id,
-                'title': title,
-                'message': message,
-                'data': data,
-                'read': False,
-                'created_at': datetime.utcnow().isoformat()
-            }
-
-            # Ici: stocker en DB
-            # db.notifications.insert(notification)
-
-            # Publier via WebSocket pour notification temps réel
-            # await realtime_analytics.broadcast_metric(
-            #     'notification',
-            #     notification,
-            #     dashboard_type=f'user:{user_id}'
-            # )
+            row = self._in_app_row(user_id, title, message, data)
+            await asyncio.to_thread(self._insert_in_app, row)
 
             logger.info(f"In-app notification created for user {user_id}")
             return True
@@ -297,6 +298,30 @@ class SmartNotificationService:
             logger.error(f"In-app notification failed: {e}")
             return False
 
+    def _in_app_row(
+        self,
+        user_id: int,
+        title: str,
+        message: str,
+        data: Optional[Dict] = None
+    ) -> Dict[str, Any]:
+        """Ligne de la table notifications"""
+        return {
+            'user_id': user_id,
+            'type': 'info',
+            'title': title,
+            'message': message,
+            'metadata': data,
+            'is_read': False,
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+    def _insert_in_app(self, row: Dict[str, Any]):
+        """INSERT dans notifications"""
+        from supabase_client import supabase
+
+        supabase.table('notifications').insert(row).execute()
+
     async def _send_whatsapp(self, user_id: int, message: str) -> bool:
         """Envoyer message WhatsApp Business"""
         if not self.whatsapp_token:
@@ -321,7 +346,7 @@ class SmartNotificationService:
                 'text': {'body': message}
             }
 
-            response = requests.post(url, json=payload, headers=headers)
+            response = await asyncio.to_thread(requests.post, url, json=payload, headers=headers)
             response.raise_for_status()
 
             logger.info(f"WhatsApp sent to {user_phone}")
@@ -365,7 +390,7 @@ class SmartNotificationService:
                     ]
                 })
 
-            response = requests.post(self.slack_webhook, json=payload)
+            response = await asyncio.to_thread(requests.post, self.slack_webhook, json=payload)
             response.raise_for_status()
 
             logger.info("Slack notification sent")
@@ -434,16 +459,13 @@ class SmartNotificationService:
 
     async def _check_rate_limit(self, user_id: int) -> bool:
         """Vérifier si l'utilisateur n'est pas rate limited"""
-        key = f"notif_count:{user_id}"
-
-        # Limite: max 10 notifications par heure
-        count = self.notification_counts.get(key, 0)
-
-        if count >= 10:
-            logger.warning(f"User {user_id} rate limited (10/hour)")
+        # Limite: NOTIFICATION_RATE_LIMIT notifications par fenêtre glissante (10 / heure par défaut)
+        if not self.rate_limiter.allow(user_id):
+            logger.warning(
+                f"User {user_id} rate limited "
+                f"({self.rate_limiter.limit}/{self.rate_limiter.window}s)"
+            )
             return False
-
-        self.notification_counts[key] = count + 1
         return True
 
     def _generate_email_html(
@@ -0,0 +1,252 @@
+"""
+Pool de connexions SMTP
+
+Évite un handshake complet (TCP, STARTTLS, LOGIN) par email :
+- connexions gardées ouvertes et réutilisées entre les envois
+- NOOP avant réutilisation d'une connexion restée inactive
+- reconnexion automatique (un nouvel essai) si le serveur a coupé
+- connexion recyclée après SMTP_POOL_MAX_MESSAGES envois ou SMTP_POOL_IDLE_SECONDS d'inactivité
+- send_many : lots répartis sur au plus SMTP_POOL_SIZE connexions simultanées
+- métriques : connexions ouvertes / réutilisées, reconnexions, débit du dernier lot
+"""
+
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.message import Message
+from typing import Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_POOL_IDLE_SECONDS = int(os.getenv("SMTP_POOL_IDLE_SECONDS", "60"))
+SMTP_POOL_NOOP_AFTER_SECONDS = int(os.getenv("SMTP_POOL_NOOP_AFTER_SECONDS", "10"))
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", "100"))
+SMTP_POOL_ACQUIRE_TIMEOUT = int(os.getenv("SMTP_POOL_ACQUIRE_TIMEOUT", "30"))
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    Erreur qui rend la connexion inutilisable (on la jette et on réessaie)
+
+    SMTPException hérite d'OSError : les refus du serveur (destinataire,
+    contenu) n'invalident pas la connexion, smtplib l'a déjà remise à zéro (RSET)
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class _PooledConnection:
+    __slots__ = ("server", "created_at", "last_used", "sent")
+
+    def __init__(self, server):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.sent = 0
+
+
+class SMTPConnectionPool:
+    """Connexions SMTP réutilisables, sûres entre threads"""
+
+    def __init__(
+        self,
+        connect: Callable[[], smtplib.SMTP],
+        max_connections: int = SMTP_POOL_SIZE,
+        idle_timeout: float = SMTP_POOL_IDLE_SECONDS,
+        noop_after: float = SMTP_POOL_NOOP_AFTER_SECONDS,
+        max_messages: int = SMTP_POOL_MAX_MESSAGES,
+        acquire_timeout: float = SMTP_POOL_ACQUIRE_TIMEOUT,
+    ):
+        self._connect = connect
+        self.max_connections = max(1, max_connections)
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.max_messages = max_messages
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._lock = threading.Lock()
+        self._stats = {
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "connections_closed": 0,
+            "reconnects": 0,
+            "noop_checks": 0,
+            "sent": 0,
+            "failed": 0,
+            "last_batch_size": 0,
+            "last_batch_seconds": 0.0,
+            "last_batch_per_second": 0.0,
+        }
+
+    # ============================================
+    # CONNEXIONS
+    # ============================================
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _open(self) -> _PooledConnection:
+        connection = _PooledConnection(self._connect())
+        self._count("connections_opened")
+        return connection
+
+    def _close(self, connection: _PooledConnection):
+        try:
+            connection.server.quit()
+        except Exception:
+            try:
+                connection.server.close()
+            except Exception:
+                pass
+        self._count("connections_closed")
+
+    def _is_alive(self, connection: _PooledConnection) -> bool:
+        """NOOP si la connexion est restée inactive (le serveur a pu la couper)"""
+        if time.monotonic() - connection.last_used < self.noop_after:
+            return True
+        self._count("noop_checks")
+        try:
+            code, _ = connection.server.noop()
+            return code == 250
+        except OSError:
+            return False
+
+    def _checkout(self) -> _PooledConnection:
+        """Connexion inactive encore valide, sinon nouvelle connexion"""
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._open()
+
+            expired = time.monotonic() - connection.last_used > self.idle_timeout
+            if not expired and self._is_alive(connection):
+                self._count("connections_reused")
+                return connection
+            self._close(connection)
+
+    def _checkin(self, connection: _PooledConnection, broken: bool = False):
+        if broken or connection.sent >= self.max_messages:
+            self._close(connection)
+            return
+        connection.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(connection)
+
+    @contextmanager
+    def connection(self):
+        """
+        Emprunter une connexion (au plus max_connections en même temps)
+
+        Une erreur de connexion dans le bloc la retire du pool
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise RuntimeError("Aucune connexion SMTP disponible")
+        connection = None
+        broken = False
+        try:
+            connection = self._checkout()
+            yield connection
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            if connection is not None:
+                self._checkin(connection, broken)
+            self._slots.release()
+
+    # ============================================
+    # ENVOI
+    # ============================================
+
+    def send(self, message: Message) -> None:
+        """
+        Envoyer un message sur une connexion du pool
+
+        Si la connexion a été coupée, un second essai est fait sur une
+        connexion neuve ; les refus du serveur (destinataire, contenu)
+        remontent tels quels sans jeter la connexion
+        """
+        for attempt in (1, 2):
+            try:
+                with self.connection() as connection:
+                    connection.server.send_message(message)
+                    connection.sent += 1
+                self._count("sent")
+                return
+            except Exception as e:
+                if attempt == 2 or not is_connection_error(e):
+                    self._count("failed")
+                    raise
+                self._count("reconnects")
+                logger.warning("smtp_connection_lost", error=str(e))
+
+    def send_many(self, messages: List[Message], concurrency: Optional[int] = None) -> Dict:
+        """
+        Envoyer un lot de messages en réutilisant les connexions
+
+        Args:
+            messages: Messages à envoyer
+            concurrency: Connexions simultanées (défaut: taille du pool)
+
+        Returns:
+            sent, failed, failures [{index, error}], seconds, per_second
+        """
+        if not messages:
+            return {"sent": 0, "failed": 0, "failures": [], "seconds": 0.0, "per_second": 0.0}
+
+        workers = max(1, min(concurrency or self.max_connections, self.max_connections, len(messages)))
+        failures = []
+
+        def deliver(index: int):
+            try:
+                self.send(messages[index])
+            except Exception as e:
+                failures.append({"index": index, "error": str(e)})
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smtp") as executor:
+            list(executor.map(deliver, range(len(messages))))
+        seconds = time.monotonic() - started
+
+        sent = len(messages) - len(failures)
+        per_second = round(sent / seconds, 2) if seconds > 0 else float(sent)
+        with self._lock:
+            self._stats["last_batch_size"] = len(messages)
+            self._stats["last_batch_seconds"] = round(seconds, 3)
+            self._stats["last_batch_per_second"] = per_second
+
+        logger.info("smtp_batch_sent", sent=sent, failed=len(failures), seconds=round(seconds, 3),
+                    per_second=per_second, connections=workers)
+        return {
+            "sent": sent,
+            "failed": len(failures),
+            "failures": sorted(failures, key=lambda failure: failure["index"]),
+            "seconds": round(seconds, 3),
+            "per_second": per_second,
+        }
+
+    def close_all(self):
+        """Fermer les connexions inactives (arrêt du worker)"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._close(connection)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle_connections"] = len(self._idle)
+        stats["max_connections"] = self.max_connections
+        return stats
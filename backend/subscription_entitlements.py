@@ -0,0 +1,170 @@
+"""
+Compteurs d'usage des abonnements (produits, campagnes, affiliés, liens)
+
+Alimentent les vérifications de SubscriptionLimits sans COUNT en base :
+- un hash Redis par compte : entitlements:usage:{role}:{entity_id}
+  (entity_id = merchants.id ou influencers.id)
+- incrémenté / décrémenté par les fonctions de création et de suppression
+  (record_usage) ; un delta sur un compteur absent est ignoré, la prochaine
+  lecture le reconstruit depuis la base
+- le hash expire après ENTITLEMENT_RECONCILE_SECONDS : la lecture suivante
+  recompte en base (réconciliation périodique, dérive bornée)
+- Redis indisponible : mêmes compteurs en mémoire locale au processus.
+  Chaque worker ne voit alors que ses propres deltas : jusqu'à la
+  réconciliation suivante (ENTITLEMENT_RECONCILE_SECONDS), les créations
+  faites par les autres workers ne sont pas comptées et une limite peut
+  être dépassée d'autant
+
+Aucune dépendance vers la base : importable depuis les helpers d'écriture
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+ENTITLEMENT_RECONCILE_SECONDS = int(os.getenv("ENTITLEMENT_RECONCILE_SECONDS", "900"))
+USAGE_KEY_PREFIX = "entitlements:usage"
+
+# HINCRBY seulement si le compteur existe (sinon il serait partiel)
+_INCR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return false
+"""
+
+
+def usage_key(role: str, entity_id: str) -> str:
+    return f"{USAGE_KEY_PREFIX}:{role}:{entity_id}"
+
+
+class UsageCounters:
+    """Compteurs d'usage par compte, Redis ou mémoire locale (propre au processus)"""
+
+    def __init__(self, redis_client=None, ttl: int = ENTITLEMENT_RECONCILE_SECONDS, use_redis: bool = True):
+        self.ttl = ttl
+        self._redis = redis_client
+        self._redis_checked = redis_client is not None or not use_redis
+        self._incr_script = None
+        self._local: Dict[str, tuple] = {}  # clé -> (expire_at, compteurs)
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if not self._redis_checked:
+            self._redis_checked = True
+            try:
+                client = redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=1)
+                client.ping()
+                self._redis = client
+            except redis.RedisError as e:
+                logger.warning(f"⚠️ Redis indisponible, compteurs d'usage en mémoire locale: {e}")
+        return self._redis
+
+    # ============================================
+    # LECTURE / ÉCRITURE
+    # ============================================
+
+    def get(self, role: str, entity_id: str) -> Optional[Dict[str, int]]:
+        """Compteurs du compte, None s'ils sont à reconstruire"""
+        key = usage_key(role, entity_id)
+        client = self._client()
+        if client is not None:
+            try:
+                raw = client.hgetall(key)
+            except redis.RedisError as e:
+                logger.warning(f"Lecture compteurs d'usage impossible ({key}): {e}")
+                return None
+            return {field: max(0, int(value)) for field, value in raw.items()} if raw else None
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None or entry[0] <= time.time():
+                self._local.pop(key, None)
+                return None
+            return {field: max(0, value) for field, value in entry[1].items()}
+
+    def set(self, role: str, entity_id: str, usage: Dict[str, int]):
+        """Remplace les compteurs (réconciliation) et relance leur durée de vie"""
+        key = usage_key(role, entity_id)
+        client = self._client()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.hset(key, mapping={field: int(value) for field, value in usage.items()})
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.warning(f"Écriture compteurs d'usage impossible ({key}): {e}")
+            return
+
+        with self._lock:
+            self._local[key] = (time.time() + self.ttl, {f: int(v) for f, v in usage.items()})
+
+    def incr(self, role: str, entity_id: str, field: str, delta: int = 1):
+        """Applique un delta si les compteurs du compte sont connus"""
+        key = usage_key(role, entity_id)
+        client = self._client()
+        if client is not None:
+            try:
+                if self._incr_script is None:
+                    self._incr_script = client.register_script(_INCR_IF_EXISTS)
+                self._incr_script(keys=[key], args=[field, delta])
+            except redis.RedisError as e:
+                # Compteur faux jusqu'à la prochaine réconciliation : on l'efface
+                logger.warning(f"Mise à jour compteur d'usage impossible ({key}.{field}): {e}")
+                self.invalidate(role, entity_id)
+            return
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                entry[1][field] = entry[1].get(field, 0) + delta
+
+    def invalidate(self, role: str, entity_id: str):
+        key = usage_key(role, entity_id)
+        client = self._client()
+        if client is not None:
+            try:
+                client.delete(key)
+            except redis.RedisError as e:
+                logger.warning(f"Suppression compteurs d'usage impossible ({key}): {e}")
+            return
+
+        with self._lock:
+            self._local.pop(key, None)
+
+    def get_or_reconcile(
+        self, role: str, entity_id: str, loader: Callable[[], Dict[str, int]]
+    ) -> Dict[str, int]:
+        """Compteurs en cache, ou recomptés en base par `loader` puis mis en cache"""
+        usage = self.get(role, entity_id)
+        if usage is None:
+            usage = loader()
+            self.set(role, entity_id, usage)
+        return usage
+
+
+# Instance globale
+usage_counters = UsageCounters()
+
+
+def record_usage(role: str, entity_id: Optional[str], field: str, delta: int = 1):
+    """
+    Répercute une création (+1) ou une suppression (-1) sur les compteurs
+
+    Ne lève jamais d'exception : au pire la réconciliation corrige
+    """
+    if not entity_id:
+        return
+    try:
+        usage_counters.incr(role, str(entity_id), field, delta)
+    except Exception as e:
+        logger.warning(f"Compteur d'usage non mis à jour ({role}:{entity_id}.{field}): {e}")
@@ -10,6 +10,9 @@ from typing import Optional, Dict, Any
 from supabase import create_client, Client
 import os
 
+from services.cache_engine import CacheEngine
+from subscription_entitlements import usage_counters
+
 # Configuration Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -20,148 +23,204 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 else:
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+# Ligne merchants / influencers de l'utilisateur (plan, id du compte)
+ENTITLEMENT_ACCOUNT_TTL = int(os.getenv("ENTITLEMENT_ACCOUNT_TTL", "60"))
+_account_cache = CacheEngine(max_entries=10000, refresh_workers=1)
+
+ACCOUNT_TABLES = {"merchant": "merchants", "influencer": "influencers"}
+USAGE_FIELDS = {
+    "merchant": ("products", "campaigns", "affiliates"),
+    "influencer": ("campaigns", "links"),
+}
+
 # ============================================
 # USAGE COUNTING FUNCTIONS
 # ============================================
 
+def _empty_usage(user_role: str) -> Dict[str, int]:
+    return {field: 0 for field in USAGE_FIELDS.get(user_role, USAGE_FIELDS["influencer"])}
+
+def count_usage(user_role: str, entity_id: str) -> Dict[str, int]:
+    """Compte l'utilisation d'un compte merchant / influencer en base (lève en cas d'erreur)"""
+    if user_role == "merchant":
+        # Compter les produits (hors soft delete)
+        products_response = supabase.from_("products")\
+            .select("id", count="exact")\
+            .eq("merchant_id", entity_id)\
+            .is_("deleted_at", "null")\
+            .execute()
+
+        # Compter les campagnes (hors soft delete)
+        campaigns_response = supabase.from_("campaigns")\
+            .select("id", count="exact")\
+            .eq("merchant_id", entity_id)\
+            .is_("deleted_at", "null")\
+            .execute()
+
+        # Compter les affiliations (affiliés)
+        affiliates_response = supabase.from_("affiliations")\
+            .select("id", count="exact")\
+            .eq("merchant_id", entity_id)\
+            .execute()
+
+        return {
+            "products": products_response.count or 0,
+            "campaigns": campaigns_response.count or 0,
+            "affiliates": affiliates_response.count or 0
+        }
+
+    # Compter les campagnes (affiliations)
+    campaigns_response = supabase.from_("affiliations")\
+        .select("id", count="exact")\
+        .eq("influencer_id", entity_id)\
+        .execute()
+
+    # Compter les liens de tracking
+    links_response = supabase.from_("tracking_links")\
+        .select("id", count="exact")\
+        .eq("influencer_id", entity_id)\
+        .execute()
+
+    return {
+        "campaigns": campaigns_response.count or 0,
+        "links": links_response.count or 0
+    }
+
+def get_account(user_id: str, user_role: str) -> Optional[Dict[str, Any]]:
+    """Ligne merchants / influencers de l'utilisateur, en cache ENTITLEMENT_ACCOUNT_TTL secondes"""
+    table = ACCOUNT_TABLES.get(user_role)
+    if not supabase or not table:
+        return None
+
+    def load():
+        response = supabase.from_(table)\
+            .select("*")\
+            .eq("user_id", user_id)\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
+
+    return _account_cache.get_or_load(
+        f"entitlement_account:{user_id}", load, ttl=ENTITLEMENT_ACCOUNT_TTL, use_l2=False
+    )
+
+def invalidate_account(user_id: str):
+    """À appeler après un changement de plan de l'utilisateur"""
+    _account_cache.delete(f"entitlement_account:{user_id}")
+
+def get_usage(user_role: str, entity_id: str) -> Dict[str, int]:
+    """Compteurs d'usage (Redis / mémoire), recomptés en base s'ils sont absents ou expirés"""
+    try:
+        usage = usage_counters.get_or_reconcile(
+            user_role, entity_id, lambda: count_usage(user_role, entity_id)
+        )
+    except Exception as e:
+        print(f"❌ Error counting usage: {e}")
+        # Valeurs par défaut, non mises en cache
+        return _empty_usage(user_role)
+    return {**_empty_usage(user_role), **usage}
+
 async def get_real_usage_counts(user_id: str, user_role: str) -> Dict[str, int]:
     """Compte l'utilisation réelle depuis la base de données"""
     if not supabase:
         print("⚠️ Supabase not configured, returning mock data")
         return {"products": 0, "campaigns": 0, "affiliates": 0}
-    
+
     try:
-        if user_role == "merchant":
-            # Trouver le merchant_id
-            merchant_response = supabase.from_("merchants")\
-                .select("id")\
-                .eq("user_id", user_id)\
-                .single()\
-                .execute()
-            
-            if not merchant_response.data:
-                return {"products": 0, "campaigns": 0, "affiliates": 0}
-            
-            merchant_id = merchant_response.data["id"]
-            
-            # Compter les produits
-            products_response = supabase.from_("products")\
-                .select("id", count="exact")\
-                .eq("merchant_id", merchant_id)\
-                .execute()
-            
-            # Compter les campagnes
-            campaigns_response = supabase.from_("campaigns")\
-                .select("id", count="exact")\
-                .eq("merchant_id", merchant_id)\
-                .execute()
-            
-            # Compter les affiliations (affiliés)
-            affiliates_response = supabase.from_("affiliations")\
-                .select("id", count="exact")\
-                .eq("merchant_id", merchant_id)\
-                .execute()
-            
-            return {
-                "products": products_response.count or 0,
-                "campaigns": campaigns_response.count or 0,
-                "affiliates": affiliates_response.count or 0
-            }
-        
-        elif user_role == "influencer":
-            # Trouver l'influencer_id
-            influencer_response = supabase.from_("influencers")\
-                .select("id")\
-                .eq("user_id", user_id)\
-                .single()\
-                .execute()
-            
-            if not influencer_response.data:
-                return {"campaigns": 0, "links": 0}
-            
-            influencer_id = influencer_response.data["id"]
-            
-            # Compter les campagnes (affiliations)
-            campaigns_response = supabase.from_("affiliations")\
-                .select("id", count="exact")\
-                .eq("influencer_id", influencer_id)\
-                .execute()
-            
-            # Compter les liens de tracking
-            links_response = supabase.from_("trackable_links")\
-                .select("id", count="exact")\
-                .eq("influencer_id", influencer_id)\
-                .execute()
-            
-            return {
-                "campaigns": campaigns_response.count or 0,
-                "links": links_response.count or 0
-            }
-    
+        account = get_account(user_id, user_role)
+        if not account:
+            return _empty_usage(user_role)
+        return count_usage(user_role, account["id"])
     except Exception as e:
         print(f"❌ Error counting usage: {e}")
         # Retourner des valeurs par défaut en cas d'erreur
-        if user_role == "merchant":
-            return {"products": 0, "campaigns": 0, "affiliates": 0}
-        else:
-            return {"campaigns": 0, "links": 0}
-    
-    return {}
+        return _empty_usage(user_role)
+
+def get_entitlements(user_id: str, user_role: str) -> Optional[Dict[str, Any]]:
+    """
+    Instantané utilisé par les vérifications de limites : plan, limites, usage
+
+    Aucun COUNT en base sur le chemin courant : compte en cache local,
+    limites constantes par plan, usage lu dans les compteurs
+    """
+    try:
+        account = get_account(user_id, user_role)
+    except Exception as e:
+        print(f"❌ Error loading subscription account: {e}")
+        return None
+    if not account:
+        return None
+
+    if user_role == "merchant":
+        plan_code = account.get("subscription_plan") or "free"
+        limits = get_merchant_limits(plan_code)
+    else:
+        plan_code = account.get("subscription_plan") or "starter"
+        limits = get_influencer_limits(plan_code)
+
+    return {
+        "plan_code": plan_code,
+        "limits": limits,
+        "usage": get_usage(user_role, account["id"]),
+    }
 
 # ============================================
 # SUBSCRIPTION DATA FUNCTIONS
 # ============================================
 
+# Limites par plan (None = illimité)
+MERCHANT_PLAN_LIMITS = {
+    "free": {
+        "products": 10,
+        "campaigns": 5,
+        "affiliates": 50,
+        "commission_rate": 5.0
+    },
+    "starter": {
+        "products": 50,
+        "campaigns": 20,
+        "affiliates": 200,
+        "commission_rate": 4.0
+    },
+    "pro": {
+        "products": 200,
+        "campaigns": 100,
+        "affiliates": 1000,
+        "commission_rate": 3.0
+    },
+    "enterprise": {
+        "products": None,  # Illimité
+        "campaigns": None,
+        "affiliates": None,
+        "commission_rate": 2.0
+    }
+}
+
+INFLUENCER_PLAN_LIMITS = {
+    "starter": {
+        "campaigns": 5,
+        "links": 10,
+        "platform_fee_rate": 5.0
+    },
+    "pro": {
+        "campaigns": 50,
+        "links": 100,
+        "platform_fee_rate": 3.0
+    },
+    "elite": {
+        "campaigns": None,  # Illimité
+        "links": None,
+        "platform_fee_rate": 2.0
+    }
+}
+
 def get_merchant_limits(plan: str) -> Dict[str, Any]:
     """Retourne les limites du plan merchant"""
-    limits_map = {
-        "free": {
-            "products": 10,
-            "campaigns": 5,
-            "affiliates": 50,
-            "commission_rate": 5.0
-        },
-        "starter": {
-            "products": 50,
-            "campaigns": 20,
-            "affiliates": 200,
-            "commission_rate": 4.0
-        },
-        "pro": {
-            "products": 200,
-            "campaigns": 100,
-            "affiliates": 1000,
-            "commission_rate": 3.0
-        },
-        "enterprise": {
-            "products": None,  # Illimité
-            "campaigns": None,
-            "affiliates": None,
-            "commission_rate": 2.0
-        }
-    }
-    return limits_map.get(plan, limits_map["free"])
+    return dict(MERCHANT_PLAN_LIMITS.get(plan, MERCHANT_PLAN_LIMITS["free"]))
 
 def get_influencer_limits(plan: str) -> Dict[str, Any]:
     """Retourne les limites du plan influencer"""
-    limits_map = {
-        "starter": {
-            "campaigns": 5,
-            "links": 10,
-            "platform_fee_rate": 5.0
-        },
-        "pro": {
-            "campaigns": 50,
-            "links": 100,
-            "platform_fee_rate": 3.0
-        },
-        "elite": {
-            "campaigns": None,  # Illimité
-            "links": None,
-            "platform_fee_rate": 2.0
-        }
-    }
-    return limits_map.get(plan, limits_map["starter"])
+    return dict(INFLUENCER_PLAN_LIMITS.get(plan, INFLUENCER_PLAN_LIMITS["starter"]))
 
 def get_plan_features(plan_code: str, plan_type: str) -> list:
     """Retourne les features du plan"""
@@ -238,67 +297,50 @@ async def get_user_subscription_data(user_id: str, user_role: str) -> Optional[D
         return None
     
     try:
+        data = get_account(user_id, user_role)
+        if not data:
+            return None
+
+        # Utilisation actuelle (compteurs réconciliés avec la base)
+        usage = get_usage(user_role, data["id"])
+
         if user_role == "merchant":
-            response = supabase.from_("merchants") \
-                .select("*") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-                
-            if response.data:
-                data = response.data
+            return {
+                "plan_name": data.get("subscription_plan", "free").capitalize(),
+                "plan_code": data.get("subscription_plan", "free"),
+                "type": "merchant",
+                "status": data.get("subscription_status", "active"),
+                "monthly_fee": float(data.get("monthly_fee", 0)),
+                "commission_rate": float(data.get("commission_rate", 5)),
+                "total_sales": float(data.get("total_sales", 0)),
+                "total_commission_paid": float(data.get("total_commission_paid", 0)),
                 
-                # Obtenir l'utilisation réelle
-                usage = await get_real_usage_counts(user_id, user_role)
+                # Limites selon le plan
+                "limits": get_merchant_limits(data.get("subscription_plan", "free")),
                 
-                return {
-                    "plan_name": data.get("subscription_plan", "free").capitalize(),
-                    "plan_code": data.get("subscription_plan", "free"),
-                    "type": "merchant",
-                    "status": data.get("subscription_status", "active"),
-                    "monthly_fee": float(data.get("monthly_fee", 0)),
-                    "commission_rate": float(data.get("commission_rate", 5)),
-                    "total_sales": float(data.get("total_sales", 0)),
-                    "total_commission_paid": float(data.get("total_commission_paid", 0)),
-                    
-                    # Limites selon le plan
-                    "limits": get_merchant_limits(data.get("subscription_plan", "free")),
-                    
-                    # Utilisation actuelle (réelle)
-                    "usage": usage
-                }
+                # Utilisation actuelle (réelle)
+                "usage": usage
+            }
         
         elif user_role == "influencer":
-            response = supabase.from_("influencers") \
-                .select("*") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-                
-            if response.data:
-                data = response.data
+            return {
+                "plan_name": data.get("subscription_plan", "starter").capitalize(),
+                "plan_code": data.get("subscription_plan", "starter"),
+                "type": "influencer",
+                "status": data.get("subscription_status", "active"),
+                "monthly_fee": float(data.get("monthly_fee", 0)),
+                "platform_fee_rate": float(data.get("platform_fee_rate", 5)),
+                "total_earnings": float(data.get("total_earnings", 0)),
+                "balance": float(data.get("balance", 0)),
+                "audience_size": data.get("audience_size", 0),
+                "engagement_rate": float(data.get("engagement_rate", 0)),
                 
-                # Obtenir l'utilisation réelle
-                usage = await get_real_usage_counts(user_id, user_role)
+                # Limites selon le plan
+                "limits": get_influencer_limits(data.get("subscription_plan", "starter")),
                 
-                return {
-                    "plan_name": data.get("subscription_plan", "starter").capitalize(),
-                    "plan_code": data.get("subscription_plan", "starter"),
-                    "type": "influencer",
-                    "status": data.get("subscription_status", "active"),
-                    "monthly_fee": float(data.get("monthly_fee", 0)),
-                    "platform_fee_rate": float(data.get("platform_fee_rate", 5)),
-                    "total_earnings": float(data.get("total_earnings", 0)),
-                    "balance": float(data.get("balance", 0)),
-                    "audience_size": data.get("audience_size", 0),
-                    "engagement_rate": float(data.get("engagement_rate", 0)),
-                    
-                    # Limites selon le plan
-                    "limits": get_influencer_limits(data.get("subscription_plan", "starter")),
-                    
-                    # Utilisation actuelle (réelle)
-                    "usage": usage
-                }
+                # Utilisation actuelle (réelle)
+                "usage": usage
+            }
                 
     except Exception as e:
         print(f"❌ Error fetching subscription data: {e}")
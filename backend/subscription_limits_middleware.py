@@ -9,7 +9,8 @@ BUG 7 CORRIGÉ: Utilise factory functions au lieu de Depends dans méthodes stat
 from fastapi import HTTPException, Depends
 from typing import Optional, Callable
 from auth import get_current_user
-from subscription_helpers_simple import get_user_subscription_data
+from supabase_async import run_sync
+from subscription_helpers_simple import get_user_subscription_data, get_entitlements
 
 class SubscriptionLimits:
     """Middleware pour vérifier les limites d'abonnement"""
@@ -21,7 +22,9 @@ class SubscriptionLimits:
             if current_user.get("role") != "merchant":
                 raise HTTPException(status_code=403, detail="Only merchants can create products")
             
-            subscription_data = await get_user_subscription_data(
+            # Instantané plan / limites / compteurs : pas de COUNT en base
+            subscription_data = await run_sync(
+                get_entitlements,
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -49,7 +52,9 @@ class SubscriptionLimits:
     def check_campaign_limit() -> Callable:
         """Factory qui retourne une dépendance pour vérifier les campagnes (BUG 7 CORRIGÉ)"""
         async def checker(current_user: dict = Depends(get_current_user)):
-            subscription_data = await get_user_subscription_data(
+            # Instantané plan / limites / compteurs : pas de COUNT en base
+            subscription_data = await run_sync(
+                get_entitlements,
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -80,7 +85,9 @@ class SubscriptionLimits:
             if current_user.get("role") != "merchant":
                 raise HTTPException(status_code=403, detail="Only merchants can manage affiliates")
             
-            subscription_data = await get_user_subscription_data(
+            # Instantané plan / limites / compteurs : pas de COUNT en base
+            subscription_data = await run_sync(
+                get_entitlements,
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -111,7 +118,9 @@ class SubscriptionLimits:
             if current_user.get("role") != "influencer":
                 raise HTTPException(status_code=403, detail="Only influencers can create tracking links")
             
-            subscription_data = await get_user_subscription_data(
+            # Instantané plan / limites / compteurs : pas de COUNT en base
+            subscription_data = await run_sync(
+                get_entitlements,
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -0,0 +1,197 @@
+"""
+Client Supabase asynchrone pour les endpoints async
+
+Le client supabase-py de supabase_client.py est synchrone : appelé depuis un
+`async def`, chaque requête bloque la boucle d'événements du worker. Ce module
+fournit :
+
+- async_supabase : client PostgREST async (même API fluide table/select/eq,
+  mais `await ....execute()`) sur un pool HTTP/2 partagé, avec un timeout par
+  requête et une limite de requêtes simultanées
+- run_sync : exécute un appel synchrone existant (db_helpers...) dans un pool
+  de threads borné, pour migrer les endpoints progressivement
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+from postgrest import AsyncPostgrestClient
+
+from supabase_client import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+
+DB_POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", "100"))
+DB_POOL_MAX_KEEPALIVE = int(os.getenv("DB_POOL_MAX_KEEPALIVE", "20"))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "64"))
+DB_REQUEST_TIMEOUT = float(os.getenv("DB_REQUEST_TIMEOUT", "10"))
+DB_SYNC_OFFLOAD_WORKERS = int(os.getenv("DB_SYNC_OFFLOAD_WORKERS", "16"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class DatabaseTimeoutError(Exception):
+    """La requête a dépassé DB_REQUEST_TIMEOUT"""
+
+
+class _PooledQuery:
+    """
+    Enveloppe un builder PostgREST async : les méthodes de chaînage renvoient
+    une nouvelle enveloppe, execute() passe par le limiteur du client
+    """
+
+    __slots__ = ("_builder", "_client")
+
+    def __init__(self, builder, client: "AsyncSupabaseClient"):
+        self._builder = builder
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._builder, name)
+        # Propriétés qui renvoient un builder (ex: .not_)
+        if hasattr(attr, "execute"):
+            return _PooledQuery(attr, self._client)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                return _PooledQuery(result, self._client)
+            return result
+
+        return chained
+
+    async def execute(self):
+        return await self._client.run(self._builder.execute())
+
+
+class AsyncSupabaseClient:
+    """Client PostgREST async sur un pool de connexions partagé"""
+
+    def __init__(
+        self,
+        url: Optional[str],
+        key: Optional[str],
+        max_connections: int = DB_POOL_MAX_CONNECTIONS,
+        max_keepalive: int = DB_POOL_MAX_KEEPALIVE,
+        max_concurrency: int = DB_MAX_CONCURRENCY,
+        timeout: float = DB_REQUEST_TIMEOUT,
+    ):
+        self.url = (url or "").rstrip("/")
+        self.key = key or ""
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        self._http: Optional[httpx.AsyncClient] = None
+        self._postgrest: Optional[AsyncPostgrestClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._timeouts = 0
+
+    def _ensure_client(self) -> AsyncPostgrestClient:
+        # Créé à la première requête : le pool est lié à la boucle du worker
+        if self._postgrest is None:
+            headers = {
+                "apikey": self.key,
+                "Authorization": f"Bearer {self.key}",
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+            }
+            self._http = httpx.AsyncClient(
+                headers=headers,
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+                follow_redirects=True,
+            )
+            self._postgrest = AsyncPostgrestClient(
+                f"{self.url}/rest/v1", headers=headers, http_client=self._http
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._postgrest
+
+    def table(self, table_name: str) -> _PooledQuery:
+        return _PooledQuery(self._ensure_client().from_(table_name), self)
+
+    def from_(self, table_name: str) -> _PooledQuery:
+        return self.table(table_name)
+
+    def rpc(self, fn: str, params: Optional[Dict] = None, **kwargs) -> _PooledQuery:
+        return _PooledQuery(self._ensure_client().rpc(fn, params or {}, **kwargs), self)
+
+    async def run(self, awaitable):
+        """Exécute une requête sous la limite de concurrence et le timeout"""
+        self._ensure_client()
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                return await asyncio.wait_for(awaitable, timeout=self.timeout)
+            except asyncio.TimeoutError as e:
+                self._timeouts += 1
+                raise DatabaseTimeoutError(
+                    f"Requête Supabase > {self.timeout}s"
+                ) from e
+            finally:
+                self._in_flight -= 1
+
+    async def aclose(self):
+        """Ferme le pool HTTP (arrêt du serveur)"""
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._postgrest = None
+        self._semaphore = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "max_connections": self.max_connections,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "timeouts": self._timeouts,
+        }
+
+
+# ============================================
+# OFFLOAD DES APPELS SYNCHRONES
+# ============================================
+
+_sync_executor = ThreadPoolExecutor(
+    max_workers=DB_SYNC_OFFLOAD_WORKERS, thread_name_prefix="db-sync"
+)
+
+
+async def run_sync(func: Callable, *args, **kwargs):
+    """
+    Exécute un appel synchrone (client supabase-py, db_helpers...) hors de la
+    boucle d'événements, dans un pool de threads borné
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_sync_executor, functools.partial(func, *args, **kwargs))
+
+
+# Client par défaut (service_role)
+async_supabase = AsyncSupabaseClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+
+def get_async_supabase_client() -> AsyncSupabaseClient:
+    """Retourne le client async partagé (service_role)"""
+    return async_supabase
+
+
+async def close_async_supabase():
+    """Libère le pool HTTP (le pool de threads reste disponible)"""
+    await async_supabase.aclose()
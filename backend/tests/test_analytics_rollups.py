@@ -0,0 +1,72 @@
+"""
+Tests unitaires pour les rollups analytiques journaliers
+"""
+
+import pytest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import analytics_rollups
+
+
+def _response(data=None):
+    response = MagicMock()
+    response.data = data
+    return response
+
+
+@pytest.fixture
+def db():
+    mock = MagicMock()
+    for method in ("table", "select", "eq", "gte", "lte", "lt"):
+        getattr(mock, method).return_value = mock
+    with patch.object(analytics_rollups, "supabase", mock):
+        yield mock
+
+
+@pytest.mark.unit
+def test_daily_series_fills_missing_days_with_zeros(db):
+    db.execute.return_value = _response([
+        {"day": "2026-01-02", "conversions": 3, "revenue": "150.50"},
+        {"day": "2026-01-02", "conversions": 1, "revenue": 10},  # dimension_id=None : somme
+    ])
+
+    series = analytics_rollups.get_daily_series(
+        "merchant", None, date(2026, 1, 1), date(2026, 1, 3), fields=("conversions", "revenue")
+    )
+
+    assert series == [
+        {"day": date(2026, 1, 1), "conversions": 0.0, "revenue": 0.0},
+        {"day": date(2026, 1, 2), "conversions": 4.0, "revenue": 160.5},
+        {"day": date(2026, 1, 3), "conversions": 0.0, "revenue": 0.0},
+    ]
+    db.table.assert_called_once_with(analytics_rollups.FACTS_TABLE)
+
+
+@pytest.mark.unit
+def test_daily_series_falls_back_to_bounded_sales_scan(db):
+    db.execute.side_effect = [
+        Exception('{"code": "PGRST205", "message": "Could not find the table public.analytics_daily_facts"}'),
+        _response([
+            {"created_at": "2026-01-01T10:00:00", "amount": 100, "influencer_commission": 12, "status": "completed"},
+            {"created_at": "2026-01-01T11:00:00", "amount": 50, "influencer_commission": 5, "status": "refunded"},
+        ]),
+    ]
+
+    series = analytics_rollups.get_daily_series(
+        "influencer", "inf-1", date(2026, 1, 1), date(2026, 1, 2), fields=("conversions", "commissions")
+    )
+
+    assert series[0] == {"day": date(2026, 1, 1), "conversions": 1.0, "commissions": 12.0}
+    assert series[1]["conversions"] == 0.0
+    db.eq.assert_any_call("influencer_id", "inf-1")
+
+
+@pytest.mark.unit
+def test_daily_series_raises_errors_other_than_a_missing_table(db):
+    db.execute.side_effect = TimeoutError("canceling statement due to statement timeout")
+
+    with pytest.raises(TimeoutError):
+        analytics_rollups.get_daily_series("merchant", "m-1", date(2026, 1, 1), date(2026, 1, 2))
+
+    db.lt.assert_not_called()
@@ -0,0 +1,129 @@
+"""
+Tests unitaires pour la résolution du principal (auth.py / cache db_helpers)
+"""
+
+import asyncio
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+import auth
+import db_helpers
+
+
+USER = {"id": "u-1", "email": "a@b.c", "role": "merchant", "password_hash": "x", "token_version": 0}
+
+
+@pytest.fixture
+def version_lookups():
+    calls = []
+
+    def fake_execute():
+        calls.append("u-1")
+        return MagicMock(data=[{"token_version": USER["token_version"]}])
+
+    client = MagicMock()
+    client.table.return_value.select.return_value.eq.return_value.execute.side_effect = fake_execute
+    with patch.object(db_helpers, "supabase", client):
+        yield calls
+
+
+@pytest.fixture
+def lookups(version_lookups):
+    db_helpers.principal_cache.clear_local()
+    calls = []
+
+    def fake_get_user_by_id(user_id):
+        calls.append(user_id)
+        return dict(USER)
+
+    with patch.object(db_helpers, "get_user_by_id", side_effect=fake_get_user_by_id):
+        yield calls
+    db_helpers.principal_cache.clear_local()
+
+
+@pytest.mark.unit
+def test_principal_is_cached_and_sanitized(lookups):
+    payload = {"sub": "u-1", "ver": 0}
+
+    first = asyncio.run(auth.get_current_user(payload))
+    second = asyncio.run(auth.get_current_merchant(payload))
+
+    assert lookups == ["u-1"]
+    assert "password_hash" not in first
+    assert second == first
+
+
+@pytest.mark.unit
+def test_invalidation_forces_a_fresh_lookup(lookups):
+    payload = {"sub": "u-1"}
+    asyncio.run(auth.get_current_user(payload))
+
+    db_helpers.invalidate_principal("u-1")
+    asyncio.run(auth.get_current_user(payload))
+
+    assert lookups == ["u-1", "u-1"]
+
+
+@pytest.mark.unit
+def test_role_claims_answer_without_user_lookup(lookups, version_lookups):
+    payload = {"sub": "u-1", "email": "a@b.c", "role": "merchant"}
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(auth.get_current_admin(payload))
+    principal = asyncio.run(auth.require_role("merchant")(payload))
+
+    assert excinfo.value.status_code == 403
+    assert principal == {"id": "u-1", "email": "a@b.c", "role": "merchant"}
+    assert lookups == []
+    assert version_lookups == ["u-1"]
+
+
+@pytest.mark.unit
+def test_token_issued_before_role_change_is_revoked(lookups):
+    USER["token_version"] = 1700000000
+    try:
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(auth.get_current_user({"sub": "u-1", "ver": 0}))
+    finally:
+        USER["token_version"] = 0
+
+    assert excinfo.value.status_code == 401
+
+
+@pytest.mark.unit
+def test_role_claims_of_a_demoted_user_are_revoked(lookups):
+    payload = {"sub": "u-1", "email": "a@b.c", "role": "admin", "ver": 0}
+    USER["token_version"] = 1700000000
+    try:
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(auth.require_role("admin")(payload))
+        with pytest.raises(HTTPException) as admin_excinfo:
+            asyncio.run(auth.get_current_admin(payload))
+    finally:
+        USER["token_version"] = 0
+
+    assert excinfo.value.status_code == 401
+    assert admin_excinfo.value.status_code == 401
+    assert lookups == []
+
+
+@pytest.mark.unit
+def test_invalidation_drops_the_cached_token_version(lookups, version_lookups):
+    payload = {"sub": "u-1", "email": "a@b.c", "role": "merchant", "ver": 0}
+    asyncio.run(auth.require_role("merchant")(payload))
+
+    USER["token_version"] = 1700000000
+    db_helpers.invalidate_principal("u-1")
+    try:
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(auth.require_role("merchant")(payload))
+    finally:
+        USER["token_version"] = 0
+
+    assert excinfo.value.status_code == 401
+    assert version_lookups == ["u-1", "u-1"]
@@ -0,0 +1,245 @@
+"""
+Tests unitaires pour le service de paiement automatique (validation, paiements)
+"""
+
+import re
+from pathlib import Path
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+import auto_payment_service as payment_module
+from auto_payment_service import AutoPaymentService, VALIDATION_JOB_NAME
+
+
+PAYOUT_MIGRATION = (
+    Path(__file__).resolve().parents[2] / "database" / "migrations" / "add_payout_batch_functions.sql"
+)
+
+
+def _response(data):
+    response = MagicMock()
+    response.data = data
+    return response
+
+
+def _sale(i, influencer_id="inf-1"):
+    return {
+        "id": f"sale-{i:03d}",
+        "influencer_id": influencer_id,
+        "link_id": "link-1",
+        "influencer_commission": 10.0,
+        "created_at": f"2026-01-01T00:00:{i:02d}",
+    }
+
+
+@pytest.fixture
+def db():
+    mock = MagicMock()
+    for method in (
+        "table", "select", "eq", "lt", "gte", "or_", "order", "limit",
+        "in_", "update", "insert", "upsert",
+    ):
+        getattr(mock, method).return_value = mock
+    with patch.object(payment_module, "supabase", mock):
+        yield mock
+
+
+@pytest.fixture
+def service(db):
+    service = AutoPaymentService()
+    service.checkpoints = MagicMock()
+    service.checkpoints.load.return_value = None
+    return service
+
+
+# ============================================================================
+# TESTS: AutoPaymentService.validate_pending_sales
+# ============================================================================
+
+
+@pytest.mark.unit
+def test_validate_pending_sales_processes_chunks_through_rpc(service, db):
+    db.execute.side_effect = [
+        _response([_sale(1), _sale(2)]),
+        _response([_sale(3)]),
+    ]
+    db.rpc.return_value.execute.side_effect = [
+        _response({"validated": 2, "total_commission": 20.0, "influencers": 1}),
+        _response({"validated": 1, "total_commission": 10.0, "influencers": 1}),
+    ]
+
+    result = service.validate_pending_sales(chunk_size=2)
+
+    assert result["success"] is True
+    assert result["validated_sales"] == 3
+    assert result["total_commission"] == 30.0
+    assert result["chunks"] == 2
+    assert db.rpc.call_count == 2
+    assert db.rpc.call_args_list[0][0] == (
+        "validate_sales_batch",
+        {"p_sale_ids": ["sale-001", "sale-002"]},
+    )
+    service.checkpoints.save.assert_any_call(
+        VALIDATION_JOB_NAME, {"created_at": _sale(2)["created_at"], "id": "sale-002"}, 2
+    )
+    service.checkpoints.complete.assert_called_once_with(VALIDATION_JOB_NAME, 3)
+
+
+@pytest.mark.unit
+def test_validate_pending_sales_resumes_from_checkpoint(service, db):
+    service.checkpoints.load.return_value = {
+        "params": {"validation_date": "2026-01-01T00:00:00"},
+        "cursor": {"created_at": "2025-12-01T00:00:00", "id": "sale-050"},
+        "processed": 50,
+    }
+    db.execute.return_value = _response([])
+
+    result = service.validate_pending_sales()
+
+    assert result["validated_sales"] == 0
+    db.lt.assert_called_with("created_at", "2026-01-01T00:00:00")
+    assert 'id.gt.sale-050' in db.or_.call_args[0][0]
+    service.checkpoints.start.assert_not_called()
+    service.checkpoints.complete.assert_called_once_with(VALIDATION_JOB_NAME, 50)
+
+
+@pytest.mark.unit
+def test_validate_chunk_fallback_aggregates_deltas(service, db):
+    db.rpc.return_value.execute.side_effect = Exception(
+        "PGRST202: Could not find the function public.validate_sales_batch"
+    )
+    db.execute.side_effect = [
+        _response([_sale(1), _sale(2), _sale(3, influencer_id="inf-2")]),  # update sales
+        _response([]),  # insert commissions
+        _response([
+            {"id": "inf-1", "balance": 5, "total_earnings": 5},
+            {"id": "inf-2", "balance": 0, "total_earnings": 0},
+        ]),
+        _response([]), _response([]),  # update influencers
+        _response([{"id": "link-1", "total_commission": 1}]),
+        _response([]),  # update link
+    ]
+
+    result = service._validate_sales_chunk([_sale(1), _sale(2), _sale(3, "inf-2")])
+
+    assert result["validated"] == 3
+    assert result["total_commission"] == 30.0
+    assert result["influencer_ids"] == {"inf-1", "inf-2"}
+    updates = [c[0][0] for c in db.update.call_args_list]
+    assert {"balance": 25.0, "total_earnings": 25.0} == {
+        k: updates[1][k] for k in ("balance", "total_earnings")
+    }
+    assert updates[-1] == {"total_commission": 31.0}
+
+
+@pytest.mark.unit
+def test_validate_chunk_does_not_replay_after_rpc_error(service, db):
+    db.rpc.return_value.execute.side_effect = Exception("canceling statement due to statement timeout")
+
+    with pytest.raises(Exception, match="statement timeout"):
+        service._validate_sales_chunk([_sale(1)])
+
+    db.update.assert_not_called()
+
+
+# ============================================================================
+# TESTS: AutoPaymentService.process_automatic_payouts
+# ============================================================================
+
+
+def _influencer(i, method="paypal", details=None):
+    return {
+        "id": f"inf-{i}",
+        "user_id": f"user-{i}",
+        "username": f"influencer{i}",
+        "balance": 100.0,
+        "payment_method": method,
+        "payment_details": details if details is not None else {"email": f"i{i}@test.com"},
+    }
+
+
+@pytest.mark.unit
+def test_process_automatic_payouts_batches_and_skips_in_flight(service, db):
+    influencers = [_influencer(1), _influencer(2), _influencer(3), _influencer(4, details={})]
+    run_date = payment_module.datetime.now().strftime("%Y%m%d")
+    db.execute.side_effect = [
+        _response(influencers),  # éligibles
+        _response([{"influencer_id": "inf-2"}]),  # paiements en cours
+        _response([{"id": "user-1", "email": "a@test.com"}, {"id": "user-3", "email": "c@test.com"}]),
+        _response([]),  # notifications
+    ]
+    db.rpc.return_value.execute.side_effect = [
+        _response([  # create_payout_batch
+            {"id": "p-1", "influencer_id": "inf-1", "amount": 100.0, "idempotency_key": f"auto-payout-inf-1-{run_date}"},
+            {"id": "p-3", "influencer_id": "inf-3", "amount": 100.0, "idempotency_key": f"auto-payout-inf-3-{run_date}"},
+        ]),
+        _response(2),  # complete_payout_batch
+    ]
+
+    result = service.process_automatic_payouts(max_workers=4)
+
+    assert result["success"] is True
+    assert result["processed_count"] == 2
+    assert result["total_paid"] == 200.0
+    assert [f["reason"] for f in result["failed_payments"]] == ["payment_method_not_configured"]
+
+    (create_name, create_args), (complete_name, complete_args) = [c[0] for c in db.rpc.call_args_list]
+    assert create_name == "create_payout_batch"
+    assert {row["influencer_id"] for row in create_args["p_rows"]} == {"inf-1", "inf-3"}
+    assert all(row["idempotency_key"].startswith("auto-payout-") for row in create_args["p_rows"])
+    db.upsert.assert_not_called()
+
+    assert complete_name == "complete_payout_batch"
+    assert {r["payout_id"] for r in complete_args["p_results"]} == {"p-1", "p-3"}
+    assert all(r["status"] == "paid" for r in complete_args["p_results"])
+
+    # Une seule insertion groupée de notifications
+    assert len(db.insert.call_args[0][0]) == 2
+
+
+@pytest.mark.unit
+def test_gateway_failure_is_reported_per_payout(service, db):
+    with patch.object(service, "_process_paypal_payment", side_effect=RuntimeError("timeout")):
+        result = service._execute_payout(
+            {"payout_id": "p-1", "amount": 60.0, "idempotency_key": "k", "influencer": _influencer(1)}
+        )
+
+    assert result["status"] == "failed"
+    assert result["transaction_id"] is None
+
+
+@pytest.mark.unit
+def test_payout_conflict_target_matches_migration_index():
+    sql = " ".join(PAYOUT_MIGRATION.read_text().split())
+
+    index = re.search(
+        r"CREATE UNIQUE INDEX IF NOT EXISTS idx_payouts_idempotency_key ON payouts \((\w+)\)( WHERE [^;]+)?;", sql
+    )
+    column, predicate = index.group(1), (index.group(2) or "")
+    conflict = re.search(r"ON CONFLICT \((\w+)\)( WHERE .+?)? DO NOTHING", sql)
+
+    # Un index partiel n'est inféré que si la cible répète son prédicat
+    assert conflict.group(1) == column
+    assert (conflict.group(2) or "") == predicate
+    assert "FUNCTION create_payout_batch" in sql
+
+
+@pytest.mark.unit
+def test_complete_payouts_fallback_debits_paid_amount(service, db):
+    db.rpc.return_value.execute.side_effect = Exception("PGRST202: function complete_payout_batch not found")
+    db.execute.side_effect = [
+        _response([{"id": "p-1"}]),  # p-1 processing -> paid
+        _response([]),  # p-2 déjà traité
+        _response([{"id": "inf-1", "balance": 130.0}]),
+        _response([]),  # débit
+    ]
+
+    service._complete_payouts([
+        {"payout_id": "p-1", "status": "paid", "transaction_id": "t-1", "amount": 100.0, "influencer": _influencer(1)},
+        {"payout_id": "p-2", "status": "paid", "transaction_id": "t-2", "amount": 100.0, "influencer": _influencer(2)},
+    ])
+
+    debit = db.update.call_args_list[-1][0][0]
+    assert debit["balance"] == 30.0
+    db.in_.assert_called_with("id", ["inf-1"])
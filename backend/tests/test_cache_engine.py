@@ -0,0 +1,156 @@
+"""
+Tests unitaires pour le moteur de cache L1/L2 (TTL, éviction, single-flight)
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services import cache_engine as cache_engine_module
+from services.cache_engine import CacheEngine
+from services.cache_service import RedisCache
+from tests.test_cache_service import FakeRedis
+
+
+class DictTier:
+    """L2 factice en mémoire"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl, tags=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.mark.unit
+def test_per_entry_ttl_is_honoured():
+    engine = CacheEngine()
+    engine.set("api:short", "a", ttl=0.05)
+    engine.set("product:long", "b", ttl=3600)
+
+    time.sleep(0.06)
+
+    assert engine.get("api:short") is None
+    assert engine.get("product:long") == "b"
+    assert engine.get_stats()["namespaces"]["api"]["expirations"] == 1
+
+
+@pytest.mark.unit
+def test_l1_is_bounded_by_bytes_and_entries():
+    engine = CacheEngine(max_entries=3, max_bytes=50)
+    for i in range(5):
+        engine.set(f"k:{i}", "x" * 10, ttl=60)
+
+    stats = engine.get_stats()
+    assert stats["l1"]["entries"] <= 3
+    assert stats["l1"]["bytes"] <= 50
+    assert stats["namespaces"]["k"]["evictions"] == 2
+
+    engine.set("big:1", "x" * 100, ttl=60)
+    assert engine.get("big:1") is None
+
+
+@pytest.mark.unit
+def test_frequent_key_is_not_evicted_by_one_hit_wonder():
+    engine = CacheEngine(max_entries=1)
+    engine.set("hot:1", "v", ttl=60)
+    for _ in range(5):
+        engine.get("hot:1")
+
+    engine.set("cold:1", "v", ttl=60)
+
+    assert engine.get("hot:1") == "v"
+    assert engine.get_stats()["namespaces"]["cold"]["rejections"] == 1
+
+
+@pytest.mark.unit
+def test_l2_hit_is_promoted_to_l1():
+    l2 = DictTier()
+    CacheEngine(l2=l2).set("user:1", {"id": 1}, ttl=60)
+    engine = CacheEngine(l2=l2)
+
+    assert engine.get("user:1") == {"id": 1}
+    l2.data.clear()
+    assert engine.get("user:1") == {"id": 1}
+    assert engine.get_stats()["namespaces"]["user"]["l2_hits"] == 1
+
+
+@pytest.mark.unit
+def test_l1_hit_checks_tag_generations_bumped_elsewhere(monkeypatch):
+    l2 = RedisCache()
+    l2.redis = FakeRedis()
+    engine = CacheEngine(l2=l2)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {"page": len(loads)}
+
+    tags = ["products:m-1"]
+    assert engine.get_or_load("products:m-1:page:1", load, ttl=60, tags=tags) == {"page": 1}
+    assert engine.get_or_load("products:m-1:page:1", load, ttl=60, tags=tags) == {"page": 1}
+
+    # Invalidation par un autre worker : seul le compteur Redis change
+    l2.delete_by_tag("products:m-1")
+    monkeypatch.setattr(cache_engine_module, "CACHE_TAG_VERSION_TTL", 0)
+
+    assert engine.get_or_load("products:m-1:page:1", load, ttl=60, tags=tags) == {"page": 2}
+    assert len(loads) == 2
+
+
+@pytest.mark.unit
+def test_concurrent_misses_share_a_single_load():
+    engine = CacheEngine()
+    calls = []
+    start = threading.Barrier(8)
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    def worker(results):
+        start.wait()
+        results.append(engine.get_or_load("api:hot", loader, ttl=60))
+
+    results = []
+    threads = [threading.Thread(target=worker, args=(results,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_async_single_flight_and_stale_while_revalidate():
+    engine = CacheEngine()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    results = await asyncio.gather(
+        *(engine.get_or_load_async("report:1", loader, ttl=0.05, stale_ttl=10) for _ in range(5))
+    )
+    assert results == [1] * 5
+
+    await asyncio.sleep(0.06)
+    # Valeur périmée servie immédiatement, rafraîchie en arrière-plan
+    assert await engine.get_or_load_async("report:1", loader, ttl=0.05, stale_ttl=10) == 1
+    await asyncio.sleep(0.03)
+    assert engine.get("report:1") == 2
+    assert engine.get_stats()["namespaces"]["report"]["stale_hits"] == 1
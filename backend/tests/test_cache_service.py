@@ -0,0 +1,170 @@
+"""
+Tests unitaires pour RedisCache (générations de tags, opérations groupées)
+"""
+
+import fnmatch
+
+import pytest
+
+from services import cache_engine as cache_engine_module
+from services import cache_service
+from services.cache_engine import CacheEngine
+from services.cache_service import CacheInvalidator, CacheKeys, CacheTags, RedisCache, CACHE_PREFIX
+
+
+class FakeRedis:
+    """Sous-ensemble de redis-py en mémoire (valeurs bytes)"""
+
+    def __init__(self):
+        self.data = {}
+        self.sets = {}
+        self.round_trips = 0
+
+    def _bytes(self, value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        self.round_trips += 1
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = self._bytes(value)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = self._bytes(value)
+
+    def incr(self, key):
+        value = int(self.data.get(key, b"0")) + 1
+        self.data[key] = self._bytes(value)
+        return value
+
+    def delete(self, *keys):
+        return sum(1 for k in keys if self.data.pop(k, None) is not None or self.sets.pop(k, None))
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def scan(self, cursor, match=None, count=None):
+        keys = [k for k in list(self.data) + list(self.sets) if fnmatch.fnmatch(k, match)]
+        return 0, keys
+
+    def sscan_iter(self, key, count=None):
+        return iter(list(self.sets.get(key, ())))
+
+    def srem(self, key, *members):
+        members_set = self.sets.get(key, set())
+        removed = len(members_set & set(members))
+        members_set -= set(members)
+        if not members_set:
+            self.sets.pop(key, None)
+        return removed
+
+    def scard(self, key):
+        return len(self.sets.get(key, ()))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        self.redis.round_trips += 1
+        rounds = self.redis.round_trips
+        results = [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+        self.redis.round_trips = rounds
+        return results
+
+
+@pytest.fixture
+def cache():
+    instance = RedisCache()
+    instance.redis = FakeRedis()
+    return instance
+
+
+@pytest.mark.unit
+def test_tag_invalidation_is_a_single_counter_increment(cache):
+    cache.set("products:m-1:page:1", ["a"], tags=["products:m-1"])
+    cache.set("product:p-1", {"id": "p-1"}, tags=["products:m-1"])
+    assert cache.get("products:m-1:page:1", tags=["products:m-1"]) == ["a"]
+
+    assert cache.delete_by_tag("products:m-1") == 1
+
+    assert cache.get("products:m-1:page:1", tags=["products:m-1"]) is None
+    # Tags non fournis par l'appelant : générations lues depuis la valeur
+    assert cache.get("product:p-1") is None
+    assert cache.stats["stale_tag_misses"] == 2
+
+    cache.set("product:p-1", {"id": "p-1", "v": 2}, tags=["products:m-1"])
+    assert cache.get("product:p-1") == {"id": "p-1", "v": 2}
+
+
+@pytest.mark.unit
+def test_get_many_reads_values_and_tag_versions_in_one_round_trip(cache):
+    cache.set_many({"user:1": {"id": 1}, "user:2": {"id": 2}}, tags=["users"])
+    cache.redis.round_trips = 0
+
+    found = cache.get_many(["user:1", "user:2", "user:3"], tags=["users"])
+
+    assert found == {"user:1": {"id": 1}, "user:2": {"id": 2}}
+    assert cache.redis.round_trips == 1
+
+
+@pytest.mark.unit
+def test_untagged_values_keep_plain_json_format(cache):
+    cache.set("quotas:1", {"used": 3})
+
+    assert cache.redis.data[f"{CACHE_PREFIX}quotas:1"] == b'{"used": 3}'
+    assert cache.get("quotas:1") == {"used": 3}
+
+
+@pytest.mark.unit
+def test_prune_tag_sets_removes_expired_members(cache):
+    live = f"{CACHE_PREFIX}user:1"
+    cache.redis.data[live] = b"{}"
+    cache.redis.sets[f"{CACHE_PREFIX}tag:users"] = {live, f"{CACHE_PREFIX}user:gone"}
+    cache.redis.sets[f"{CACHE_PREFIX}tag:old"] = {f"{CACHE_PREFIX}old:gone"}
+
+    result = cache.prune_tag_sets()
+
+    assert result == {"visited": 2, "pruned_members": 2, "deleted_sets": 1}
+    assert cache.redis.sets == {f"{CACHE_PREFIX}tag:users": {live}}
+
+
+@pytest.mark.unit
+def test_invalidation_reaches_l1_of_another_engine_sharing_redis(monkeypatch):
+    # Deux workers : un moteur chacun, un seul Redis
+    shared = FakeRedis()
+    workers = []
+    for _ in range(2):
+        l2 = RedisCache()
+        l2.redis = shared
+        workers.append(CacheEngine(l2=l2))
+    local, other = workers
+    monkeypatch.setattr(cache_service, "cache_engine", local)
+    monkeypatch.setattr(cache_engine_module, "CACHE_TAG_VERSION_TTL", 0)
+
+    plan = {"plan": "free"}
+    subscription = dict(ttl=300, tags=[CacheTags.subscription("u-1")])
+    products = dict(ttl=300, tags=[CacheTags.merchant_products("m-1")])
+    for engine in workers:
+        engine.get_or_load(CacheKeys.subscription("u-1"), lambda: dict(plan), **subscription)
+        engine.get_or_load(CacheKeys.products_list("m-1"), lambda: ["a"], **products)
+
+    plan["plan"] = "pro"
+    CacheInvalidator.invalidate_subscription("u-1")
+    CacheInvalidator.invalidate_merchant("m-1")
+
+    assert other.get_or_load(CacheKeys.subscription("u-1"), lambda: dict(plan), **subscription) == {"plan": "pro"}
+    assert other.get_or_load(CacheKeys.products_list("m-1"), lambda: ["b"], **products) == ["b"]
+    assert local.get_or_load(CacheKeys.subscription("u-1"), lambda: dict(plan), **subscription) == {"plan": "pro"}
@@ -0,0 +1,81 @@
+"""
+Tests unitaires pour la file d'ingestion des clics
+"""
+
+import pytest
+
+from click_ingestion import ClickIngestionQueue
+
+
+def _click(i, link_id="link-1"):
+    return {"id": f"click-{i}", "link_id": link_id, "clicked_at": f"2026-01-01T00:00:{i:02d}"}
+
+
+class RecordingSink:
+    """Collecte les lots flushés (et peut échouer sur commande)"""
+
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    def __call__(self, batch):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("db down")
+        self.batches.append(list(batch))
+        return len(batch)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_submit_before_start_is_rejected():
+    queue = ClickIngestionQueue(flush_func=RecordingSink())
+
+    assert await queue.submit(_click(1)) is False
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_clicks_are_flushed_in_batches_and_drained_on_stop():
+    sink = RecordingSink()
+    queue = ClickIngestionQueue(flush_func=sink, batch_size=10, flush_interval_ms=50)
+    await queue.start()
+
+    for i in range(25):
+        assert await queue.submit(_click(i)) is True
+
+    await queue.stop()
+
+    flushed = [c["id"] for batch in sink.batches for c in batch]
+    assert len(flushed) == 25
+    assert all(len(batch) <= 10 for batch in sink.batches)
+    assert queue.get_stats()["flushed"] == 25
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_full_buffer_applies_backpressure():
+    queue = ClickIngestionQueue(flush_func=RecordingSink(), max_buffer=3, flush_interval_ms=10_000)
+    await queue.start()
+
+    results = [await queue.submit(_click(i)) for i in range(5)]
+    await queue.stop()
+
+    assert results.count(False) >= 1
+    assert queue.get_stats()["rejected"] >= 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried():
+    sink = RecordingSink(fail_times=1)
+    queue = ClickIngestionQueue(flush_func=sink, batch_size=5, flush_interval_ms=10)
+    await queue.start()
+
+    for i in range(3):
+        await queue.submit(_click(i))
+
+    await queue.stop()
+
+    assert sum(len(b) for b in sink.batches) == 3
+    assert queue.get_stats()["failed_batches"] == 1
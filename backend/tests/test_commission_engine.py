@@ -0,0 +1,192 @@
+"""
+Tests unitaires pour CommissionEngine (chunks keyset, verrou d'exécution)
+"""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from services.commission_engine import CommissionEngine, RunLock, compute_commissions
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def expire(self, key, ttl):
+        return key in self.data
+
+    def eval(self, script, numkeys, key, token):
+        if self.data.get(key) == token:
+            del self.data[key]
+            return 1
+        return 0
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.limit_value = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row[column] > value)
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, n):
+        self.limit_value = n
+        return self
+
+    def execute(self):
+        self.db.queries += 1
+        rows = sorted(
+            (r for r in self.db.conversions if all(f(r) for f in self.filters)),
+            key=lambda r: r["id"]
+        )
+        return SimpleNamespace(data=[dict(r) for r in rows[:self.limit_value]])
+
+
+class FakeRpc:
+    def __init__(self, db, ids):
+        self.db = db
+        self.ids = set(ids)
+
+    def execute(self):
+        self.db.rpc_calls += 1
+        processed = 0
+        for row in self.db.conversions:
+            if row["id"] in self.ids and not row["commission_paid"]:
+                row["commission_paid"] = True
+                self.db.commissions.append(row["id"])
+                processed += 1
+        return SimpleNamespace(data={"processed": processed})
+
+
+class FakeSupabase:
+    def __init__(self, count):
+        self.conversions = [
+            {"id": f"c{i:04d}", "order_amount": 100, "commission_rate": 10, "commission_paid": False}
+            for i in range(count)
+        ]
+        self.commissions = []
+        self.queries = 0
+        self.rpc_calls = 0
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, params["p_conversion_ids"])
+
+
+@pytest.mark.unit
+def test_run_processes_backlog_in_chunks():
+    db = FakeSupabase(25)
+    engine = CommissionEngine(db, redis_client=FakeRedis())
+
+    result = engine.run(chunk_size=10)
+
+    assert result["processed"] == 25
+    assert result["chunks"] == 3
+    assert result["complete"] is True
+    assert result["rows_per_sec"] > 0
+    assert db.rpc_calls == 3
+    assert sorted(db.commissions) == [f"c{i:04d}" for i in range(25)]
+
+
+@pytest.mark.unit
+def test_run_is_skipped_while_another_run_holds_the_lock():
+    redis_client = FakeRedis()
+    other = RunLock(redis_client)
+    assert other.acquire()
+
+    db = FakeSupabase(5)
+    result = CommissionEngine(db, redis_client=redis_client).run()
+
+    assert result == {"skipped": True, "reason": "already_running"}
+    assert db.queries == 0
+
+    other.release()
+    assert CommissionEngine(db, redis_client=redis_client).run()["processed"] == 5
+    # Verrou libéré en fin de run
+    assert redis_client.data == {}
+
+
+@pytest.mark.unit
+def test_compute_commissions_rounds_to_the_cent():
+    rows = compute_commissions(
+        [{"id": "c1", "influencer_id": "i1", "merchant_id": "m1", "order_amount": "19.99", "commission_rate": "12.5"}],
+        created_at="2026-01-01T00:00:00"
+    )
+
+    assert rows == [{
+        "conversion_id": "c1",
+        "influencer_id": "i1",
+        "merchant_id": "m1",
+        "amount": 2.5,
+        "status": "pending",
+        "created_at": "2026-01-01T00:00:00",
+    }]
+
+
+@pytest.mark.unit
+def test_created_commissions_are_pushed_to_their_influencers():
+    db = MagicMock()
+    db.rpc.return_value.execute.return_value = SimpleNamespace(data={
+        "processed": 2,
+        "commissions": [
+            {"id": "k-1", "conversion_id": "c1", "influencer_id": "inf-1", "amount": 10.0},
+            {"id": "k-2", "conversion_id": "c2", "influencer_id": "inf-9", "amount": 5.0},
+        ],
+    })
+    influencers = db.table.return_value.select.return_value.in_.return_value
+    influencers.execute.return_value = SimpleNamespace(data=[{"id": "inf-1", "user_id": "u-1"}])
+    engine = CommissionEngine(db, redis_client=FakeRedis())
+
+    with patch("services.commission_engine.publish_events") as publish:
+        processed = engine._process_chunk([{"id": "c1"}, {"id": "c2"}])
+
+    assert processed == 2
+    assert list(publish.call_args[0][0]) == [
+        ("u-1", "commission_created", {"commission_id": "k-1", "conversion_id": "c1", "amount": 10.0})
+    ]
+
+
+@pytest.mark.unit
+def test_chunk_falls_back_only_when_the_rpc_is_missing():
+    db = MagicMock()
+    db.rpc.return_value.execute.side_effect = TimeoutError("canceling statement due to statement timeout")
+    engine = CommissionEngine(db, redis_client=FakeRedis())
+
+    with patch.object(engine, "_process_chunk_fallback") as fallback:
+        with pytest.raises(TimeoutError):
+            engine._process_chunk([{"id": "c1"}])
+        fallback.assert_not_called()
+
+        db.rpc.return_value.execute.side_effect = Exception(
+            '{"code": "PGRST202", "message": "Could not find the function calculate_commissions_batch"}'
+        )
+        fallback.return_value = (1, [])
+        assert engine._process_chunk([{"id": "c1"}]) == 1
+        fallback.assert_called_once_with(["c1"])
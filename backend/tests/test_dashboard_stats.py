@@ -0,0 +1,169 @@
+"""
+Tests unitaires pour les statistiques du dashboard (agrégats journaliers)
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import dashboard_rollups
+import db_helpers
+
+
+def _response(data=None, count=None):
+    response = MagicMock()
+    response.data = data
+    response.count = count
+    return response
+
+
+def _day(days_ago):
+    return (datetime.now() - timedelta(days=days_ago)).date().isoformat()
+
+
+@pytest.fixture
+def db():
+    mock = MagicMock()
+    for method in ("table", "select", "eq", "gte", "single"):
+        getattr(mock, method).return_value = mock
+    with patch.object(db_helpers, "supabase", mock), patch.object(dashboard_rollups, "supabase", mock):
+        yield mock
+
+
+@pytest.mark.unit
+def test_sum_buckets_filters_window():
+    buckets = [
+        {"day": "2026-01-01", "sales_amount": 10},
+        {"day": "2026-01-15", "sales_amount": "5.5"},
+        {"day": "2026-02-01", "sales_amount": None},
+    ]
+    since = datetime(2026, 1, 10).date()
+    until = datetime(2026, 2, 1).date()
+
+    assert dashboard_rollups.sum_buckets(buckets, ("sales_amount",)) == {"sales_amount": 15.5}
+    assert dashboard_rollups.sum_buckets(buckets, ("sales_amount",), since=since, until=until) == {
+        "sales_amount": 5.5
+    }
+
+
+@pytest.mark.unit
+def test_merchant_stats_read_daily_buckets(db):
+    db.execute.side_effect = [
+        _response(count=3),  # produits
+        _response([{"day": _day(1), "sales_amount": 120}, {"day": _day(400), "sales_amount": 80}]),
+    ]
+
+    with patch.object(db_helpers, "get_merchant_by_user_id", return_value={"id": "m-1"}):
+        stats = db_helpers.get_dashboard_stats("merchant", "user-1")
+
+    assert stats["total_sales"] == 200.0
+    assert stats["products_count"] == 3
+    db.table.assert_any_call("dashboard_daily_stats")
+    db.eq.assert_any_call("scope_id", "m-1")
+
+
+@pytest.mark.unit
+def test_influencer_growth_from_buckets(db):
+    db.execute.side_effect = [
+        _response({"id": "user-1", "influencer_id": "inf-1"}),
+        _response([
+            {"day": _day(2), "conversions_count": 6, "conversions_completed": 4, "commission_amount": 30},
+            {"day": _day(45), "conversions_count": 3, "conversions_completed": 2, "commission_amount": 20},
+            {"day": _day(200), "conversions_count": 1, "conversions_completed": 1, "commission_amount": 50},
+        ]),
+        _response([{"amount": 40}]),  # payouts payés
+    ]
+
+    stats = db_helpers.get_dashboard_stats("influencer", "user-1")
+
+    assert stats["total_clicks"] == 10
+    assert stats["total_sales"] == 7
+    assert stats["total_earnings"] == 100.0
+    assert stats["balance"] == 60.0
+    assert stats["earnings_growth"] == 50.0
+    assert stats["clicks_growth"] == 100.0
+    assert stats["sales_growth"] == 100.0
+
+
+@pytest.mark.unit
+def test_admin_revenue_falls_back_to_sales_scan(db):
+    db.execute.side_effect = [
+        _response(count=10), _response(count=4), _response(count=5),
+        _response(count=7), _response(count=2),
+        Exception('relation "dashboard_daily_stats" does not exist'),
+        _response([{"amount": 12.5}, {"amount": 7.5}]),
+    ]
+
+    stats = db_helpers.get_dashboard_stats("admin", "admin-1")
+
+    assert stats["total_users"] == 10
+    assert stats["total_revenue"] == 20.0
+
+
+@pytest.mark.unit
+def test_platform_revenue_rollup_uses_rpc_and_keeps_top_n(db):
+    db.rpc.return_value.execute.return_value = _response({
+        "summary": {"platform_commission": 15, "sales_amount": 300, "sales_count": 3},
+        "by_merchant": [
+            {"merchant_id": "m-2", "platform_commission": 5, "sales_count": 1},
+            {"merchant_id": "m-1", "platform_commission": 10, "sales_count": 2},
+        ],
+    })
+
+    rollup = dashboard_rollups.get_platform_revenue_rollup(top=1)
+
+    assert db.rpc.call_args[0] == (
+        "platform_revenue_rollup", {"p_start_day": None, "p_end_day": None, "p_top": 1}
+    )
+    assert rollup["summary"]["sales_amount"] == 300.0
+    assert [row["merchant_id"] for row in rollup["by_merchant"]] == ["m-1"]
+
+
+@pytest.mark.unit
+def test_platform_revenue_rollup_falls_back_to_buckets(db):
+    db.rpc.return_value.execute.side_effect = Exception("function platform_revenue_rollup does not exist")
+    db.lte.return_value = db
+    db.execute.side_effect = [
+        _response([{"scope_id": "*", "day": "2026-01-02", "platform_commission": 9, "sales_count": 3}]),
+        _response([
+            {"scope_id": "m-1", "day": "2026-01-01", "platform_commission": 2, "sales_count": 1},
+            {"scope_id": "m-2", "day": "2026-01-01", "platform_commission": 3, "sales_count": 1},
+            {"scope_id": "m-1", "day": "2026-01-02", "platform_commission": 4, "sales_count": 1},
+        ]),
+    ]
+
+    rollup = dashboard_rollups.get_platform_revenue_rollup(
+        datetime(2026, 1, 1).date(), datetime(2026, 1, 31).date()
+    )
+
+    db.lte.assert_any_call("day", "2026-01-31")
+    assert rollup["summary"]["platform_commission"] == 9.0
+    assert [(r["merchant_id"], r["platform_commission"]) for r in rollup["by_merchant"]] == [
+        ("m-1", 6.0), ("m-2", 3.0)
+    ]
+
+
+@pytest.mark.unit
+def test_platform_revenue_rollup_falls_back_to_sales_without_buckets(db):
+    db.rpc.return_value.execute.side_effect = Exception("function platform_revenue_rollup does not exist")
+    db.lte.return_value = db
+    db.lt.return_value = db
+    db.execute.side_effect = [
+        Exception('relation "dashboard_daily_stats" does not exist'),
+        _response([
+            {"merchant_id": "m-1", "amount": 100, "platform_commission": 5, "merchant_revenue": 80},
+            {"merchant_id": "m-2", "amount": 200, "platform_commission": 10, "merchant_revenue": 160},
+            {"merchant_id": "m-1", "amount": 50, "platform_commission": "2.5", "merchant_revenue": None},
+        ]),
+    ]
+
+    rollup = dashboard_rollups.get_platform_revenue_rollup(
+        datetime(2026, 1, 1).date(), datetime(2026, 1, 31).date()
+    )
+
+    db.lt.assert_called_once_with("created_at", "2026-02-01")
+    assert rollup["summary"]["sales_amount"] == 350.0
+    assert rollup["summary"]["sales_count"] == 3
+    assert [(r["merchant_id"], r["platform_commission"]) for r in rollup["by_merchant"]] == [
+        ("m-2", 10.0), ("m-1", 7.5)
+    ]
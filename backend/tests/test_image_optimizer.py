@@ -160,6 +160,47 @@ class TestImageOptimizer:
         assert thumbnail['dimensions']['width'] == 150
         assert thumbnail['dimensions']['height'] == 150
 
+    def test_thumbnails_report_stage_timings(self, optimizer, sample_image_data):
+        """Test timings par étape dans le résultat"""
+        result = optimizer.generate_thumbnails(
+            image_data=sample_image_data,
+            filename='test.jpg',
+            sizes={'wide': (400, 100), 'small': (120, 120)}
+        )
+
+        assert set(result['timings']) >= {'decode_ms', 'resize_ms', 'stats_ms', 'encode_ms', 'total_ms'}
+        assert result['thumbnails']['wide']['webp']['dimensions'] == {'width': 400, 'height': 100}
+        assert result['thumbnails']['small']['jpeg']['dimensions'] == {'width': 120, 'height': 120}
+
+    def test_pyramid_never_upscales_a_level(self, optimizer):
+        """Test niveaux ordonnés par échelle par axe (bandeau large après un carré plus grand)"""
+        image = Image.new('RGB', (2000, 1000), color=(10, 200, 30))
+        resized = []
+        original_resize = Image.Image.resize
+
+        def resize(self, size, *args, **kwargs):
+            resized.append((self.size, tuple(size)))
+            return original_resize(self, size, *args, **kwargs)
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(Image.Image, 'resize', resize)
+            levels = optimizer._build_pyramid(image, {'square': (300, 300), 'banner': (800, 100)})
+
+        assert levels['banner'].size == (800, 100)
+        assert levels['square'].size == (300, 300)
+        assert all(new[0] <= old[0] and new[1] <= old[1] for old, new in resized)
+
+    def test_decode_only_needed_resolution(self, optimizer):
+        """Test décodage JPEG réduit (draft) selon la plus grande sortie"""
+        img = Image.new('RGB', (4000, 3000), color=(10, 200, 30))
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG')
+
+        decoded = optimizer._decode(buffer.getvalue(), target_sizes=[(320, 320), (150, 150)])
+
+        assert decoded.width < 4000
+        assert min(decoded.size) >= 320
+
     def test_extract_metadata(self, optimizer, sample_image_data):
         """Test extraction de métadonnées"""
         img = Image.open(io.BytesIO(sample_image_data))
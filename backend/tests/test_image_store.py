@@ -0,0 +1,79 @@
+"""
+Tests unitaires pour le stockage d'images adressé par contenu
+"""
+
+import pytest
+
+from services.image_store import ContentAddressedImageStore, source_hash, variant_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentAddressedImageStore(str(tmp_path), max_bytes=100)
+
+
+@pytest.mark.unit
+def test_key_depends_on_source_and_params():
+    digest = source_hash(b"image")
+
+    assert variant_key(digest, format="webp", quality=80) == variant_key(digest, quality=80, format="webp")
+    assert variant_key(digest, format="webp", quality=80) != variant_key(digest, format="webp", quality=81)
+    assert variant_key(digest, format="webp") != variant_key(source_hash(b"other"), format="webp")
+
+
+@pytest.mark.unit
+def test_put_writes_sharded_file_and_index_survives_restart(store, tmp_path):
+    key = variant_key(source_hash(b"image"), format="webp")
+    stored = store.put(key, b"x" * 10, "webp")
+
+    assert stored.path == tmp_path / "cas" / key[:2] / key[2:4] / f"{key}.webp"
+    assert stored.path.read_bytes() == b"x" * 10
+
+    reopened = ContentAddressedImageStore(str(tmp_path), max_bytes=100)
+    found = reopened.get(key)
+    assert found.mime_type == "image/webp"
+    assert found.etag == key
+    assert reopened.total_bytes == 10
+
+
+@pytest.mark.unit
+def test_lru_eviction_keeps_recently_served_objects(store):
+    keys = [variant_key("src", n=n) for n in range(3)]
+    for key in keys:
+        store.put(key, b"x" * 40, "jpeg")
+
+    # 120 octets > plafond de 100 : le plus ancien est évincé
+    assert store.get(keys[0]) is None
+    assert store.get(keys[1]) is not None
+
+    store.put(variant_key("src", n=3), b"x" * 40, "jpeg")
+
+    assert store.get(keys[2]) is None
+    assert store.get(keys[1]) is not None
+    assert store.get_stats()["evictions"] == 2
+
+
+@pytest.mark.unit
+def test_json_results_round_trip(store):
+    key = variant_key("src", op="upload")
+    store.put_json(key, {"success": True, "optimized": {}})
+
+    assert store.get_json(key) == {"success": True, "optimized": {}}
+
+
+@pytest.mark.unit
+def test_get_falls_back_to_disk_and_drops_vanished_files(store, tmp_path):
+    # Deux workers sur le même répertoire, chacun avec son index
+    other = ContentAddressedImageStore(str(tmp_path), max_bytes=100)
+    key = variant_key("src", format="png")
+    other.put(key, b"x" * 10, "png")
+
+    found = store.get(key)
+    assert found is not None and found.mime_type == "image/png"
+    assert store.total_bytes == 10
+
+    other.discard(key)
+
+    assert store.get(key) is None
+    assert store.total_bytes == 0
+    assert store.get_stats()["misses"] == 1
@@ -0,0 +1,75 @@
+"""
+Tests unitaires pour les classements en ensembles triés (leaderboard_engine)
+"""
+
+import asyncio
+import random
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+import services.gamification_service as gamification_module
+from services.gamification_service import GamificationService, UserType
+from services.leaderboard_engine import LeaderboardEngine, ScoreSkipList, period_bucket
+
+
+@pytest.fixture
+def engine():
+    instance = LeaderboardEngine(use_redis=False)
+    with patch.object(gamification_module, "leaderboard_engine", instance):
+        yield instance
+
+
+@pytest.mark.unit
+def test_skip_list_matches_sorted_order():
+    board = ScoreSkipList()
+    reference = {}
+    rng = random.Random(7)
+    for _ in range(500):
+        member = f"m-{rng.randint(0, 60)}"
+        amount = rng.randint(-5, 20)
+        reference[member] = reference.get(member, 0) + amount
+        board.incr(member, amount)
+
+    expected = sorted(reference.items(), key=lambda item: (-item[1], item[0]))
+
+    assert board.range(0, len(expected) - 1) == [(m, float(s)) for m, s in expected]
+    assert [board.rank(m) for m, _ in expected] == list(range(len(expected)))
+
+
+@pytest.mark.unit
+def test_rank_and_points_to_next(engine):
+    for member, points in (("a", 50), ("b", 120), ("c", 80)):
+        engine.incr("merchant", member, points)
+
+    assert [entry["member_id"] for entry in engine.top("merchant", "points", "month", 2)] == ["b", "c"]
+    assert engine.rank("merchant", "a") == {
+        "rank": 3, "score": 50, "total": 3, "percentile": 33.3, "points_to_next_rank": 30,
+    }
+    assert engine.scores("merchant", ["c", "zz"]) == {"c": 80, "zz": 0}
+
+
+@pytest.mark.unit
+def test_periods_roll_over_by_bucket(engine):
+    october, november = datetime(2026, 10, 20), datetime(2026, 11, 3)
+    engine.incr("influencer", "i-1", 40, now=october)
+    engine.incr("influencer", "i-1", 10, now=november)
+
+    assert period_bucket("month", october) == "2026-10"
+    assert engine.rank("influencer", "i-1", period="month", now=november)["score"] == 10
+    assert engine.rank("influencer", "i-1", period="all", now=november)["score"] == 50
+
+
+@pytest.mark.unit
+def test_award_points_updates_rank(engine):
+    service = GamificationService()
+
+    asyncio.run(service.award_points("r-1", UserType.SALES_REP, "deal_closed"))
+    asyncio.run(service.award_points("r-2", UserType.SALES_REP, "target_achieved"))
+    rank = asyncio.run(service.get_user_rank("r-1", UserType.SALES_REP))
+    top = asyncio.run(service.get_leaderboard(UserType.SALES_REP, limit=1))
+
+    assert rank["rank"] == 2
+    assert rank["points_to_next_rank"] == 900
+    assert top[0]["user_id"] == "r-2"
@@ -0,0 +1,77 @@
+"""
+Tests unitaires pour les histogrammes à quantiles en flux
+"""
+
+import random
+
+import pytest
+
+from services.metrics_sketch import QuantileSketch
+from services.monitoring_observability import MetricsCollector
+
+
+@pytest.mark.unit
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(42)
+    values = sorted(rng.lognormvariate(3, 1.2) for _ in range(20000))
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.record(value)
+
+    for q in (0.5, 0.95, 0.99, 0.999):
+        exact = values[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.02)
+    assert sketch.summary()["max"] == values[-1]
+
+
+@pytest.mark.unit
+def test_sketches_merge_bucket_by_bucket():
+    workers = [QuantileSketch(), QuantileSketch()]
+    for i in range(100):
+        workers[i % 2].record(float(i + 1))
+
+    merged = QuantileSketch()
+    for sketch in workers:
+        merged.merge(sketch)
+
+    assert merged.count == 100
+    assert merged.sum == pytest.approx(5050)
+    assert merged.quantile(0.5) == pytest.approx(50, rel=0.02)
+    assert merged.summary()["max"] == 100
+
+
+@pytest.mark.unit
+def test_collector_exports_labelled_prometheus_summaries():
+    collector = MetricsCollector()
+    for ms in (10, 20, 30):
+        collector.timing("http.request.duration_ms", ms, tags={"route": "/api/products/{id}", "status": 200})
+    collector.increment("http.requests.total")
+
+    text = collector.export_prometheus()
+
+    assert "# TYPE http_requests_total counter\nhttp_requests_total 1\n" in text
+    assert 'http_request_duration_ms{route="/api/products/{id}",status="200",quantile="0.99"}' in text
+    assert 'http_request_duration_ms_count{route="/api/products/{id}",status="200"} 3' in text
+    timing = collector.get_metrics()["timings"]["http.request.duration_ms{route=/api/products/{id},status=200}"]
+    assert timing["count"] == 3
+    assert timing["p50"] == pytest.approx(20, rel=0.02)
+
+
+@pytest.mark.unit
+def test_prometheus_type_line_written_once_per_metric():
+    collector = MetricsCollector()
+    collector.increment("http.requests.total", tags={"status": "200"})
+    collector.timing("http.request.duration_ms", 5, tags={"route": "/a"})
+    collector.increment("http.requests.total", tags={"status": "500"})
+    collector.timing("http.request.duration_ms", 7, tags={"route": "/b"})
+
+    text = collector.export_prometheus()
+
+    assert text.count("# TYPE http_requests_total counter") == 1
+    assert text.count("# TYPE http_request_duration_ms summary") == 1
+    lines = text.splitlines()
+    start = lines.index("# TYPE http_requests_total counter")
+    assert lines[start + 1:start + 3] == [
+        'http_requests_total{status="200"} 1',
+        'http_requests_total{status="500"} 1',
+    ]
@@ -0,0 +1,120 @@
+"""
+Tests unitaires pour le rate limiter GCRA (réserve locale, règles par préfixe)
+"""
+
+import os
+
+import pytest
+import redis
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Le package middleware charge auth.py, qui exige un secret JWT
+os.environ.setdefault("JWT_SECRET", "test-secret-" + "x" * 32)
+
+from middleware import rate_limiting
+from middleware.rate_limiting import RateLimiter, get_endpoint_limits
+
+
+class FakeScript:
+    """Script Lua factice : rejoue les réponses prévues et compte les appels"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    async def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+class FakeAsyncRedis:
+    def __init__(self, replies):
+        self.script = FakeScript(replies)
+        self.deleted = []
+
+    def register_script(self, source):
+        return self.script
+
+    async def delete(self, key):
+        self.deleted.append(key)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_lease_serves_following_requests_locally():
+    fake = FakeAsyncRedis([[1, 5, 200, 0], [1, 1, 194, 0]])
+    limiter = RateLimiter(redis=fake, local_lease_max=10)
+
+    results = [await limiter.check_rate_limit("user:1", "/api/products", 300, 60) for _ in range(6)]
+
+    assert [r[0] for r in results] == [True] * 6
+    assert [r[1] for r in results[:5]] == [204, 203, 202, 201, 200]
+    assert len(fake.script.calls) == 2
+    keys, args = fake.script.calls[0]
+    assert keys == ["ratelimit:/api/products:user:1", "ratelimit:whitelist:user:1"]
+    assert args == [200000.0, 60000000, 11]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_strict_limits_always_go_to_redis_and_report_retry_after():
+    fake = FakeAsyncRedis([[1, 1, 0, 0], [0, 0, 0, 11_500_000]])
+    limiter = RateLimiter(redis=fake)
+
+    assert await limiter.check_rate_limit("ip:1.2.3.4", "/api/auth/login", 5, 60) == (True, 0, 0)
+    assert await limiter.check_rate_limit("ip:1.2.3.4", "/api/auth/login", 5, 60) == (False, 0, 12)
+    assert fake.script.calls[0][1][2] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_whitelist_and_fail_open():
+    fake = FakeAsyncRedis([[1, -1, -1, 0], redis.ConnectionError("down")])
+    limiter = RateLimiter(redis=fake)
+
+    assert await limiter.check_rate_limit("user:1", "/x", 50, 60, client_ip="10.0.0.1") == (True, 50, 0)
+    assert fake.script.calls[0][0][1] == "ratelimit:whitelist:10.0.0.1"
+    assert await limiter.check_rate_limit("user:1", "/x", 50, 60) == (True, 50, 0)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_reset_drops_local_lease():
+    fake = FakeAsyncRedis([[1, 3, 90, 0], [1, 1, 97, 0]])
+    limiter = RateLimiter(redis=fake)
+
+    await limiter.check_rate_limit("user:1", "/api/orders", 100, 60)
+    await limiter.reset_limit("user:1", "/api/orders")
+    await limiter.check_rate_limit("user:1", "/api/orders", 100, 60)
+
+    assert fake.deleted == ["ratelimit:/api/orders:user:1"]
+    assert len(fake.script.calls) == 2
+
+
+@pytest.mark.unit
+def test_endpoint_limits_use_longest_prefix():
+    assert get_endpoint_limits("/api/products/p-42")["limit"] == 300
+    assert get_endpoint_limits("/api/products/upload-image")["limit"] == 20
+    assert get_endpoint_limits("/api/productsx") == {"limit": 100, "window": 60, "prefix": None}
+    assert get_endpoint_limits("/api/auth/login/")["prefix"] == "/api/auth/login"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_middleware_handles_requests_without_client(monkeypatch):
+    fake = FakeAsyncRedis([[1, 5, 90, 0]])
+    monkeypatch.setattr(rate_limiting, "rate_limiter", RateLimiter(redis=fake))
+    request = Request({"type": "http", "method": "GET", "path": "/api/orders", "headers": [], "client": None})
+
+    async def call_next(request):
+        return Response("ok")
+
+    response = await rate_limiting.rate_limit_middleware(request, call_next)
+
+    assert response.status_code == 200
+    keys, _ = fake.script.calls[0]
+    assert keys == ["ratelimit:/api/orders:ip:unknown", "ratelimit:whitelist:unknown"]
@@ -0,0 +1,106 @@
+"""
+Tests unitaires pour la diffusion temps réel (realtime_events / realtime_hub)
+"""
+
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+import realtime_events
+from realtime_events import EventTypes, decode_envelope, encode_envelope, encode_frame, publish_events
+from realtime_hub import ClientConnection, ConnectionHub
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.frames = []
+        self.closed = False
+
+    async def send_str(self, frame: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(frame)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.unit
+def test_slow_client_does_not_delay_others():
+    async def scenario():
+        hub = ConnectionHub()
+        fast, slow = FakeWebSocket(), FakeWebSocket(delay=60)
+        hub.register(fast, "u-1")
+        hub.register(slow, "u-2")
+
+        for i in range(5):
+            hub.deliver("*", encode_frame(EventTypes.SALE_CREATED, {"i": i}))
+        await asyncio.sleep(0.01)
+
+        assert [json.loads(frame)["data"]["i"] for frame in fast.frames] == [0, 1, 2, 3, 4]
+        assert slow.frames == []
+        assert hub.get_stats()["connections"] == 2
+        await hub.close_all()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.unit
+def test_full_queue_drops_oldest_and_coalesces_state_events():
+    async def scenario():
+        connection = ClientConnection(FakeWebSocket(), "u-1", max_queue=3)
+
+        assert connection.enqueue("a")
+        assert connection.enqueue("dash-1", coalesce_key="dashboard_update")
+        assert connection.enqueue("b")
+        assert connection.enqueue("dash-2", coalesce_key="dashboard_update")
+        assert not connection.enqueue("c")
+
+        connection.start()
+        await asyncio.sleep(0.01)
+
+        assert connection.ws.frames == ["dash-2", "b", "c"]
+        assert connection.dropped == 1
+        await connection.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.unit
+def test_envelope_round_trip_targets_user_only():
+    async def scenario():
+        hub = ConnectionHub()
+        mine, other = FakeWebSocket(), FakeWebSocket()
+        hub.register(mine, "u-1")
+        hub.register(other, "u-2")
+
+        delivered = hub.deliver_envelope(encode_envelope("u-1", EventTypes.DASHBOARD_UPDATE, {"sales": 3}))
+        await asyncio.sleep(0.01)
+
+        assert delivered == 1
+        assert json.loads(mine.frames[0])["data"] == {"sales": 3}
+        assert other.frames == []
+        await hub.close_all()
+
+    asyncio.run(scenario())
+    assert decode_envelope(encode_envelope("*", EventTypes.SALE_CREATED, {}))[:2] == ("*", None)
+
+
+@pytest.mark.unit
+def test_publish_events_uses_one_pipeline():
+    client = MagicMock()
+    pipe = client.pipeline.return_value
+
+    published = publish_events(
+        [("u-1", EventTypes.PAYMENT_STATUS_CHANGED, {"status": "paid"}), (None, EventTypes.SALE_CREATED, {})],
+        client=client,
+    )
+
+    assert published == 2
+    targets = [call.args[1].split("\t", 1)[0] for call in pipe.publish.call_args_list]
+    assert targets == ["u-1", "*"]
+    assert {call.args[0] for call in pipe.publish.call_args_list} == {realtime_events.REALTIME_CHANNEL}
+    pipe.execute.assert_called_once()
@@ -0,0 +1,91 @@
+"""
+Tests unitaires pour l'export de rapports en flux
+"""
+
+import csv
+import io
+import json
+from unittest.mock import MagicMock
+
+import openpyxl
+import pytest
+
+import services.report_generator as report_module
+from services.report_generator import ReportFormat, ReportGenerator, paged_rows
+
+
+def _rows(n):
+    for i in range(n):
+        yield {"id": f"s-{i:05d}", "created_at": f"2026-01-01T00:00:{i % 60:02d}", "amount": i * 1.5}
+
+
+@pytest.fixture
+def generator():
+    return ReportGenerator()
+
+
+@pytest.mark.unit
+def test_csv_is_written_in_bounded_chunks(generator, monkeypatch):
+    monkeypatch.setattr(report_module, "EXPORT_CHUNK_BYTES", 1024)
+
+    chunks = list(generator.stream_export(ReportFormat.CSV, _rows(500)))
+
+    assert len(chunks) > 10
+    assert all(len(chunk) < 2048 for chunk in chunks)
+    parsed = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert len(parsed) == 500
+    assert parsed[499] == {"id": "s-00499", "created_at": "2026-01-01T00:00:19", "amount": "748.5"}
+
+
+@pytest.mark.unit
+def test_jsonl_consumes_iterator_lazily(generator):
+    consumed = []
+
+    def rows():
+        for row in _rows(3):
+            consumed.append(row["id"])
+            yield row
+
+    stream = generator.stream_export(ReportFormat.JSONL, rows())
+    assert consumed == []
+
+    lines = b"".join(stream).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["s-00000", "s-00001", "s-00002"]
+
+
+@pytest.mark.unit
+def test_excel_write_only_export(generator):
+    data = b"".join(generator.stream_export(ReportFormat.EXCEL, _rows(300), title="sales"))
+
+    sheet = openpyxl.load_workbook(io.BytesIO(data), read_only=True)["sales"]
+    values = list(sheet.values)
+    assert values[0] == ("id", "created_at", "amount")
+    assert len(values) == 301
+    assert values[-1][0] == "s-00299"
+
+
+@pytest.mark.unit
+def test_paged_rows_uses_keyset_cursor():
+    client = MagicMock()
+    query = client.table.return_value.select.return_value
+    for method in ("eq", "gte", "lt", "or_", "order", "limit"):
+        getattr(query, method).return_value = query
+    query.execute.side_effect = [
+        MagicMock(data=[{"id": "a", "created_at": "t1"}, {"id": "b", "created_at": "t2"}]),
+        MagicMock(data=[{"id": "c", "created_at": "t2"}]),
+    ]
+
+    rows = list(paged_rows(client, "sales", filters={"merchant_id": "m-1"}, since="2026-01-01", page_size=2))
+
+    assert [r["id"] for r in rows] == ["a", "b", "c"]
+    query.eq.assert_any_call("merchant_id", "m-1")
+    query.or_.assert_called_once_with('created_at.gt."t2",and(created_at.eq."t2",id.gt.b)')
+    assert query.execute.call_count == 2
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("dataset", sorted(report_module.EXPORT_DATASETS))
+def test_every_export_dataset_is_scoped_for_merchants_and_influencers(dataset):
+    scopes = report_module.EXPORT_DATASETS[dataset]["scopes"]
+
+    assert scopes == {"merchant": "merchant_id", "influencer": "influencer_id"}
@@ -0,0 +1,172 @@
+"""
+Tests unitaires pour les rapports hebdomadaires (chunks, reprise sur checkpoint)
+"""
+
+import importlib.util
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import ModuleType
+from unittest.mock import MagicMock, patch
+
+import pytest
+from celery import Celery
+
+import batch_checkpoints
+
+REPORT_TASKS = Path(__file__).resolve().parent.parent / "celery_tasks" / "report_tasks.py"
+PERIOD = {"start": "01/01/2025", "end": "08/01/2025"}
+
+
+@pytest.fixture(scope="module")
+def report_tasks():
+    # celery_tasks.py masque le dossier celery_tasks/ : module chargé par son chemin,
+    # connexion psycopg2 et tâche d'envoi d'email remplacées par des mocks
+    database = ModuleType("database")
+    database.get_db_connection = MagicMock()
+    notification_tasks = ModuleType("celery_tasks.notification_tasks")
+    notification_tasks.send_email_task = MagicMock()
+
+    with patch.dict(sys.modules, {
+        "database": database,
+        "celery_tasks": ModuleType("celery_tasks"),
+        "celery_tasks.notification_tasks": notification_tasks,
+    }):
+        spec = importlib.util.spec_from_file_location("celery_tasks.report_tasks", REPORT_TASKS)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+    # Application dédiée : enregistre les shared_task du module chargé
+    app = Celery("report-tasks-tests", set_as_current=True)
+    app.finalize()
+    return module
+
+
+def _row(user_id, platform, current=1000, week_ago=900, engagement=4.0, week_ago_engagement=3.5):
+    return (user_id, f"{user_id}@mail.ma", f"User {user_id}", platform, f"{user_id}_{platform}",
+            current, engagement, 12, week_ago, week_ago_engagement)
+
+
+class FakeCheckpoints:
+    def __init__(self, checkpoint=None):
+        self.checkpoint = checkpoint
+        self.started = []
+        self.saved = []
+        self.completed = []
+
+    def __call__(self, supabase_client):
+        return self
+
+    def load(self, job_name):
+        return self.checkpoint
+
+    def start(self, job_name, params):
+        self.started.append(params)
+
+    def save(self, job_name, cursor, processed):
+        self.saved.append((cursor, processed))
+
+    def complete(self, job_name, processed):
+        self.completed.append(processed)
+
+
+def _run(report_tasks, checkpoints, chunks, chunk_size):
+    cursor = MagicMock()
+    cursor.fetchall.side_effect = chunks
+    report_tasks.get_db_connection.return_value.cursor.return_value = cursor
+
+    with patch.object(batch_checkpoints, "BatchCheckpointStore", checkpoints), \
+            patch.object(report_tasks, "_send_report_batch", side_effect=len):
+        result = report_tasks.send_weekly_social_reports(chunk_size=chunk_size)
+    return result, [call.args[1] for call in cursor.execute.call_args_list]
+
+
+# ============================================================================
+# TESTS: build_weekly_reports
+# ============================================================================
+
+
+@pytest.mark.unit
+def test_build_weekly_reports_groups_platforms_per_user(report_tasks):
+    rows = [
+        _row("u-1", "instagram", current=1000, week_ago=900),
+        _row("u-1", "tiktok", current=500, week_ago=300, engagement=6.0),
+        _row("u-2", "youtube", current=None, week_ago=None, engagement=None, week_ago_engagement=None),
+    ]
+
+    reports = report_tasks.build_weekly_reports(rows, PERIOD)
+
+    assert set(reports) == {"u-1", "u-2"}
+    summary = reports["u-1"]["report"]["summary"]
+    assert summary == {"total_followers": 1500, "total_growth": 300, "avg_engagement": 5.0,
+                       "best_platform": "tiktok"}
+    assert reports["u-1"]["email"] == "u-1@mail.ma"
+
+    never_synced = reports["u-2"]["report"]["platforms"][0]
+    assert never_synced["followers"] == 0
+    assert never_synced["followers_growth"] == 0
+    assert reports["u-2"]["report"]["summary"]["best_platform"] is None
+
+
+# ============================================================================
+# TESTS: reprise sur checkpoint
+# ============================================================================
+
+
+@pytest.mark.unit
+def test_is_resumable_only_within_the_same_week(report_tasks):
+    recent = {"params": {"started_at": (datetime.now() - timedelta(days=1)).isoformat()}}
+    stale = {"params": {"started_at": (datetime.now() - timedelta(days=7)).isoformat()}}
+
+    assert report_tasks._is_resumable(recent) is True
+    assert report_tasks._is_resumable(stale) is False
+    assert report_tasks._is_resumable({"params": {}}) is False
+
+
+@pytest.mark.unit
+def test_fresh_run_checkpoints_after_each_chunk(report_tasks):
+    checkpoints = FakeCheckpoints()
+    chunks = [
+        [_row("u-1", "instagram"), _row("u-1", "tiktok"), _row("u-2", "instagram")],
+        [_row("u-3", "instagram")],
+    ]
+
+    result, params = _run(report_tasks, checkpoints, chunks, chunk_size=2)
+
+    assert len(checkpoints.started) == 1
+    assert [p["after_user_id"] for p in params] == [None, "u-2"]
+    assert all(p["user_id"] is None for p in params)
+    assert checkpoints.saved == [({"user_id": "u-2"}, 2), ({"user_id": "u-3"}, 3)]
+    assert checkpoints.completed == [3]
+    assert result["reports_sent"] == 3
+
+
+@pytest.mark.unit
+def test_interrupted_run_resumes_after_saved_cursor(report_tasks):
+    params = {
+        "week_ago": "2025-01-01T09:00:00",
+        "period": PERIOD,
+        "started_at": datetime.now().isoformat(),
+    }
+    checkpoints = FakeCheckpoints({"params": params, "cursor": {"user_id": "u-2"}, "processed": 2})
+
+    result, executed = _run(report_tasks, checkpoints, [[_row("u-3", "instagram")]], chunk_size=2)
+
+    assert checkpoints.started == []
+    assert executed[0]["after_user_id"] == "u-2"
+    assert executed[0]["week_ago"] == params["week_ago"]
+    assert checkpoints.completed == [3]
+    assert result["total_influencers"] == 1
+
+
+@pytest.mark.unit
+def test_single_user_report_passes_user_id_as_parameter(report_tasks):
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [_row("u-9", "instagram")]
+
+    report = report_tasks.generate_weekly_report("u-9", cursor)
+
+    sql, params = cursor.execute.call_args.args
+    assert sql == report_tasks.WEEKLY_REPORTS_CHUNK_SQL
+    assert params["user_id"] == "u-9"
+    assert report["summary"]["total_followers"] == 1000
@@ -0,0 +1,34 @@
+"""
+Tests unitaires pour SmartNotificationService (limite de débit, connexions SMTP)
+"""
+
+import smtplib
+from unittest.mock import patch
+
+import pytest
+
+from services.notification_rate_limit import SlidingWindowRateLimiter
+from services.smart_notifications import SmartNotificationService
+
+
+@pytest.mark.unit
+def test_sliding_window_limit():
+    limiter = SlidingWindowRateLimiter(limit=2, window=60, use_redis=False)
+
+    assert limiter.allow("u-1", now=0) and limiter.allow("u-1", now=10)
+    assert not limiter.allow("u-1", now=30)
+    assert limiter.allow("u-2", now=30)
+    assert limiter.allow("u-1", now=61)
+
+
+@pytest.mark.unit
+def test_smtp_connection_closed_when_login_fails():
+    service = SmartNotificationService()
+
+    with patch("services.smart_notifications.smtplib.SMTP") as smtp:
+        server = smtp.return_value
+        server.login.side_effect = smtplib.SMTPAuthenticationError(535, b"bad credentials")
+        with pytest.raises(smtplib.SMTPAuthenticationError):
+            service._create_smtp_connection()
+
+    server.close.assert_called_once()
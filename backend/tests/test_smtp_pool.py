@@ -0,0 +1,105 @@
+"""
+Tests unitaires pour le pool de connexions SMTP (services/smtp_pool.py)
+"""
+
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+from services.smtp_pool import SMTPConnectionPool
+
+
+class FakeSMTP:
+    def __init__(self, fail_on=None):
+        self.sent = []
+        self.noops = 0
+        self.closed = False
+        self.fail_on = fail_on or {}
+
+    def send_message(self, message):
+        error = self.fail_on.pop(message["To"], None)
+        if error:
+            raise error
+        time.sleep(0.01)
+        self.sent.append(message["To"])
+
+    def noop(self):
+        self.noops += 1
+        return (250, b"OK")
+
+    def quit(self):
+        self.closed = True
+
+    close = quit
+
+
+def _message(to):
+    message = MIMEText("Bonjour")
+    message["To"] = to
+    return message
+
+
+def _factory(**kwargs):
+    servers = []
+    lock = threading.Lock()
+
+    def connect():
+        with lock:
+            servers.append(FakeSMTP(**kwargs))
+            return servers[-1]
+
+    return servers, connect
+
+
+@pytest.mark.unit
+def test_batch_reuses_a_bounded_number_of_connections():
+    servers, connect = _factory()
+    pool = SMTPConnectionPool(connect, max_connections=3)
+
+    result = pool.send_many([_message(f"u{i}@ex.ma") for i in range(30)])
+
+    assert result["sent"] == 30 and result["failed"] == 0
+    assert 1 <= len(servers) <= 3
+    assert sum(len(server.sent) for server in servers) == 30
+    assert pool.get_stats()["connections_reused"] == 30 - len(servers)
+
+
+@pytest.mark.unit
+def test_dropped_connection_is_replaced_and_message_retried():
+    servers, connect = _factory(fail_on={"a@ex.ma": smtplib.SMTPServerDisconnected("gone")})
+    pool = SMTPConnectionPool(connect, max_connections=1)
+
+    pool.send(_message("a@ex.ma"))
+
+    assert len(servers) == 2
+    assert servers[0].closed
+    assert servers[1].sent == ["a@ex.ma"]
+    assert pool.get_stats()["reconnects"] == 1
+
+
+@pytest.mark.unit
+def test_refused_recipient_keeps_connection():
+    refused = smtplib.SMTPRecipientsRefused({"bad@ex.ma": (550, b"unknown")})
+    servers, connect = _factory(fail_on={"bad@ex.ma": refused})
+    pool = SMTPConnectionPool(connect, max_connections=1)
+
+    result = pool.send_many([_message("ok@ex.ma"), _message("bad@ex.ma"), _message("ok2@ex.ma")])
+
+    assert result["sent"] == 2
+    assert [failure["index"] for failure in result["failures"]] == [1]
+    assert len(servers) == 1 and not servers[0].closed
+
+
+@pytest.mark.unit
+def test_idle_connection_is_checked_with_noop():
+    servers, connect = _factory()
+    pool = SMTPConnectionPool(connect, max_connections=1, noop_after=0)
+
+    pool.send(_message("a@ex.ma"))
+    pool.send(_message("b@ex.ma"))
+
+    assert len(servers) == 1
+    assert servers[0].noops == 1
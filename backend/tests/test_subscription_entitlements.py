@@ -0,0 +1,140 @@
+"""
+Tests unitaires pour les instantanés de droits d'abonnement (compteurs d'usage)
+"""
+
+import asyncio
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+import advanced_helpers
+import subscription_helpers_simple as helpers_module
+from subscription_entitlements import UsageCounters
+
+
+@pytest.fixture
+def counters():
+    instance = UsageCounters(use_redis=False)
+    with patch.object(helpers_module, "usage_counters", instance):
+        yield instance
+
+
+@pytest.fixture
+def db():
+    mock = MagicMock()
+    for method in ("from_", "select", "eq", "is_", "limit"):
+        getattr(mock, method).return_value = mock
+    helpers_module._account_cache.clear_local()
+    with patch.object(helpers_module, "supabase", mock):
+        yield mock
+    helpers_module._account_cache.clear_local()
+
+
+def _count(value):
+    response = MagicMock()
+    response.count = value
+    return response
+
+
+def _rows(rows):
+    response = MagicMock()
+    response.data = rows
+    return response
+
+
+@pytest.mark.unit
+def test_delta_on_unknown_counters_is_ignored(counters):
+    counters.incr("merchant", "m-1", "products")
+    assert counters.get("merchant", "m-1") is None
+
+    counters.set("merchant", "m-1", {"products": 3, "campaigns": 0, "affiliates": 1})
+    counters.incr("merchant", "m-1", "products")
+    counters.incr("merchant", "m-1", "campaigns", -1)
+
+    assert counters.get("merchant", "m-1") == {"products": 4, "campaigns": 0, "affiliates": 1}
+
+
+@pytest.mark.unit
+def test_expired_counters_are_reconciled(counters):
+    counters.ttl = -1
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"campaigns": 2, "links": 7}
+
+    counters.get_or_reconcile("influencer", "i-1", loader)
+    usage = counters.get_or_reconcile("influencer", "i-1", loader)
+
+    assert usage == {"campaigns": 2, "links": 7}
+    assert len(loads) == 2
+
+
+@pytest.mark.unit
+def test_limit_snapshot_counts_once_then_reads_counters(db, counters):
+    db.execute.side_effect = [
+        _rows([{"id": "m-1", "subscription_plan": "free"}]),
+        _count(9), _count(1), _count(4),
+    ]
+
+    first = helpers_module.get_entitlements("u-1", "merchant")
+    counters.incr("merchant", "m-1", "products")
+    second = helpers_module.get_entitlements("u-1", "merchant")
+
+    assert first["usage"] == {"products": 9, "campaigns": 1, "affiliates": 4}
+    assert second["usage"]["products"] == 10
+    assert second["limits"]["products"] == 10
+    assert db.execute.call_count == 4
+
+
+@pytest.mark.unit
+def test_usage_count_skips_soft_deleted_rows(db):
+    db.execute.side_effect = [_count(9), _count(1), _count(4)]
+
+    helpers_module.count_usage("merchant", "m-1")
+
+    filters = [call.args for call in db.is_.call_args_list]
+    assert filters == [("deleted_at", "null"), ("deleted_at", "null")]
+
+
+@pytest.mark.unit
+def test_created_tracking_link_is_counted_in_the_same_table(db, counters):
+    import tracking_service as tracking_module
+
+    counters.set("influencer", "i-1", {"campaigns": 1, "links": 2})
+    links = MagicMock()
+    for method in ("table", "insert", "update", "eq"):
+        getattr(links, method).return_value = links
+    links.execute.return_value = _rows([{"id": "link-1"}])
+
+    with patch.object(tracking_module, "supabase", links), \
+            patch("subscription_entitlements.usage_counters", counters):
+        service = tracking_module.TrackingService()
+        asyncio.run(service.create_tracking_link("i-1", "p-1", "https://boutique.ma/produit"))
+
+    assert counters.get("influencer", "i-1")["links"] == 3
+    links.table.assert_any_call("tracking_links")
+
+    db.execute.side_effect = [_count(1), _count(3)]
+    assert helpers_module.count_usage("influencer", "i-1") == {"campaigns": 1, "links": 3}
+    db.from_.assert_called_with("tracking_links")
+
+
+@pytest.mark.unit
+def test_repeated_soft_delete_decrements_once(counters):
+    counters.set("merchant", "m-1", {"products": 3, "campaigns": 0, "affiliates": 0})
+    table = MagicMock()
+    for method in ("table", "update", "eq", "is_"):
+        getattr(table, method).return_value = table
+    table.execute.side_effect = [_rows([{"id": "p-1", "merchant_id": "m-1"}]), _rows([])]
+
+    with patch.object(advanced_helpers, "supabase", table), \
+            patch("subscription_entitlements.usage_counters", counters):
+        assert advanced_helpers.delete_product("p-1")
+        assert advanced_helpers.delete_product("p-1")
+
+    table.is_.assert_called_with("deleted_at", "null")
+    assert counters.get("merchant", "m-1")["products"] == 2
@@ -0,0 +1,92 @@
+"""
+Tests unitaires pour le client Supabase asynchrone (pool, limites, offload)
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from supabase_async import AsyncSupabaseClient, DatabaseTimeoutError, run_sync
+
+
+class SlowBuilder:
+    """Builder factice : chaînable, execute() attend `delay` secondes"""
+
+    def __init__(self, tracker, delay=0.01):
+        self.tracker = tracker
+        self.delay = delay
+        self.calls = []
+
+    def select(self, *args, **kwargs):
+        self.calls.append(("select", args))
+        return self
+
+    def eq(self, *args):
+        self.calls.append(("eq", args))
+        return self
+
+    async def execute(self):
+        self.tracker["current"] += 1
+        self.tracker["peak"] = max(self.tracker["peak"], self.tracker["current"])
+        await asyncio.sleep(self.delay)
+        self.tracker["current"] -= 1
+        return self.calls
+
+
+class FakePostgrest:
+    def __init__(self, delay=0.01):
+        self.tracker = {"current": 0, "peak": 0}
+        self.delay = delay
+
+    def from_(self, table):
+        return SlowBuilder(self.tracker, self.delay)
+
+
+def _client(max_concurrency=2, timeout=1.0, delay=0.01):
+    client = AsyncSupabaseClient("http://db.test", "key", max_concurrency=max_concurrency, timeout=timeout)
+    client._postgrest = FakePostgrest(delay)
+    client._semaphore = asyncio.Semaphore(max_concurrency)
+    return client
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_fluent_chain_is_preserved():
+    client = _client()
+
+    calls = await client.table("users").select("id").eq("role", "merchant").execute()
+
+    assert calls == [("select", ("id",)), ("eq", ("role", "merchant"))]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    client = _client(max_concurrency=2)
+
+    await asyncio.gather(*(client.table("users").select("id").execute() for _ in range(6)))
+
+    assert client._postgrest.tracker["peak"] == 2
+    assert client.get_stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_slow_query_times_out():
+    client = _client(timeout=0.01, delay=0.5)
+
+    with pytest.raises(DatabaseTimeoutError):
+        await client.table("sales").select("*").execute()
+    assert client.get_stats()["timeouts"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_run_sync_offloads_to_worker_thread():
+    loop_thread = threading.get_ident()
+
+    result = await run_sync(lambda value: (value, threading.get_ident()), 42)
+
+    assert result[0] == 42
+    assert result[1] != loop_thread
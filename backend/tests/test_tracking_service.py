@@ -0,0 +1,244 @@
+"""
+Tests unitaires pour le service de tracking (index short_code, cookie d'attribution)
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import tracking_service as tracking_module
+from attribution_cookie import ENCODED_LENGTH, AttributionCookieSigner
+from tracking_service import IndexedLink, ShortCodeIndex, TrackingService
+
+
+def _link(link_id="link-1", status="active"):
+    return IndexedLink(
+        link_id=link_id,
+        influencer_id="inf-1",
+        destination_url="https://boutique.ma/produit",
+        status=status,
+    )
+
+
+# ============================================================================
+# TESTS: ShortCodeIndex
+# ============================================================================
+
+
+@pytest.mark.unit
+def test_index_put_get_and_invalidate_by_link_id():
+    index = ShortCodeIndex()
+    index.put("ABC12345", _link())
+
+    assert index.get("ABC12345") == _link()
+
+    index.invalidate(link_id="link-1")
+    assert index.get("ABC12345") is ShortCodeIndex._MISSING
+
+
+@pytest.mark.unit
+def test_index_negative_entry_and_expiry():
+    index = ShortCodeIndex(ttl_seconds=-1)
+    index.put("DEADBEEF", None)
+
+    # TTL négatif: l'entrée est immédiatement expirée
+    assert index.get("DEADBEEF") is ShortCodeIndex._MISSING
+
+    index.ttl_seconds = 60
+    index.put("DEADBEEF", None)
+    assert index.get("DEADBEEF") is None
+
+
+@pytest.mark.unit
+def test_index_evicts_oldest_when_full():
+    index = ShortCodeIndex(max_entries=2)
+    index.put("A", _link("l-a"))
+    index.put("B", _link("l-b"))
+    index.put("C", _link("l-c"))
+
+    assert len(index) == 2
+    assert index.get("A") is ShortCodeIndex._MISSING
+    assert index.get("C").link_id == "l-c"
+
+
+# ============================================================================
+# TESTS: TrackingService.resolve_short_code
+# ============================================================================
+
+
+@pytest.fixture
+def db():
+    mock = MagicMock()
+    for method in ("table", "select", "eq", "limit", "range", "insert", "upsert", "update"):
+        getattr(mock, method).return_value = mock
+    mock.execute.return_value.data = []
+    with patch.object(tracking_module, "supabase", mock):
+        yield mock
+
+
+@pytest.mark.unit
+def test_resolve_short_code_hits_db_once(db):
+    db.execute.return_value.data = [
+        {
+            "id": "link-1",
+            "short_code": "ABC12345",
+            "influencer_id": "inf-1",
+            "destination_url": "https://boutique.ma/produit",
+            "status": "active",
+        }
+    ]
+    service = TrackingService()
+
+    first = service.resolve_short_code("ABC12345")
+    second = service.resolve_short_code("ABC12345")
+
+    assert first == second == _link()
+    assert db.execute.call_count == 1
+
+
+@pytest.mark.unit
+def test_resolve_unknown_code_is_cached(db):
+    service = TrackingService()
+
+    assert service.resolve_short_code("NOPE0000") is None
+    assert service.resolve_short_code("NOPE0000") is None
+    assert db.execute.call_count == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_update_link_status_invalidates_index(db):
+    db.execute.return_value.data = [{"id": "link-1", "short_code": "ABC12345"}]
+    service = TrackingService()
+    service.link_index.put("ABC12345", _link())
+
+    result = await service.update_link_status("link-1", "paused")
+
+    assert result["success"] is True
+    assert service.link_index.get("ABC12345") is ShortCodeIndex._MISSING
+
+
+@pytest.mark.unit
+def test_build_click_event_pregenerates_id():
+    service = TrackingService()
+    request = MagicMock()
+    request.client.host = "1.2.3.4"
+    request.headers = {"user-agent": "pytest"}
+
+    click = service.build_click_event(_link(), request)
+
+    assert click["id"]
+    assert click["link_id"] == "link-1"
+    assert click["ip_address"] == "1.2.3.4"
+    assert click["user_agent"] == "pytest"
+
+
+# ============================================================================
+# TESTS: Cookie d'attribution signé
+# ============================================================================
+
+@pytest.fixture
+def signer():
+    return AttributionCookieSigner({0: b"old-secret", 1: b"current-secret"}, current_key_id=1)
+
+
+@pytest.mark.unit
+def test_signed_cookie_roundtrip(signer):
+    ids = [str(uuid4()) for _ in range(3)]
+
+    value = signer.encode(*ids)
+    claims = signer.decode(value)
+
+    assert len(value) == ENCODED_LENGTH
+    assert (claims.link_id, claims.influencer_id, claims.click_id) == tuple(ids)
+    assert claims.key_id == 1
+
+
+@pytest.mark.unit
+def test_signed_cookie_rejects_tampering(signer):
+    value = signer.encode(str(uuid4()), str(uuid4()), str(uuid4()))
+    tampered = value[:10] + ("A" if value[10] != "A" else "B") + value[11:]
+
+    assert signer.decode(tampered) is None
+    assert signer.decode(value[:-1]) is None
+    assert signer.decode("link|influencer|click|2025-01-01") is None
+
+
+@pytest.mark.unit
+def test_signed_cookie_key_rotation_and_expiry(signer):
+    old_signer = AttributionCookieSigner({0: b"old-secret"}, current_key_id=0)
+    value = old_signer.encode(str(uuid4()), str(uuid4()), str(uuid4()), issued_at=1_000)
+
+    # Ancienne clé toujours acceptée, mais cookie trop vieux
+    assert signer.decode(value).key_id == 0
+    assert signer.decode(value, max_age_seconds=60) is None
+
+    rotated = AttributionCookieSigner({1: b"current-secret"}, current_key_id=1)
+    assert rotated.decode(value) is None
+
+
+@pytest.mark.unit
+def test_parse_attribution_cookie_marks_signed_cookies_verified():
+    service = TrackingService()
+    link_id, influencer_id, click_id = str(uuid4()), str(uuid4()), str(uuid4())
+
+    signed = service.parse_attribution_cookie(
+        service._generate_attribution_cookie(link_id, influencer_id, click_id)
+    )
+    legacy = service.parse_attribution_cookie(f"{link_id}|{influencer_id}|{click_id}|2025-01-01")
+
+    assert signed["verified"] is True
+    assert signed["influencer_id"] == influencer_id
+    assert legacy["verified"] is False
+
+
+@pytest.mark.unit
+def test_cookie_skipped_when_link_has_no_influencer():
+    response = MagicMock()
+    link = IndexedLink(
+        link_id=str(uuid4()), influencer_id=None, destination_url="https://boutique.ma", status="active"
+    )
+
+    assert TrackingService().set_attribution_cookie(response, link, str(uuid4())) is None
+    response.set_cookie.assert_not_called()
+
+
+@pytest.mark.unit
+def test_signer_from_env_accepts_empty_settings(monkeypatch):
+    monkeypatch.setenv("ATTRIBUTION_COOKIE_KEYS", "")
+    monkeypatch.setenv("ATTRIBUTION_COOKIE_KEY_ID", "")
+    monkeypatch.setenv("JWT_SECRET", "test-secret")
+
+    signer = AttributionCookieSigner.from_env()
+
+    assert signer.current_key_id == 0
+
+
+# ============================================================================
+# TESTS: TrackingService.record_clicks_bulk
+# ============================================================================
+
+
+def _click(link_id="link-1", clicked_at="2025-10-23T10:00:00"):
+    return {"id": str(uuid4()), "link_id": link_id, "clicked_at": clicked_at}
+
+
+@pytest.mark.unit
+def test_record_clicks_bulk_survives_counter_failure(db):
+    clicks = [_click(), _click(clicked_at="2025-10-23T10:00:05")]
+    db.execute.return_value.data = clicks
+    db.rpc.side_effect = RuntimeError("statement timeout")
+
+    assert TrackingService().record_clicks_bulk(clicks) == 2
+
+    db.upsert.assert_called_once_with(clicks, on_conflict="id", ignore_duplicates=True)
+
+
+@pytest.mark.unit
+def test_replayed_clicks_are_not_counted_twice(db):
+    clicks = [_click()]
+    db.execute.return_value.data = []
+
+    assert TrackingService().record_clicks_bulk(clicks) == 1
+
+    db.rpc.assert_not_called()
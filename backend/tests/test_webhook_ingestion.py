@@ -0,0 +1,226 @@
+"""
+Tests unitaires pour l'ingestion des webhooks en file (webhook_inbox)
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+import webhook_service as webhook_module
+from webhook_ingestion import WebhookWorkerPool
+from webhook_service import WebhookService
+
+WEBHOOK_MIGRATION = Path(__file__).resolve().parents[2] / "database" / "migrations" / "add_webhook_inbox.sql"
+
+
+def _response(data=None):
+    response = MagicMock()
+    response.data = data
+    return response
+
+
+class FakeRequest:
+    def __init__(self, body: bytes, headers: dict):
+        self._body = body
+        self.headers = headers
+
+    async def body(self):
+        return self._body
+
+
+@pytest.fixture
+def db():
+    mock = MagicMock()
+    for method in ("table", "select", "eq", "in_", "insert", "upsert", "rpc"):
+        getattr(mock, method).return_value = mock
+    with patch.object(webhook_module, "supabase", mock):
+        yield mock
+
+
+@pytest.fixture
+def service():
+    instance = WebhookService()
+    instance._get_merchant_cached = lambda merchant_id: {
+        "shopify_webhook_secret": "shh",
+        "influencer_commission_rate": 10.0,
+        "platform_commission_rate": 5.0,
+    }
+    return instance
+
+
+def _shopify_request(order: dict, secret: str = "shh") -> FakeRequest:
+    body = json.dumps(order).encode()
+    signature = base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+    return FakeRequest(body, {"x-shopify-hmac-sha256": signature, "x-shopify-topic": "orders/create"})
+
+
+@pytest.mark.unit
+def test_enqueue_stores_raw_body_once_per_order(db, service):
+    db.execute.side_effect = [_response([{"id": "evt-1"}]), _response([])]
+
+    first = asyncio.run(service.enqueue_webhook("shopify", _shopify_request({"id": 42}), "m-1"))
+    retry = asyncio.run(service.enqueue_webhook("shopify", _shopify_request({"id": 42}), "m-1"))
+
+    assert first == {"accepted": True, "duplicate": False, "event_id": "evt-1"}
+    assert retry == {"accepted": True, "duplicate": True}
+    event = db.upsert.call_args_list[0].args[0]
+    assert event["dedup_key"] == "42"
+    assert "x-shopify-hmac-sha256" not in event["headers"]
+    assert db.upsert.call_args_list[0].kwargs == {
+        "on_conflict": "source,merchant_id,dedup_key", "ignore_duplicates": True
+    }
+
+
+@pytest.mark.unit
+def test_enqueue_rejects_bad_signature(db, service):
+    from fastapi import HTTPException
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(service.enqueue_webhook("shopify", _shopify_request({"id": 1}, secret="wrong"), "m-1"))
+
+    assert excinfo.value.status_code == 401
+    db.upsert.assert_not_called()
+
+
+@pytest.mark.unit
+def test_process_batch_inserts_sales_in_one_statement(db, service):
+    attribution = {"influencer_id": "inf-1", "link_id": "link-1"}
+    events = [
+        {"id": f"evt-{i}", "source": "shopify", "merchant_id": "m-1", "attempts": 1,
+         "body": json.dumps({"id": i, "total_price": "100.00"})}
+        for i in range(3)
+    ]
+    db.execute.side_effect = [
+        _response([{"id": "sale-old", "external_order_id": "0"}]),  # commande déjà enregistrée
+        _response([{"id": "sale-1"}, {"id": "sale-2"}]),
+        _response(None),  # increment_link_conversions
+        _response([{"id": "inf-1", "user_id": "u-1"}]),
+        _response(None),  # notifications
+    ]
+
+    with patch.object(service, "_find_attribution_shopify", return_value=attribution), \
+            patch.object(webhook_module, "publish_events") as publish:
+        results = service.process_inbox_batch(events)
+
+    assert [(r["id"], r["status"], r["sale_id"]) for r in results] == [
+        ("evt-0", "processed", "sale-old"),
+        ("evt-1", "processed", "sale-1"),
+        ("evt-2", "processed", "sale-2"),
+    ]
+    inserted = db.insert.call_args_list[0].args[0]
+    assert [sale["external_order_id"] for sale in inserted] == ["1", "2"]
+    assert inserted[0]["influencer_commission"] == 10.0
+    db.rpc.assert_called_once_with(
+        "increment_link_conversions", {"p_deltas": [{"link_id": "link-1", "conversions": 2, "revenue": 200.0}]}
+    )
+    pushed = list(publish.call_args.args[0])
+    assert [(user_id, event_type) for user_id, event_type, _ in pushed] == [("u-1", "sale_created")] * 2
+
+
+@pytest.mark.unit
+def test_failed_batch_is_requeued_until_attempts_run_out():
+    completed = []
+
+    def process(events):
+        raise RuntimeError("db down")
+
+    pool = WebhookWorkerPool(lambda limit, stale, max_attempts: [], process, completed.extend, max_attempts=3)
+    asyncio.run(pool.run_batch([{"id": "a", "attempts": 1}, {"id": "b", "attempts": 3}]))
+
+    assert [(r["id"], r["status"]) for r in completed] == [("a", "queued"), ("b", "failed")]
+    assert pool.stats["retried"] == 1
+    assert pool.stats["failed"] == 1
+
+
+@pytest.mark.unit
+def test_claim_passes_attempt_cap_to_rpc(db, service):
+    service.claim_inbox_events(50, 300, 5)
+
+    db.rpc.assert_called_once_with(
+        "claim_webhook_events", {"p_limit": 50, "p_stale_seconds": 300, "p_max_attempts": 5}
+    )
+
+
+def _claim_with_sqlite(rows, now, limit=50, stale_seconds=300, max_attempts=5):
+    """
+    Exécute le corps de claim_webhook_events (migration) sur SQLite
+
+    Seuls les éléments propres à PostgreSQL sont adaptés : paramètres,
+    NOW() / make_interval, FOR UPDATE SKIP LOCKED et RETURN QUERY
+    """
+    sql = WEBHOOK_MIGRATION.read_text()
+    function = sql[sql.index("CREATE OR REPLACE FUNCTION claim_webhook_events"):]
+    body = function[function.index("BEGIN") + len("BEGIN"):function.index("END;")]
+    body = (
+        body.replace("NOW() - make_interval(secs => p_stale_seconds)", ":stale_before")
+        .replace("NOW()", ":now")
+        .replace("p_max_attempts", ":max_attempts")
+        .replace("p_limit", ":limit")
+        .replace("FOR UPDATE SKIP LOCKED", "")
+        .replace("RETURN QUERY", "")
+        .replace("RETURNING w.*", "RETURNING id")
+    )
+
+    db = sqlite3.connect(":memory:")
+    db.execute(
+        "CREATE TABLE webhook_inbox (id TEXT PRIMARY KEY, status TEXT, locked_at TEXT, "
+        "attempts INTEGER, error_message TEXT, received_at TEXT)"
+    )
+    db.executemany(
+        "INSERT INTO webhook_inbox VALUES (:id, :status, :locked_at, :attempts, NULL, :received_at)", rows
+    )
+    params = {
+        "now": now.isoformat(),
+        "stale_before": (now - timedelta(seconds=stale_seconds)).isoformat(),
+        "max_attempts": max_attempts,
+        "limit": limit,
+    }
+    claimed = []
+    for statement in filter(str.strip, body.split(";")):
+        claimed = [row[0] for row in db.execute(statement, params).fetchall()]
+    statuses = dict(db.execute("SELECT id, status FROM webhook_inbox"))
+    return claimed, statuses
+
+
+@pytest.mark.unit
+def test_stale_events_are_reclaimed_only_below_the_attempt_cap():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    stale = (now - timedelta(minutes=10)).isoformat()
+    recent = (now - timedelta(seconds=30)).isoformat()
+    received = (now - timedelta(hours=1)).isoformat()
+    rows = [
+        {"id": "below-cap", "status": "processing", "locked_at": stale, "attempts": 4, "received_at": received},
+        {"id": "at-cap", "status": "processing", "locked_at": stale, "attempts": 5, "received_at": received},
+        {"id": "in-flight", "status": "processing", "locked_at": recent, "attempts": 1, "received_at": received},
+        {"id": "queued", "status": "queued", "locked_at": None, "attempts": 0, "received_at": received},
+    ]
+
+    claimed, statuses = _claim_with_sqlite(rows, now, max_attempts=5)
+
+    assert sorted(claimed) == ["below-cap", "queued"]
+    assert statuses == {"below-cap": "processing", "at-cap": "failed", "in-flight": "processing",
+                        "queued": "processing"}
+
+
+@pytest.mark.unit
+def test_inline_sale_notification_publishes_sale_created(db, service):
+    db.execute.side_effect = [_response([{"user_id": "user-1"}]), _response([])]
+
+    with patch.object(webhook_module, "publish_events") as publish:
+        asyncio.run(service._notify_influencer_sale("inf-1", 120.0, 12.0, order_id="1001"))
+
+    (events,), _ = publish.call_args
+    assert list(events) == [
+        ("user-1", "sale_created", {"order_id": "1001", "amount": 120.0, "commission": 12.0})
+    ]
@@ -9,10 +9,17 @@ from fastapi import Request, Response
 from fastapi.responses import RedirectResponse
 from datetime import datetime, timedelta
 from supabase_client import supabase
-from typing import Optional, Dict
+from click_ingestion import ClickIngestionQueue
+from attribution_cookie import attribution_signer
+from subscription_entitlements import record_usage
+from typing import Optional, Dict, List, NamedTuple
 import hashlib
 import secrets
 import logging
+import os
+import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +33,103 @@ except ImportError:
 COOKIE_NAME = "systrack"  # ShareYourSales tracking
 COOKIE_EXPIRY_DAYS = 30  # Durée d'attribution (30 jours)
 SHORT_CODE_LENGTH = 8
+SHORT_CODE_INDEX_TTL_SECONDS = 300  # Rafraîchissement d'une entrée de l'index
+SHORT_CODE_INDEX_MAX_ENTRIES = 200_000
+SHORT_CODE_INDEX_WARM_PAGE_SIZE = 1000
+
+
+class IndexedLink(NamedTuple):
+    """Entrée de l'index short_code (le strict nécessaire pour rediriger)"""
+
+    link_id: str
+    influencer_id: str
+    destination_url: str
+    status: str
+
+
+class ShortCodeIndex:
+    """
+    Index en mémoire short_code → lien, consulté par la redirection /r/{short_code}
+
+    - Préchargé au démarrage (warm) avec les liens actifs
+    - Chaque entrée expire après `ttl_seconds` (filet de sécurité multi-workers)
+    - Invalidé explicitement à la création d'un lien ou au changement de statut
+    - Les codes inconnus sont mémorisés (negative caching) pour ne pas
+      retaper la BDD sur chaque clic d'un lien mort
+    """
+
+    _MISSING = object()
+
+    def __init__(
+        self,
+        ttl_seconds: int = SHORT_CODE_INDEX_TTL_SECONDS,
+        max_entries: int = SHORT_CODE_INDEX_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, tuple] = {}  # short_code -> (IndexedLink | None, expires_at)
+        self._codes_by_link: Dict[str, str] = {}  # link_id -> short_code
+        self._lock = threading.Lock()
+        self.warmed = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, short_code: str):
+        """
+        Retourne l'IndexedLink, None si le code est connu comme inexistant,
+        ou ShortCodeIndex._MISSING si l'index ne sait pas (absent ou expiré)
+        """
+        entry = self._entries.get(short_code)
+        if entry is None:
+            return self._MISSING
+
+        link, expires_at = entry
+        if expires_at < time.monotonic():
+            return self._MISSING
+        return link
+
+    def put(self, short_code: str, link: Optional[IndexedLink]):
+        """Ajoute ou remplace une entrée (link=None pour un code inexistant)"""
+        with self._lock:
+            if len(self._entries) >= self.max_entries and short_code not in self._entries:
+                # Éviction grossière: on retire l'entrée la plus ancienne (ordre d'insertion)
+                oldest_code = next(iter(self._entries))
+                self._drop(oldest_code)
+
+            self._entries[short_code] = (link, time.monotonic() + self.ttl_seconds)
+            if link is not None:
+                self._codes_by_link[link.link_id] = short_code
+
+    def invalidate(self, short_code: Optional[str] = None, link_id: Optional[str] = None):
+        """Retire une entrée par short_code et/ou par link_id"""
+        with self._lock:
+            if link_id is not None:
+                code = self._codes_by_link.get(link_id)
+                if code is not None:
+                    self._drop(code)
+            if short_code is not None:
+                self._drop(short_code)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._codes_by_link.clear()
+            self.warmed = False
+
+    def _drop(self, short_code: str):
+        entry = self._entries.pop(short_code, None)
+        if entry and entry[0] is not None:
+            self._codes_by_link.pop(entry[0].link_id, None)
+
+    @staticmethod
+    def from_row(row: Dict) -> IndexedLink:
+        return IndexedLink(
+            link_id=row["id"],
+            influencer_id=row.get("influencer_id"),
+            destination_url=row.get("destination_url"),
+            status=row.get("status") or "active",
+        )
 
 
 class TrackingService:
@@ -33,6 +137,7 @@ class TrackingService:
 
     def __init__(self):
         self.supabase = supabase
+        self.link_index = ShortCodeIndex()
 
     # ============================================
     # 1. GÉNÉRATION DE LIENS TRACKÉS
@@ -86,6 +191,7 @@ class TrackingService:
 
             result = supabase.table("tracking_links").insert(link_data).execute()
             link_id = result.data[0]["id"]
+            record_usage("influencer", influencer_id, "links")
 
             # 2. Générer un code court unique
             short_code = self.generate_short_code(link_id)
@@ -95,7 +201,18 @@ class TrackingService:
                 "id", link_id
             ).execute()
 
-            # 4. Construire l'URL de tracking
+            # 4. Publier le lien dans l'index de redirection
+            self.link_index.put(
+                short_code,
+                IndexedLink(
+                    link_id=link_id,
+                    influencer_id=influencer_id,
+                    destination_url=merchant_url,
+                    status="active",
+                ),
+            )
+
+            # 5. Construire l'URL de tracking
             tracking_url = f"http://localhost:8000/r/{short_code}"
             # En production: https://tracknow.io/r/{short_code}
 
@@ -113,95 +230,218 @@ class TrackingService:
             logger.error(f"Erreur création lien: {e}")
             return {"success": False, "error": str(e)}
 
+    async def update_link_status(self, link_id: str, status: str) -> Dict:
+        """
+        Change le statut d'un lien (active, paused, archived...)
+        et invalide son entrée dans l'index de redirection
+        """
+        try:
+            result = (
+                supabase.table("tracking_links")
+                .update({"status": status})
+                .eq("id", link_id)
+                .execute()
+            )
+            self.link_index.invalidate(link_id=link_id)
+
+            if not result.data:
+                return {"success": False, "error": "Lien introuvable"}
+
+            self.link_index.invalidate(short_code=result.data[0].get("short_code"))
+            return {"success": True, "link": result.data[0]}
+
+        except Exception as e:
+            logger.error(f"Erreur mise à jour statut lien: {e}")
+            return {"success": False, "error": str(e)}
+
     # ============================================
     # 2. TRACKING DES CLICS
     # ============================================
 
-    async def track_click(
-        self, short_code: str, request: Request, response: Response
-    ) -> Optional[str]:
+    def warm_link_index(self) -> int:
         """
-        Enregistre un clic et retourne l'URL de destination
-
-        Args:
-            short_code: Code du lien (ex: "ABC12345")
-            request: Requête FastAPI (pour IP, User-Agent, etc.)
-            response: Réponse FastAPI (pour set cookie)
+        Précharge l'index short_code avec tous les liens actifs (appelé au démarrage)
 
         Returns:
-            URL de destination ou None si lien invalide
+            Nombre de liens indexés
         """
+        loaded = 0
+        offset = 0
         try:
-            # 1. Récupérer le lien depuis la BDD
-            link_result = (
-                supabase.table("tracking_links").select("*").eq("short_code", short_code).execute()
-            )
-
-            if not link_result.data:
-                logger.warning(f"⚠️ Lien introuvable: {short_code}")
-                return None
+            while True:
+                page = (
+                    supabase.table("tracking_links")
+                    .select("id, short_code, influencer_id, destination_url, status")
+                    .eq("status", "active")
+                    .range(offset, offset + SHORT_CODE_INDEX_WARM_PAGE_SIZE - 1)
+                    .execute()
+                )
+                rows = page.data or []
+                for row in rows:
+                    if row.get("short_code"):
+                        self.link_index.put(row["short_code"], ShortCodeIndex.from_row(row))
+                        loaded += 1
+
+                if len(rows) < SHORT_CODE_INDEX_WARM_PAGE_SIZE:
+                    break
+                offset += SHORT_CODE_INDEX_WARM_PAGE_SIZE
+
+            self.link_index.warmed = True
+            logger.info(f"🔥 Index short_code préchargé: {loaded} liens actifs")
+        except Exception as e:
+            logger.error(f"Erreur préchargement index short_code: {e}")
 
-            link = link_result.data[0]
+        return loaded
 
-            # Vérifier que le lien est actif
-            if link.get("status") != "active":
-                logger.warning(f"⚠️ Lien inactif: {short_code}")
-                return None
+    def resolve_short_code(self, short_code: str) -> Optional[IndexedLink]:
+        """
+        Résout un short_code depuis l'index en mémoire
 
-            # 2. Extraire les métadonnées du visiteur
-            client_ip = request.client.host if request.client else "unknown"
-            user_agent = request.headers.get("user-agent", "unknown")
-            referer = request.headers.get("referer", "")
-
-            # 3. Enregistrer le clic dans la table click_logs
-            click_data = {
-                "link_id": link["id"],
-                "influencer_id": link["influencer_id"],
-                "ip_address": client_ip,
-                "user_agent": user_agent,
-                "referer": referer,
-                "clicked_at": datetime.now().isoformat(),
-            }
+        Ne touche la BDD qu'en cas d'absence dans l'index (une seule lecture,
+        résultat mémorisé, y compris quand le code n'existe pas)
+        """
+        link = self.link_index.get(short_code)
+        if link is not ShortCodeIndex._MISSING:
+            return link
 
-            click_result = supabase.table("click_logs").insert(click_data).execute()
-            click_id = click_result.data[0]["id"]
+        try:
+            result = (
+                supabase.table("tracking_links")
+                .select("id, short_code, influencer_id, destination_url, status")
+                .eq("short_code", short_code)
+                .limit(1)
+                .execute()
+            )
+        except Exception as e:
+            logger.error(f"Erreur résolution short_code {short_code}: {e}")
+            return None
 
-            # 4. Incrémenter le compteur de clics
-            new_clicks = int(link.get("clicks", 0)) + 1
-            supabase.table("tracking_links").update(
-                {"clicks": new_clicks, "last_click_at": datetime.now().isoformat()}
-            ).eq("id", link["id"]).execute()
+        link = ShortCodeIndex.from_row(result.data[0]) if result.data else None
+        self.link_index.put(short_code, link)
+        return link
 
-            # 5. Créer le cookie d'attribution (expire dans 30 jours)
+    def build_click_event(self, link: IndexedLink, request: Request) -> Dict:
+        """
+        Construit l'évènement de clic (id généré côté application pour que le
+        cookie d'attribution puisse être posé avant toute écriture en BDD)
+        """
+        return {
+            "id": str(uuid.uuid4()),
+            "link_id": link.link_id,
+            "influencer_id": link.influencer_id,
+            "ip_address": request.client.host if request.client else "unknown",
+            "user_agent": request.headers.get("user-agent", "unknown"),
+            "referer": request.headers.get("referer", ""),
+            "clicked_at": datetime.now().isoformat(),
+        }
+
+    def set_attribution_cookie(
+        self, response: Response, link: IndexedLink, click_id: str
+    ) -> Optional[str]:
+        """Pose le cookie d'attribution signé (30 jours) sur la réponse"""
+        try:
             cookie_value = self._generate_attribution_cookie(
-                link_id=link["id"], influencer_id=link["influencer_id"], click_id=click_id
+                link_id=link.link_id, influencer_id=link.influencer_id, click_id=click_id
             )
+        except (TypeError, ValueError) as e:
+            # Identifiant absent (None) ou qui n'est pas un UUID
+            logger.error(f"Cookie d'attribution non émis pour le lien {link.link_id}: {e}")
+            return None
 
-            response.set_cookie(
-                key=COOKIE_NAME,
-                value=cookie_value,
-                max_age=COOKIE_EXPIRY_DAYS * 24 * 60 * 60,  # 30 jours en secondes
-                httponly=True,  # Sécurité: pas accessible via JavaScript
-                samesite="lax",  # Protection CSRF
-            )
+        response.set_cookie(
+            key=COOKIE_NAME,
+            value=cookie_value,
+            max_age=COOKIE_EXPIRY_DAYS * 24 * 60 * 60,
+            httponly=True,
+            samesite="lax",
+        )
+        return cookie_value
+
+    def record_click(self, click_data: Dict):
+        """
+        Persiste un clic déjà redirigé (exécuté en tâche de fond, hors du
+        chemin critique de la redirection)
+        """
+        try:
+            self.record_clicks_bulk([click_data])
+        except Exception as e:
+            logger.error(f"Erreur enregistrement clic {click_data.get('id')}: {e}")
+
+    def record_clicks_bulk(self, clicks: List[Dict]) -> int:
+        """
+        Persiste un lot de clics: un INSERT multi-lignes dans click_logs puis
+        un incrément agrégé par lien (RPC increment_tracking_link_clicks)
 
-            logger.info(f"🖱️ Clic tracké: {short_code} → Cookie: {cookie_value[:20]}...")
+        L'INSERT ignore les clics déjà présents (id pré-généré) : un lot rejoué
+        n'échoue pas sur la clé primaire et n'est compté qu'une fois. Lève
+        l'exception en cas d'échec de l'INSERT pour que l'appelant puisse
+        rejouer le lot ; un échec des compteurs est seulement journalisé.
 
-            # 6. Retourner l'URL de destination
-            return link["destination_url"]
+        Returns:
+            Nombre de clics traités
+        """
+        if not clicks:
+            return 0
+
+        result = (
+            supabase.table("click_logs")
+            .upsert(clicks, on_conflict="id", ignore_duplicates=True)
+            .execute()
+        )
 
+        # Seules les lignes réellement insérées sont comptées
+        try:
+            self._increment_link_clicks(result.data or [])
         except Exception as e:
-            logger.error(f"Erreur tracking clic: {e}")
-            return None
+            logger.error(f"Compteurs de clics non mis à jour ({len(clicks)} clics): {e}")
+
+        return len(clicks)
+
+    def _increment_link_clicks(self, clicks: List[Dict]):
+        """Incrément agrégé de tracking_links.clicks / last_click_at"""
+        deltas: Dict[str, Dict] = {}
+        for click in clicks:
+            delta = deltas.setdefault(
+                click["link_id"], {"link_id": click["link_id"], "clicks": 0, "last_click_at": None}
+            )
+            delta["clicks"] += 1
+            if delta["last_click_at"] is None or click["clicked_at"] > delta["last_click_at"]:
+                delta["last_click_at"] = click["clicked_at"]
+
+        if not deltas:
+            return
+
+        try:
+            supabase.rpc(
+                "increment_tracking_link_clicks", {"p_deltas": list(deltas.values())}
+            ).execute()
+        except Exception as e:
+            # Fonction SQL absente (migration non appliquée): lecture/écriture
+            # par lien, toujours agrégée sur le lot
+            logger.warning(f"RPC increment_tracking_link_clicks indisponible: {e}")
+            for delta in deltas.values():
+                link = (
+                    supabase.table("tracking_links")
+                    .select("clicks")
+                    .eq("id", delta["link_id"])
+                    .execute()
+                )
+                current_clicks = int(link.data[0].get("clicks") or 0) if link.data else 0
+                supabase.table("tracking_links").update(
+                    {
+                        "clicks": current_clicks + delta["clicks"],
+                        "last_click_at": delta["last_click_at"],
+                    }
+                ).eq("id", delta["link_id"]).execute()
 
     def _generate_attribution_cookie(self, link_id: str, influencer_id: str, click_id: str) -> str:
         """
         Génère la valeur du cookie d'attribution
-        Format: link_id|influencer_id|click_id|timestamp
+        Format: jeton binaire signé HMAC (voir attribution_cookie.py)
         """
-        timestamp = datetime.now().isoformat()
-        cookie_parts = [link_id, influencer_id, click_id, timestamp]
-        return "|".join(cookie_parts)
+        return attribution_signer.encode(
+            link_id=link_id, influencer_id=influencer_id, click_id=click_id
+        )
 
     # ============================================
     # 3. ATTRIBUTION DES VENTES
@@ -211,14 +451,37 @@ class TrackingService:
         """
         Parse le cookie d'attribution
 
+        Les cookies signés sont vérifiés (signature + expiration) sans accès BDD.
+        Les anciens cookies en clair (link_id|influencer_id|click_id|timestamp)
+        sont encore lus pendant la fenêtre d'attribution, avec verified=False.
+
         Returns:
             {
                 "link_id": "uuid",
                 "influencer_id": "uuid",
                 "click_id": "uuid",
-                "timestamp": "2025-10-23T..."
+                "timestamp": "2025-10-23T...",
+                "verified": True
             }
         """
+        if not cookie_value:
+            return None
+
+        if "|" not in cookie_value:
+            claims = attribution_signer.decode(
+                cookie_value, max_age_seconds=COOKIE_EXPIRY_DAYS * 24 * 60 * 60
+            )
+            if not claims:
+                return None
+
+            return {
+                "link_id": claims.link_id,
+                "influencer_id": claims.influencer_id,
+                "click_id": claims.click_id,
+                "timestamp": datetime.fromtimestamp(claims.issued_at).isoformat(),
+                "verified": True,
+            }
+
         try:
             parts = cookie_value.split("|")
             if len(parts) != 4:
@@ -229,6 +492,7 @@ class TrackingService:
                 "influencer_id": parts[1],
                 "click_id": parts[2],
                 "timestamp": parts[3],
+                "verified": False,
             }
         except Exception as e:
             logger.error(f"Erreur parse cookie: {e}")
@@ -256,7 +520,12 @@ class TrackingService:
         if not attribution:
             return None
 
-        # Vérifier que le cookie n'a pas expiré (30 jours)
+        if attribution["verified"]:
+            # Signature valide et non expirée: aucune lecture BDD nécessaire
+            logger.info(f"✅ Attribution trouvée: Influenceur {attribution['influencer_id']}")
+            return attribution
+
+        # Ancien cookie non signé: vérifier l'expiration puis le couple lien/influenceur
         try:
             cookie_timestamp = datetime.fromisoformat(attribution["timestamp"])
             age_days = (datetime.now() - cookie_timestamp).days
@@ -265,6 +534,16 @@ class TrackingService:
                 logger.warning(f"⚠️ Cookie expiré ({age_days} jours)")
                 return None
 
+            link = (
+                supabase.table("tracking_links")
+                .select("influencer_id")
+                .eq("id", attribution["link_id"])
+                .execute()
+            )
+            if not link.data or link.data[0].get("influencer_id") != attribution["influencer_id"]:
+                logger.warning(f"⚠️ Cookie d'attribution non signé invalide: {attribution['link_id']}")
+                return None
+
             logger.info(f"✅ Attribution trouvée: Influenceur {attribution['influencer_id']}")
             return attribution
 
@@ -323,3 +602,9 @@ class TrackingService:
 
 # Instance globale
 tracking_service = TrackingService()
+
+# File d'ingestion des clics (Redis Stream si REDIS_URL est défini, sinon mémoire)
+click_ingestion_queue = ClickIngestionQueue(
+    flush_func=tracking_service.record_clicks_bulk,
+    redis_url=os.getenv("REDIS_URL"),
+)
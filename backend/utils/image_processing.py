@@ -143,7 +143,8 @@ def validate_image(
 def calculate_optimal_quality(
     image: Image.Image,
     target_format: str = 'webp',
-    max_file_size: Optional[int] = None
+    max_file_size: Optional[int] = None,
+    variance: Optional[float] = None
 ) -> int:
     """
     Calcule la qualité optimale pour une image
@@ -152,16 +153,16 @@ def calculate_optimal_quality(
         image: Image PIL
         target_format: Format cible (webp, jpeg, etc.)
         max_file_size: Taille maximale souhaitée en bytes
+        variance: Complexité déjà calculée (image_variance), évite un
+            nouveau passage ImageStat quand on encode plusieurs sorties
 
     Returns:
         Qualité optimale (0-100)
     """
     try:
         # Analyser la complexité de l'image
-        stat = ImageStat.Stat(image)
-
-        # Calculer la variance moyenne (mesure de complexité)
-        variance = sum(stat.var) / len(stat.var) if stat.var else 0
+        if variance is None:
+            variance = image_variance(image)
 
         # Base quality selon le format
         base_quality = {
@@ -198,6 +199,12 @@ def calculate_optimal_quality(
         return 85  # Valeur par défaut
 
 
+def image_variance(image: Image.Image) -> float:
+    """Variance moyenne des canaux (mesure de complexité de l'image)"""
+    stat = ImageStat.Stat(image)
+    return sum(stat.var) / len(stat.var) if stat.var else 0
+
+
 def _find_quality_for_size(
     image: Image.Image,
     format: str,
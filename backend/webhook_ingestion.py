@@ -0,0 +1,166 @@
+"""
+Traitement différé des webhooks e-commerce
+Les endpoints /api/webhook/queue/{source}/{merchant_id} stockent le body
+brut dans webhook_inbox et acquittent ; ce pool de workers le transforme
+en ventes par lots
+
+- N workers concurrents, chacun réserve un lot (FOR UPDATE SKIP LOCKED) :
+  jamais deux workers (ou deux instances) sur le même évènement
+- Réveil immédiat après une mise en file locale, sinon polling toutes les
+  WEBHOOK_POLL_INTERVAL_MS (évènements reçus par une autre instance)
+- Un lot en erreur est remis en file jusqu'à WEBHOOK_MAX_ATTEMPTS tentatives ;
+  un évènement réservé par un worker mort est repris après
+  WEBHOOK_STALE_SECONDS
+- Arrêt propre : les lots en cours sont terminés
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+WEBHOOK_POLL_INTERVAL_MS = int(os.getenv("WEBHOOK_POLL_INTERVAL_MS", "1000"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_STALE_SECONDS = 300
+WEBHOOK_ERROR_BACKOFF = 5.0
+
+
+class WebhookWorkerPool:
+    """Pool de workers asyncio consommant webhook_inbox par lots"""
+
+    def __init__(
+        self,
+        claim_func: Callable[[int, int, int], List[Dict]],
+        process_func: Callable[[List[Dict]], List[Dict]],
+        complete_func: Callable[[List[Dict]], None],
+        workers: int = WEBHOOK_WORKERS,
+        batch_size: int = WEBHOOK_BATCH_SIZE,
+        poll_interval_ms: int = WEBHOOK_POLL_INTERVAL_MS,
+        max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+    ):
+        """
+        Args:
+            claim_func: (limite, délai de reprise en s, tentatives max) -> évènements réservés
+            process_func: évènements -> résultats [{"id", "status", "error_message", "sale_id"}]
+            complete_func: enregistre les résultats d'un lot
+            (fonctions synchrones, exécutées dans un thread)
+        """
+        self.claim_func = claim_func
+        self.process_func = process_func
+        self.complete_func = complete_func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval_ms / 1000
+        self.max_attempts = max_attempts
+
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+        self.stats = {
+            "batches": 0,
+            "processed": 0,
+            "ignored": 0,
+            "failed": 0,
+            "retried": 0,
+            "last_batch_ms": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    # ============================================
+    # CYCLE DE VIE
+    # ============================================
+
+    async def start(self):
+        """Démarre les workers (appelé au démarrage du serveur)"""
+        if self.running or self.workers <= 0:
+            return
+
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(i)) for i in range(self.workers)]
+        logger.info(f"📦 Traitement des webhooks démarré ({self.workers} workers)")
+
+    async def stop(self):
+        """Arrête les workers après leur lot en cours"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+        logger.info(f"🛑 Traitement des webhooks arrêté ({self.stats['processed']} ventes créées)")
+
+    def notify(self):
+        """Réveille un worker (évènement mis en file par cette instance)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ============================================
+    # CONSOMMATION
+    # ============================================
+
+    async def _run(self, worker_id: int):
+        while not self._stopping:
+            try:
+                events = await asyncio.to_thread(
+                    self.claim_func, self.batch_size, WEBHOOK_STALE_SECONDS, self.max_attempts
+                )
+            except Exception as e:
+                logger.error(f"Erreur réservation webhooks (worker {worker_id}): {e}")
+                await asyncio.sleep(WEBHOOK_ERROR_BACKOFF)
+                continue
+
+            if events:
+                await self.run_batch(events)
+                # Lot plein : il en reste probablement, on enchaîne sans attendre
+                if len(events) >= self.batch_size:
+                    continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_batch(self, events: List[Dict]):
+        """Traite un lot réservé et enregistre son issue"""
+        started = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self.process_func, events)
+        except Exception as e:
+            logger.error(f"Erreur traitement de {len(events)} webhooks: {e}")
+            results = [self._retry_result(event, str(e)) for event in events]
+
+        try:
+            await asyncio.to_thread(self.complete_func, results)
+        except Exception as e:
+            # Évènements laissés en 'processing' : repris après WEBHOOK_STALE_SECONDS
+            logger.error(f"Erreur enregistrement du résultat de {len(results)} webhooks: {e}")
+
+        self.stats["batches"] += 1
+        for result in results:
+            key = {"processed": "processed", "ignored": "ignored", "queued": "retried"}.get(result["status"], "failed")
+            self.stats[key] += 1
+        self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _retry_result(self, event: Dict, error: str) -> Dict:
+        exhausted = int(event.get("attempts") or 0) >= self.max_attempts
+        return {
+            "id": event["id"],
+            "status": "failed" if exhausted else "queued",
+            "error_message": error,
+            "sale_id": None,
+        }
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "workers": len(self._tasks), "running": self.running}
@@ -5,15 +5,38 @@ Supporte Shopify, WooCommerce, Stripe, etc.
 
 from fastapi import Request, HTTPException
 from supabase_client import supabase
+from supabase_async import run_sync
+from services.cache_service import cache_engine
+from tracking_service import tracking_service, COOKIE_NAME
+from webhook_ingestion import WebhookWorkerPool
+from realtime_events import EventTypes, publish_events
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+import base64
 import hmac
 import hashlib
 import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+INBOX_TABLE = "webhook_inbox"
+WEBHOOK_MERCHANT_CACHE_TTL = int(os.getenv("WEBHOOK_MERCHANT_CACHE_TTL", "300"))
+
+# Statuts "payé" TikTok Shop (seules ces commandes créent une vente)
+TIKTOK_PAID_STATUSES = (111, 112, 121)
+
+# source -> (champ secret du merchant, header de signature, encodage du HMAC-SHA256)
+WEBHOOK_SIGNATURES = {
+    "shopify": ("shopify_webhook_secret", "x-shopify-hmac-sha256", "base64"),
+    "woocommerce": ("woocommerce_webhook_secret", "x-wc-webhook-signature", "base64"),
+    "tiktok_shop": ("tiktok_app_secret", "x-tiktok-signature", "hex"),
+}
+
+# Headers conservés avec l'évènement (jamais la signature)
+STORED_HEADER_PREFIXES = ("x-shopify-", "x-wc-webhook-", "x-tiktok-")
+
 
 class WebhookService:
     """Service de gestion des webhooks e-commerce"""
@@ -67,7 +90,7 @@ class WebhookService:
             customer_email = order_data.get("email", "")
 
             # 5. Chercher l'attribution (cookie/UTM dans note_attributes)
-            attribution = await self._find_attribution_shopify(order_data)
+            attribution = self._find_attribution_shopify(order_data)
 
             if not attribution:
                 logger.warning(f"⚠️ Pas d'attribution pour commande Shopify #{order_number}")
@@ -126,6 +149,7 @@ class WebhookService:
                 influencer_id=attribution["influencer_id"],
                 amount=total_price,
                 commission=influencer_commission,
+                order_id=order_id,
             )
 
             # 11. Logger le webhook comme traité
@@ -168,10 +192,8 @@ class WebhookService:
                 logger.warning("⚠️ Pas de secret Shopify configuré")
                 return False  # En dev, on pourrait retourner True
 
-            # Calculer le HMAC
-            calculated_hmac = hmac.new(
-                shopify_secret.encode("utf-8"), body, hashlib.sha256
-            ).hexdigest()
+            # Calculer le HMAC (Shopify l'envoie encodé en base64)
+            calculated_hmac = _compute_signature(shopify_secret, body, "base64")
 
             # Comparer avec le header
             return hmac.compare_digest(calculated_hmac, hmac_header)
@@ -180,24 +202,33 @@ class WebhookService:
             logger.error(f"Erreur vérification HMAC: {e}")
             return False
 
-    async def _find_attribution_shopify(self, order_data: Dict) -> Optional[Dict]:
+    def _find_attribution_shopify(self, order_data: Dict) -> Optional[Dict]:
         """
         Trouve l'attribution depuis les données Shopify
         Cherche dans: note_attributes, customer tags, UTM parameters
         """
         try:
-            # Méthode 1: Note attributes (si influenceur a ajouté tracking_code)
             note_attributes = order_data.get("note_attributes", [])
+
+            # Méthode 0: Cookie d'attribution signé recopié dans le panier
+            # (vérification cryptographique, aucune lecture BDD)
+            for attr in note_attributes:
+                if attr.get("name") == COOKIE_NAME:
+                    attribution = self._get_attribution_from_cookie(attr.get("value"))
+                    if attribution:
+                        return attribution
+
+            # Méthode 1: Note attributes (si influenceur a ajouté tracking_code)
             for attr in note_attributes:
                 if attr.get("name") == "tracking_code":
                     short_code = attr.get("value")
-                    return await self._get_attribution_from_code(short_code)
+                    return self._get_attribution_from_code(short_code)
 
             # Méthode 2: Landing site (si contient notre short_code)
             landing_site = order_data.get("landing_site", "")
             if "/r/" in landing_site:
                 short_code = landing_site.split("/r/")[-1].split("?")[0]
-                return await self._get_attribution_from_code(short_code)
+                return self._get_attribution_from_code(short_code)
 
             # Méthode 3: Referring site
             referring_site = order_data.get("referring_site", "")
@@ -205,7 +236,7 @@ class WebhookService:
                 # Extraire le code
                 if "/r/" in referring_site:
                     short_code = referring_site.split("/r/")[-1].split("?")[0]
-                    return await self._get_attribution_from_code(short_code)
+                    return self._get_attribution_from_code(short_code)
 
             # Méthode 4: UTM source (si = influencer_id)
             utm_source = order_data.get("source_name", "")
@@ -219,19 +250,27 @@ class WebhookService:
             logger.error(f"Erreur attribution Shopify: {e}")
             return None
 
-    async def _get_attribution_from_code(self, short_code: str) -> Optional[Dict]:
-        """Récupère l'attribution depuis un short_code"""
+    def _get_attribution_from_cookie(self, cookie_value: Optional[str]) -> Optional[Dict]:
+        """Attribution depuis un cookie signé (les cookies non signés sont ignorés)"""
+        attribution = tracking_service.parse_attribution_cookie(cookie_value)
+        if not attribution or not attribution["verified"]:
+            return None
+
+        return {
+            "influencer_id": attribution["influencer_id"],
+            "link_id": attribution["link_id"],
+            "click_id": attribution["click_id"],
+        }
+
+    def _get_attribution_from_code(self, short_code: str) -> Optional[Dict]:
+        """Récupère l'attribution depuis un short_code (index en mémoire du tracking)"""
         try:
-            link = (
-                supabase.table("tracking_links").select("*").eq("short_code", short_code).execute()
-            )
+            link = tracking_service.resolve_short_code(short_code)
 
-            if not link.data:
+            if not link:
                 return None
 
-            link_data = link.data[0]
-
-            return {"influencer_id": link_data["influencer_id"], "link_id": link_data["id"]}
+            return {"influencer_id": link.influencer_id, "link_id": link.link_id}
         except Exception as e:
             logger.error(f"Erreur récupération attribution: {e}")
             return None
@@ -258,7 +297,7 @@ class WebhookService:
             currency = order_data.get("currency", "EUR")
 
             # Attribution depuis meta_data
-            attribution = await self._find_attribution_woocommerce(order_data)
+            attribution = self._find_attribution_woocommerce(order_data)
 
             if not attribution:
                 return await self._log_webhook(
@@ -294,6 +333,13 @@ class WebhookService:
             sale_result = supabase.table("sales").insert(sale_data).execute()
             sale_id = sale_result.data[0]["id"]
 
+            await self._notify_influencer_sale(
+                influencer_id=attribution["influencer_id"],
+                amount=total,
+                commission=influencer_commission,
+                order_id=order_id,
+            )
+
             await self._log_webhook(
                 source="woocommerce",
                 merchant_id=merchant_id,
@@ -312,15 +358,21 @@ class WebhookService:
             logger.error(f"Erreur webhook WooCommerce: {e}")
             return {"success": False, "error": str(e)}
 
-    async def _find_attribution_woocommerce(self, order_data: Dict) -> Optional[Dict]:
+    def _find_attribution_woocommerce(self, order_data: Dict) -> Optional[Dict]:
         """Trouve l'attribution dans les meta_data WooCommerce"""
         try:
             meta_data = order_data.get("meta_data", [])
 
+            for meta in meta_data:
+                if meta.get("key") == f"_{COOKIE_NAME}":
+                    attribution = self._get_attribution_from_cookie(meta.get("value"))
+                    if attribution:
+                        return attribution
+
             for meta in meta_data:
                 if meta.get("key") == "_tracking_code":
                     short_code = meta.get("value")
-                    return await self._get_attribution_from_code(short_code)
+                    return self._get_attribution_from_code(short_code)
 
             return None
         except Exception as e:
@@ -400,7 +452,7 @@ class WebhookService:
             customer_name = buyer_info.get("name", "")
 
             # Chercher l'attribution
-            attribution = await self._find_attribution_tiktok(data)
+            attribution = self._find_attribution_tiktok(data)
 
             if not attribution:
                 logger.warning(f"⚠️ Pas d'attribution pour commande TikTok #{order_id}")
@@ -464,6 +516,7 @@ class WebhookService:
                 influencer_id=attribution["influencer_id"],
                 amount=total_amount,
                 commission=influencer_commission,
+                order_id=order_id,
             )
 
             # Logger le webhook comme traité
@@ -522,7 +575,7 @@ class WebhookService:
             logger.error(f"Erreur vérification signature TikTok: {e}")
             return False
 
-    async def _find_attribution_tiktok(self, order_data: Dict) -> Optional[Dict]:
+    def _find_attribution_tiktok(self, order_data: Dict) -> Optional[Dict]:
         """
         Trouve l'attribution depuis les données TikTok Shop
 
@@ -538,7 +591,7 @@ class WebhookService:
                 creator_id = creator_info.get("creator_id")
                 # Mapper creator_id TikTok → influencer_id
                 # Vous devez stocker cette relation dans la BDD
-                influencer = await self._get_influencer_by_tiktok_id(creator_id)
+                influencer = self._get_influencer_by_tiktok_id(creator_id)
                 if influencer:
                     return {"influencer_id": influencer["id"], "source": "tiktok_creator"}
 
@@ -548,7 +601,7 @@ class WebhookService:
                 promo_code = promo.get("promotion_code", "")
                 # Si le code promo contient un tracking_code
                 if promo_code:
-                    attribution = await self._get_attribution_from_code(promo_code)
+                    attribution = self._get_attribution_from_code(promo_code)
                     if attribution:
                         return attribution
 
@@ -559,13 +612,13 @@ class WebhookService:
 
             # Si utm_source = notre short_code
             if utm_source:
-                attribution = await self._get_attribution_from_code(utm_source)
+                attribution = self._get_attribution_from_code(utm_source)
                 if attribution:
                     return attribution
 
             # Si utm_campaign = notre short_code
             if utm_campaign:
-                attribution = await self._get_attribution_from_code(utm_campaign)
+                attribution = self._get_attribution_from_code(utm_campaign)
                 if attribution:
                     return attribution
 
@@ -574,7 +627,7 @@ class WebhookService:
             if "TRACK:" in order_note:
                 # Format: "TRACK:ABC12345"
                 short_code = order_note.split("TRACK:")[1].split()[0]
-                return await self._get_attribution_from_code(short_code)
+                return self._get_attribution_from_code(short_code)
 
             return None
 
@@ -582,7 +635,7 @@ class WebhookService:
             logger.error(f"Erreur attribution TikTok: {e}")
             return None
 
-    async def _get_influencer_by_tiktok_id(self, tiktok_creator_id: str) -> Optional[Dict]:
+    def _get_influencer_by_tiktok_id(self, tiktok_creator_id: str) -> Optional[Dict]:
         """Récupère un influenceur par son TikTok Creator ID"""
         try:
             # Chercher dans la table influencers
@@ -610,28 +663,67 @@ class WebhookService:
         except:
             return {}
 
+    def _get_merchant_cached(self, merchant_id: str) -> Dict:
+        """
+        Merchant (taux de commission, secrets webhook) en cache mémoire local
+
+        Jamais en Redis : la ligne contient les secrets de signature
+        """
+        def load():
+            result = supabase.table("merchants").select("*").eq("id", merchant_id).execute()
+            return result.data[0] if result.data else {}
+
+        return cache_engine.get_or_load(
+            f"webhook_merchant:{merchant_id}",
+            load,
+            ttl=WEBHOOK_MERCHANT_CACHE_TTL,
+            use_l2=False,
+        )
+
     async def _increment_link_conversion(self, link_id: str, revenue: float):
         """Incrémente les conversions d'un lien"""
+        self._increment_link_conversions({link_id: (1, revenue)})
+
+    def _increment_link_conversions(self, deltas: Dict[str, Tuple[int, float]]):
+        """
+        Incréments agrégés par lien ({link_id: (conversions, revenue)}) appliqués
+        atomiquement par la RPC increment_link_conversions
+        """
+        if not deltas:
+            return
+        payload = [
+            {"link_id": link_id, "conversions": conversions, "revenue": round(revenue, 2)}
+            for link_id, (conversions, revenue) in deltas.items()
+        ]
+        try:
+            supabase.rpc("increment_link_conversions", {"p_deltas": payload}).execute()
+            return
+        except Exception as e:
+            # Migration add_webhook_inbox.sql non appliquée
+            logger.warning(f"⚠️ RPC increment_link_conversions indisponible: {e}")
+
         try:
-            link = (
+            links = (
                 supabase.table("tracking_links")
-                .select("conversions, revenue")
-                .eq("id", link_id)
+                .select("id, conversions, revenue")
+                .in_("id", list(deltas))
                 .execute()
             )
-
-            if link.data:
-                current_conversions = int(link.data[0].get("conversions", 0))
-                current_revenue = float(link.data[0].get("revenue", 0))
-
+            for link in links.data or []:
+                conversions, revenue = deltas[link["id"]]
                 supabase.table("tracking_links").update(
-                    {"conversions": current_conversions + 1, "revenue": current_revenue + revenue}
-                ).eq("id", link_id).execute()
+                    {
+                        "conversions": int(link.get("conversions") or 0) + conversions,
+                        "revenue": float(link.get("revenue") or 0) + revenue,
+                    }
+                ).eq("id", link["id"]).execute()
         except Exception as e:
             logger.error(f"Erreur incrémentation conversion: {e}")
 
-    async def _notify_influencer_sale(self, influencer_id: str, amount: float, commission: float):
-        """Envoie une notification à l'influenceur"""
+    async def _notify_influencer_sale(
+        self, influencer_id: str, amount: float, commission: float, order_id: Optional[str] = None
+    ):
+        """Envoie une notification à l'influenceur et pousse sale_created à ses dashboards"""
         try:
             # Récupérer le user_id de l'influenceur
             influencer = (
@@ -656,6 +748,11 @@ class WebhookService:
 
             supabase.table("notifications").insert(notification_data).execute()
 
+            # Push temps réel vers les dashboards ouverts
+            publish_events(
+                [(user_id, EventTypes.SALE_CREATED, {"order_id": order_id, "amount": amount, "commission": commission})]
+            )
+
             logger.info(f"📧 Notification envoyée à influenceur {influencer_id}")
 
         except Exception as e:
@@ -694,6 +791,322 @@ class WebhookService:
             logger.error(f"Erreur log webhook: {e}")
             return {}
 
+    # ============================================
+    # 4. INGESTION EN FILE (webhook_inbox)
+    # ============================================
+
+    async def enqueue_webhook(self, source: str, request: Request, merchant_id: str) -> Dict:
+        """
+        Vérifie la signature, stocke le body brut et acquitte immédiatement
+
+        Le traitement (attribution, vente, compteurs, notification) est fait
+        par lots par WebhookWorkerPool (webhook_ingestion.py). La clé de
+        déduplication (source + merchant + id de commande externe) absorbe les
+        renvois de la plateforme : un doublon est acquitté sans être rejoué
+
+        Returns:
+            {"accepted": bool, "duplicate": bool, "event_id"?, "reason"?}
+
+        Raises:
+            HTTPException: 400 source inconnue ou body illisible, 401 signature invalide
+        """
+        if source not in WEBHOOK_SIGNATURES:
+            raise HTTPException(status_code=400, detail=f"Unknown webhook source: {source}")
+
+        body = await request.body()
+        headers = dict(request.headers)
+
+        merchant = await run_sync(self._get_merchant_cached, merchant_id)
+        if not self._verify_signature(source, body, headers, merchant):
+            logger.warning(f"⚠️ Signature {source} invalide (merchant {merchant_id})")
+            raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+        dedup_key, event_type, ignore_reason = self._event_identity(source, payload, headers)
+        if ignore_reason:
+            return {"accepted": False, "duplicate": False, "reason": ignore_reason}
+
+        event = {
+            "source": source,
+            "merchant_id": merchant_id,
+            "dedup_key": dedup_key,
+            "event_type": event_type,
+            "body": body.decode("utf-8"),
+            "headers": {k: v for k, v in headers.items() if k.startswith(STORED_HEADER_PREFIXES)
+                        and k != WEBHOOK_SIGNATURES[source][1]},
+        }
+        result = await run_sync(
+            lambda: supabase.table(INBOX_TABLE)
+            .upsert(event, on_conflict="source,merchant_id,dedup_key", ignore_duplicates=True)
+            .execute()
+        )
+
+        if not result.data:
+            return {"accepted": True, "duplicate": True}
+        return {"accepted": True, "duplicate": False, "event_id": result.data[0]["id"]}
+
+    def _verify_signature(self, source: str, body: bytes, headers: Dict, merchant: Dict) -> bool:
+        secret_field, header, encoding = WEBHOOK_SIGNATURES[source]
+        secret = merchant.get(secret_field)
+        if not secret:
+            logger.warning(f"⚠️ Pas de secret {source} configuré")
+            return False
+        return hmac.compare_digest(_compute_signature(secret, body, encoding), headers.get(header, ""))
+
+    def _event_identity(
+        self, source: str, payload: Dict, headers: Dict
+    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """(clé de déduplication, type d'évènement, raison d'ignorer)"""
+        if source == "tiktok_shop":
+            data = payload.get("data") or {}
+            order_id = data.get("order_id")
+            # Les changements de statut non payés ne créent rien : pas de mise en file,
+            # sinon ils occuperaient la clé de la commande avant son paiement
+            if data.get("order_status") not in TIKTOK_PAID_STATUSES:
+                return None, None, f"Order status {data.get('order_status')} not paid yet"
+            event_type = payload.get("type")
+        elif source == "shopify":
+            order_id = payload.get("id")
+            event_type = headers.get("x-shopify-topic", "orders/create")
+        else:
+            order_id = payload.get("id")
+            event_type = headers.get("x-wc-webhook-topic", "order.created")
+
+        if order_id in (None, ""):
+            return None, None, "No order id"
+        return str(order_id), event_type, None
+
+    def claim_inbox_events(self, limit: int, stale_seconds: int, max_attempts: int) -> List[Dict]:
+        """
+        Réserve un lot d'évènements à traiter (RPC claim_webhook_events)
+
+        Un évènement abandonné par un worker n'est repris que tant qu'il lui
+        reste des tentatives ; au-delà il passe en 'failed'
+        """
+        result = supabase.rpc(
+            "claim_webhook_events",
+            {"p_limit": limit, "p_stale_seconds": stale_seconds, "p_max_attempts": max_attempts},
+        ).execute()
+        return result.data or []
+
+    def complete_inbox_events(self, results: List[Dict]):
+        """Enregistre l'issue d'un lot en une requête (RPC complete_webhook_events)"""
+        if results:
+            supabase.rpc("complete_webhook_events", {"p_results": results}).execute()
+
+    def process_inbox_batch(self, events: List[Dict]) -> List[Dict]:
+        """
+        Transforme un lot d'évènements en ventes
+
+        - Merchants lus depuis le cache local (taux de commission)
+        - Commandes déjà enregistrées (ex: reçues par l'ancien endpoint) non recréées
+        - Un INSERT multi-lignes des ventes, un incrément agrégé par lien,
+          un INSERT multi-lignes des notifications
+
+        Une erreur sur l'INSERT des ventes fait échouer tout le lot (rejoué
+        par le worker) ; les évènements individuellement invalides sont
+        marqués sans bloquer les autres
+
+        Returns:
+            [{"id", "status", "error_message", "sale_id"}] (un par évènement)
+        """
+        results: Dict[str, Dict] = {}
+        pending: List[Tuple[Dict, Dict]] = []
+
+        for event in events:
+            try:
+                order = self._normalize_order(event["source"], json.loads(event["body"]))
+            except (ValueError, TypeError, AttributeError) as e:
+                results[event["id"]] = _event_result(event, "failed", f"Invalid payload: {e}")
+                continue
+
+            if not order["attribution"]:
+                results[event["id"]] = _event_result(event, "ignored", "No attribution found")
+                continue
+
+            merchant = self._get_merchant_cached(event["merchant_id"])
+            pending.append((event, self._build_sale(event, order, merchant)))
+
+        if pending:
+            existing = self._existing_sales(sale for _, sale in pending)
+            to_insert = []
+            for event, sale in pending:
+                sale_id = existing.get((sale["merchant_id"], sale["external_order_id"]))
+                if sale_id:
+                    results[event["id"]] = _event_result(event, "processed", "Duplicate order", sale_id)
+                else:
+                    to_insert.append((event, sale))
+
+            if to_insert:
+                inserted = supabase.table("sales").insert([sale for _, sale in to_insert]).execute()
+                link_deltas: Dict[str, Tuple[int, float]] = {}
+                for (event, sale), row in zip(to_insert, inserted.data or []):
+                    results[event["id"]] = _event_result(event, "processed", sale_id=row["id"])
+                    if sale.get("link_id"):
+                        conversions, revenue = link_deltas.get(sale["link_id"], (0, 0.0))
+                        link_deltas[sale["link_id"]] = (conversions + 1, revenue + sale["amount"])
+
+                self._increment_link_conversions(link_deltas)
+                self._notify_influencers_sales([sale for _, sale in to_insert])
+
+        return [results[event["id"]] for event in events if event["id"] in results]
+
+    def _normalize_order(self, source: str, payload: Dict) -> Dict:
+        """Champs communs d'une commande, quelle que soit la plateforme"""
+        if source == "tiktok_shop":
+            data = payload.get("data") or {}
+            buyer_info = data.get("buyer_info") or {}
+            payment_info = data.get("payment") or {}
+            return {
+                "order_id": str(data.get("order_id")),
+                "order_number": str(data.get("order_id")),
+                "amount": float(payment_info.get("total_amount", 0)) / 100,  # centimes
+                "currency": payment_info.get("currency", "USD"),
+                "customer_email": buyer_info.get("email", ""),
+                "metadata": {
+                    "order_status": data.get("order_status"),
+                    "customer_name": buyer_info.get("name", ""),
+                },
+                "attribution": self._find_attribution_tiktok(data),
+            }
+
+        if source == "shopify":
+            return {
+                "order_id": str(payload.get("id")),
+                "order_number": payload.get("order_number"),
+                "amount": float(payload.get("total_price", 0)),
+                "currency": payload.get("currency", "EUR"),
+                "customer_email": payload.get("email", ""),
+                "metadata": {},
+                "attribution": self._find_attribution_shopify(payload),
+            }
+
+        billing = payload.get("billing") or {}
+        return {
+            "order_id": str(payload.get("id")),
+            "order_number": payload.get("number"),
+            "amount": float(payload.get("total", 0)),
+            "currency": payload.get("currency", "EUR"),
+            "customer_email": billing.get("email", ""),
+            "metadata": {},
+            "attribution": self._find_attribution_woocommerce(payload),
+        }
+
+    def _build_sale(self, event: Dict, order: Dict, merchant: Dict) -> Dict:
+        """Ligne `sales` d'une commande (mêmes calculs que le traitement direct)"""
+        influencer_commission_rate = merchant.get("influencer_commission_rate", 10.0)
+        platform_commission_rate = merchant.get("platform_commission_rate", 5.0)
+
+        amount = order["amount"]
+        influencer_commission = amount * (influencer_commission_rate / 100)
+        platform_commission = amount * (platform_commission_rate / 100)
+        attribution = order["attribution"]
+
+        return {
+            "merchant_id": event["merchant_id"],
+            "influencer_id": attribution["influencer_id"],
+            "link_id": attribution.get("link_id"),
+            "click_id": attribution.get("click_id"),
+            "product_id": None,
+            "amount": amount,
+            "currency": order["currency"],
+            "influencer_commission": influencer_commission,
+            "platform_commission": platform_commission,
+            "merchant_revenue": amount - influencer_commission - platform_commission,
+            "status": "pending",  # En attente validation (14 jours)
+            "payment_status": "pending",
+            "external_order_id": order["order_id"],
+            "external_order_number": order["order_number"],
+            "customer_email": order["customer_email"],
+            # Le payload brut reste dans webhook_inbox : référencé, pas recopié
+            "metadata": {"source": event["source"], "webhook_event_id": event["id"], **order["metadata"]},
+            "created_at": datetime.now().isoformat(),
+        }
+
+    def _existing_sales(self, sales: Iterable[Dict]) -> Dict[Tuple[str, str], str]:
+        """Ventes déjà présentes pour ces commandes : {(merchant_id, external_order_id): sale_id}"""
+        by_merchant: Dict[str, List[str]] = {}
+        for sale in sales:
+            by_merchant.setdefault(sale["merchant_id"], []).append(sale["external_order_id"])
+
+        existing = {}
+        for merchant_id, order_ids in by_merchant.items():
+            result = (
+                supabase.table("sales")
+                .select("id, external_order_id")
+                .eq("merchant_id", merchant_id)
+                .in_("external_order_id", order_ids)
+                .execute()
+            )
+            for row in result.data or []:
+                existing[(merchant_id, row["external_order_id"])] = row["id"]
+        return existing
+
+    def _notify_influencers_sales(self, sales: List[Dict]):
+        """Notifications de vente d'un lot : une lecture des influenceurs, un insert"""
+        try:
+            influencer_ids = list({sale["influencer_id"] for sale in sales})
+            influencers = (
+                supabase.table("influencers").select("id, user_id").in_("id", influencer_ids).execute()
+            )
+            user_ids = {row["id"]: row["user_id"] for row in influencers.data or []}
+
+            now = datetime.now().isoformat()
+            notifications = [
+                {
+                    "user_id": user_ids[sale["influencer_id"]],
+                    "type": "sale",
+                    "title": "🎉 Nouvelle vente !",
+                    "message": f"Vous avez généré une vente de {sale['amount']}€. "
+                               f"Commission: {sale['influencer_commission']}€ (validation dans 14 jours)",
+                    "is_read": False,
+                    "metadata": {"amount": sale["amount"], "commission": sale["influencer_commission"]},
+                    "created_at": now,
+                }
+                for sale in sales
+                if sale["influencer_id"] in user_ids
+            ]
+            if notifications:
+                supabase.table("notifications").insert(notifications).execute()
+
+            # Push temps réel vers les dashboards ouverts
+            publish_events(
+                (
+                    user_ids[sale["influencer_id"]],
+                    EventTypes.SALE_CREATED,
+                    {
+                        "order_id": sale["external_order_id"],
+                        "amount": sale["amount"],
+                        "commission": sale["influencer_commission"],
+                    },
+                )
+                for sale in sales
+                if sale["influencer_id"] in user_ids
+            )
+        except Exception as e:
+            logger.error(f"Erreur notification: {e}")
+
+
+def _compute_signature(secret: str, body: bytes, encoding: str) -> str:
+    """HMAC-SHA256 du body, encodé comme l'envoie la plateforme (hex ou base64)"""
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode() if encoding == "base64" else digest.hex()
+
+
+def _event_result(event: Dict, status: str, error: Optional[str] = None, sale_id: Optional[str] = None) -> Dict:
+    return {"id": event["id"], "status": status, "error_message": error, "sale_id": sale_id}
+
 
 # Instance globale
 webhook_service = WebhookService()
+
+# Workers du mode file (démarrés avec le serveur)
+webhook_worker_pool = WebhookWorkerPool(
+    claim_func=webhook_service.claim_inbox_events,
+    process_func=webhook_service.process_inbox_batch,
+    complete_func=webhook_service.complete_inbox_events,
+)
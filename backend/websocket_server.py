@@ -1,28 +1,34 @@
 """
 WebSocket server for real-time notifications
 Handles commission alerts, payment status updates, and live dashboard updates
+
+Events are pushed, not polled: producers publish to a Redis pub/sub channel
+(realtime_events.py) and every server process fans them out to its own
+connections through per-connection bounded send queues (realtime_hub.py).
+Run as many processes as needed behind the load balancer.
 """
 
 import asyncio
 import json
+import os
 from datetime import datetime
-from typing import Dict, Set
 from aiohttp import web, WSMsgType
 import aiohttp_cors
-from supabase_client import get_supabase
+import redis.asyncio as aioredis
 
-# Connected clients by user_id
-connected_clients: Dict[str, Set[web.WebSocketResponse]] = {}
+from realtime_events import (
+    REALTIME_CHANNEL,
+    BROADCAST_TARGET,
+    EventTypes,
+    encode_frame,
+)
+from realtime_hub import ConnectionHub
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+LISTENER_RETRY_DELAY = 2.0
 
-# Event types
-class EventTypes:
-    COMMISSION_CREATED = "commission_created"
-    COMMISSION_UPDATED = "commission_updated"
-    PAYMENT_CREATED = "payment_created"
-    PAYMENT_STATUS_CHANGED = "payment_status_changed"
-    SALE_CREATED = "sale_created"
-    DASHBOARD_UPDATE = "dashboard_update"
+# Connected clients by user_id (local to this process)
+hub = ConnectionHub()
 
 
 async def websocket_handler(request):
@@ -30,7 +36,7 @@ async def websocket_handler(request):
     ws = web.WebSocketResponse()
     await ws.prepare(request)
 
-    user_id = None
+    connection = None
 
     try:
         async for msg in ws:
@@ -41,26 +47,26 @@ async def websocket_handler(request):
                     # Handle authentication
                     if data.get("type") == "auth":
                         user_id = data.get("user_id")
-                        if user_id:
-                            if user_id not in connected_clients:
-                                connected_clients[user_id] = set()
-                            connected_clients[user_id].add(ws)
+                        if user_id and connection is None:
+                            connection = hub.register(ws, str(user_id))
 
                             # Send confirmation
-                            await ws.send_json(
+                            connection.enqueue(json.dumps(
                                 {
                                     "type": "auth_success",
                                     "message": "Authenticated successfully",
                                     "timestamp": datetime.now().isoformat(),
                                 }
-                            )
+                            ))
                             print(f"User {user_id} connected")
 
                     # Handle ping/pong for keepalive
                     elif data.get("type") == "ping":
-                        await ws.send_json(
-                            {"type": "pong", "timestamp": datetime.now().isoformat()}
-                        )
+                        pong = json.dumps({"type": "pong", "timestamp": datetime.now().isoformat()})
+                        if connection is not None:
+                            connection.enqueue(pong)
+                        else:
+                            await ws.send_str(pong)
 
                 except json.JSONDecodeError:
                     await ws.send_json({"type": "error", "message": "Invalid JSON"})
@@ -70,110 +76,59 @@ async def websocket_handler(request):
 
     finally:
         # Clean up on disconnect
-        if user_id and user_id in connected_clients:
-            connected_clients[user_id].discard(ws)
-            if not connected_clients[user_id]:
-                del connected_clients[user_id]
-            print(f"User {user_id} disconnected")
+        if connection is not None:
+            await hub.unregister(connection)
+            print(f"User {connection.user_id} disconnected")
 
     return ws
 
 
 async def broadcast_to_user(user_id: str, event_type: str, data: dict):
-    """Send event to specific user"""
-    if user_id not in connected_clients:
-        return
-
-    message = {"type": event_type, "data": data, "timestamp": datetime.now().isoformat()}
-
-    # Send to all connections for this user
-    disconnected = set()
-    for ws in connected_clients[user_id]:
-        try:
-            await ws.send_json(message)
-        except Exception as e:
-            print(f"Error sending to user {user_id}: {e}")
-            disconnected.add(ws)
-
-    # Clean up disconnected clients
-    for ws in disconnected:
-        connected_clients[user_id].discard(ws)
+    """Send event to specific user (connections of this process only)"""
+    hub.deliver(str(user_id), encode_frame(event_type, data))
 
 
 async def broadcast_to_all(event_type: str, data: dict):
-    """Send event to all connected users"""
-    message = {"type": event_type, "data": data, "timestamp": datetime.now().isoformat()}
-
-    for user_id in list(connected_clients.keys()):
-        disconnected = set()
-        for ws in connected_clients[user_id]:
-            try:
-                await ws.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting to user {user_id}: {e}")
-                disconnected.add(ws)
-
-        # Clean up disconnected clients
-        for ws in disconnected:
-            connected_clients[user_id].discard(ws)
+    """Send event to all connected users (serialized once, queued per connection)"""
+    hub.deliver(BROADCAST_TARGET, encode_frame(event_type, data))
 
 
-async def listen_to_database_changes():
-    """Listen to Supabase realtime changes (simulated with polling)"""
-    supabase = get_supabase()
-    last_check = datetime.now()
+async def listen_to_events():
+    """
+    Subscribe to the realtime channel and fan events out to local connections
 
+    Reconnects after a Redis failure; events published while disconnected
+    are lost (clients reload their state on reconnect)
+    """
     while True:
+        client = aioredis.from_url(REDIS_URL, decode_responses=True)
+        pubsub = client.pubsub()
         try:
-            # Check for new commissions
-            response = (
-                supabase.table("commissions")
-                .select("*")
-                .gte("created_at", last_check.isoformat())
-                .execute()
-            )
-
-            for commission in response.data:
-                affiliate_id = commission.get("affiliate_id")
-                if affiliate_id:
-                    await broadcast_to_user(
-                        str(affiliate_id),
-                        EventTypes.COMMISSION_CREATED,
-                        {
-                            "commission_id": commission["id"],
-                            "amount": commission["amount"],
-                            "sale_id": commission["sale_id"],
-                        },
-                    )
-
-            # Check for payment status changes
-            response = (
-                supabase.table("payments")
-                .select("*")
-                .gte("updated_at", last_check.isoformat())
-                .execute()
-            )
-
-            for payment in response.data:
-                affiliate_id = payment.get("affiliate_id")
-                if affiliate_id:
-                    await broadcast_to_user(
-                        str(affiliate_id),
-                        EventTypes.PAYMENT_STATUS_CHANGED,
-                        {
-                            "payment_id": payment["id"],
-                            "status": payment["status"],
-                            "amount": payment["amount"],
-                        },
-                    )
-
-            last_check = datetime.now()
-
+            await pubsub.subscribe(REALTIME_CHANNEL)
+            print(f"Listening to {REALTIME_CHANNEL}")
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    hub.deliver_envelope(message["data"])
+                except ValueError as e:
+                    print(f"Malformed realtime event: {e}")
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"Error listening to database: {e}")
+            print(f"Realtime listener error, retrying: {e}")
+            await asyncio.sleep(LISTENER_RETRY_DELAY)
+        finally:
+            try:
+                await pubsub.close()
+                await client.close()
+            except Exception:
+                pass
+
 
-        # Check every 5 seconds
-        await asyncio.sleep(5)
+async def stats_handler(request):
+    """Fan-out counters of this process"""
+    return web.json_response(hub.get_stats())
 
 
 async def init_app():
@@ -192,13 +147,15 @@ async def init_app():
 
     # Add WebSocket route
     app.router.add_get("/ws", websocket_handler)
+    app.router.add_get("/ws/stats", stats_handler)
 
     # Configure CORS on all routes
     for route in list(app.router.routes()):
         cors.add(route)
 
-    # Start database listener
-    app["db_listener"] = asyncio.create_task(listen_to_database_changes())
+    # Start realtime event listener
+    app["db_listener"] = asyncio.create_task(listen_to_events())
+    app.on_cleanup.append(cleanup)
 
     return app
 
@@ -213,9 +170,7 @@ async def cleanup(app):
             pass
 
     # Close all WebSocket connections
-    for user_id in list(connected_clients.keys()):
-        for ws in connected_clients[user_id]:
-            await ws.close()
+    await hub.close_all()
 
 
 if __name__ == "__main__":
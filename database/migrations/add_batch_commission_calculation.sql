@@ -0,0 +1,73 @@
+-- =============================================================================
+-- Migration: Batched commission calculation
+-- Description: Computes the commissions of a chunk of unpaid conversions in a
+--              single transaction: set-based amount computation, one
+--              multi-row insert into commissions and one update marking the
+--              conversions paid. Used by services/commission_engine.py
+--              (Celery task calculate_commissions).
+-- Date: 2026-10-17
+-- =============================================================================
+
+ALTER TABLE conversions ADD COLUMN IF NOT EXISTS commission_paid BOOLEAN NOT NULL DEFAULT FALSE;
+
+ALTER TABLE commissions ADD COLUMN IF NOT EXISTS conversion_id UUID REFERENCES conversions(id) ON DELETE CASCADE;
+ALTER TABLE commissions ADD COLUMN IF NOT EXISTS merchant_id UUID;
+
+-- One commission per conversion, whatever happens to the runs
+CREATE UNIQUE INDEX IF NOT EXISTS idx_commissions_conversion_unique
+    ON commissions (conversion_id)
+    WHERE conversion_id IS NOT NULL;
+
+-- Keyset scan of the backlog (ORDER BY id on unpaid rows only)
+CREATE INDEX IF NOT EXISTS idx_conversions_commission_unpaid
+    ON conversions (id)
+    WHERE commission_paid = FALSE;
+
+
+CREATE OR REPLACE FUNCTION calculate_commissions_batch(
+    p_conversion_ids UUID[]
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_processed INTEGER;
+    v_total_amount NUMERIC;
+    v_commissions JSONB;
+BEGIN
+    -- Only conversions still unpaid are processed: re-running a chunk is a no-op
+    WITH locked AS (
+        SELECT id
+        FROM conversions
+        WHERE id = ANY(p_conversion_ids)
+          AND commission_paid = FALSE
+        FOR UPDATE SKIP LOCKED
+    ), updated AS (
+        UPDATE conversions AS c
+        SET commission_paid = TRUE
+        FROM locked
+        WHERE c.id = locked.id
+        RETURNING
+            c.id,
+            c.influencer_id,
+            c.merchant_id,
+            ROUND(COALESCE(c.order_amount, 0) * COALESCE(c.commission_rate, 0) / 100, 2) AS amount
+    ), inserted AS (
+        INSERT INTO commissions (conversion_id, influencer_id, merchant_id, amount, status, created_at)
+        SELECT id, influencer_id, merchant_id, amount, 'pending', NOW()
+        FROM updated
+        ON CONFLICT (conversion_id) WHERE conversion_id IS NOT NULL DO NOTHING
+        RETURNING id, conversion_id, influencer_id, amount
+    )
+    SELECT
+        (SELECT COUNT(*) FROM updated),
+        COALESCE((SELECT SUM(amount) FROM inserted), 0),
+        -- Created rows, pushed to the influencers' dashboards (commission_created)
+        COALESCE((SELECT jsonb_agg(to_jsonb(inserted)) FROM inserted), '[]'::jsonb)
+    INTO v_processed, v_total_amount, v_commissions;
+
+    RETURN jsonb_build_object(
+        'processed', v_processed,
+        'total_amount', v_total_amount,
+        'commissions', v_commissions
+    );
+END;
+$$ LANGUAGE plpgsql;
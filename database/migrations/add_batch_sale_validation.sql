@@ -0,0 +1,97 @@
+-- =============================================================================
+-- Migration: Batched sale validation
+-- Description: Validates a chunk of pending sales in a single transaction:
+--              status update, commission inserts and aggregated balance /
+--              link deltas. Adds a checkpoint table so long batch jobs can
+--              resume after a crash.
+-- Date: 2026-10-17
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS batch_job_checkpoints (
+    job_name TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'running',     -- running | completed
+    cursor JSONB NOT NULL DEFAULT '{}'::jsonb,  -- last processed position
+    params JSONB NOT NULL DEFAULT '{}'::jsonb,  -- run parameters (cutoff...)
+    processed INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sales_pending_created_id
+    ON sales (created_at, id)
+    WHERE status = 'pending';
+
+
+CREATE OR REPLACE FUNCTION validate_sales_batch(
+    p_sale_ids UUID[]
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_validated INTEGER;
+    v_total_commission NUMERIC;
+    v_influencers INTEGER;
+BEGIN
+    CREATE TEMP TABLE _validated_sales (
+        id UUID,
+        influencer_id UUID,
+        link_id UUID,
+        commission NUMERIC
+    ) ON COMMIT DROP;
+
+    -- Only sales still pending are validated: re-running a chunk is a no-op
+    WITH locked AS (
+        SELECT id
+        FROM sales
+        WHERE id = ANY(p_sale_ids)
+          AND status = 'pending'
+        FOR UPDATE SKIP LOCKED
+    ), updated AS (
+        UPDATE sales AS s
+        SET
+            status = 'completed',
+            payment_status = 'pending',
+            payment_processed_at = NULL
+        FROM locked
+        WHERE s.id = locked.id
+        RETURNING s.id, s.influencer_id, s.link_id, COALESCE(s.influencer_commission, 0)
+    )
+    INSERT INTO _validated_sales (id, influencer_id, link_id, commission)
+    SELECT * FROM updated;
+
+    INSERT INTO commissions (sale_id, influencer_id, amount, currency, status, approved_at)
+    SELECT id, influencer_id, commission, 'EUR', 'approved', NOW()
+    FROM _validated_sales;
+
+    UPDATE influencers AS i
+    SET
+        balance = COALESCE(i.balance, 0) + d.total,
+        total_earnings = COALESCE(i.total_earnings, 0) + d.total,
+        updated_at = NOW()
+    FROM (
+        SELECT influencer_id, SUM(commission) AS total
+        FROM _validated_sales
+        GROUP BY influencer_id
+    ) AS d
+    WHERE i.id = d.influencer_id;
+
+    UPDATE trackable_links AS l
+    SET total_commission = COALESCE(l.total_commission, 0) + d.total
+    FROM (
+        SELECT link_id, SUM(commission) AS total
+        FROM _validated_sales
+        WHERE link_id IS NOT NULL
+        GROUP BY link_id
+    ) AS d
+    WHERE l.id = d.link_id;
+
+    SELECT COUNT(*), COALESCE(SUM(commission), 0), COUNT(DISTINCT influencer_id)
+    INTO v_validated, v_total_commission, v_influencers
+    FROM _validated_sales;
+
+    RETURN jsonb_build_object(
+        'validated', v_validated,
+        'total_commission', v_total_commission,
+        'influencers', v_influencers
+    );
+END;
+$$ LANGUAGE plpgsql;
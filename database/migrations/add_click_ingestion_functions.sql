@@ -0,0 +1,26 @@
+-- =============================================================================
+-- Migration: Batched click ingestion
+-- Description: Atomic, aggregated click counter increments for tracking_links.
+--              Called once per flush of the click ingestion queue with one
+--              delta per link, so concurrent flushes never lose increments.
+-- Date: 2026-10-17
+-- =============================================================================
+
+CREATE OR REPLACE FUNCTION increment_tracking_link_clicks(
+    p_deltas JSONB  -- [{"link_id": "uuid", "clicks": 12, "last_click_at": "..."}]
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE tracking_links AS tl
+    SET
+        clicks = COALESCE(tl.clicks, 0) + d.clicks,
+        last_click_at = GREATEST(COALESCE(tl.last_click_at, d.last_click_at), d.last_click_at)
+    FROM jsonb_to_recordset(p_deltas) AS d(link_id UUID, clicks INTEGER, last_click_at TIMESTAMPTZ)
+    WHERE tl.id = d.link_id;
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
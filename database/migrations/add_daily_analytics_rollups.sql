@@ -0,0 +1,248 @@
+-- =============================================================================
+-- Migration: Incremental daily analytics rollups
+-- Description: Daily fact rows per platform / merchant / influencer / product /
+--              link (clicks, unique clicks, conversions, revenue, commissions),
+--              refreshed by the aggregate_daily_analytics Celery task.
+--              Each refresh only recomputes the days touched by source rows
+--              written since the previous high-water mark, so late-arriving
+--              or corrected rows land in the right day.
+-- Date: 2026-10-17
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS analytics_daily_facts (
+    dimension TEXT NOT NULL CHECK (dimension IN ('platform', 'merchant', 'influencer', 'product', 'link')),
+    dimension_id TEXT NOT NULL,  -- '*' for platform
+    day DATE NOT NULL,
+
+    clicks INTEGER NOT NULL DEFAULT 0,
+    unique_clicks INTEGER NOT NULL DEFAULT 0,
+    conversions INTEGER NOT NULL DEFAULT 0,   -- sales not refunded / cancelled
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    commissions NUMERIC(14, 2) NOT NULL DEFAULT 0,
+
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (dimension, dimension_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_analytics_daily_facts_day
+    ON analytics_daily_facts (day);
+
+
+-- Refresh state: everything written up to high_water_mark is rolled up
+CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+    job_name TEXT PRIMARY KEY,
+    high_water_mark TIMESTAMPTZ NOT NULL DEFAULT '-infinity',
+    last_run_at TIMESTAMPTZ,
+    days_refreshed INTEGER NOT NULL DEFAULT 0
+);
+
+-- Days whose source rows were deleted or moved to another day
+CREATE TABLE IF NOT EXISTS analytics_rollup_dirty_days (
+    day DATE PRIMARY KEY,
+    marked_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+
+-- -----------------------------------------------------------------------------
+-- Write timestamps on the sources (wall clock of the write, not event time:
+-- a sale inserted today with an old created_at is still picked up)
+-- -----------------------------------------------------------------------------
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS rollup_touched_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+ALTER TABLE click_logs ADD COLUMN IF NOT EXISTS rollup_touched_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_sales_rollup_touched_at ON sales (rollup_touched_at);
+CREATE INDEX IF NOT EXISTS idx_click_logs_rollup_touched_at ON click_logs (rollup_touched_at);
+
+-- Day ranges scanned by rebuild_analytics_daily_facts (sales.created_at is
+-- already indexed by idx_sales_created_at)
+CREATE INDEX IF NOT EXISTS idx_click_logs_clicked_at ON click_logs (clicked_at);
+
+CREATE OR REPLACE FUNCTION trg_touch_analytics_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.rollup_touched_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_touch_analytics_rollup ON sales;
+CREATE TRIGGER sales_touch_analytics_rollup
+    BEFORE INSERT OR UPDATE ON sales
+    FOR EACH ROW EXECUTE FUNCTION trg_touch_analytics_rollup();
+
+DROP TRIGGER IF EXISTS click_logs_touch_analytics_rollup ON click_logs;
+CREATE TRIGGER click_logs_touch_analytics_rollup
+    BEFORE INSERT OR UPDATE ON click_logs
+    FOR EACH ROW EXECUTE FUNCTION trg_touch_analytics_rollup();
+
+
+CREATE OR REPLACE FUNCTION trg_mark_analytics_dirty_day()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_old_day DATE;
+    v_new_day DATE;
+BEGIN
+    IF TG_TABLE_NAME = 'click_logs' THEN
+        v_old_day := OLD.clicked_at::date;
+        v_new_day := CASE WHEN TG_OP = 'UPDATE' THEN NEW.clicked_at::date END;
+    ELSE
+        v_old_day := OLD.created_at::date;
+        v_new_day := CASE WHEN TG_OP = 'UPDATE' THEN NEW.created_at::date END;
+    END IF;
+
+    -- An update that keeps the day is covered by rollup_touched_at
+    IF v_old_day IS NOT NULL AND v_old_day IS DISTINCT FROM v_new_day THEN
+        INSERT INTO analytics_rollup_dirty_days (day) VALUES (v_old_day)
+        ON CONFLICT (day) DO NOTHING;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_mark_analytics_dirty_day ON sales;
+CREATE TRIGGER sales_mark_analytics_dirty_day
+    AFTER DELETE OR UPDATE OF created_at ON sales
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_analytics_dirty_day();
+
+DROP TRIGGER IF EXISTS click_logs_mark_analytics_dirty_day ON click_logs;
+CREATE TRIGGER click_logs_mark_analytics_dirty_day
+    AFTER DELETE OR UPDATE OF clicked_at ON click_logs
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_analytics_dirty_day();
+
+
+-- -----------------------------------------------------------------------------
+-- Recompute a set of days for every dimension (delete + insert, idempotent)
+--
+-- Each day is scanned as a half-open range [day, day + 1) so the created_at /
+-- clicked_at indexes are used (a ::date cast on the column would not be)
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION rebuild_analytics_daily_facts(p_days DATE[])
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    DELETE FROM analytics_daily_facts WHERE day = ANY(p_days);
+
+    INSERT INTO analytics_daily_facts (
+        dimension, dimension_id, day,
+        clicks, unique_clicks, conversions, revenue, commissions, updated_at
+    )
+    SELECT
+        dimension, dimension_id, day,
+        COUNT(click_ip),
+        COUNT(DISTINCT click_ip),
+        COALESCE(SUM(conversions), 0),
+        COALESCE(SUM(revenue), 0),
+        COALESCE(SUM(commissions), 0),
+        NOW()
+    FROM (
+        SELECT d.dimension, d.dimension_id, r.day,
+               NULL::text AS click_ip,
+               1 AS conversions,
+               COALESCE(s.amount, 0) AS revenue,
+               COALESCE(s.influencer_commission, 0) AS commissions
+        FROM (SELECT DISTINCT unnest(p_days) AS day) AS r
+        JOIN sales s ON s.created_at >= r.day AND s.created_at < r.day + 1
+        CROSS JOIN LATERAL (VALUES
+            ('platform', '*'),
+            ('merchant', s.merchant_id::text),
+            ('influencer', s.influencer_id::text),
+            ('product', s.product_id::text),
+            ('link', s.link_id::text)
+        ) AS d(dimension, dimension_id)
+        WHERE COALESCE(s.status, 'pending') NOT IN ('refunded', 'cancelled')
+
+        UNION ALL
+
+        SELECT d.dimension, d.dimension_id, r.day,
+               COALESCE(c.ip_address::text, c.id::text),
+               NULL, NULL, NULL
+        FROM (SELECT DISTINCT unnest(p_days) AS day) AS r
+        JOIN click_logs c ON c.clicked_at >= r.day AND c.clicked_at < r.day + 1
+        LEFT JOIN tracking_links tl ON tl.id = c.link_id
+        CROSS JOIN LATERAL (VALUES
+            ('platform', '*'),
+            ('merchant', tl.merchant_id::text),
+            ('influencer', COALESCE(c.influencer_id, tl.influencer_id)::text),
+            ('product', tl.product_id::text),
+            ('link', c.link_id::text)
+        ) AS d(dimension, dimension_id)
+    ) AS facts
+    WHERE dimension_id IS NOT NULL AND day IS NOT NULL
+    GROUP BY dimension, dimension_id, day;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- -----------------------------------------------------------------------------
+-- Incremental refresh: days touched since the high-water mark + dirty days
+--
+-- p_lag_seconds keeps the mark behind NOW(): a transaction that stamped its
+-- rows before the scan but commits after it is still caught by the next run
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION refresh_daily_analytics(p_lag_seconds INTEGER DEFAULT 120)
+RETURNS JSONB AS $$
+DECLARE
+    v_from TIMESTAMPTZ;
+    v_to TIMESTAMPTZ := clock_timestamp() - make_interval(secs => p_lag_seconds);
+    v_days DATE[];
+    v_rows INTEGER := 0;
+BEGIN
+    -- Overlapping runs are skipped, not queued
+    IF NOT pg_try_advisory_xact_lock(hashtext('refresh_daily_analytics')) THEN
+        RETURN jsonb_build_object('skipped', TRUE);
+    END IF;
+
+    INSERT INTO analytics_rollup_state (job_name) VALUES ('daily_analytics')
+    ON CONFLICT (job_name) DO NOTHING;
+
+    SELECT high_water_mark INTO v_from
+    FROM analytics_rollup_state
+    WHERE job_name = 'daily_analytics'
+    FOR UPDATE;
+
+    -- The window never moves backwards (clock skew, lag change)
+    IF v_to <= v_from THEN
+        v_to := v_from;
+    END IF;
+
+    WITH dirty AS (
+        DELETE FROM analytics_rollup_dirty_days RETURNING day
+    )
+    SELECT ARRAY(
+        SELECT created_at::date FROM sales
+        WHERE rollup_touched_at > v_from AND rollup_touched_at <= v_to
+        UNION
+        SELECT clicked_at::date FROM click_logs
+        WHERE rollup_touched_at > v_from AND rollup_touched_at <= v_to
+        UNION
+        SELECT day FROM dirty
+    ) INTO v_days;
+
+    v_days := ARRAY(SELECT d FROM unnest(v_days) AS d WHERE d IS NOT NULL);
+
+    IF cardinality(v_days) > 0 THEN
+        v_rows := rebuild_analytics_daily_facts(v_days);
+    END IF;
+
+    UPDATE analytics_rollup_state
+    SET high_water_mark = v_to,
+        last_run_at = NOW(),
+        days_refreshed = cardinality(v_days)
+    WHERE job_name = 'daily_analytics';
+
+    RETURN jsonb_build_object(
+        'skipped', FALSE,
+        'days_refreshed', cardinality(v_days),
+        'rows_written', v_rows,
+        'high_water_mark', v_to
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Initial backfill: every existing row is past the (-infinity) mark
+SELECT refresh_daily_analytics(0);
@@ -0,0 +1,197 @@
+-- =============================================================================
+-- Migration: Incremental dashboard aggregates
+-- Description: Daily buckets per platform / merchant / influencer maintained by
+--              triggers on sales and conversions, so /api/dashboard/stats
+--              reads O(days) rows instead of scanning the whole history.
+-- Date: 2026-10-17
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS dashboard_daily_stats (
+    scope_type TEXT NOT NULL CHECK (scope_type IN ('platform', 'merchant', 'influencer')),
+    scope_id TEXT NOT NULL,  -- '*' for platform
+    day DATE NOT NULL,
+
+    -- sales (status = 'completed')
+    sales_count INTEGER NOT NULL DEFAULT 0,
+    sales_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+
+    -- conversions (all statuses / completed only)
+    conversions_count INTEGER NOT NULL DEFAULT 0,
+    conversions_completed INTEGER NOT NULL DEFAULT 0,
+    commission_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (scope_type, scope_id, day)
+);
+
+
+CREATE OR REPLACE FUNCTION bump_dashboard_daily_stats(
+    p_scope_type TEXT,
+    p_scope_id TEXT,
+    p_day DATE,
+    p_sales_count INTEGER DEFAULT 0,
+    p_sales_amount NUMERIC DEFAULT 0,
+    p_conversions_count INTEGER DEFAULT 0,
+    p_conversions_completed INTEGER DEFAULT 0,
+    p_commission_amount NUMERIC DEFAULT 0
+)
+RETURNS VOID AS $$
+BEGIN
+    IF p_scope_id IS NULL OR p_day IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO dashboard_daily_stats AS d (
+        scope_type, scope_id, day,
+        sales_count, sales_amount,
+        conversions_count, conversions_completed, commission_amount
+    )
+    VALUES (
+        p_scope_type, p_scope_id, p_day,
+        p_sales_count, p_sales_amount,
+        p_conversions_count, p_conversions_completed, p_commission_amount
+    )
+    ON CONFLICT (scope_type, scope_id, day) DO UPDATE
+    SET
+        sales_count = d.sales_count + EXCLUDED.sales_count,
+        sales_amount = d.sales_amount + EXCLUDED.sales_amount,
+        conversions_count = d.conversions_count + EXCLUDED.conversions_count,
+        conversions_completed = d.conversions_completed + EXCLUDED.conversions_completed,
+        commission_amount = d.commission_amount + EXCLUDED.commission_amount,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- -----------------------------------------------------------------------------
+-- sales → completed sales count / amount
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION trg_sales_dashboard_daily_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_sign INTEGER;
+    v_row sales%ROWTYPE;
+BEGIN
+    FOREACH v_sign IN ARRAY ARRAY[-1, 1] LOOP
+        IF v_sign = -1 AND TG_OP IN ('UPDATE', 'DELETE') THEN
+            v_row := OLD;
+        ELSIF v_sign = 1 AND TG_OP IN ('INSERT', 'UPDATE') THEN
+            v_row := NEW;
+        ELSE
+            CONTINUE;
+        END IF;
+
+        IF v_row.status = 'completed' THEN
+            PERFORM bump_dashboard_daily_stats('platform', '*', v_row.created_at::date,
+                v_sign, v_sign * COALESCE(v_row.amount, 0));
+            PERFORM bump_dashboard_daily_stats('merchant', v_row.merchant_id::text, v_row.created_at::date,
+                v_sign, v_sign * COALESCE(v_row.amount, 0));
+            PERFORM bump_dashboard_daily_stats('influencer', v_row.influencer_id::text, v_row.created_at::date,
+                v_sign, v_sign * COALESCE(v_row.amount, 0));
+        END IF;
+    END LOOP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_dashboard_daily_stats ON sales;
+CREATE TRIGGER sales_dashboard_daily_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, amount, merchant_id, influencer_id, created_at
+    ON sales
+    FOR EACH ROW EXECUTE FUNCTION trg_sales_dashboard_daily_stats();
+
+
+-- -----------------------------------------------------------------------------
+-- conversions → conversions count / completed / commission
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION trg_conversions_dashboard_daily_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_sign INTEGER;
+    v_row conversions%ROWTYPE;
+    v_completed INTEGER;
+    v_commission NUMERIC;
+BEGIN
+    FOREACH v_sign IN ARRAY ARRAY[-1, 1] LOOP
+        IF v_sign = -1 AND TG_OP IN ('UPDATE', 'DELETE') THEN
+            v_row := OLD;
+        ELSIF v_sign = 1 AND TG_OP IN ('INSERT', 'UPDATE') THEN
+            v_row := NEW;
+        ELSE
+            CONTINUE;
+        END IF;
+
+        v_completed := CASE WHEN v_row.status = 'completed' THEN 1 ELSE 0 END;
+        v_commission := CASE WHEN v_row.status = 'completed' THEN COALESCE(v_row.commission_amount, 0) ELSE 0 END;
+
+        PERFORM bump_dashboard_daily_stats('platform', '*', v_row.created_at::date,
+            0, 0, v_sign, v_sign * v_completed, v_sign * v_commission);
+        PERFORM bump_dashboard_daily_stats('merchant', v_row.merchant_id::text, v_row.created_at::date,
+            0, 0, v_sign, v_sign * v_completed, v_sign * v_commission);
+        PERFORM bump_dashboard_daily_stats('influencer', v_row.influencer_id::text, v_row.created_at::date,
+            0, 0, v_sign, v_sign * v_completed, v_sign * v_commission);
+    END LOOP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS conversions_dashboard_daily_stats ON conversions;
+CREATE TRIGGER conversions_dashboard_daily_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, commission_amount, merchant_id, influencer_id, created_at
+    ON conversions
+    FOR EACH ROW EXECUTE FUNCTION trg_conversions_dashboard_daily_stats();
+
+
+-- -----------------------------------------------------------------------------
+-- Full rebuild (initial backfill, or reconciliation after manual fixes)
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION rebuild_dashboard_daily_stats()
+RETURNS VOID AS $$
+BEGIN
+    -- Block writers for the duration of the rebuild so no delta is lost
+    LOCK TABLE sales, conversions IN SHARE MODE;
+
+    TRUNCATE dashboard_daily_stats;
+
+    INSERT INTO dashboard_daily_stats AS d (
+        scope_type, scope_id, day,
+        sales_count, sales_amount,
+        conversions_count, conversions_completed, commission_amount
+    )
+    SELECT scope_type, scope_id, day,
+           SUM(sales_count), SUM(sales_amount),
+           SUM(conversions_count), SUM(conversions_completed), SUM(commission_amount)
+    FROM (
+        SELECT s.scope_type, s.scope_id, created_at::date AS day,
+               1 AS sales_count, COALESCE(amount, 0) AS sales_amount,
+               0 AS conversions_count, 0 AS conversions_completed, 0 AS commission_amount
+        FROM sales
+        CROSS JOIN LATERAL (VALUES
+            ('platform', '*'),
+            ('merchant', merchant_id::text),
+            ('influencer', influencer_id::text)
+        ) AS s(scope_type, scope_id)
+        WHERE status = 'completed'
+
+        UNION ALL
+
+        SELECT c.scope_type, c.scope_id, created_at::date,
+               0, 0,
+               1,
+               CASE WHEN status = 'completed' THEN 1 ELSE 0 END,
+               CASE WHEN status = 'completed' THEN COALESCE(commission_amount, 0) ELSE 0 END
+        FROM conversions
+        CROSS JOIN LATERAL (VALUES
+            ('platform', '*'),
+            ('merchant', merchant_id::text),
+            ('influencer', influencer_id::text)
+        ) AS c(scope_type, scope_id)
+    ) AS facts
+    WHERE scope_id IS NOT NULL AND day IS NOT NULL
+    GROUP BY scope_type, scope_id, day;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_dashboard_daily_stats();
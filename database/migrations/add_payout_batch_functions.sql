@@ -0,0 +1,85 @@
+-- =============================================================================
+-- Migration: Batched automatic payouts
+-- Description: Idempotency key per payout, a single call to create the
+--              payouts of a run and a single call to record its outcome
+--              (status transitions + balance debits).
+-- Date: 2026-10-17
+-- =============================================================================
+
+ALTER TABLE payouts ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payouts_idempotency_key
+    ON payouts (idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_payouts_in_flight
+    ON payouts (influencer_id)
+    WHERE status IN ('pending', 'processing');
+
+
+-- PostgREST upsert(on_conflict="idempotency_key") cannot target the partial
+-- index above; the conflict target must repeat its predicate to be inferred
+CREATE OR REPLACE FUNCTION create_payout_batch(
+    p_rows JSONB  -- [{"influencer_id": "uuid", "amount": 100, ..., "idempotency_key": "..."}]
+)
+RETURNS SETOF payouts AS $$
+    INSERT INTO payouts (
+        influencer_id, amount, currency, status, payment_method,
+        requested_at, approved_at, is_automatic, idempotency_key
+    )
+    SELECT
+        r.influencer_id, r.amount, r.currency, r.status, r.payment_method,
+        r.requested_at, r.approved_at, r.is_automatic, r.idempotency_key
+    FROM jsonb_to_recordset(p_rows) AS r(
+        influencer_id UUID,
+        amount DECIMAL(10, 2),
+        currency VARCHAR(3),
+        status VARCHAR(50),
+        payment_method VARCHAR(50),
+        requested_at TIMESTAMP,
+        approved_at TIMESTAMP,
+        is_automatic BOOLEAN,
+        idempotency_key VARCHAR(255)
+    )
+    ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+    RETURNING *;
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION complete_payout_batch(
+    p_results JSONB  -- [{"payout_id": "uuid", "status": "paid"|"failed", "transaction_id": "..."}]
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    -- Only payouts still 'processing' transition, and only those are debited:
+    -- replaying the same results never debits a balance twice
+    WITH updated AS (
+        UPDATE payouts AS p
+        SET
+            status = r.status,
+            transaction_id = r.transaction_id,
+            paid_at = CASE WHEN r.status = 'paid' THEN NOW() ELSE p.paid_at END,
+            notes = CASE WHEN r.status = 'failed' THEN 'Échec du traitement automatique' ELSE p.notes END
+        FROM jsonb_to_recordset(p_results)
+            AS r(payout_id UUID, status TEXT, transaction_id TEXT)
+        WHERE p.id = r.payout_id
+          AND p.status = 'processing'
+        RETURNING p.influencer_id, p.amount, p.status
+    ), debited AS (
+        -- Debit exactly the paid amount: commissions credited during the run are kept
+        UPDATE influencers AS i
+        SET
+            balance = GREATEST(COALESCE(i.balance, 0) - u.amount, 0),
+            updated_at = NOW()
+        FROM updated AS u
+        WHERE i.id = u.influencer_id
+          AND u.status = 'paid'
+        RETURNING i.id
+    )
+    SELECT COUNT(*) INTO v_updated FROM updated;
+
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
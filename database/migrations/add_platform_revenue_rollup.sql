@@ -0,0 +1,213 @@
+-- =============================================================================
+-- Migration: Platform revenue rollup
+-- Description: Adds commission / revenue columns to dashboard_daily_stats so
+--              /api/admin/platform-revenue answers any date range by summing
+--              daily buckets (platform + per merchant) instead of loading
+--              every completed sale.
+-- Depends on: add_dashboard_daily_stats.sql
+-- Date: 2026-10-17
+-- =============================================================================
+
+ALTER TABLE dashboard_daily_stats
+    ADD COLUMN IF NOT EXISTS platform_commission NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS influencer_commission NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS merchant_revenue NUMERIC(14, 2) NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_dashboard_daily_stats_scope_day
+    ON dashboard_daily_stats (scope_type, day);
+
+-- "Recent commissions" list: bounded read of the latest completed sales
+CREATE INDEX IF NOT EXISTS idx_sales_completed_created_at
+    ON sales (created_at DESC)
+    WHERE status = 'completed';
+
+
+-- New trailing parameters: existing positional callers keep working
+DROP FUNCTION IF EXISTS bump_dashboard_daily_stats(TEXT, TEXT, DATE, INTEGER, NUMERIC, INTEGER, INTEGER, NUMERIC);
+
+CREATE OR REPLACE FUNCTION bump_dashboard_daily_stats(
+    p_scope_type TEXT,
+    p_scope_id TEXT,
+    p_day DATE,
+    p_sales_count INTEGER DEFAULT 0,
+    p_sales_amount NUMERIC DEFAULT 0,
+    p_conversions_count INTEGER DEFAULT 0,
+    p_conversions_completed INTEGER DEFAULT 0,
+    p_commission_amount NUMERIC DEFAULT 0,
+    p_platform_commission NUMERIC DEFAULT 0,
+    p_influencer_commission NUMERIC DEFAULT 0,
+    p_merchant_revenue NUMERIC DEFAULT 0
+)
+RETURNS VOID AS $$
+BEGIN
+    IF p_scope_id IS NULL OR p_day IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO dashboard_daily_stats AS d (
+        scope_type, scope_id, day,
+        sales_count, sales_amount,
+        conversions_count, conversions_completed, commission_amount,
+        platform_commission, influencer_commission, merchant_revenue
+    )
+    VALUES (
+        p_scope_type, p_scope_id, p_day,
+        p_sales_count, p_sales_amount,
+        p_conversions_count, p_conversions_completed, p_commission_amount,
+        p_platform_commission, p_influencer_commission, p_merchant_revenue
+    )
+    ON CONFLICT (scope_type, scope_id, day) DO UPDATE
+    SET
+        sales_count = d.sales_count + EXCLUDED.sales_count,
+        sales_amount = d.sales_amount + EXCLUDED.sales_amount,
+        conversions_count = d.conversions_count + EXCLUDED.conversions_count,
+        conversions_completed = d.conversions_completed + EXCLUDED.conversions_completed,
+        commission_amount = d.commission_amount + EXCLUDED.commission_amount,
+        platform_commission = d.platform_commission + EXCLUDED.platform_commission,
+        influencer_commission = d.influencer_commission + EXCLUDED.influencer_commission,
+        merchant_revenue = d.merchant_revenue + EXCLUDED.merchant_revenue,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION trg_sales_dashboard_daily_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_sign INTEGER;
+    v_row sales%ROWTYPE;
+BEGIN
+    FOREACH v_sign IN ARRAY ARRAY[-1, 1] LOOP
+        IF v_sign = -1 AND TG_OP IN ('UPDATE', 'DELETE') THEN
+            v_row := OLD;
+        ELSIF v_sign = 1 AND TG_OP IN ('INSERT', 'UPDATE') THEN
+            v_row := NEW;
+        ELSE
+            CONTINUE;
+        END IF;
+
+        IF v_row.status = 'completed' THEN
+            PERFORM bump_dashboard_daily_stats(s.scope_type, s.scope_id, v_row.created_at::date,
+                v_sign, v_sign * COALESCE(v_row.amount, 0),
+                0, 0, 0,
+                v_sign * COALESCE(v_row.platform_commission, 0),
+                v_sign * COALESCE(v_row.influencer_commission, 0),
+                v_sign * COALESCE(v_row.merchant_revenue, 0))
+            FROM (VALUES
+                ('platform', '*'),
+                ('merchant', v_row.merchant_id::text),
+                ('influencer', v_row.influencer_id::text)
+            ) AS s(scope_type, scope_id);
+        END IF;
+    END LOOP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_dashboard_daily_stats ON sales;
+CREATE TRIGGER sales_dashboard_daily_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, amount, platform_commission, influencer_commission,
+        merchant_revenue, merchant_id, influencer_id, created_at
+    ON sales
+    FOR EACH ROW EXECUTE FUNCTION trg_sales_dashboard_daily_stats();
+
+
+CREATE OR REPLACE FUNCTION rebuild_dashboard_daily_stats()
+RETURNS VOID AS $$
+BEGIN
+    -- Block writers for the duration of the rebuild so no delta is lost
+    LOCK TABLE sales, conversions IN SHARE MODE;
+
+    TRUNCATE dashboard_daily_stats;
+
+    INSERT INTO dashboard_daily_stats AS d (
+        scope_type, scope_id, day,
+        sales_count, sales_amount,
+        conversions_count, conversions_completed, commission_amount,
+        platform_commission, influencer_commission, merchant_revenue
+    )
+    SELECT scope_type, scope_id, day,
+           SUM(sales_count), SUM(sales_amount),
+           SUM(conversions_count), SUM(conversions_completed), SUM(commission_amount),
+           SUM(platform_commission), SUM(influencer_commission), SUM(merchant_revenue)
+    FROM (
+        SELECT s.scope_type, s.scope_id, created_at::date AS day,
+               1 AS sales_count, COALESCE(amount, 0) AS sales_amount,
+               0 AS conversions_count, 0 AS conversions_completed, 0 AS commission_amount,
+               COALESCE(platform_commission, 0) AS platform_commission,
+               COALESCE(influencer_commission, 0) AS influencer_commission,
+               COALESCE(merchant_revenue, 0) AS merchant_revenue
+        FROM sales
+        CROSS JOIN LATERAL (VALUES
+            ('platform', '*'),
+            ('merchant', merchant_id::text),
+            ('influencer', influencer_id::text)
+        ) AS s(scope_type, scope_id)
+        WHERE status = 'completed'
+
+        UNION ALL
+
+        SELECT c.scope_type, c.scope_id, created_at::date,
+               0, 0,
+               1,
+               CASE WHEN status = 'completed' THEN 1 ELSE 0 END,
+               CASE WHEN status = 'completed' THEN COALESCE(commission_amount, 0) ELSE 0 END,
+               0, 0, 0
+        FROM conversions
+        CROSS JOIN LATERAL (VALUES
+            ('platform', '*'),
+            ('merchant', merchant_id::text),
+            ('influencer', influencer_id::text)
+        ) AS c(scope_type, scope_id)
+    ) AS facts
+    WHERE scope_id IS NOT NULL AND day IS NOT NULL
+    GROUP BY scope_type, scope_id, day;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- -----------------------------------------------------------------------------
+-- Report: platform totals + top-N merchants for a day range (bounds inclusive)
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION platform_revenue_rollup(
+    p_start_day DATE DEFAULT NULL,
+    p_end_day DATE DEFAULT NULL,
+    p_top INTEGER DEFAULT 20
+)
+RETURNS JSONB AS $$
+    WITH platform AS (
+        SELECT
+            COALESCE(SUM(platform_commission), 0) AS platform_commission,
+            COALESCE(SUM(influencer_commission), 0) AS influencer_commission,
+            COALESCE(SUM(merchant_revenue), 0) AS merchant_revenue,
+            COALESCE(SUM(sales_amount), 0) AS sales_amount,
+            COALESCE(SUM(sales_count), 0) AS sales_count
+        FROM dashboard_daily_stats
+        WHERE scope_type = 'platform'
+          AND (p_start_day IS NULL OR day >= p_start_day)
+          AND (p_end_day IS NULL OR day <= p_end_day)
+    ), merchants AS (
+        SELECT
+            scope_id AS merchant_id,
+            SUM(platform_commission) AS platform_commission,
+            SUM(influencer_commission) AS influencer_commission,
+            SUM(merchant_revenue) AS merchant_revenue,
+            SUM(sales_amount) AS sales_amount,
+            SUM(sales_count) AS sales_count
+        FROM dashboard_daily_stats
+        WHERE scope_type = 'merchant'
+          AND (p_start_day IS NULL OR day >= p_start_day)
+          AND (p_end_day IS NULL OR day <= p_end_day)
+        GROUP BY scope_id
+        HAVING SUM(sales_count) > 0
+        ORDER BY SUM(platform_commission) DESC
+        LIMIT p_top
+    )
+    SELECT jsonb_build_object(
+        'summary', (SELECT to_jsonb(platform) FROM platform),
+        'by_merchant', COALESCE((SELECT jsonb_agg(to_jsonb(merchants)) FROM merchants), '[]'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
+
+SELECT rebuild_dashboard_daily_stats();
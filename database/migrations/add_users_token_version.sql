@@ -0,0 +1,12 @@
+-- =============================================================================
+-- Migration: Token version on users
+-- Description: Access tokens carry the user's token_version in a "ver" claim.
+--              Changing a user's role sets a new token_version, so tokens
+--              issued before the change are rejected and the per-process
+--              principal cache (keyed by user id + token version) never
+--              serves them a stale role.
+-- Date: 2026-10-17
+-- =============================================================================
+
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS token_version BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,124 @@
+-- =============================================================================
+-- Migration: Queued e-commerce webhook ingestion
+-- Description: Durable inbox for Shopify / WooCommerce / TikTok Shop order
+--              webhooks. The endpoint verifies the signature, stores the raw
+--              body once under a dedup key (source + merchant + external
+--              order id) and acknowledges; a worker pool claims events in
+--              batches and turns them into sales.
+-- Date: 2026-10-17
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS webhook_inbox (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    source TEXT NOT NULL,                -- shopify | woocommerce | tiktok_shop
+    merchant_id TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,             -- external order id
+    event_type TEXT,
+    body TEXT NOT NULL,                  -- raw request body, stored once
+    headers JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'processing', 'processed', 'ignored', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    sale_id UUID,
+    received_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_at TIMESTAMPTZ,
+    processed_at TIMESTAMPTZ,
+    UNIQUE (source, merchant_id, dedup_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_inbox_pending
+    ON webhook_inbox (received_at)
+    WHERE status IN ('queued', 'processing');
+
+
+-- -----------------------------------------------------------------------------
+-- Claim a batch: queued events, plus events left in 'processing' by a dead
+-- worker for longer than p_stale_seconds. Stale events that already used
+-- p_max_attempts claims are marked 'failed' instead of being reclaimed
+-- -----------------------------------------------------------------------------
+DROP FUNCTION IF EXISTS claim_webhook_events(INTEGER, INTEGER);
+
+CREATE OR REPLACE FUNCTION claim_webhook_events(
+    p_limit INTEGER DEFAULT 50,
+    p_stale_seconds INTEGER DEFAULT 300,
+    p_max_attempts INTEGER DEFAULT 5
+)
+RETURNS SETOF webhook_inbox AS $$
+BEGIN
+    UPDATE webhook_inbox
+    SET status = 'failed',
+        error_message = COALESCE(error_message, 'Worker lost the event too many times'),
+        locked_at = NULL
+    WHERE status = 'processing'
+      AND locked_at < NOW() - make_interval(secs => p_stale_seconds)
+      AND attempts >= p_max_attempts;
+
+    RETURN QUERY
+    UPDATE webhook_inbox AS w
+    SET status = 'processing',
+        locked_at = NOW(),
+        attempts = w.attempts + 1
+    FROM (
+        SELECT id
+        FROM webhook_inbox
+        WHERE status = 'queued'
+           OR (status = 'processing'
+               AND locked_at < NOW() - make_interval(secs => p_stale_seconds)
+               AND attempts < p_max_attempts)
+        ORDER BY received_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ) AS picked
+    WHERE w.id = picked.id
+    RETURNING w.*;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- -----------------------------------------------------------------------------
+-- Record the outcome of a batch in one statement
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION complete_webhook_events(
+    p_results JSONB  -- [{"id": "uuid", "status": "processed", "error_message": null, "sale_id": "uuid"}]
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE webhook_inbox AS w
+    SET status = r.status,
+        error_message = r.error_message,
+        sale_id = COALESCE(r.sale_id, w.sale_id),
+        locked_at = NULL,
+        processed_at = CASE WHEN r.status IN ('processed', 'ignored') THEN NOW() ELSE w.processed_at END
+    FROM jsonb_to_recordset(p_results) AS r(id UUID, status TEXT, error_message TEXT, sale_id UUID)
+    WHERE w.id = r.id;
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- -----------------------------------------------------------------------------
+-- Atomic, aggregated conversion / revenue increments on tracking_links
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION increment_link_conversions(
+    p_deltas JSONB  -- [{"link_id": "uuid", "conversions": 2, "revenue": 149.90}]
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE tracking_links AS tl
+    SET
+        conversions = COALESCE(tl.conversions, 0) + d.conversions,
+        revenue = COALESCE(tl.revenue, 0) + d.revenue
+    FROM jsonb_to_recordset(p_deltas) AS d(link_id UUID, conversions INTEGER, revenue NUMERIC)
+    WHERE tl.id = d.link_id;
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;